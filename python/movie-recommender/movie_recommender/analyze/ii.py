@@ -1,50 +1,103 @@
 # coding=utf-8
-"""Tools for analyzing the database, for the item-item algorithm."""
+"""Tools for analyzing the database, for the item-item algorithm.
+
+Similarity scores may also be computed with sparse matrix products, by
+:mod:`movie_recommender.analyze.ii_matrix`, and updated incrementally as
+ratings arrive, by :mod:`movie_recommender.analyze.ii_update`. Approximate
+analysis is supported by :mod:`movie_recommender.analyze.ii_lsh`.
+"""
 import itertools
 import math
 import multiprocessing
+import os
+
+import numpy
 
-from movie_recommender import exceptions
+from movie_recommender import exceptions, matrix, profiling, progress
+from movie_recommender.analyze import ii_lsh, schedule
 from movie_recommender.constants import (
     JOBS_PER_PROCESS_PER_BATCH,
     MIN_PAIRS_FOR_SIMILARITY,
+    SIMILARITY_BLOCK_SIZE,
+)
+from movie_recommender.db import (
+    calc,
+    common,
+    count,
+    init,
+    read,
+    shards,
+    store,
+    write,
 )
-from movie_recommender.db import calc, common, count, read, write
 
 
-def analyze_users(overwrite, jobs, reporter=None):
+def analyze_users(overwrite, jobs, reporter=None, in_memory=False):
     """Compute the average of each user's ratings.
 
     :meth:`compute_similarity` makes heavy use of users' average ratings. For
     it to work efficiently, these average ratings should be pre-computed. This
-    method does just that.
+    method does just that. Users who have rated the most movies are handled
+    first. See :mod:`movie_recommender.analyze.schedule`.
 
     :param overwrite: Should already-computed values be re-computed?
     :param jobs: The number of processes to spawn. If ``None``, spawn one per
         CPU.
     :param reporter: A function that reports progress to the user. Must accept
-        one argument, where that argument is a multiprocessing ``Connection``
-        object. Values from 0 to 1, inclusive, will be sent.  If ``None``,
-        progress isn't reported.
+        one argument, a :class:`movie_recommender.progress.Snapshot`. If
+        ``None``, progress isn't reported.
+    :param in_memory: Should each process answer reads from an in-memory
+        store? See :mod:`movie_recommender.db.store`.
+    :return: A :class:`movie_recommender.analyze.schedule.Report`, whose tasks
+        are user IDs, and whose costs are numbers of ratings.
+    """
+    users = read.users()
+    if not overwrite:
+        users.difference_update(read.users_in_avg_ratings())
+    # chunksize chosen empirically with an R7 1700 CPU and a no-op func. For
+    # details, see JOBS_PER_PROCESS_PER_BATCH.
+    return schedule.run(
+        call_caur,
+        users,
+        count.user_ratings(),
+        _write_avg_ratings,
+        jobs,
+        store.load if in_memory else None,
+        reporter,
+        batch_size=JOBS_PER_PROCESS_PER_BATCH * (jobs or os.cpu_count()),
+        chunksize=4,
+    )
+
+
+def analyze_users_scan(overwrite, reporter=None):
+    """Compute the average of each user's ratings, in one pass.
+
+    This function has the same effect as :meth:`analyze_users`. But instead of
+    computing each user's average in a worker process, with one query per
+    user, it computes every average with one aggregate query over the ratings
+    table, and then writes every average in one transaction. See
+    :meth:`movie_recommender.db.calc.avg_user_ratings`.
+
+    :param overwrite: Should already-computed values be re-computed?
+    :param reporter: A function that reports progress to the user. Must accept
+        one argument, a :class:`movie_recommender.progress.Snapshot`. If
+        ``None``, progress isn't reported.
     :return: Nothing.
     """
-    caur_args = gen_caur_args(overwrite, reporter)
-    jobs_per_batch = JOBS_PER_PROCESS_PER_BATCH * jobs
-    with multiprocessing.Pool(jobs) as pool:
-        while True:
-            batch = itertools.islice(caur_args, jobs_per_batch)
-            try:
-                batch_head = next(batch)  # pull val from caur_args
-            except StopIteration:
-                break
-            # chunksize chosen empirically with an R7 1700 CPU and a no-op
-            # func. For details, see JOBS_PER_PROCESS_PER_BATCH.
-            avg_ratings = tuple(pool.imap_unordered(
-                func=call_caur,
-                iterable=itertools.chain((batch_head,), batch),
-                chunksize=4,
-            ))
-            write.avg_ratings(avg_ratings)
+    num_users = 0
+    if reporter:
+        num_users = count.user_ids()
+        if not overwrite:
+            num_users -= count.avg_ratings()
+
+    # The aggregate query reads from avgRatings, so the query must be
+    # exhausted before avgRatings is written to.
+    avg_ratings = []
+    with progress.Progress(num_users, reporter, 0) as tracker:
+        for avg_rating in calc.avg_user_ratings(overwrite):
+            avg_ratings.append(avg_rating)
+            tracker.advance()
+        write.avg_ratings(avg_ratings)
 
 
 def call_caur(user_id):
@@ -53,6 +106,16 @@ def call_caur(user_id):
     return common.AvgRating(user_id, avg_rating)
 
 
+def _write_avg_ratings(results):
+    """Write the average ratings computed by :func:`call_caur`.
+
+    :param results: An iterable of ``(user_id, avg_rating)`` pairs, where
+        ``avg_rating`` is a :class:`movie_recommender.db.common.AvgRating`.
+    :return: Nothing.
+    """
+    write.avg_ratings(avg_rating for _, avg_rating in results)
+
+
 def gen_caur_args(overwrite, reporter=None):
     """Yield user IDs.
 
@@ -62,9 +125,8 @@ def gen_caur_args(overwrite, reporter=None):
 
     :param overwrite: Should already-computed values be overwritten?
     :param reporter: A function that reports progress to the user. Must accept
-        one argument, where that argument is a multiprocessing ``Connection``
-        object. Values from 0 to 1, inclusive, will be sent.  If ``None``,
-        progress isn't reported.
+        one argument, a :class:`movie_recommender.progress.Snapshot`. If
+        ``None``, progress isn't reported.
     :return: A generator that yields user IDs. These values may be passed to
         :meth:`movie_recommender.db.calc.avg_user_rating`.
     """
@@ -72,28 +134,22 @@ def gen_caur_args(overwrite, reporter=None):
     if not overwrite:
         users.difference_update(read.users_in_avg_ratings())
 
-    if reporter:
-        num_users = len(users)
-        users_yielded = 0
-        conn_out, conn_in = multiprocessing.Pipe(duplex=False)
-        proc = multiprocessing.Process(target=reporter, args=(conn_out,))
-        proc.start()
-
-    for user in users:
-        yield user
-
-        if reporter:
-            users_yielded += 1
-            if users_yielded % JOBS_PER_PROCESS_PER_BATCH == 0:
-                conn_in.send(users_yielded / num_users)
-
-    if reporter:
-        conn_in.send(1)
-        conn_in.close()
-        proc.join()
-
-
-def analyze_movies(movies, users, overwrite, jobs, reporter=None):
+    with progress.Progress(len(users), reporter, 0) as tracker:
+        for user in users:
+            yield user
+            tracker.advance()
+
+
+def analyze_movies(  # pylint:disable=too-many-arguments
+        movies,
+        users,
+        overwrite,
+        jobs,
+        reporter=None,
+        in_memory=False,
+        shard=None,
+        db_path=None,
+        lsh=None):
     """Analyze movies.
 
     The item-item movie prediction algorithm works by comparing a target movie
@@ -124,25 +180,121 @@ def analyze_movies(movies, users, overwrite, jobs, reporter=None):
     :param jobs: How many processes should be spawned? If none, spawn one per
         CPU.
     :param reporter: A function that reports progress to the user. Must accept
-        one argument, where that argument is a multiprocessing ``Connection``
-        object. Values from 0 to 1, inclusive, will be sent.  If ``None``,
-        progress isn't reported.
+        one argument, a :class:`movie_recommender.progress.Snapshot`. If
+        ``None``, progress isn't reported.
+    :param in_memory: Should each process answer reads from an in-memory
+        store? See :mod:`movie_recommender.db.store`.
+    :param shard: A :class:`movie_recommender.db.shards.Shard`. If not
+        ``None``, only analyze pairs of movies in this shard.
+    :param db_path: The path to the database to write similarity scores to. If
+        ``None``, write to the usual database, and bump its dataset version
+        once analysis ends. See :func:`movie_recommender.db.shards.create` and
+        :func:`movie_recommender.db.write.changing_dataset`.
+    :param lsh: A ``(bands, rows)`` tuple. If not ``None``, only compare pairs
+        of movies whose sets of raters are similar, as judged by a
+        :class:`movie_recommender.matrix.MinHashBuckets` with this many bands
+        and rows. Other pairs are skipped, and no similarity score is written
+        for them. See :data:`movie_recommender.constants.LSH_BANDS`.
     :return: Nothing.
     """
-    cs_args = gen_cs_args(movies, users, overwrite, reporter)
-    jobs_per_batch = JOBS_PER_PROCESS_PER_BATCH * jobs
-    with multiprocessing.Pool(jobs) as pool:
+    check_avg_ratings()
+    ratings = matrix.load_ratings_matrix()
+    with profiling.stage('count co-raters'):
+        co_raters = matrix.CoRaters(ratings)
+    buckets = ii_lsh.load_buckets(ratings, lsh)
+    # Pairs with too few co-raters are never sent to workers. Their zero scores
+    # are buffered, and written alongside the next batch of similarities, or
+    # on their own once a batch's worth has been buffered.
+    zeros = _ZeroScores(JOBS_PER_PROCESS_PER_BATCH * jobs, db_path)
+    # The pool is created inside the tracker's context, so that workers
+    # inherit it, and may report their busy time.
+    with write.changing_dataset(db_path):
+        with progress.Progress(0, reporter, jobs) as tracker:
+            _compute_similarities(
+                gen_cs_args(
+                    movies,
+                    users,
+                    overwrite,
+                    tracker,
+                    shard,
+                    db_path,
+                    co_raters,
+                    zeros.extend,
+                    buckets,
+                ),
+                zeros,
+                jobs,
+                store.load if in_memory else None,
+            )
+
+
+def _compute_similarities(cs_args, zeros, jobs, initializer):
+    """Compute similarities in a pool of processes, and write them.
+
+    Pairs of movies are pulled from ``cs_args`` in this process, one batch at
+    a time, so ``zeros`` is only ever flushed from this process, while the
+    pool is idle.
+
+    :param cs_args: An iterator of pairs of movies, as yielded by
+        :meth:`gen_cs_args`.
+    :param zeros: A :class:`_ZeroScores`. The batch size is its chunk size.
+    :param jobs: How many processes should be spawned?
+    :param initializer: A pool initializer, or ``None``.
+    :return: Nothing.
+    """
+    func = profiling.task(
+        progress.timed(call_cs_prefiltered),
+        'call_cs_prefiltered',
+    )
+    with multiprocessing.Pool(jobs, initializer=initializer) as pool:
         while True:
-            batch = itertools.islice(cs_args, jobs_per_batch)
-            try:
-                batch_head = next(batch)  # pull val from cs_args
-            except StopIteration:
+            batch = tuple(itertools.islice(cs_args, zeros.chunk_size))
+            if not batch:
                 break
-            similarities = tuple(pool.imap_unordered(
-                func=call_cs,
-                iterable=itertools.chain((batch_head,), batch),
-            ))
-            write.similarities(similarities)
+            zeros.flush(profiling.results(pool.imap_unordered(
+                func=func,
+                iterable=batch,
+            )))
+    zeros.flush()
+
+
+class _ZeroScores():
+    """A buffer of zero similarity scores, written in chunks.
+
+    :param chunk_size: Once this many scores are buffered, they're written.
+    :param db_path: See :meth:`movie_recommender.db.write.similarities`.
+    """
+
+    def __init__(self, chunk_size, db_path=None):
+        """Initialize instance attributes."""
+        self.chunk_size = chunk_size
+        self.db_path = db_path
+        self._scores = []
+
+    def extend(self, similarities):
+        """Buffer zero scores, and write them if a chunk's worth is buffered.
+
+        :param similarities: An iterable of
+            :class:`movie_recommender.db.common.Similarity` objects.
+        :return: Nothing.
+        """
+        for similarity in similarities:
+            self._scores.append(similarity)
+            if len(self._scores) >= self.chunk_size:
+                self.flush()
+
+    def flush(self, similarities=()):
+        """Write the buffered scores, along with some other similarities.
+
+        :param similarities: An iterable of
+            :class:`movie_recommender.db.common.Similarity` objects.
+        :return: Nothing.
+        """
+        rows = tuple(similarities) + tuple(self._scores)
+        self._scores.clear()
+        if rows:
+            with profiling.stage('write similarities'):
+                write.similarities(rows, self.db_path)
 
 
 def call_cs(args):
@@ -151,30 +303,53 @@ def call_cs(args):
     return common.Similarity(*args, score)
 
 
-def gen_cs_args(movies, users, overwrite, reporter=None):
+def call_cs_prefiltered(args):
+    """Compute the similarity of a pair of movies with enough co-raters.
+
+    Unlike :meth:`call_cs`, don't count the pair's co-raters, or check that
+    average ratings have been computed. :meth:`analyze_movies` has already
+    done so, for all pairs at once.
+    """
+    try:
+        score = compute_similarity_unsafe(*args)
+    except ZeroDivisionError:
+        score = 0
+    return common.Similarity(*args, score)
+
+
+def gen_cs_args(  # pylint:disable=too-many-arguments
+        movies,
+        users,
+        overwrite,
+        tracker=None,
+        shard=None,
+        db_path=None,
+        co_raters=None,
+        skip=None,
+        buckets=None):
     """Generate pairs of movies for whom similarity should be computed.
 
     As pseudo-code, this method does the following::
 
         target_movies = {2, 4}
         all_movies = {1, 2, 3, 4, 5}
-        for movie in all_movies:
-            for target_movie in target_movies:
+        for target_movie in target_movies:
+            for movie in all_movies:
                 if problematic(target_movie, movie):
                     continue
-                yield (target_movie, movie)
+                yield (movie, target_movie)
 
     This function will yield pairs like the following:
 
     * 1, 2
-    * 1, 4
     * 2, 2
-    * 2, 4
     * 3, 2
-    * 3, 4
     * 4, 2
-    * 4, 4
     * 5, 2
+    * 1, 4
+    * 2, 4
+    * 3, 4
+    * 4, 4
     * 5, 4
 
     These pairs may be passed to
@@ -189,73 +364,262 @@ def gen_cs_args(movies, users, overwrite, reporter=None):
     * If similarity has already been calculated for a pair of movie IDs, and if
       similarity scores shouldn't be overwritten, then that pair of movie IDs
       is problematic.
+    * If only one shard of the pairs of movies is being analyzed, then pairs
+      in other shards are problematic.
+    * If co-rater counts are given, then pairs rated by fewer than
+      :data:`movie_recommender.constants.MIN_PAIRS_FOR_SIMILARITY` users are
+      problematic. Their similarity is 0, and is handed to ``skip``.
 
     :param movies: Movie IDs. Movies to be analyzed. These movies are merged
         into the ``target_movies`` set.
     :param users: User IDs. The movies these users have rated are merged into
         the ``target_movies`` set.
     :param overwrite: Should already-computed similarities be re-computed?
-    :param reporter: A function that reports progress to the user. Must accept
-        one argument, where that argument is a multiprocessing ``Connection``
-        object. Values from 0 to 1, inclusive, will be sent.  If ``None``,
-        progress isn't reported.
+    :param tracker: A :class:`movie_recommender.progress.Progress`, or
+        ``None``. If given, its total is set to the number of target movies,
+        and it's advanced once all of a target movie's pairs have been yielded.
+    :param shard: A :class:`movie_recommender.db.shards.Shard`. If not
+        ``None``, only yield pairs of movies in this shard.
+    :param db_path: The path to the database similarity scores are written
+        to. Only pairs of movies in this database are considered to have
+        already been computed.
+    :param co_raters: A :class:`movie_recommender.matrix.CoRaters` for every
+        movie in the database, or ``None``. If ``None``, pairs aren't filtered
+        by their number of co-raters.
+    :param skip: A function accepting an iterable of
+        :class:`movie_recommender.db.common.Similarity` objects. It's called
+        with the zero scores of the pairs filtered out by ``co_raters``.
+    :param buckets: See :meth:`gen_candidates`. Pairs of movies which don't
+        collide are problematic, too. Unlike pairs with too few co-raters,
+        they aren't handed to ``skip``.
     :return: A generator that yields tuples of movie IDs.
     """
-    # target_movies can be smaller than all_movies. This code attempts to
-    # improve efficiency by making the inner for loop iterate over the smaller
-    # set, by performing "x in y" loops on the smaller set, and by keeping a
-    # database connection open.
-    #
-    # Ideally, we would take advantage of the fact that all_movies() is a
-    # generator. This would improve streaminess. But this function is called by
-    # multiple processes, and SQLite objects can't be shared across threads or
-    # processes.
-    #
-    # In cases where most of the movies returned by this function have already
-    # been analyzed, this function is a bottleneck. However, in the presumably
-    # more common case where most movies *haven't* been analyzed,
-    # compute_similarity() is the bottleneck. Consequently, although there is
-    # value in multiprocessing in this function, one should be careful to avoid
-    # over-allocating resources here and causing pointless context switches.
+    # Problematic pairs are filtered out with a handful of numpy operations per
+    # target movie, rather than with Python-level tests per pair of movies. In
+    # particular, already-computed pairs are loaded from the database in one
+    # pass, rather than looked up one pair at a time. See
+    # load_computed_pairs().
     #
     # In addition, using processes has some overhead. Notably, when a master
     # process calls a worker process, arguments are shipped via pickling.
-    all_movies = set(read.all_movies())
-    target_movies = set(movies).union(set(read.rated_movies(users)))
-
-    if reporter:
-        num_pairs = len(all_movies) * len(target_movies)
-        pairs_yielded = 0
-        conn_out, conn_in = multiprocessing.Pipe(duplex=False)
-        proc = multiprocessing.Process(target=reporter, args=(conn_out,))
-        proc.start()
-
-    for movie in all_movies:
-        for target_movie in target_movies:
-
-            # Skip (2, 2).
-            if movie == target_movie:
-                continue
-
-            # Skip (4, 2). Process (2, 4).
-            if movie in target_movies and movie > target_movie:
-                continue
-
-            # Overwrite an already-computed similarity score?
-            if not overwrite and similarity_computed(movie, target_movie):
-                continue
-
-            yield (movie, target_movie)
-
-            if reporter:
-                pairs_yielded += 1
-                if pairs_yielded % JOBS_PER_PROCESS_PER_BATCH == 0:
-                    conn_in.send(pairs_yielded / num_pairs)
+    all_movies = numpy.array(sorted(read.all_movies()), dtype=numpy.int64)
+    target_movies = numpy.array(
+        sorted(set(movies).union(set(read.rated_movies(users)))),
+        dtype=numpy.int64,
+    )
+    computed = (
+        None if overwrite else load_computed_pairs(all_movies, db_path)
+    )
+    if tracker:
+        tracker.total = len(target_movies)
+    yield from gen_pairs(
+        all_movies,
+        target_movies,
+        tracker,
+        computed,
+        shard,
+        co_raters,
+        skip,
+        buckets,
+    )
+
+
+def gen_pairs(  # pylint:disable=too-many-arguments,too-many-locals
+        all_movies,
+        target_movies,
+        tracker=None,
+        computed=None,
+        shard=None,
+        co_raters=None,
+        skip=None,
+        buckets=None):
+    """Generate pairs of movies for whom similarity should be computed.
 
-    if reporter:
-        conn_in.send(1)
-        conn_in.close()
-        proc.join()
+    This is :meth:`gen_cs_args`, minus its reads from the database.
+
+    :param all_movies: A sorted numpy array of every movie ID.
+    :param target_movies: A sorted numpy array of every target movie ID.
+    :param tracker: A :class:`movie_recommender.progress.Progress`, or
+        ``None``. If given, it's advanced once all of a target movie's pairs
+        have been yielded.
+    :param computed: See :meth:`gen_candidates`.
+    :param shard: See :meth:`gen_candidates`.
+    :param co_raters: A :class:`movie_recommender.matrix.CoRaters` whose
+        movies are ``all_movies``, or ``None``. See :meth:`gen_cs_args`.
+    :param skip: See :meth:`gen_cs_args`.
+    :param buckets: See :meth:`gen_candidates`.
+    :return: A generator that yields tuples of movie IDs.
+    """
+    all_movies_list = all_movies.tolist()
+    # Co-rater counts are computed one block of target movies at a time, so
+    # that only a block-sized slice of the (dense) count matrix is in memory.
+    for start in range(0, len(target_movies), SIMILARITY_BLOCK_SIZE):
+        block = target_movies[start:start + SIMILARITY_BLOCK_SIZE]
+        counts = None
+        if co_raters is not None:
+            with profiling.stage('count co-raters'):
+                counts = co_raters.counts(block.tolist())
+        for j, (target_movie, candidates) in enumerate(gen_candidates(
+                all_movies,
+                target_movies,
+                block,
+                computed,
+                shard,
+                buckets)):
+            if counts is not None:
+                enough = counts[candidates, j] >= MIN_PAIRS_FOR_SIMILARITY
+                skip(
+                    common.Similarity(movie, target_movie, 0)
+                    for movie in all_movies[candidates[~enough]].tolist()
+                )
+                candidates = candidates[enough]
+            for k in candidates.tolist():
+                yield (all_movies_list[k], target_movie)
+            if tracker:
+                tracker.advance()
+
+
+def gen_candidates(  # pylint:disable=too-many-arguments
+        all_movies,
+        target_movies,
+        block,
+        computed=None,
+        shard=None,
+        buckets=None):
+    """Tell which movies each target movie should be compared to.
+
+    Pairs of movies are chosen as described in :meth:`gen_cs_args`.
+
+    :param all_movies: A sorted numpy array of every movie ID.
+    :param target_movies: A sorted numpy array of every target movie ID.
+    :param block: An iterable of target movie IDs. The target movies for which
+        candidates should be generated.
+    :param computed: A :class:`movie_recommender.matrix.PairBitmap` of pairs
+        of movies that shouldn't be compared, because their similarity has
+        already been computed. If ``None``, no pairs are skipped for this
+        reason.
+    :param shard: A :class:`movie_recommender.db.shards.Shard`. If not
+        ``None``, pairs of movies in other shards are skipped.
+    :param buckets: A :class:`movie_recommender.matrix.MinHashBuckets` for
+        every movie in ``all_movies``. If not ``None``, pairs of movies which
+        don't collide are skipped. Each target movie's candidates are then
+        drawn from the members of its buckets, so they cost O(collisions),
+        not O(M) for M movies.
+    :return: A generator that yields ``(target_movie, candidates)`` tuples,
+        one per movie in ``block``, where ``candidates`` is a sorted numpy
+        array of the indices in ``all_movies`` of the movies the target movie
+        should be compared to.
+    """
+    for target_movie in numpy.asarray(block).tolist():
+        if buckets is None:
+            candidates = numpy.arange(len(all_movies))
+        else:
+            candidates = buckets.collisions(target_movie)
+        movies = all_movies[candidates]
+        is_target = target_movies[numpy.minimum(
+            numpy.searchsorted(target_movies, movies),
+            len(target_movies) - 1,
+        )] == movies
+        # Skip (2, 2). Skip (4, 2), and process (2, 4).
+        keep = ~is_target | (movies < target_movie)
+        if computed is not None:
+            keep &= ~computed.paired(target_movie, movies)
+        if shard is not None:
+            keep &= shards.pair_shards(
+                movies,
+                target_movie,
+                shard.count,
+            ) == shard.index
+        yield target_movie, candidates[keep]
+
+
+def load_computed_pairs(all_movies, db_path=None):
+    """Load the pairs of movies whose similarity has been computed.
+
+    Every key in the similarities table is read in one pass.
+
+    :param all_movies: An iterable of every movie ID.
+    :param db_path: The path to the database to read from. If ``None``, read
+        from the usual database.
+    :return: A :class:`movie_recommender.matrix.PairBitmap`.
+    """
+    computed = matrix.PairBitmap(all_movies)
+    keys = read.similarity_keys(db_path)
+    while True:
+        chunk = numpy.fromiter(
+            itertools.chain.from_iterable(itertools.islice(keys, 2**16)),
+            dtype=numpy.int64,
+        ).reshape(-1, 2)
+        if not chunk.size:
+            break
+        computed.add(chunk[:, 0], chunk[:, 1])
+    return computed
+
+
+def analyze_neighbors(neighbors_per_movie, drop_similarities=False):
+    """Build the neighbor model from the similarities table.
+
+    Replace the contents of the "neighbors" table with the
+    ``neighbors_per_movie`` most similar movies to each movie. Similarity is
+    ranked by magnitude, as negative similarity scores carry as much weight in
+    :meth:`movie_recommender.predict.ii.predict_rating` as positive ones. Ties
+    are broken by movie ID. Movies with a similarity score of 0 are never
+    neighbors.
+
+    Every row in the similarities table is considered, so this function should
+    be called after similarities have been computed with e.g.
+    :meth:`analyze_movies`.
+
+    :param neighbors_per_movie: The maximum number of neighbors to keep for
+        each movie.
+    :param drop_similarities: Should every row in the similarities table be
+        deleted once the neighbor model has been built? This saves a great
+        deal of space. But predictions which don't use the neighbor model will
+        then fail, and :meth:`analyze_movies` can only rebuild the similarities
+        table from scratch. The dataset version is bumped only if this is
+        true. Otherwise, the analysis which wrote the similarity scores has
+        already bumped it.
+    :return: Nothing.
+    """
+    with common.get_db_conn() as conn:
+        init.c_neighbors_table(conn)
+        init.c_metadata_table(conn)
+        with conn:
+            if drop_similarities:
+                write.bump_dataset_version(conn)
+            conn.execute('DELETE FROM neighbors')
+            # Each pair of movies is stored once in the similarities table, so
+            # each movie's candidate neighbors are found in both columns.
+            conn.execute(
+                """
+                INSERT INTO neighbors
+                SELECT movieId, neighborId, similarity
+                FROM (
+                    SELECT movieId, neighborId, similarity, ROW_NUMBER() OVER (
+                        PARTITION BY movieId
+                        ORDER BY ABS(similarity) DESC, neighborId
+                    ) AS rank
+                    FROM (
+                        SELECT movieAId AS movieId,
+                            movieBId AS neighborId,
+                            similarity
+                        FROM similarities
+                        WHERE similarity != 0
+                        UNION ALL
+                        SELECT movieBId, movieAId, similarity
+                        FROM similarities
+                        WHERE similarity != 0
+                    )
+                )
+                WHERE rank <= ?
+                """,
+                (neighbors_per_movie,),
+            )
+            if drop_similarities:
+                conn.execute('DELETE FROM similarities')
+        if drop_similarities:
+            # VACUUM can't be executed within a transaction.
+            conn.execute('VACUUM')
 
 
 def compute_similarity(movie_a, movie_b):
@@ -285,8 +649,26 @@ def compute_similarity(movie_a, movie_b):
     if count.rating_pairs(movie_a, movie_b) < MIN_PAIRS_FOR_SIMILARITY:
         return 0
 
-    # This formula makes heavy use of users' average ratings. For efficiency
-    # reasons, they must be precomputed. Are they?
+    check_avg_ratings()
+
+    # All pre-flight checks have passed. The exception handling is stupid. See
+    # the comments in the called function.
+    try:
+        return compute_similarity_unsafe(movie_a, movie_b)
+    except ZeroDivisionError:
+        return 0
+
+
+def check_avg_ratings():
+    """Check that every user's average rating has been computed.
+
+    The adjusted cosine similarity formula makes heavy use of users' average
+    ratings. For efficiency reasons, they must be precomputed.
+
+    :return: Nothing.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
     num_avg_ratings = count.avg_ratings()
     num_user_ids = count.user_ids()
     if num_avg_ratings < num_user_ids:
@@ -299,13 +681,6 @@ def compute_similarity(movie_a, movie_b):
             """
         )
 
-    # All pre-flight checks have passed. The exception handling is stupid. See
-    # the comments in the called function.
-    try:
-        return compute_similarity_unsafe(movie_a, movie_b)
-    except ZeroDivisionError:
-        return 0
-
 
 def compute_similarity_unsafe(movie_a, movie_b):
     """Compute the similarity between two movies.
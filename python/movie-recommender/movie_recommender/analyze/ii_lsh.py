@@ -0,0 +1,156 @@
+# coding=utf-8
+"""Tools for approximate item-item analysis, with locality-sensitive hashing.
+
+Comparing every pair of movies costs O(M²) for M movies. Instead, movies may
+be bucketed by the MinHash signatures of their sets of raters, and only pairs of
+movies which share a bucket compared. See
+:class:`movie_recommender.matrix.MinHashBuckets`.
+"""
+import time
+from collections import namedtuple
+
+import numpy
+
+from movie_recommender import matrix, profiling
+from movie_recommender.constants import (
+    MIN_PAIRS_FOR_SIMILARITY,
+    SIMILARITY_BLOCK_SIZE,
+)
+
+
+LshReport = namedtuple('LshReport', (
+    'sample',
+    'pairs',
+    'candidates',
+    'similar',
+    'similar_found',
+    'neighbors',
+    'neighbors_found',
+    'bucket_seconds',
+    'exact_seconds',
+    'approximate_seconds',
+))
+"""The outcome of :func:`compare_lsh`.
+
+``sample`` is the number of movies sampled, and ``pairs`` is the number of
+pairs of a sampled movie and any other movie. ``candidates`` is how many of
+those pairs collide, and would be compared by approximate analysis. Of the
+pairs with a non-zero similarity score, ``similar``, ``similar_found`` collide.
+Of each sampled movie's neighbors, as built by
+:func:`movie_recommender.analyze.ii.analyze_neighbors`, ``neighbors`` in all,
+``neighbors_found`` collide. ``bucket_seconds`` is the time taken to build the
+buckets. ``exact_seconds`` is the time taken to score the sample against every
+movie, and ``approximate_seconds`` the time taken to find the sample's
+collisions and score it against them alone, as the matrix engine does. See
+:func:`candidate_rows`.
+"""
+
+
+def load_buckets(ratings, lsh=None):
+    """Bucket movies by the MinHash signatures of their sets of raters.
+
+    :param ratings: A :class:`movie_recommender.matrix.RatingsMatrix`.
+    :param lsh: A ``(bands, rows)`` tuple, or ``None``.
+    :return: A :class:`movie_recommender.matrix.MinHashBuckets`, or ``None``
+        if ``lsh`` is ``None``.
+    """
+    if lsh is None:
+        return None
+    with profiling.stage('bucket signatures'):
+        return matrix.MinHashBuckets(ratings, *lsh)
+
+
+def candidate_rows(candidates):
+    """Merge the candidates of a block of target movies.
+
+    :param candidates: A sequence of ``(target_movie, candidates)`` tuples, as
+        yielded by :meth:`movie_recommender.analyze.ii.gen_candidates`.
+    :return: A sorted numpy array of every index in any ``candidates``. Pass
+        it to :meth:`movie_recommender.matrix.AdjustedCosine.stats` to only
+        compare the block to the movies at those indices.
+    """
+    return numpy.unique(numpy.concatenate([
+        numpy.empty(0, dtype=numpy.int64),
+        *(indices for _, indices in candidates),
+    ]))
+
+
+def compare_lsh(  # pylint:disable=too-many-locals
+        lsh,
+        sample_size,
+        neighbors_per_movie,
+        seed=0):
+    """Compare approximate analysis to exact analysis, on a sample of movies.
+
+    Sample rated movies, and score them against every movie with the matrix
+    engine (see
+    :meth:`movie_recommender.analyze.ii_matrix.analyze_movies_matrix`). Then
+    count how many of the pairs which matter would have been compared by
+    approximate analysis (see
+    :meth:`movie_recommender.analyze.ii.analyze_movies`). Both ways of scoring
+    the sample are timed. Nothing is written to the database.
+
+    :param lsh: A ``(bands, rows)`` tuple. See
+        :meth:`movie_recommender.analyze.ii.analyze_movies`.
+    :param sample_size: The number of movies to sample. If fewer movies have
+        been rated, all rated movies are sampled.
+    :param neighbors_per_movie: The number of neighbors to keep for each
+        movie. See :meth:`movie_recommender.analyze.ii.analyze_neighbors`.
+    :param seed: A seed for choosing the sample.
+    :return: A :class:`LshReport`.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
+    ratings = matrix.load_ratings_matrix()
+    cosine = matrix.load_adjusted_cosine(ratings, MIN_PAIRS_FOR_SIMILARITY)
+    before = time.perf_counter()
+    buckets = load_buckets(ratings, lsh)
+    bucket_seconds = time.perf_counter() - before
+    rated_movies = ratings.movies[numpy.diff(ratings.ratings.indptr) > 0]
+    sample = numpy.sort(numpy.random.default_rng(seed).choice(
+        rated_movies,
+        min(sample_size, len(rated_movies)),
+        replace=False,
+    ))
+
+    # pairs, candidates, similar, similar_found, neighbors, neighbors_found
+    totals = numpy.zeros(6, dtype=numpy.int64)
+    exact_seconds = approximate_seconds = 0.0
+    for start in range(0, len(sample), SIMILARITY_BLOCK_SIZE):
+        block = sample[start:start + SIMILARITY_BLOCK_SIZE]
+        columns = ratings.movie_index(block)
+        before = time.perf_counter()
+        scores = cosine.scores(columns)
+        exact_seconds += time.perf_counter() - before
+
+        before = time.perf_counter()
+        collisions = tuple(
+            (movie, buckets.collisions(movie)) for movie in block.tolist()
+        )
+        cosine.scores(columns, candidate_rows(collisions))
+        approximate_seconds += time.perf_counter() - before
+
+        for j, (movie, indices) in enumerate(collisions):
+            others = ratings.movies != movie
+            collides = numpy.zeros(len(others), dtype=bool)
+            collides[indices] = True
+            collides &= others
+            similar = (scores[:, j] != 0) & others
+            # Rank as analyze_neighbors() does: by magnitude, then by ID.
+            ranked = numpy.lexsort((ratings.movies, -numpy.abs(scores[:, j])))
+            neighbors = ranked[similar[ranked]][:neighbors_per_movie]
+            totals += (
+                others.sum(),
+                collides.sum(),
+                similar.sum(),
+                (similar & collides).sum(),
+                len(neighbors),
+                collides[neighbors].sum(),
+            )
+    return LshReport(
+        len(sample),
+        *totals.tolist(),
+        bucket_seconds,
+        exact_seconds,
+        approximate_seconds,
+    )
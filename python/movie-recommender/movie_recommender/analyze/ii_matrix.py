@@ -0,0 +1,223 @@
+# coding=utf-8
+"""Tools for computing item-item similarity scores with sparse matrices.
+
+:func:`analyze_movies_matrix` is an alternative to
+:func:`movie_recommender.analyze.ii.analyze_movies`. See
+:mod:`movie_recommender.matrix`.
+"""
+import numpy
+
+from movie_recommender import matrix, progress
+from movie_recommender.analyze import ii, ii_lsh
+from movie_recommender.constants import (
+    MIN_PAIRS_FOR_SIMILARITY,
+    SIMILARITY_BLOCK_SIZE,
+)
+from movie_recommender.db import common, init, read, write
+
+
+def analyze_movies_matrix(  # pylint:disable=too-many-arguments,too-many-locals
+        movies,
+        users,
+        overwrite,
+        reporter=None,
+        stats=False,
+        shard=None,
+        db_path=None,
+        lsh=None):
+    """Analyze movies, with sparse matrix products.
+
+    This function is an alternative to
+    :meth:`movie_recommender.analyze.ii.analyze_movies`. It computes similarity
+    scores for the same pairs of movies, and it computes the same scores. But
+    instead of querying the database several times per pair of movies, it
+    loads every rating into memory once, and then compares whole blocks of
+    target movies to every movie at once. For details, see
+    :class:`movie_recommender.matrix.AdjustedCosine` and
+    :data:`movie_recommender.constants.SIMILARITY_BLOCK_SIZE`.
+
+    Only one process is used. The sparse matrix products are handled by
+    compiled code, and splitting the work between processes would mean copying
+    the ratings matrix into each of them.
+
+    :param movies: Movie IDs. Movies to be analyzed. These movies are merged
+        into the ``target_movies`` set.
+    :param users: User IDs. The movies these users have rated are merged into
+        the ``target_movies`` set.
+    :param overwrite: Should already-computed values be re-computed?
+    :param reporter: A function that reports progress to the user. Must accept
+        one argument, a :class:`movie_recommender.progress.Snapshot`. If
+        ``None``, progress isn't reported.
+    :param stats: Should the sufficient statistics for each similarity score
+        be written to the similarityStats table, too? This is a prerequisite
+        for :meth:`movie_recommender.analyze.ii_update.update_ratings`.
+    :param shard: See :meth:`movie_recommender.analyze.ii.analyze_movies`.
+    :param db_path: See :meth:`movie_recommender.analyze.ii.analyze_movies`.
+        Sufficient statistics are always written to the usual database.
+    :param lsh: See :meth:`movie_recommender.analyze.ii.analyze_movies`. Each
+        block of target movies is only scored against the movies which collide
+        with at least one of them, and only colliding pairs are written.
+    :return: Nothing.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
+    if stats:
+        with common.get_db_conn() as conn:
+            init.c_similarity_stats_table(conn)
+    ratings = matrix.load_ratings_matrix()
+    cosine = matrix.load_adjusted_cosine(ratings, MIN_PAIRS_FOR_SIMILARITY)
+    target_movies = numpy.array(
+        sorted(set(movies).union(set(read.rated_movies(users)))),
+        dtype=numpy.int64,
+    )
+    computed = (
+        None if overwrite else ii.load_computed_pairs(ratings.movies, db_path)
+    )
+    buckets = ii_lsh.load_buckets(ratings, lsh)
+
+    with write.changing_dataset(db_path):
+        with progress.Progress(len(target_movies), reporter, 0) as tracker:
+            for start in range(0, len(target_movies), SIMILARITY_BLOCK_SIZE):
+                block = target_movies[start:start + SIMILARITY_BLOCK_SIZE]
+                candidates = tuple(ii.gen_candidates(
+                    ratings.movies,
+                    target_movies,
+                    block,
+                    computed,
+                    shard,
+                    buckets,
+                ))
+                rows = (
+                    None if buckets is None
+                    else ii_lsh.candidate_rows(candidates)
+                )
+                block_stats = tuple(
+                    stat.toarray()
+                    for stat in cosine.stats(ratings.movie_index(block), rows)
+                )
+                scores = matrix.adjusted_cosine(
+                    *block_stats,
+                    MIN_PAIRS_FOR_SIMILARITY,
+                )
+                write.similarities(tuple(gen_block_similarities(
+                    ratings.movies,
+                    candidates,
+                    scores,
+                    rows,
+                )), db_path)
+                if stats:
+                    write.similarity_stats(tuple(gen_block_stats(
+                        ratings.movies,
+                        candidates,
+                        block_stats,
+                        rows,
+                    )))
+                tracker.advance(len(block))
+
+
+def gen_block_similarities(all_movies, candidates, scores, rows=None):
+    """Yield similarities for a block of target movies.
+
+    Pairs of movies are chosen in the same way as in
+    :meth:`movie_recommender.analyze.ii.gen_cs_args`.
+
+    :param all_movies: A sorted numpy array of every movie ID.
+    :param candidates: A sequence of ``(target_movie, candidates)`` tuples, as
+        yielded by :meth:`movie_recommender.analyze.ii.gen_candidates`. One per
+        movie in the block of movies which have been scored.
+    :param scores: A numpy array of similarity scores, as returned by
+        :meth:`movie_recommender.matrix.AdjustedCosine.scores`. The n-th
+        column corresponds to the n-th movie in the block.
+    :param rows: The ``rows`` the scores were computed for, if any. See
+        :func:`movie_recommender.analyze.ii_lsh.candidate_rows`.
+    :return: A generator that yields
+        :class:`movie_recommender.db.common.Similarity` objects.
+    """
+    for j, (target_movie, indices) in enumerate(candidates):
+        positions = _positions(indices, rows)
+        for movie, score in zip(
+                all_movies[indices].tolist(),
+                scores[positions, j].tolist()):
+            yield common.Similarity(movie, target_movie, score)
+
+
+def gen_block_stats(all_movies, candidates, block_stats, rows=None):
+    """Yield sufficient statistics for a block of target movies.
+
+    Pairs of movies are chosen in the same way as in
+    :meth:`movie_recommender.analyze.ii.gen_cs_args`.
+
+    :param all_movies: A sorted numpy array of every movie ID.
+    :param candidates: See :func:`gen_block_similarities`.
+    :param block_stats: A tuple of dense numpy arrays, as returned by
+        :meth:`movie_recommender.matrix.AdjustedCosine.stats`. The n-th column
+        of each array corresponds to the n-th movie in the block.
+    :param rows: See :func:`gen_block_similarities`.
+    :return: A generator that yields
+        :class:`movie_recommender.db.common.SimilarityStats` objects.
+    """
+    for j, (target_movie, indices) in enumerate(candidates):
+        positions = _positions(indices, rows)
+        yield from gen_column_stats(
+            all_movies[indices].tolist(),
+            target_movie,
+            tuple(stat[positions, j] for stat in block_stats),
+        )
+
+
+def gen_column_stats(movies, target_movie, column_stats):
+    """Yield sufficient statistics for pairs of one target movie and others.
+
+    :param movies: A list of movie IDs. The movies paired with
+        ``target_movie``.
+    :param target_movie: A movie ID.
+    :param column_stats: A tuple of numpy arrays, one per statistic returned by
+        :meth:`movie_recommender.matrix.AdjustedCosine.stats`. The n-th value
+        of each array is for the n-th movie in ``movies``.
+    :return: A generator that yields
+        :class:`movie_recommender.db.common.SimilarityStats` objects.
+    """
+    for movie, *stats in zip(
+            movies,
+            *(stat.tolist() for stat in column_stats)):
+        yield _similarity_stats(movie, target_movie, *stats)
+
+
+def _positions(indices, rows):
+    """Find the rows of a block's scores for some indices of movies.
+
+    See :func:`gen_block_similarities`.
+    """
+    if rows is None:
+        return indices
+    return numpy.searchsorted(rows, indices)
+
+
+def _similarity_stats(  # pylint:disable=too-many-arguments
+        movie,
+        target_movie,
+        count_,
+        products,
+        squares,
+        target_squares):
+    """Make a :class:`movie_recommender.db.common.SimilarityStats` object.
+
+    Movie A is the movie with the lower ID.
+    """
+    if movie < target_movie:
+        return common.SimilarityStats(
+            movie,
+            target_movie,
+            int(count_),
+            products,
+            squares,
+            target_squares,
+        )
+    return common.SimilarityStats(
+        target_movie,
+        movie,
+        int(count_),
+        products,
+        target_squares,
+        squares,
+    )
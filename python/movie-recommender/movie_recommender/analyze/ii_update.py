@@ -0,0 +1,276 @@
+# coding=utf-8
+"""Tools for updating item-item similarity scores as ratings arrive.
+
+See :func:`update_ratings`.
+"""
+import math
+
+import numpy
+
+from movie_recommender import exceptions, matrix
+from movie_recommender.analyze import ii_matrix
+from movie_recommender.constants import (
+    AVG_RATING_TOLERANCE,
+    JOBS_PER_PROCESS_PER_BATCH,
+    MIN_PAIRS_FOR_SIMILARITY,
+    SIMILARITY_BLOCK_SIZE,
+)
+from movie_recommender.db import common, init, read, write
+
+
+def update_ratings(ratings):  # pylint:disable=too-many-locals
+    """Fold new or changed ratings into the database and similarity scores.
+
+    Each similarity score is a function of a handful of sums over the users who
+    rated both movies. If the sums are known, then a user's contribution to
+    them may be subtracted, and their new contribution may be added. This
+    function does just that, and then re-computes the affected similarity
+    scores. Only similarity scores whose sums are in the similarityStats table
+    are refreshed. See
+    :meth:`movie_recommender.analyze.ii_matrix.analyze_movies_matrix`.
+
+    When a user adds or changes a rating, their average rating changes, too.
+    Rather than re-computing every sum involving any movie that user has
+    rated, this function tolerates a bounded error. See
+    :data:`movie_recommender.constants.AVG_RATING_TOLERANCE`.
+
+    The following aren't updated, and should be re-computed if needed:
+
+    * Similarity scores involving movies that weren't yet in the
+      similarityStats table, such as new movies.
+    * The neighbor model. See
+      :meth:`movie_recommender.analyze.ii.analyze_neighbors`.
+
+    Everything is written in one transaction.
+
+    :param ratings: An iterable of ``(user_id, movie_id, rating, timestamp)``
+        tuples. If a user rates a movie several times, the last rating wins.
+    :return: The number of similarity scores refreshed.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If a user
+        has existing ratings, but their average rating hasn't been
+        pre-computed.
+    :raise movie_recommender.exceptions.MissingSimilarityStatsError: If some
+        similarity scores are affected, but none of their sums are in the
+        similarityStats table. Nothing is written.
+    """
+    batch = {}
+    for user_id, movie_id, rating, timestamp in ratings:
+        batch[(user_id, movie_id)] = (rating, timestamp)
+    users = sorted({user_id for user_id, _ in batch})
+
+    # Each user's ratings before and after this update.
+    old_ratings = {user_id: {} for user_id in users}
+    for start in range(0, len(users), JOBS_PER_PROCESS_PER_BATCH):
+        for user_id, movie_id, rating in read.user_ratings(
+                users[start:start + JOBS_PER_PROCESS_PER_BATCH]):
+            old_ratings[user_id][movie_id] = rating
+    new_ratings = {user_id: dict(old_ratings[user_id]) for user_id in users}
+    batch_movies = {user_id: set() for user_id in users}
+    for (user_id, movie_id), (rating, _) in batch.items():
+        new_ratings[user_id][movie_id] = rating
+        batch_movies[user_id].add(movie_id)
+
+    # The average each user's ratings are centred on, before and after this
+    # update, and the movies whose centred ratings change.
+    old_means = {}
+    new_means = {}
+    changed = set()
+    for user_id in users:
+        new_mean = math.fsum(new_ratings[user_id].values()) / len(
+            new_ratings[user_id]
+        )
+        if old_ratings[user_id]:
+            old_means[user_id] = read.avg_rating(user_id)
+            if abs(new_mean - old_means[user_id]) <= AVG_RATING_TOLERANCE:
+                new_mean = old_means[user_id]
+        new_means[user_id] = new_mean
+        if new_mean == old_means.get(user_id):
+            changed.update(batch_movies[user_id])
+        else:
+            changed.update(new_ratings[user_id])
+
+    all_movies = set()
+    for user_ratings in new_ratings.values():
+        all_movies.update(user_ratings)
+    deltas = tuple(gen_stats_deltas(
+        _ratings_matrix(old_ratings, all_movies),
+        old_means,
+        _ratings_matrix(new_ratings, all_movies),
+        new_means,
+        changed,
+    ))
+
+    with common.get_db_conn() as conn:
+        init.c_similarity_stats_table(conn)
+        init.c_metadata_table(conn)
+        with conn:
+            write.bump_dataset_version(conn)
+            conn.executemany(
+                """
+                INSERT INTO ratings VALUES (?, ?, ?, ?)
+                ON CONFLICT (userId, movieId) DO UPDATE SET
+                    rating=excluded.rating,
+                    timestamp=excluded.timestamp
+                """,
+                (key + value for key, value in batch.items()),
+            )
+            conn.executemany(
+                """
+                INSERT INTO avgRatings VALUES (?, ?)
+                ON CONFLICT (userId) DO UPDATE SET avgRating=excluded.avgRating
+                """,
+                (
+                    (user_id, new_mean)
+                    for user_id, new_mean in new_means.items()
+                    if new_mean != old_means.get(user_id)
+                ),
+            )
+            conn.execute(
+                """
+                CREATE TEMP TABLE similarityDeltas (
+                    movieAId INTEGER,
+                    movieBId INTEGER,
+                    count INTEGER,
+                    sumProducts REAL,
+                    sumSquaresA REAL,
+                    sumSquaresB REAL,
+                    PRIMARY KEY (movieAId, movieBId)
+                )
+                """
+            )
+            conn.executemany(
+                'INSERT INTO similarityDeltas VALUES (?, ?, ?, ?, ?, ?)',
+                deltas,
+            )
+            # UPDATE FROM was added in SQLite 3.33.0.
+            conn.execute(
+                """
+                UPDATE similarityStats SET
+                    count=similarityStats.count + deltas.count,
+                    sumProducts=similarityStats.sumProducts
+                        + deltas.sumProducts,
+                    sumSquaresA=similarityStats.sumSquaresA
+                        + deltas.sumSquaresA,
+                    sumSquaresB=similarityStats.sumSquaresB
+                        + deltas.sumSquaresB
+                FROM similarityDeltas AS deltas
+                WHERE similarityStats.movieAId = deltas.movieAId
+                    AND similarityStats.movieBId = deltas.movieBId
+                """
+            )
+            refreshed = conn.execute(
+                """
+                SELECT movieAId, movieBId, similarityStats.count,
+                    similarityStats.sumProducts,
+                    similarityStats.sumSquaresA,
+                    similarityStats.sumSquaresB
+                FROM similarityStats
+                JOIN similarityDeltas USING (movieAId, movieBId)
+                """
+            ).fetchall()
+            conn.execute('DROP TABLE similarityDeltas')
+            if deltas and not refreshed:
+                # Raising rolls back the transaction.
+                raise exceptions.MissingSimilarityStatsError(
+                    'No similarity scores could be updated, as their '
+                    'sufficient statistics are missing. Analyze movies with '
+                    '"mr-analyze ii --engine matrix --stats" first.'
+                )
+            if refreshed:
+                columns = numpy.array(refreshed, dtype=numpy.float64).T
+                scores = matrix.adjusted_cosine(
+                    *columns[2:],
+                    MIN_PAIRS_FOR_SIMILARITY,
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO similarities VALUES (?, ?, ?)
+                    ON CONFLICT (movieAId, movieBId) DO UPDATE
+                    SET similarity=excluded.similarity
+                    """,
+                    (
+                        (row[0], row[1], score)
+                        for row, score in zip(refreshed, scores.tolist())
+                    ),
+                )
+    return len(refreshed)
+
+
+def gen_stats_deltas(  # pylint:disable=too-many-locals
+        old_ratings,
+        old_means,
+        new_ratings,
+        new_means,
+        changed):
+    """Yield the change in sufficient statistics caused by new ratings.
+
+    :param old_ratings: A :class:`movie_recommender.matrix.RatingsMatrix`. The
+        ratings of every updated user, before the update.
+    :param old_means: A dict mapping user IDs to the averages their ratings
+        were centred on, before the update.
+    :param new_ratings: A :class:`movie_recommender.matrix.RatingsMatrix`. The
+        ratings of every updated user, after the update. Must have the same
+        movies as ``old_ratings``.
+    :param new_means: A dict mapping user IDs to the averages their ratings
+        are centred on, after the update.
+    :param changed: An iterable of movie IDs. The movies for which some user's
+        centred rating has changed. Pairs of movies where neither movie has
+        changed are unaffected by the update.
+    :return: A generator that yields
+        :class:`movie_recommender.db.common.SimilarityStats` objects, where
+        each value is the amount by which the statistic has changed.
+    """
+    cosines = tuple(
+        matrix.AdjustedCosine(
+            ratings.centered(numpy.array(
+                [means[user_id] for user_id in ratings.users.tolist()],
+                dtype=numpy.float64,
+            )),
+            ratings.rated(),
+            MIN_PAIRS_FOR_SIMILARITY,
+        )
+        for ratings, means in ((old_ratings, old_means),
+                               (new_ratings, new_means))
+    )
+    all_movies = new_ratings.movies
+    changed = numpy.array(sorted(changed), dtype=numpy.int64)
+    is_changed = numpy.isin(all_movies, changed)
+    for start in range(0, len(changed), SIMILARITY_BLOCK_SIZE):
+        block = changed[start:start + SIMILARITY_BLOCK_SIZE]
+        columns = new_ratings.movie_index(block)
+        old_stats, new_stats = (
+            tuple(stat.toarray() for stat in cosine.stats(columns))
+            for cosine in cosines
+        )
+        touched = (old_stats[0] + new_stats[0]) > 0
+        deltas = tuple(
+            new_stat - old_stat
+            for old_stat, new_stat in zip(old_stats, new_stats)
+        )
+        for j, target_movie in enumerate(block.tolist()):
+            # Pairs of changed movies appear in two columns. Keep one.
+            keep = touched[:, j] & (all_movies != target_movie)
+            keep &= ~is_changed | (all_movies < target_movie)
+            indices = numpy.flatnonzero(keep)
+            yield from ii_matrix.gen_column_stats(
+                all_movies[indices].tolist(),
+                target_movie,
+                tuple(delta[indices, j] for delta in deltas),
+            )
+
+
+def _ratings_matrix(ratings, all_movies):
+    """Make a ratings matrix from a dict of dicts of ratings.
+
+    :param ratings: A dict in the form ``{user_id: {movie_id: rating}}``.
+    :param all_movies: An iterable of movie IDs. Each gets a column.
+    :return: A :class:`movie_recommender.matrix.RatingsMatrix`.
+    """
+    triples = tuple(
+        (user_id, movie_id, rating)
+        for user_id, user_ratings in ratings.items()
+        for movie_id, rating in user_ratings.items()
+    )
+    if not triples:
+        return matrix.RatingsMatrix((), (), (), all_movies)
+    return matrix.RatingsMatrix(*zip(*triples), all_movies)
@@ -1,33 +1,58 @@
 # coding=utf-8
 """Tools for analyses needed by the machine learning prediction algorithm."""
-import multiprocessing
 from typing import Dict, Mapping
 
+import numpy
+
 from movie_recommender import exceptions
-from movie_recommender.constants import GENRES
-from movie_recommender.db import common, read
+from movie_recommender.constants import (
+    MAX_RATING,
+    MIN_RATING,
+    PREDICTOR_NAMES,
+)
+from movie_recommender.analyze import schedule
+from movie_recommender.db import count, read, store, write
 from movie_recommender.predict import ml
 
 
-def analyze_users(user_ids, overwrite, jobs):
+def analyze_users(  # pylint:disable=too-many-arguments
+        user_ids,
+        overwrite,
+        jobs,
+        in_memory=False,
+        reporter=None):
     """Analyze users, to find out which predictor works best for them.
 
+    The time it takes to analyze a user depends on the number of movies
+    they've rated, so users are analyzed in order of the number of movies
+    they've rated, most first. See :mod:`movie_recommender.analyze.schedule`.
+    Each user's predictor is written to the database as soon as it's chosen.
+
     :param user_ids: An iterable of user IDs. The users for which analyses are
         being performed.
     :param overwrite: If a user has already been analyzed, should the analysis
         be overwritten?
     :param jobs: The number of processes to spawn. If none, spawn one per CPU.
-    :returns: Nothing.
+    :param in_memory: Should each process answer reads from an in-memory
+        store? See :mod:`movie_recommender.db.store`.
+    :param reporter: A function that reports progress to the user. Must accept
+        one argument, a :class:`movie_recommender.progress.Snapshot`. If
+        ``None``, progress isn't reported.
+    :returns: A :class:`movie_recommender.analyze.schedule.Report`, whose
+        tasks are user IDs, and whose costs are numbers of ratings.
     """
-    # The amount of time it takes to analyze a user depends on the number of
-    # movies they've rated. If analysis of a user who has rated many movies
-    # kicks off late in execution, then that one analysis will greatly lengthen
-    # execution time. Anecdotally, this problem can be seen with data sets as
-    # small as 64 users. An improvement would be to sort (user_id, overwrite)
-    # tuples by the number of movies each user has rated.
-    pfu_args = tuple((user_id, overwrite) for user_id in user_ids)
-    with multiprocessing.Pool(jobs) as pool:
-        pool.starmap(analyze_user, pfu_args)
+    user_ids = set(user_ids)
+    if not overwrite:
+        user_ids.difference_update(read.users_in_predictors())
+    return schedule.run(
+        choose_predictor,
+        user_ids,
+        count.user_ratings(),
+        _write_predictors,
+        jobs,
+        store.load if in_memory else None,
+        reporter,
+    )
 
 
 def analyze_user(user_id, overwrite):
@@ -39,81 +64,155 @@ def analyze_user(user_id, overwrite):
         be overwritten?
     :returns: Nothing.
     """
-    with common.get_db_conn() as conn:
-        # What if a user already has a predictor?
-        if not overwrite and conn.execute(
-                'SELECT * FROM predictors WHERE userId=?',
-                (user_id,)
-        ).fetchall():
+    # What if a user already has a predictor?
+    if not overwrite:
+        try:
+            read.predictor_name(user_id)
             return
+        except exceptions.NoPersonalizedPredictorError:
+            pass
+    write.predictor(user_id, choose_predictor(user_id))
 
-        # Create a personalized predictor for this user. SQLite added
-        # support for UPSERT in version 3.24.0, which was released on
-        # 2018-06-24. See: https://www.sqlite.org/lang_UPSERT.html
-        sses = calc_sse(user_id)
-        predictor = min_sse(sses)
-        with conn:
-            conn.execute(
-                """
-                INSERT INTO predictors VALUES (?, ?)
-                ON CONFLICT (userId) DO UPDATE SET predictor=?
-                """,
-                (user_id, predictor, predictor)
-            )
+
+def choose_predictor(user_id):
+    """Choose the predictor which works best for a user.
+
+    :param user_id: A user ID.
+    :return: A predictor name. See :func:`calc_sse` and :func:`min_sse`.
+    """
+    return min_sse(calc_sse(user_id))
 
 
 def calc_sse(user_id) -> Mapping[str, float]:
     """Calculate the SSE for each type of predictor for the given user.
 
-    .. WARNING:: This function may take a long time to execute.
+    For each movie the user has rated, a predictor of each type is fitted to
+    every *other* movie the user has rated, and is asked to predict the user's
+    rating for the held-out movie. The squared errors are summed per type of
+    predictor. See :func:`movie_recommender.predict.ml.make_year_predictor`
+    and :func:`movie_recommender.predict.ml.make_genre_predictor`.
+
+    Rather than fitting a predictor per held-out movie, the user's ratings are
+    read once, with :func:`movie_recommender.predict.ml.rated_movie_features`,
+    and every held-out prediction is computed at once from sums
+    over all of the user's ratings. See :func:`loo_predictions`.
 
     :param user_id: A user ID.
     :return: A dict in the form ``{predictor_name: sum_of_squared_errors}``.
     """
     # predictor name → sum of squared errors
     sses: Dict[str, float] = {}
-
-    for movie_id in read.rated_movies((user_id,)):
-
-        # Make a bunch of predictors, like year, genre:comedy, and
-        # genre:horror. Let them be based on all movies the current user has
-        # rated except the control.
-        predictors = {'year': ml.make_year_predictor(user_id, movie_id)}
-        for genre in GENRES:
-            predictors[f'genre:{genre}'] = (
-                ml.make_genre_predictor(genre, user_id, movie_id)
-            )
-
-        # See how well each predictor predicts the control. If we're using a
-        # year-based predictor, then two errors can occur:
-        #
-        # * The movie for which a prediction is being made doesn't have a
-        #   year.
-        # * The movie for which a prediction is being made does have a
-        #   year, but all of the _other_ movies the user has rated don't
-        #   have a year.
-        #
-        # In either case, we respond by not calculating an SSE for the
-        # predictor.
-        #
-        # It is possible to encounter this problem for every combination of
-        # (control movie, other movies) for a user. In this case, we set the
-        # SSE for that type of predictor to "infinite." Other areas of the code
-        # base must be prepared to find out that a predictor has an infinite
-        # SSE.
-        for pred_name, pred in predictors.items():
-            try:
-                predicted_rating = pred(movie_id)
-            except (exceptions.NoMovieYearError, exceptions.EmptyGraphError):
-                continue
-            actual_rating = read.rating(user_id, movie_id)
-            sses.setdefault(pred_name, 0)
-            sses[pred_name] += (predicted_rating - actual_rating) ** 2
+    features, present, ratings = ml.rated_movie_features(user_id)
+
+    # If we're using a year-based predictor, then two errors can occur:
+    #
+    # * The movie for which a prediction is being made doesn't have a year.
+    # * The movie for which a prediction is being made does have a year, but
+    #   all of the _other_ movies the user has rated don't have a year.
+    #
+    # In either case, we respond by not calculating an SSE for the predictor.
+    #
+    # It is possible to encounter this problem for every movie the user has
+    # rated. In this case, we set the SSE for that type of predictor to
+    # "infinite." Other areas of the code base must be prepared to find out
+    # that a predictor has an infinite SSE.
+    has_year = present[:, 0]
+    if has_year.sum() > 1:
+        sses['year'] = _sse(
+            loo_predictions(features[has_year, :1], ratings[has_year]),
+            ratings[has_year],
+        )[0]
+
+    # A genre-based predictor can't be fitted if the user has rated no other
+    # movies. Genres are visited in a fixed order, so that predictors with
+    # equal SSEs are chosen between in the same way by every process. See
+    # :func:`min_sse`.
+    if len(ratings) > 1:
+        for predictor_name, sse in zip(PREDICTOR_NAMES[1:], _sse(
+                loo_predictions(features[:, 1:], ratings),
+                ratings)):
+            sses[predictor_name] = sse
 
     sses.setdefault('year', float('inf'))
     return sses
 
 
+def loo_predictions(x_values, y_values):
+    """Make leave-one-out predictions with univariate least-squares lines.
+
+    For each column of ``x_values``, and for each point ``i``, fit a line of
+    best fit to every point except ``i``, and evaluate it at ``i``'s x value.
+    This is what :class:`movie_recommender.graph.Graph` would do, if a graph
+    were created for each point. If the other points' x values are all equal,
+    their line of best fit is vertical, and the average of their y values is
+    used instead.
+
+    Each fit is computed in O(1), by subtracting point ``i`` from sums over all
+    points. The x values are centred on their mean first, which doesn't change
+    any line's predictions, but keeps the sums small enough that little
+    precision is lost to cancellation.
+
+    :param x_values: A numpy array of x values, with one row per point and one
+        column per predictor. At least two rows are required.
+    :param y_values: A numpy array of y values, with one value per point.
+    :return: A numpy array of predicted y values, shaped like ``x_values``.
+    """
+    others = len(y_values) - 1
+    x_values = x_values - x_values.mean(axis=0)
+    y_values = y_values.reshape(-1, 1)
+    mean_x = (x_values.sum(axis=0) - x_values) / others
+    mean_y = (y_values.sum() - y_values) / others
+    products = x_values * y_values
+    squares = x_values ** 2
+    numerator = products.sum(axis=0) - products - others * mean_x * mean_y
+    denominator = squares.sum(axis=0) - squares - others * mean_x ** 2
+    slope = numpy.zeros(x_values.shape)
+    numpy.divide(
+        numerator,
+        denominator,
+        out=slope,
+        where=~_loo_vertical(x_values),
+    )
+    return mean_y + slope * (x_values - mean_x)
+
+
+def _loo_vertical(x_values):
+    """Tell which leave-one-out lines of best fit are vertical.
+
+    This is decided exactly, rather than by comparing a denominator to zero.
+    See :func:`loo_predictions`.
+
+    :param x_values: A numpy array of x values, with one row per point and one
+        column per predictor.
+    :return: A boolean numpy array, shaped like ``x_values``. True where the
+        other points' x values are all equal.
+    """
+    vertical = numpy.zeros(x_values.shape, dtype=bool)
+    for j in range(x_values.shape[1]):
+        _, inverse, counts = numpy.unique(
+            x_values[:, j],
+            return_inverse=True,
+            return_counts=True,
+        )
+        if len(counts) == 1:
+            vertical[:, j] = True
+        elif len(counts) == 2:
+            vertical[:, j] = counts[inverse] == 1
+    return vertical
+
+
+def _sse(predictions, y_values):
+    """Sum the squared errors of clamped predictions, per column.
+
+    See :func:`movie_recommender.predict.ml.clamp_rating`.
+
+    :return: A list of floats, one per column.
+    """
+    predictions = numpy.clip(predictions, MIN_RATING, MAX_RATING)
+    errors = predictions - y_values.reshape(-1, 1)
+    return (errors ** 2).sum(axis=0).tolist()
+
+
 def min_sse(sses):
     """Select the best predictor from the given choices.
 
@@ -127,3 +226,13 @@ def min_sse(sses):
         if sse < best_sse:
             best_pred_name, best_sse = pred_name, sse
     return best_pred_name
+
+
+def _write_predictors(results):
+    """Write the predictors chosen by :func:`choose_predictor`.
+
+    :param results: An iterable of ``(user_id, predictor_name)`` pairs.
+    :return: Nothing.
+    """
+    for user_id, predictor_name in results:
+        write.predictor(user_id, predictor_name)
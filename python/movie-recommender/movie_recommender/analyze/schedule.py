@@ -0,0 +1,138 @@
+# coding=utf-8
+"""Spread tasks of uneven cost across a pool of processes.
+
+The time it takes to analyze a user depends on the number of movies they've
+rated. If a costly task is dispatched late in a run, then every other process
+sits idle while it finishes, and that one task greatly lengthens the run.
+:func:`run` avoids this by estimating each task's cost up front, and
+dispatching the costliest tasks first. Cheap tasks then fill in the gaps at the
+end of the run.
+
+Results are streamed back to the parent process as they complete, in whatever
+order they complete in, and are handed to a consumer function, which typically
+writes them to the database. Each task is timed, and :func:`run` returns those
+timings, along with the tail latency of the whole run.
+"""
+import functools
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+
+from movie_recommender import profiling, progress
+
+
+Report = namedtuple('Report', ('timings', 'seconds', 'tail_seconds'))
+"""The outcome of :func:`run`.
+
+``timings`` is a tuple of :class:`Timing` objects, in the order in which tasks
+completed. ``seconds`` is the wall-clock time the whole run took.
+``tail_seconds`` is the time between the first process running out of tasks
+and the end of the run. It is the part of the run in which some processes were
+idle, waiting on the slowest tasks.
+"""
+
+Timing = namedtuple('Timing', ('task', 'cost', 'seconds'))
+"""The estimated cost of a task, and the number of seconds it took."""
+
+
+def longest_first(tasks, costs):
+    """Sort tasks by their estimated cost, costliest first.
+
+    :param tasks: An iterable of tasks.
+    :param costs: A mapping from tasks to their estimated costs. Tasks missing
+        from this mapping have a cost of 0.
+    :return: A list of tasks. Tasks with equal costs keep their order.
+    """
+    return sorted(tasks, key=lambda task: costs.get(task, 0), reverse=True)
+
+
+def run(  # pylint:disable=too-many-arguments,too-many-locals
+        func,
+        tasks,
+        costs,
+        consume,
+        jobs=None,
+        initializer=None,
+        reporter=None,
+        batch_size=1,
+        chunksize=1):
+    """Call a function on tasks in a pool of processes, costliest first.
+
+    :param func: A function accepting one task. It's called in a worker
+        process, so it must be picklable, e.g. defined at module level.
+    :param tasks: An iterable of tasks. Each must be hashable and picklable.
+    :param costs: A mapping from tasks to their estimated costs, such as the
+        number of ratings each user has made. Only the relative size of costs
+        matters. See :func:`longest_first`.
+    :param consume: A function which is called in this process, and accepts a
+        tuple of ``(task, result)`` pairs, where ``result`` is the value
+        ``func`` returned for ``task``. It's called as soon as ``batch_size``
+        results have arrived, and once more for any left over.
+    :param jobs: The number of processes to spawn. If ``None``, spawn one per
+        CPU.
+    :param initializer: A function to call in each worker process as it
+        starts, or ``None``.
+    :param reporter: A function that reports progress to the user. Must accept
+        one argument, a :class:`movie_recommender.progress.Snapshot`. Progress
+        is measured in the estimated cost of the completed tasks, and each
+        worker process reports its busy time. If ``None``, progress isn't
+        reported.
+    :param batch_size: The number of results to hand to ``consume`` at once.
+    :param chunksize: The number of tasks to send to a worker process at once.
+        Larger values reduce overhead when tasks are cheap, but make the order
+        in which tasks run coarser.
+    :return: A :class:`Report`. If profiling is enabled, the run is recorded
+        as a pool named after ``func``, and calls to ``consume`` as a stage.
+        See :mod:`movie_recommender.profiling`.
+    """
+    tasks = longest_first(tasks, costs)
+    jobs = os.cpu_count() if jobs is None else jobs
+    total_cost = sum(costs.get(task, 0) for task in tasks)
+
+    start = time.perf_counter()
+    timings = []
+    completed_at = []
+    batch = []
+    consume_stage = f'consume {func.__name__} results'
+    with progress.Progress(total_cost, reporter, jobs) as progress_:
+        with multiprocessing.Pool(jobs, initializer=initializer) as pool:
+            for task, result, seconds in profiling.results(pool.imap_unordered(
+                    profiling.task(
+                        functools.partial(_timed_call, func),
+                        func.__name__,
+                    ),
+                    tasks,
+                    chunksize=chunksize)):
+                completed_at.append(time.perf_counter() - start)
+                timings.append(Timing(task, costs.get(task, 0), seconds))
+                progress_.advance(timings[-1].cost)
+                batch.append((task, result))
+                if len(batch) >= batch_size:
+                    with profiling.stage(consume_stage):
+                        consume(tuple(batch))
+                    batch.clear()
+        if batch:
+            with profiling.stage(consume_stage):
+                consume(tuple(batch))
+    seconds = time.perf_counter() - start
+
+    # Once all but (jobs - 1) tasks have completed, the process which
+    # completed the last of them has nothing left to do.
+    if completed_at:
+        tail_seconds = seconds - completed_at[max(len(tasks) - jobs, 0)]
+    else:
+        tail_seconds = 0.0
+    return Report(tuple(timings), seconds, tail_seconds)
+
+
+def _timed_call(func, task):
+    """Call ``func(task)``, time it, and count the time as busy.
+
+    :return: A ``(task, result, seconds)`` tuple.
+    """
+    start = time.perf_counter()
+    result = func(task)
+    seconds = time.perf_counter() - start
+    progress.add_busy(seconds)
+    return task, result, seconds
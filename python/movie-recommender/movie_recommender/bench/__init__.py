@@ -0,0 +1,10 @@
+# coding=utf-8
+"""Tools for measuring how Movie Recommender's pipeline scales.
+
+The tests use the tiny "fixture" dataset, which says nothing about speed. This
+package generates synthetic datasets of any size
+(:mod:`movie_recommender.bench.synthetic`), times each stage of the pipeline
+against them (:mod:`movie_recommender.bench.scenarios`), and saves and
+compares the timings (:mod:`movie_recommender.bench.results`). See
+``mr-bench --help``.
+"""
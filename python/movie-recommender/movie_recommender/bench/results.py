@@ -0,0 +1,121 @@
+# coding=utf-8
+"""Save benchmark results, and compare them between commits.
+
+Results are saved as JSON, so they can be kept alongside the code they were
+measured against, and compared later. Each scenario is summarized by the
+fastest of its runs. Noise from other processes only ever slows a run down, so
+the fastest run is the best estimate of what a command costs.
+"""
+import json
+import os
+import platform
+import time
+from collections import namedtuple
+
+from movie_recommender.constants import BENCH_REGRESSION_THRESHOLD
+
+
+Comparison = namedtuple('Comparison', (
+    'scenario',
+    'base_seconds',
+    'new_seconds',
+    'ratio',
+    'regressed',
+))
+"""The timings of one scenario in two sets of results.
+
+``ratio`` is ``new_seconds / base_seconds``. ``regressed`` tells whether the
+ratio exceeds ``1 + threshold``. See :func:`compare`.
+"""
+
+FORMAT_VERSION = 1
+"""The version of the results format written by :func:`make`."""
+
+
+def compare(base, new, threshold=BENCH_REGRESSION_THRESHOLD):
+    """Compare two sets of results.
+
+    :param base: Results, as returned by :func:`make`, to compare against.
+    :param new: Results, as returned by :func:`make`.
+    :param threshold: How much slower a scenario may get, as a fraction of its
+        base time, before it's counted as a regression.
+    :return: A tuple of :class:`Comparison` objects, one per scenario present
+        in both sets of results, in the order they appear in ``new``.
+    :raise ValueError: If the results were measured against different
+        datasets, or are in an unknown format.
+    """
+    for results in (base, new):
+        if results.get('format_version') != FORMAT_VERSION:
+            raise ValueError(
+                f'Unknown results format: {results.get("format_version")}'
+            )
+    if base['dataset'] != new['dataset']:
+        raise ValueError(
+            'Results were measured against different datasets: '
+            f'{base["dataset"]} and {new["dataset"]}'
+        )
+    comparisons = []
+    for scenario, new_seconds in new['scenarios'].items():
+        if scenario not in base['scenarios']:
+            continue
+        base_seconds = base['scenarios'][scenario]['seconds']
+        new_seconds = new_seconds['seconds']
+        ratio = new_seconds / base_seconds if base_seconds else 1.0
+        comparisons.append(Comparison(
+            scenario,
+            base_seconds,
+            new_seconds,
+            ratio,
+            ratio > 1 + threshold,
+        ))
+    return tuple(comparisons)
+
+
+def load(path):
+    """Load results from a file.
+
+    :param path: The path to a file written by :func:`save`.
+    :return: A dict. See :func:`make`.
+    """
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def make(dataset, timings, jobs=None):
+    """Summarize timings.
+
+    :param dataset: A dict describing the dataset the timings were measured
+        against, such as ``{'users': 10, 'movies': 20, 'ratings': 100, 'seed':
+        0}``. Only results measured against equal datasets may be compared.
+    :param timings: A dict mapping scenario names to lists of timings, in
+        seconds, as returned by :func:`movie_recommender.bench.scenarios.run`.
+    :param jobs: The number of processes each command could spawn.
+    :return: A dict, which may be serialized as JSON.
+    """
+    return {
+        'format_version': FORMAT_VERSION,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'machine': {
+            'cpus': os.cpu_count(),
+            'jobs': os.cpu_count() if jobs is None else jobs,
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+        },
+        'dataset': dataset,
+        'scenarios': {
+            scenario: {'seconds': min(runs), 'runs': runs}
+            for scenario, runs in timings.items()
+        },
+    }
+
+
+def save(results, path):
+    """Save results to a file.
+
+    :param results: A dict. See :func:`make`.
+    :param path: The path to the file to write.
+    :return: Nothing.
+    """
+    with open(path, 'w') as handle:
+        json.dump(results, handle, indent=2, sort_keys=True)
+        handle.write('\n')
@@ -0,0 +1,143 @@
+# coding=utf-8
+"""Time each stage of the pipeline against a synthetic dataset.
+
+Each scenario runs one of Movie Recommender's commands, exactly as a user
+would, so the times include interpreter start-up and database access. Commands
+run in a scratch data directory, so the user's own database is never touched.
+Scenarios run in the order of :data:`SCENARIOS`, as later stages need the
+output of earlier ones. Each scenario may be run several times, so that noise
+can be told apart from change.
+"""
+import csv
+import os
+import subprocess
+import tempfile
+import time
+from collections import namedtuple
+
+from movie_recommender.bench import synthetic
+from movie_recommender.constants import XDG_RESOURCE, YEAR_MATCHER
+
+
+Scenario = namedtuple('Scenario', ('name', 'args'))
+"""A command to time.
+
+``args`` is a tuple of arguments. They may include the placeholders
+``{jobs}``, ``{user}`` and ``{movie}``. ``{user}`` is user 1, and ``{movie}``
+is the first movie with a year in its title, so that any predictor can predict
+a rating for it. See :func:`run`.
+"""
+
+SCENARIOS = (
+    Scenario('db-create', (
+        'mr-db', 'create', synthetic.NAME,
+        '--overwrite',
+        '--fast',
+        '--jobs', '{jobs}',
+    )),
+    Scenario('analyze-ii', (
+        'mr-analyze', 'ii',
+        '--overwrite',
+        '--engine', 'matrix',
+        '--avg-engine', 'scan',
+        '--jobs', '{jobs}',
+        '--no-progress',
+    )),
+    Scenario('analyze-ml', (
+        'mr-analyze', 'ml',
+        '--overwrite',
+        '--in-memory',
+        '--jobs', '{jobs}',
+        '--no-progress',
+    )),
+    Scenario('predict-ii', ('mr-predict', 'ii', '{user}', '{movie}')),
+    Scenario('predict-ml', ('mr-predict', 'ml', '{user}', '{movie}')),
+    Scenario('recommend-ii', (
+        'mr-recommend', 'ii', '{user}',
+        '--engine', 'batch',
+        '--no-cache',
+        '--no-progress',
+    )),
+    Scenario('recommend-ml', ('mr-recommend', 'ml', '{user}', '--no-cache')),
+)
+"""The scenarios which may be run, in the order they must be run in."""
+
+
+def run(  # pylint:disable=too-many-arguments
+        users,
+        movies,
+        ratings,
+        seed=0,
+        names=None,
+        repeat=3,
+        jobs=None):
+    """Generate a synthetic dataset, and time scenarios against it.
+
+    :param users: See :func:`movie_recommender.bench.synthetic.generate`.
+    :param movies: See :func:`movie_recommender.bench.synthetic.generate`.
+    :param ratings: See :func:`movie_recommender.bench.synthetic.generate`.
+    :param seed: See :func:`movie_recommender.bench.synthetic.generate`.
+    :param names: The names of the scenarios to run, or ``None`` to run all of
+        them. Scenarios that these depend on aren't run, so they should
+        usually include "db-create".
+    :param repeat: The number of times to run each scenario.
+    :param jobs: The number of processes each command may spawn. If ``None``,
+        one per CPU.
+    :return: A dict mapping the names of the scenarios run to lists of
+        timings, in seconds.
+    :raise subprocess.CalledProcessError: If a command fails.
+    """
+    timings = {}
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        env = dict(
+            os.environ,
+            XDG_CACHE_HOME=os.path.join(scratch_dir, 'cache'),
+            XDG_DATA_HOME=os.path.join(scratch_dir, 'data'),
+        )
+        dataset_dir = os.path.join(
+            scratch_dir,
+            'data',
+            XDG_RESOURCE,
+            synthetic.NAME,
+        )
+        synthetic.generate(dataset_dir, users, movies, ratings, seed)
+        placeholders = {
+            'jobs': os.cpu_count() if jobs is None else jobs,
+            'movie': _movie_with_year(dataset_dir),
+            'user': 1,
+        }
+        for scenario in SCENARIOS:
+            if names is not None and scenario.name not in names:
+                continue
+            args = tuple(arg.format(**placeholders) for arg in scenario.args)
+            timings[scenario.name] = [
+                _time(args, env) for _ in range(repeat)
+            ]
+    return timings
+
+
+def _movie_with_year(dataset_dir):
+    """Find the first movie in a dataset with a year in its title.
+
+    :return: A movie ID.
+    """
+    with open(os.path.join(dataset_dir, 'movies.csv')) as handle:
+        for row in csv.DictReader(handle):
+            if YEAR_MATCHER.search(row['title']):
+                return int(row['movieId'])
+    raise ValueError(f'No movie in {dataset_dir} has a year in its title.')
+
+
+def _time(args, env):
+    """Run a command, and time it.
+
+    :return: The number of seconds the command took.
+    """
+    start = time.perf_counter()
+    subprocess.run(
+        args,
+        check=True,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
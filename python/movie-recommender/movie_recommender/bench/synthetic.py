@@ -0,0 +1,209 @@
+# coding=utf-8
+"""Generate synthetic datasets in the MovieLens format.
+
+A synthetic dataset has a chosen number of users, movies and ratings, and is
+generated from a seed, so the same arguments always produce the same files.
+It's shaped roughly like a MovieLens dataset:
+
+* Movie popularity follows a power law, so a few movies have many ratings, and
+  most have few.
+* User activity is log-normal, so a few users rate many movies, and most rate
+  few. Every user rates at least one movie.
+* Each rating is the sum of a movie's quality, a user's bias and noise, rounded
+  to the nearest half star.
+* Most movies have a year in their title, and one to three genres.
+
+The "synthetic" dataset is installed by :func:`install`, after which
+``mr-db create synthetic`` loads it, like any other dataset.
+"""
+import os
+import shutil
+
+import numpy
+from xdg import BaseDirectory
+
+from movie_recommender.constants import (
+    GENRES,
+    MAX_RATING,
+    MIN_RATING,
+    XDG_RESOURCE,
+)
+
+
+NAME = 'synthetic'
+"""The name of the synthetic dataset.
+
+See :data:`movie_recommender.constants.DATASETS`.
+"""
+
+_NO_GENRES = '(no genres listed)'
+"""The genre given to movies without any genres."""
+
+
+def generate(  # pylint:disable=too-many-locals
+        path,
+        users,
+        movies,
+        ratings,
+        seed=0):
+    """Write a synthetic dataset to a directory.
+
+    :param path: The directory to write ``links.csv``, ``movies.csv``,
+        ``ratings.csv`` and ``tags.csv`` to. It's created if necessary.
+    :param users: The number of users. Users have IDs from 1 to ``users``.
+    :param movies: The number of movies. Movies have IDs from 1 to ``movies``.
+    :param ratings: The number of ratings.
+    :param seed: A seed for the random number generator.
+    :return: Nothing.
+    :raise ValueError: If every user can't rate a movie, or if there are more
+        ratings than pairs of users and movies.
+    """
+    if not 0 < users <= ratings <= users * movies:
+        raise ValueError(
+            f"{users} users can't give {ratings} ratings to {movies} movies. "
+            'Each user must rate at least one movie, and at most every movie.'
+        )
+    rng = numpy.random.default_rng(seed)
+    os.makedirs(path, exist_ok=True)
+
+    popularity = 1 / numpy.arange(1, movies + 1)
+    popularity = popularity[rng.permutation(movies)]
+    popularity /= popularity.sum()
+    activity = rng.lognormal(size=users)
+    activity /= activity.sum()
+    user_ids, movie_ids = _rating_pairs(
+        rng,
+        popularity,
+        activity,
+        ratings,
+    )
+
+    quality = rng.normal(scale=0.7, size=movies)
+    bias = rng.normal(scale=0.5, size=users)
+    noise = rng.normal(scale=0.8, size=ratings)
+    values = 3.5 + quality[movie_ids] + bias[user_ids] + noise
+    values = numpy.clip(numpy.round(values * 2) / 2, MIN_RATING, MAX_RATING)
+    timestamps = rng.integers(789652009, 1427784002, size=ratings)
+
+    _write_csv(
+        os.path.join(path, 'ratings.csv'),
+        'userId,movieId,rating,timestamp',
+        (
+            f'{user_id + 1},{movie_id + 1},{value},{timestamp}'
+            for user_id, movie_id, value, timestamp in zip(
+                user_ids.tolist(),
+                movie_ids.tolist(),
+                values.tolist(),
+                timestamps.tolist(),
+            )
+        ),
+    )
+    _write_csv(
+        os.path.join(path, 'movies.csv'),
+        'movieId,title,genres',
+        (
+            f'{movie_id},{title},{genres}'
+            for movie_id, (title, genres) in enumerate(
+                _movies(rng, movies),
+                start=1,
+            )
+        ),
+    )
+    _write_csv(
+        os.path.join(path, 'links.csv'),
+        'movieId,imdbId,tmdbId',
+        (
+            f'{movie_id},{movie_id:07d},{movie_id}'
+            for movie_id in range(1, movies + 1)
+        ),
+    )
+    tagged = numpy.sort(
+        rng.choice(ratings, size=ratings // 100, replace=False)
+    ).tolist()
+    _write_csv(
+        os.path.join(path, 'tags.csv'),
+        'userId,movieId,tag,timestamp',
+        (
+            f'{user_ids[i] + 1},{movie_ids[i] + 1},tag {i % 10},{timestamp}'
+            for i, timestamp in zip(tagged, timestamps[tagged].tolist())
+        ),
+    )
+
+
+def install(users, movies, ratings, seed=0):
+    """Generate the synthetic dataset, and install it.
+
+    A previously installed synthetic dataset is replaced.
+
+    :param users: See :func:`generate`.
+    :param movies: See :func:`generate`.
+    :param ratings: See :func:`generate`.
+    :param seed: See :func:`generate`.
+    :return: The path to the installed dataset.
+    """
+    path = os.path.join(BaseDirectory.save_data_path(XDG_RESOURCE), NAME)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    generate(path, users, movies, ratings, seed)
+    return path
+
+
+def _movies(rng, movies):
+    """Generate the title and genres of each movie.
+
+    :return: A list of ``(title, genres)`` tuples.
+    """
+    genres = sorted(GENRES - {_NO_GENRES})
+    years = rng.integers(1920, 2016, size=movies).tolist()
+    has_year = (rng.random(movies) >= 0.05).tolist()
+    has_genres = (rng.random(movies) >= 0.03).tolist()
+    genre_counts = rng.integers(1, 4, size=movies).tolist()
+    rows = []
+    for i in range(movies):
+        title = f'Movie {i + 1}'
+        if has_year[i]:
+            title += f' ({years[i]})'
+        if has_genres[i]:
+            genres_ = '|'.join(sorted(
+                rng.choice(genres, genre_counts[i], replace=False)
+            ))
+        else:
+            genres_ = _NO_GENRES
+        rows.append((title, genres_))
+    return rows
+
+
+def _rating_pairs(rng, popularity, activity, ratings):
+    """Choose which movies each user rates.
+
+    Each user first rates one movie. Then, batches of pairs are drawn, half
+    weighted by user activity and movie popularity and half uniformly, until
+    there are enough distinct pairs. Uniform draws ensure that even a dense
+    dataset fills up.
+
+    :return: A ``(user_ids, movie_ids)`` tuple of numpy arrays of zero-based
+        indices, sorted by user and then by movie.
+    """
+    users, movies = len(activity), len(popularity)
+    first = numpy.arange(users) * movies
+    first += rng.choice(movies, size=users, p=popularity)
+    extra = numpy.array((), dtype=numpy.int64)
+    needed = ratings - users
+    while len(extra) < needed:
+        size = needed - len(extra)
+        weighted = rng.choice(users, size=size, p=activity) * movies
+        weighted += rng.choice(movies, size=size, p=popularity)
+        uniform = rng.integers(users * movies, size=size)
+        candidates = numpy.concatenate((extra, weighted, uniform))
+        extra = numpy.setdiff1d(candidates, first)
+    extra = rng.choice(extra, size=needed, replace=False)
+    keys = numpy.sort(numpy.concatenate((first, extra)))
+    return keys // movies, keys % movies
+
+
+def _write_csv(path, header, lines):
+    """Write a header row and lines of CSV to a file."""
+    with open(path, 'w') as handle:
+        handle.write(header + '\n')
+        for line in lines:
+            handle.write(line + '\n')
@@ -1,15 +1,22 @@
 # coding=utf-8
 """Recommend movies for a user."""
 import argparse
-import functools
+import sys
 
-from movie_recommender.db import read
-from movie_recommender.analyze import ii, ml
+from movie_recommender import exceptions, profiling
+from movie_recommender.constants import LSH_BANDS, LSH_ROWS
+from movie_recommender.db import common, read, shards
+from movie_recommender.analyze import ii, ii_lsh, ii_matrix, ii_update, ml
 from movie_recommender.cli.utils import (
+    add_in_memory_flag,
     add_jobs_flag,
+    add_profile_flags,
     add_progress_flags,
-    report_progress,
+    make_reporter,
+    profile,
     to_movie_id,
+    to_positive_int,
+    to_shard,
     to_user_id,
 )
 
@@ -26,9 +33,13 @@ def main():
     )
     subparsers = parser.add_subparsers(dest='subcommand', required=True)
     add_ii_subcommand(subparsers)
+    add_ii_update_subcommand(subparsers)
+    add_ii_lsh_report_subcommand(subparsers)
     add_ml_subcommand(subparsers)
+    add_profile_flags(parser)
     args = parser.parse_args()
-    args.func(args)
+    with profile(args):
+        args.func(args)
 
 
 def add_ii_subcommand(subparsers):
@@ -60,12 +71,160 @@ def add_ii_subcommand(subparsers):
         nargs='+',
         type=to_user_id,
     )
+    parser.add_argument(
+        '--avg-engine',
+        choices=('pool', 'scan'),
+        default='pool',
+        help="""\
+        How to compute the average of each user's ratings. "pool" spreads users
+        across --jobs processes, and queries the database for each user. "scan"
+        computes every average with one aggregate query in a single process.
+        Both produce the same averages. Default is "pool".
+        """,
+    )
+    parser.add_argument(
+        '--engine',
+        choices=('matrix', 'pairwise'),
+        default='pairwise',
+        help="""\
+        How to compute movie similarities. "pairwise" spreads pairs of movies
+        across --jobs processes, and queries the database for each pair.
+        "matrix" loads all ratings into memory once, and compares blocks of
+        movies with sparse matrix products in a single process. Both produce
+        the same scores. Default is "pairwise".
+        """,
+    )
+    parser.add_argument(
+        '--stats',
+        action='store_true',
+        help="""\
+        Also store the sums each similarity score is computed from, so that
+        'mr-analyze ii-update' can later update similarity scores as ratings
+        arrive. Requires --engine matrix.
+        """,
+    )
+    parser.add_argument(
+        '--neighbors',
+        help="""\
+        Once similarities have been computed, build a neighbor model, holding
+        the K most similar movies to each movie. See 'mr-predict ii
+        --neighbors'. K must be at least 1.
+        """,
+        metavar='K',
+        type=to_positive_int,
+    )
+    parser.add_argument(
+        '--drop-similarities',
+        action='store_true',
+        help="""\
+        Once the neighbor model has been built, delete all similarities. This
+        saves space, but means that predictions can only be made with
+        --neighbors, and that similarities can't be computed incrementally.
+        Requires --neighbors.
+        """,
+    )
+    parser.add_argument(
+        '--shard',
+        help="""\
+        Split the pairs of movies into N shards, and only analyze the pairs in
+        shard i, where shards are numbered from 0. Each shard may be analyzed
+        on a different machine. The shard files are then combined with 'mr-db
+        merge-similarities'. Requires --output.
+        """,
+        metavar='i/N',
+        type=to_shard,
+    )
+    parser.add_argument(
+        '--output',
+        help="""\
+        Write similarity scores to a new shard file at this path, instead of to
+        the database. If the file already exists and holds the same shard,
+        analysis resumes where it left off. The file is marked complete once
+        analysis finishes, and only complete files may be merged. Conflicts
+        with --stats and --neighbors.
+        """,
+        metavar='PATH',
+    )
+    parser.add_argument(
+        '--lsh',
+        action='store_true',
+        help="""\
+        Only compare pairs of movies whose sets of raters are similar, as
+        judged by MinHash signatures bucketed with locality-sensitive hashing.
+        This is approximate: some similar pairs are missed, and get no
+        similarity score. Use 'mr-analyze ii-lsh-report' to measure how many.
+        """,
+    )
+    add_lsh_flags(parser)
+    add_in_memory_flag(parser)
     add_jobs_flag(parser)
     add_overwrite_flags(parser)
     add_progress_flags(parser)
     parser.set_defaults(func=handle_ii)
 
 
+def add_ii_update_subcommand(subparsers):
+    """Add the ii-update subcommand to an argparse subparsers object."""
+    parser = subparsers.add_parser(
+        'ii-update',
+        help='Add or change ratings, and update similarity scores to match.',
+        description="""\
+        Add or change ratings, and update similarity scores to match. Only the
+        similarity scores that were computed by 'mr-analyze ii --engine matrix
+        --stats' are updated. This is much faster than re-analyzing every
+        movie.
+        """,
+    )
+    parser.add_argument(
+        'ratings',
+        help="""\
+        A CSV file of ratings, in the same format as a dataset's ratings.csv
+        file.
+        """,
+    )
+    parser.set_defaults(func=handle_ii_update)
+
+
+def add_ii_lsh_report_subcommand(subparsers):
+    """Add the ii-lsh-report subcommand to an argparse subparsers object."""
+    parser = subparsers.add_parser(
+        'ii-lsh-report',
+        help="Measure the recall of 'mr-analyze ii --lsh'.",
+        description="""\
+        Measure the recall of 'mr-analyze ii --lsh'. Score a random sample of
+        movies against every movie exactly, and report how many of the pairs
+        with a non-zero score, and how many of each movie's neighbors, would
+        have been compared. Also time scoring the sample exactly, and against
+        its collisions alone. Nothing is written to the database. Users must
+        have been analyzed already.
+        """,
+    )
+    parser.add_argument(
+        '--sample',
+        default=100,
+        help='Sample this many movies, instead of 100.',
+        type=to_positive_int,
+    )
+    parser.add_argument(
+        '--neighbors',
+        default=20,
+        help="""\
+        Measure recall of each movie's K most similar movies, instead of 20.
+        See 'mr-analyze ii --neighbors'.
+        """,
+        metavar='K',
+        type=to_positive_int,
+    )
+    parser.add_argument(
+        '--seed',
+        default=0,
+        help='Seed the choice of sample with this value, instead of 0.',
+        type=int,
+    )
+    add_lsh_flags(parser)
+    parser.set_defaults(func=handle_ii_lsh_report)
+
+
 def add_ml_subcommand(subparsers):
     """Add the ml subcommand to an argparse subparsers object."""
     helptext = (
@@ -83,8 +242,21 @@ def add_ml_subcommand(subparsers):
         nargs='+',
         type=to_user_id,
     )
+    parser.add_argument(
+        '--timings',
+        action='store_true',
+        help="""\
+        Once analysis is done, print how long each user took to analyze, as
+        CSV, followed by the total and tail time of the analysis. Users are
+        analyzed in order of the number of movies they've rated, most first.
+        The tail time is the time spent waiting on the last users, once some
+        processes had run out of users to analyze.
+        """,
+    )
+    add_in_memory_flag(parser)
     add_jobs_flag(parser)
     add_overwrite_flags(parser)
+    add_progress_flags(parser)
     parser.set_defaults(func=handle_ml)
 
 
@@ -112,37 +284,188 @@ def add_overwrite_flags(parser):
     group.set_defaults(overwrite=False)
 
 
-def handle_ii(args):
+def add_lsh_flags(parser):
+    """Add the ``--lsh-bands`` and ``--lsh-rows`` flags to a parser."""
+    parser.add_argument(
+        '--lsh-bands',
+        default=LSH_BANDS,
+        help=f"""\
+        Split each MinHash signature into this many bands, instead of
+        {LSH_BANDS}. More bands raise recall, and compare more pairs.
+        """,
+        metavar='B',
+        type=to_positive_int,
+    )
+    parser.add_argument(
+        '--lsh-rows',
+        default=LSH_ROWS,
+        help=f"""\
+        Put this many hash values in each band, instead of {LSH_ROWS}. More
+        rows lower recall, and compare fewer pairs.
+        """,
+        metavar='R',
+        type=to_positive_int,
+    )
+
+
+def handle_ii(args):  # pylint:disable=too-many-branches
     """Handle the "ii" subcommand."""
+    if args.drop_similarities and args.neighbors is None:
+        print('--drop-similarities requires --neighbors.', file=sys.stderr)
+        exit(1)
+    if args.stats and args.engine != 'matrix':
+        print('--stats requires --engine matrix.', file=sys.stderr)
+        exit(1)
+    if args.shard is not None and args.output is None:
+        print('--shard requires --output.', file=sys.stderr)
+        exit(1)
+    if args.output is not None and (args.stats or args.neighbors is not None):
+        print(
+            '--output conflicts with --stats and --neighbors.',
+            file=sys.stderr,
+        )
+        exit(1)
+    if args.output is not None:
+        try:
+            shards.create(args.output, args.shard or shards.Shard(0, 1))
+        except exceptions.ShardError as err:
+            print(err, file=sys.stderr)
+            exit(1)
     if args.movie_ids is None and args.user_ids is None:
         movie_ids = set(read.all_movies())
         user_ids = set()
     else:
         movie_ids = set() if args.movie_ids is None else args.movie_ids
         user_ids = set() if args.user_ids is None else args.user_ids
-    if args.progress:
-        au_reporter = functools.partial(
-            report_progress,
-            prefix='User analysis progress: ',
+    lsh = (args.lsh_bands, args.lsh_rows) if args.lsh else None
+    au_reporter = make_reporter(args, 'User analysis')
+    am_reporter = make_reporter(args, 'Movie analysis')
+    with profiling.stage('analyze users'):
+        if args.avg_engine == 'scan':
+            ii.analyze_users_scan(args.overwrite, au_reporter)
+        else:
+            ii.analyze_users(
+                args.overwrite,
+                args.jobs,
+                au_reporter,
+                args.in_memory,
+            )
+    with profiling.stage('analyze movies'):
+        if args.engine == 'matrix':
+            ii_matrix.analyze_movies_matrix(
+                movie_ids,
+                user_ids,
+                args.overwrite,
+                am_reporter,
+                args.stats,
+                args.shard,
+                args.output,
+                lsh,
+            )
+        else:
+            ii.analyze_movies(
+                movie_ids,
+                user_ids,
+                args.overwrite,
+                args.jobs,
+                am_reporter,
+                args.in_memory,
+                args.shard,
+                args.output,
+                lsh,
+            )
+    if args.output is not None:
+        shards.finish(
+            args.output,
+            set(movie_ids).union(read.rated_movies(user_ids)),
+            args.overwrite,
         )
-        am_reporter = functools.partial(
-            report_progress,
-            prefix='Movie analysis progress: ',
+    if args.neighbors is not None:
+        with profiling.stage('analyze neighbors'):
+            ii.analyze_neighbors(args.neighbors, args.drop_similarities)
+
+
+def handle_ii_update(args):
+    """Handle the "ii-update" subcommand."""
+    with open(args.ratings) as handle:
+        try:
+            refreshed = ii_update.update_ratings(common.parse_csv(
+                handle,
+                lambda fields: (
+                    int(fields[0]),
+                    int(fields[1]),
+                    float(fields[2]),
+                    int(fields[3]),
+                )
+            ))
+        except (
+                exceptions.MissingAverageRatingError,
+                exceptions.MissingSimilarityStatsError) as err:
+            print(err, file=sys.stderr)
+            exit(1)
+    print(f'Refreshed {refreshed} similarity scores.')
+
+
+def handle_ii_lsh_report(args):
+    """Handle the "ii-lsh-report" subcommand."""
+    try:
+        report = ii_lsh.compare_lsh(
+            (args.lsh_bands, args.lsh_rows),
+            args.sample,
+            args.neighbors,
+            args.seed,
         )
-    else:
-        au_reporter = None
-        am_reporter = None
-    ii.analyze_users(args.overwrite, args.jobs, au_reporter)
-    ii.analyze_movies(
-        movie_ids,
-        user_ids,
-        args.overwrite,
-        args.jobs,
-        am_reporter,
+    except exceptions.MissingAverageRatingError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+    print(
+        f'Sampled {report.sample} movies, with {args.lsh_bands} bands of '
+        f'{args.lsh_rows} rows. Buckets took {report.bucket_seconds:.3f} '
+        'seconds to build.'
     )
+    print(
+        f'Compared {_fraction(report.candidates, report.pairs)} of pairs of '
+        'movies.'
+    )
+    print(
+        'Found '
+        f'{_fraction(report.similar_found, report.similar)} of pairs with a '
+        'non-zero similarity score.'
+    )
+    print(
+        'Found '
+        f'{_fraction(report.neighbors_found, report.neighbors)} of the '
+        f'{args.neighbors} nearest neighbors of each movie.'
+    )
+    print(
+        f'Scoring took {report.exact_seconds:.3f} seconds exactly, and '
+        f'{report.approximate_seconds:.3f} seconds approximately.'
+    )
+
+
+def _fraction(part, whole):
+    """Format a fraction as e.g. "50.0% (1/2)"."""
+    percent = 100 * part / whole if whole else 100.0
+    return f'{percent:.1f}% ({part}/{whole})'
 
 
 def handle_ml(args):
     """Handle the "ml" subcommand."""
     user_ids = read.users() if args.user_ids is None else args.user_ids
-    ml.analyze_users(user_ids, args.overwrite, args.jobs)
+    reporter = make_reporter(args, 'User analysis')
+    report = ml.analyze_users(
+        user_ids,
+        args.overwrite,
+        args.jobs,
+        args.in_memory,
+        reporter,
+    )
+    if args.timings:
+        print('userId,ratings,seconds')
+        for timing in report.timings:
+            print(f'{timing.task},{timing.cost},{timing.seconds:.6f}')
+        print(
+            f'Analyzed {len(report.timings)} users in {report.seconds:.3f} '
+            f'seconds, with a tail of {report.tail_seconds:.3f} seconds.',
+            file=sys.stderr,
+        )
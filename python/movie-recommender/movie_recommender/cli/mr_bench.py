@@ -0,0 +1,217 @@
+# coding=utf-8
+"""Measure how Movie Recommender's pipeline scales."""
+import argparse
+import json
+import subprocess
+import sys
+
+from movie_recommender.bench import results, scenarios, synthetic
+from movie_recommender.cli.utils import (
+    add_jobs_flag,
+    add_profile_flags,
+    profile,
+    to_positive_int,
+)
+from movie_recommender.constants import BENCH_REGRESSION_THRESHOLD
+
+
+def main():
+    """Parse arguments and call business logic."""
+    # The `dest` argument is a workaround for a bug in argparse. See:
+    # https://stackoverflow.com/questions/23349349/argparse-with-required-subparser
+    parser = argparse.ArgumentParser(
+        description="Measure how Movie Recommender's pipeline scales.",
+    )
+    subparsers = parser.add_subparsers(dest='subcommand', required=True)
+    add_compare_subcommand(subparsers)
+    add_generate_subcommand(subparsers)
+    add_run_subcommand(subparsers)
+    add_profile_flags(parser)
+    args = parser.parse_args()
+    with profile(args):
+        args.func(args)
+
+
+def add_compare_subcommand(subparsers):
+    """Add the compare subcommand to an argparse subparsers object."""
+    parser = subparsers.add_parser(
+        'compare',
+        help='Compare two sets of benchmark results.',
+        description="""\
+        Compare two sets of benchmark results, and print the ratio of each
+        scenario's times. Exit with a non-zero status if any scenario
+        regressed.
+        """,
+    )
+    parser.add_argument('base', help='A results file to compare against.')
+    parser.add_argument('new', help='A results file to compare.')
+    add_threshold_flag(parser)
+    parser.set_defaults(func=handle_compare)
+
+
+def add_generate_subcommand(subparsers):
+    """Add the generate subcommand to an argparse subparsers object."""
+    helptext = 'Generate and install the "synthetic" dataset.'
+    parser = subparsers.add_parser(
+        'generate',
+        help=helptext,
+        description=f"""\
+        {helptext} A previously generated dataset is replaced. Load it with
+        'mr-db create synthetic'.
+        """,
+    )
+    add_dataset_flags(parser)
+    parser.set_defaults(func=handle_generate)
+
+
+def add_run_subcommand(subparsers):
+    """Add the run subcommand to an argparse subparsers object."""
+    parser = subparsers.add_parser(
+        'run',
+        help='Time each stage of the pipeline.',
+        description="""\
+        Generate a synthetic dataset in a scratch directory, and time each
+        stage of the pipeline against it, from 'mr-db create' to
+        'mr-recommend'. Your own database is left untouched. Print the results
+        as JSON.
+        """,
+    )
+    add_dataset_flags(parser)
+    add_jobs_flag(parser)
+    parser.add_argument(
+        '--scenarios',
+        choices=tuple(scenario.name for scenario in scenarios.SCENARIOS),
+        help="""\
+        Run these scenarios, instead of all of them. Scenarios depend on the
+        ones before them, so this should usually include "db-create".
+        """,
+        nargs='+',
+    )
+    parser.add_argument(
+        '--repeat',
+        default=3,
+        help="""\
+        Run each scenario this many times, and keep the fastest time. Default
+        is 3.
+        """,
+        type=to_positive_int,
+    )
+    parser.add_argument(
+        '--output',
+        help='Write results to this file, instead of printing them.',
+    )
+    parser.add_argument(
+        '--compare',
+        help="""\
+        Compare the results with this results file, as 'mr-bench compare'
+        does.
+        """,
+        metavar='BASE',
+    )
+    add_threshold_flag(parser)
+    parser.set_defaults(func=handle_run)
+
+
+def add_dataset_flags(parser):
+    """Add flags describing a synthetic dataset to a parser."""
+    for flag, default in (
+            ('--users', 1000),
+            ('--movies', 3000),
+            ('--ratings', 100000),
+    ):
+        parser.add_argument(
+            flag,
+            default=default,
+            help=f'The number of {flag[2:]}, instead of {default}.',
+            type=int,
+        )
+    parser.add_argument(
+        '--seed',
+        default=0,
+        help='Seed the random number generator with this, instead of 0.',
+        type=int,
+    )
+
+
+def add_threshold_flag(parser):
+    """Add the ``--threshold`` flag to a parser."""
+    parser.add_argument(
+        '--threshold',
+        default=BENCH_REGRESSION_THRESHOLD,
+        help=f"""\
+        A scenario regressed if it got slower by more than this fraction of its
+        base time, instead of {BENCH_REGRESSION_THRESHOLD}.
+        """,
+        type=float,
+    )
+
+
+def handle_compare(args):
+    """Handle the "compare" subcommand."""
+    _compare(results.load(args.base), results.load(args.new), args.threshold)
+
+
+def handle_generate(args):
+    """Handle the "generate" subcommand."""
+    try:
+        path = synthetic.install(
+            args.users,
+            args.movies,
+            args.ratings,
+            args.seed,
+        )
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+    print(f'Installed synthetic dataset to {path}.')
+
+
+def handle_run(args):
+    """Handle the "run" subcommand."""
+    dataset = {
+        'users': args.users,
+        'movies': args.movies,
+        'ratings': args.ratings,
+        'seed': args.seed,
+    }
+    try:
+        timings = scenarios.run(
+            names=args.scenarios,
+            repeat=args.repeat,
+            jobs=args.jobs,
+            **dataset,
+        )
+    except (subprocess.CalledProcessError, ValueError) as err:
+        print(err, file=sys.stderr)
+        exit(1)
+    new = results.make(dataset, timings, args.jobs)
+    if args.output:
+        results.save(new, args.output)
+    else:
+        print(json.dumps(new, indent=2, sort_keys=True))
+    if args.compare:
+        # Keep stdout parseable as JSON.
+        _compare(results.load(args.compare), new, args.threshold, sys.stderr)
+
+
+def _compare(base, new, threshold, file=sys.stdout):
+    """Print a comparison of two sets of results to ``file``.
+
+    Exit with a non-zero status if the results can't be compared, or if any
+    scenario regressed.
+    """
+    try:
+        comparisons = results.compare(base, new, threshold)
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+    for comparison in comparisons:
+        verdict = 'regressed' if comparison.regressed else 'ok'
+        print(
+            f'{comparison.scenario:<14} {comparison.base_seconds:8.3f}s '
+            f'→ {comparison.new_seconds:8.3f}s '
+            f'({comparison.ratio:.2f}×) {verdict}',
+            file=file,
+        )
+    if any(comparison.regressed for comparison in comparisons):
+        exit(1)
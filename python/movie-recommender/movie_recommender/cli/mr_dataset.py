@@ -1,7 +1,10 @@
 # coding=utf-8
 """Manage Movie Recommender data sets."""
 import argparse
+import sys
 
+from movie_recommender import exceptions
+from movie_recommender.cli.utils import add_profile_flags, profile
 from movie_recommender.constants import DATASETS
 from movie_recommender.datasets import Dataset, get_installed_datasets
 
@@ -17,8 +20,10 @@ def main():
     add_absent_subcommand(subparsers)
     add_install_subcommand(subparsers)
     add_present_subcommand(subparsers)
+    add_profile_flags(parser)
     args = parser.parse_args()
-    args.func(args)
+    with profile(args):
+        args.func(args)
 
 
 def add_absent_subcommand(subparsers):
@@ -78,7 +83,11 @@ def handle_install(args):
     """Handle the "install" subcommand."""
     dataset = Dataset(args.dataset)
     dataset.download()
-    dataset.install()
+    try:
+        dataset.install()
+    except exceptions.DatasetAbsentError as err:
+        print(err, file=sys.stderr)
+        exit(1)
 
 
 def handle_present(args):
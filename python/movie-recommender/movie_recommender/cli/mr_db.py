@@ -5,14 +5,20 @@ import sys
 from pathlib import Path
 
 from movie_recommender import exceptions
-from movie_recommender.constants import DATASETS
-from movie_recommender.db import common, init
+from movie_recommender.cli.utils import (
+    add_jobs_flag,
+    add_profile_flags,
+    profile,
+)
+from movie_recommender.constants import DATASETS, SCHEMA_VERSION
+from movie_recommender.db import common, init, migrate, packed, shards
 
 
 def main():
     """Parse arguments and call business logic."""
     args = parse_args()
-    args.func(args)
+    with profile(args):
+        args.func(args)
 
 
 def parse_args():
@@ -25,23 +31,38 @@ def parse_args():
     subparsers = parser.add_subparsers(dest='subcommand', required=True)
     _add_create_subcommand(subparsers)
     _add_load_path_subcommand(subparsers)
+    _add_merge_similarities_subcommand(subparsers)
+    _add_migrate_subcommand(subparsers)
+    _add_pack_similarities_subcommand(subparsers)
     _add_save_path_subcommand(subparsers)
+    add_profile_flags(parser)
     return parser.parse_args()
 
 
 def handle_create(args):
     """Handle the "create" subcommand."""
     if args.overwrite:
+        common.close_db_conns()
         path = Path(common.get_save_path())
-        if path.exists():
-            path.unlink()
+        # A write-ahead log left behind by a crashed process must not be
+        # replayed into the new database. See DB_JOURNAL_MODE.
+        for suffix in ('', '-shm', '-wal'):
+            sibling = path.with_name(path.name + suffix)
+            if sibling.exists():
+                sibling.unlink()
     try:
-        init.cpop_db(args.dataset)
+        load_stats = init.cpop_db(args.dataset, args.fast, args.jobs)
     except (
             exceptions.DatabaseAlreadyExistsError,
             exceptions.DatasetAbsentError) as err:
         print(err, file=sys.stderr)
         exit(1)
+    if args.fast:
+        for table, rows, seconds in load_stats:
+            rate = rows / seconds if seconds else 0
+            print(
+                f'{table}: {rows} rows in {seconds:.1f}s ({rate:.0f} rows/s)'
+            )
 
 
 def handle_load_path(args):  # pylint:disable=unused-argument
@@ -52,6 +73,36 @@ def handle_load_path(args):  # pylint:disable=unused-argument
         exit(1)
 
 
+def handle_merge_similarities(args):
+    """Handle the "merge-similarities" subcommand."""
+    try:
+        merged = shards.merge(args.paths)
+    except exceptions.ShardError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+    print(f'Merged {merged} similarity scores.')
+
+
+def handle_migrate(args):  # pylint:disable=unused-argument
+    """Handle the "migrate" subcommand."""
+    applied = migrate.migrate()
+    if applied:
+        print(f'Migrated to schema version {applied[-1]}.')
+    else:
+        print(f'Schema is already at version {SCHEMA_VERSION}.')
+    try:
+        migrate.check_query_plans()
+    except exceptions.QueryPlanError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+
+
+def handle_pack_similarities(args):  # pylint:disable=unused-argument
+    """Handle the "pack-similarities" subcommand."""
+    packed_ = packed.build()
+    print(f'Packed {packed_} similarity scores into {packed.get_path()}.')
+
+
 def handle_save_path(args):  # pylint:disable=unused-argument
     """Handle the "save-path" subcommand."""
     print(common.get_save_path())
@@ -75,6 +126,17 @@ def _add_create_subcommand(subparsers):
         help='Overwrite an existing database if one exists.',
         action='store_true',
     )
+    parser_create.add_argument(
+        '--fast',
+        action='store_true',
+        help="""\
+        Parse the dataset with --jobs processes, and relax durability while
+        it's loaded. This is much faster for large datasets. If loading is
+        interrupted, re-create the database with --overwrite. Print the number
+        of rows loaded into each table per second.
+        """,
+    )
+    add_jobs_flag(parser_create)
     parser_create.set_defaults(func=handle_create)
 
 
@@ -93,6 +155,58 @@ def _add_load_path_subcommand(subparsers):
     parser_load_path.set_defaults(func=handle_load_path)
 
 
+def _add_merge_similarities_subcommand(subparsers):
+    """Add the merge-similarities subcommand to an argparse subparsers obj."""
+    parser = subparsers.add_parser(
+        'merge-similarities',
+        help='Merge shard files into the database.',
+        description="""\
+        Merge the similarity scores in shard files into the database. Shard
+        files are created by 'mr-analyze ii --shard i/N --output PATH'. Every
+        shard must be passed, and no shard may be passed twice. Each shard's
+        analysis must have finished, with the same movies and overwrite mode
+        as the others. Existing similarity scores are overwritten.
+        """
+    )
+    parser.add_argument(
+        'paths',
+        help='The shard files to merge.',
+        metavar='PATH',
+        nargs='+',
+    )
+    parser.set_defaults(func=handle_merge_similarities)
+
+
+def _add_migrate_subcommand(subparsers):
+    """Add the migrate subcommand to an argparse subparsers object."""
+    parser = subparsers.add_parser(
+        'migrate',
+        help='Upgrade the database to the latest schema.',
+        description="""\
+        Upgrade the database to the latest schema, in place. For example, add
+        indexes which older databases lack. Then gather statistics for the
+        query planner, and check that no frequently executed query scans an
+        entire table. If one does, return a non-zero exit code.
+        """
+    )
+    parser.set_defaults(func=handle_migrate)
+
+
+def _add_pack_similarities_subcommand(subparsers):
+    """Add the pack-similarities subcommand to an argparse subparsers obj."""
+    parser = subparsers.add_parser(
+        'pack-similarities',
+        help='Pack similarity scores into a memory-mappable file.',
+        description="""\
+        Pack the non-zero similarity scores in the database into a file next
+        to the database, which 'mr-predict ii --packed' and 'mr-recommend ii
+        --packed' can memory-map. The file is a snapshot. Re-create it after
+        similarity scores or ratings change.
+        """
+    )
+    parser.set_defaults(func=handle_pack_similarities)
+
+
 def _add_save_path_subcommand(subparsers):
     """Add the save-path subcommand to an argparse subparsers object."""
     parser_save_path = subparsers.add_parser(
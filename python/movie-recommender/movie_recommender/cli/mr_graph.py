@@ -4,19 +4,21 @@ import argparse
 import csv
 from collections import namedtuple
 
+from movie_recommender.cli.utils import add_profile_flags, profile
 from movie_recommender.graph import Graph, Point
 
 
 def main():
     """Parse arguments and call business logic."""
     args = parse_args()
-    graph = Graph(tuple(get_points(
-        args.input,
-        Columns(args.x_column, args.y_column),
-        header_rows=args.header_rows,
-    )))
-    print(f'y = {graph.slope:g} × x + {graph.y_intercept:g}')
-    print(f'sse = {graph.sse:g}')
+    with profile(args):
+        graph = Graph(tuple(get_points(
+            args.input,
+            Columns(args.x_column, args.y_column),
+            header_rows=args.header_rows,
+        )))
+        print(f'y = {graph.slope:g} × x + {graph.y_intercept:g}')
+        print(f'sse = {graph.sse:g}')
 
 
 def parse_args():
@@ -54,6 +56,7 @@ def parse_args():
         Defaults to "0".
         """,
     )
+    add_profile_flags(parser)
     return parser.parse_args()
 
 
@@ -4,10 +4,20 @@ import argparse
 import sys
 
 from movie_recommender import exceptions
-from movie_recommender.cli.utils import to_movie_id, to_user_id
+from movie_recommender.cli.utils import (
+    add_neighbors_flag,
+    add_packed_flag,
+    add_profile_flags,
+    add_socket_flag,
+    check_ids,
+    load_packed,
+    profile,
+    request_server,
+)
 from movie_recommender.constants import REASONS
 from movie_recommender.db import read
 from movie_recommender.predict import ii, ml
+from movie_recommender.server import Request
 
 
 def main():
@@ -20,8 +30,11 @@ def main():
     subparsers = parser.add_subparsers(dest='subcommand', required=True)
     add_ii_subcommand(subparsers)
     add_ml_subcommand(subparsers)
+    add_profile_flags(parser)
     args = parser.parse_args()
-    args.func(args)
+    with profile(args):
+        check_ids(parser, args)
+        args.func(args)
 
 
 def add_ii_subcommand(subparsers):
@@ -38,6 +51,9 @@ def add_ii_subcommand(subparsers):
         ...'.
         """,
     )
+    add_neighbors_flag(parser)
+    add_packed_flag(parser)
+    add_socket_flag(parser)
     add_user_id_arg(parser)
     add_movie_id_arg(parser)
     parser.set_defaults(func=handle_ii)
@@ -56,6 +72,7 @@ def add_ml_subcommand(subparsers):
         '--predictor',
         help='The type of univariate predictor to use, e.g. "year".',
     )
+    add_socket_flag(parser)
     add_user_id_arg(parser)
     add_movie_id_arg(parser)
     parser.set_defaults(func=handle_ml)
@@ -66,7 +83,7 @@ def add_user_id_arg(parser):
     parser.add_argument(
         'user_id',
         help='The user for which a prediction is being made.',
-        type=to_user_id,
+        type=int,
     )
 
 
@@ -75,14 +92,34 @@ def add_movie_id_arg(parser):
     parser.add_argument(
         'movie_id',
         help='The movie for which a prediction is being made.',
-        type=to_movie_id,
+        type=int,
     )
 
 
 def handle_ii(args):
     """Handle the "ii" subcommand."""
-    pred = ii.predict_rating_for_predict(args.user_id, args.movie_id)
-    movie = read.title(pred.movie)
+    if args.socket is not None:
+        predictions, titles = request_server(args, Request(
+            'predict',
+            'ii',
+            args.user_id,
+            args.movie_id,
+            neighbors=args.neighbors,
+        ))
+        pred = predictions[0]
+        movie = titles[pred.movie]
+    else:
+        load_packed(args)
+        try:
+            pred = ii.predict_rating_for_predict(
+                args.user_id,
+                args.movie_id,
+                args.neighbors,
+            )
+        except exceptions.NoNeighborModelError as err:
+            print(err, file=sys.stderr)
+            exit(1)
+        movie = read.title(pred.movie)
     pred_rating = f'{pred.pred_rating:.1f}'
     reason = REASONS[pred.reason]
     print(f'{movie} ({pred_rating}), {reason}')
@@ -90,6 +127,17 @@ def handle_ii(args):
 
 def handle_ml(args):
     """Handle the "ml" subcommand."""
+    if args.socket is not None:
+        predictions = request_server(args, Request(
+            'predict',
+            'ml',
+            args.user_id,
+            args.movie_id,
+            predictor=args.predictor,
+        ))[0]
+        print(f'{predictions[0].pred_rating:.1f}')
+        return
+
     # Retrieve the best type of predictor for this user.
     if args.predictor is None:
         try:
@@ -2,20 +2,30 @@
 """Recommend movies for a user."""
 import argparse
 import csv
+import functools
 import io
 import sys
 
 from movie_recommender import exceptions
 from movie_recommender.cli.utils import (
+    add_in_memory_flag,
     add_jobs_flag,
+    add_neighbors_flag,
+    add_packed_flag,
+    add_profile_flags,
     add_progress_flags,
-    report_progress,
+    add_socket_flag,
+    check_ids,
+    load_packed,
+    make_reporter,
+    profile,
+    request_server,
 )
-from movie_recommender.cli.utils import to_user_id
 from movie_recommender.constants import REASONS
 from movie_recommender.db import read
 from movie_recommender.predict.ml import make_predictor
-from movie_recommender.recommend import ii, ml
+from movie_recommender.recommend import cache, ii, ml
+from movie_recommender.server import Request
 
 
 def main():
@@ -28,8 +38,11 @@ def main():
     subparsers = parser.add_subparsers(dest='subcommand', required=True)
     add_ii_subcommand(subparsers)
     add_ml_subcommand(subparsers)
+    add_profile_flags(parser)
     args = parser.parse_args()
-    args.func(args)
+    with profile(args):
+        check_ids(parser, args)
+        args.func(args)
 
 
 def add_ii_subcommand(subparsers):
@@ -40,8 +53,63 @@ def add_ii_subcommand(subparsers):
         help=helptext,
         description=helptext,
     )
+    parser.add_argument(
+        '--engine',
+        choices=('batch', 'pool'),
+        default='pool',
+        help="""\
+        How to predict ratings. "pool" spreads movies across --jobs processes,
+        and queries the database several times for each movie. "batch" fetches
+        all similarity scores at once, and predicts every rating in one
+        vectorized pass in a single process. Both produce the same
+        recommendations. Default is "pool".
+        """,
+    )
+    add_in_memory_flag(parser)
+    parser.add_argument(
+        '--all-users',
+        action='store_true',
+        help="""\
+        Recommend movies for every user, instead of for one user. Requires
+        --store. Users are spread across --jobs processes.
+        """,
+    )
+    parser.add_argument(
+        '--store',
+        action='store_true',
+        help="""\
+        Store recommendations in the database, instead of printing them. Users
+        whose stored recommendations are up to date are skipped, so an
+        interrupted job may be resumed by running it again.
+        """,
+    )
+    parser.add_argument(
+        '--overwrite',
+        action='store_true',
+        help='With --store, re-compute up-to-date recommendations, too.',
+    )
+    parser.add_argument(
+        '--lookup',
+        action='store_true',
+        help="""\
+        Print the recommendations stored by --store, instead of computing
+        them.
+        """,
+    )
     add_jobs_flag(parser)
-    add_user_id_flag(parser)
+    add_neighbors_flag(parser)
+    add_packed_flag(parser)
+    add_socket_flag(parser)
+    parser.add_argument(
+        'user_id',
+        help="""\
+        The user for which recommendations are being generated. Required
+        unless --all-users is passed.
+        """,
+        nargs='?',
+        type=int,
+    )
+    add_cache_flags(parser)
     add_count_flag(parser)
     add_progress_flags(parser)
     parser.set_defaults(func=handle_ii)
@@ -60,11 +128,38 @@ def add_ml_subcommand(subparsers):
         help='The type of univariate predictor to use, e.g. "year".',
     )
     add_user_id_flag(parser)
+    add_cache_flags(parser)
     add_count_flag(parser)
     add_format_flag(parser)
+    add_socket_flag(parser)
     parser.set_defaults(func=handle_ml)
 
 
+def add_cache_flags(parser):
+    """Add the ``--{no-,}cache`` flags to a parser."""
+    # See: https://stackoverflow.com/a/15008806
+    group = parser.add_mutually_exclusive_group(required=False)
+    group.add_argument(
+        '--cache',
+        action='store_true',
+        dest='cache',
+        help="""\
+        Answer from the recommendation cache, if it holds recommendations for
+        the same user, algorithm, predictor and count, which were computed
+        since the dataset last changed. Otherwise, compute recommendations, and
+        add them to the cache. Flags which don't change recommendations, such
+        as --engine, share cache entries. Default is --cache.
+        """,
+    )
+    group.add_argument(
+        '--no-cache',
+        action='store_false',
+        dest='cache',
+        help='Opposite of --cache.',
+    )
+    group.set_defaults(cache=True)
+
+
 def add_count_flag(parser):
     """Add the ``--count`` parameter to a parser."""
     default = 5
@@ -95,28 +190,63 @@ def add_user_id_flag(parser):
     parser.add_argument(
         'user_id',
         help='The user for which recommendations are being generated.',
-        type=to_user_id,
+        type=int,
     )
 
 
 def handle_ii(args):
     """Handle the "ii" subcommand."""
-    reporter = report_progress if args.progress else None
-    recommendations = ii.recommend(
-        args.user_id,
-        args.count,
-        args.jobs,
-        reporter,
-    )
-    for rec in recommendations:
-        movie = read.title(rec.movie)
-        pred_rating = f'{rec.pred_rating:.1f}'
-        reason = REASONS[rec.reason]
-        print(f'{movie} ({pred_rating}), {reason}')
+    if args.all_users == (args.user_id is not None):
+        print('Pass either a user ID or --all-users.', file=sys.stderr)
+        exit(1)
+    if args.all_users and not args.store:
+        print('--all-users requires --store.', file=sys.stderr)
+        exit(1)
+    if args.store and args.lookup:
+        print('--store conflicts with --lookup.', file=sys.stderr)
+        exit(1)
+    if args.socket is not None and (args.store or args.lookup):
+        print('--socket conflicts with --store and --lookup.', file=sys.stderr)
+        exit(1)
+    if args.socket is not None:
+        recommendations, titles = request_server(args, Request(
+            'recommend',
+            'ii',
+            args.user_id,
+            count=args.count,
+            neighbors=args.neighbors,
+            cache=args.cache,
+        ))
+        _print_ii(recommendations, titles.__getitem__)
+        return
+    if not args.lookup:
+        # Processes forked from this one inherit the memory map.
+        load_packed(args)
+
+    if args.store:
+        _store_ii(args)
+    elif args.lookup:
+        _print_ii(_lookup_ii(args), read.title)
+    else:
+        _print_ii(_compute_ii(args), read.title)
 
 
 def handle_ml(args):
     """Handle the "ml" subcommand."""
+    formatter = _FORMATTERS[args.format]
+    if args.socket is not None:
+        recommendations, titles = request_server(args, Request(
+            'recommend',
+            'ml',
+            args.user_id,
+            count=args.count,
+            predictor=args.predictor,
+            cache=args.cache,
+        ))
+        for line in formatter(recommendations, titles.__getitem__):
+            print(line)
+        return
+
     # Retrieve the best type of predictor for this user.
     if args.predictor is None:
         try:
@@ -133,13 +263,120 @@ def handle_ml(args):
         exit(1)
 
     # Make recommendations.
-    formatter = _FORMATTERS[args.format]
-    recommendations = ml.recommend(args.user_id, args.count, predictor)
-    for line in formatter(recommendations):
+    recommend_func = functools.partial(
+        ml.recommend,
+        args.user_id,
+        args.count,
+        predictor,
+    )
+    if args.cache:
+        recommendations = cache.recommend(
+            args.user_id,
+            'ml',
+            args.predictor,
+            args.count,
+            recommend_func,
+        )
+    else:
+        recommendations = recommend_func()
+    for line in formatter(recommendations, read.title):
         print(line)
 
 
-def _format_csv(recommendations):
+def _store_ii(args):
+    """Compute and store item-item recommendations, as per ``--store``.
+
+    :param args: The parsed arguments of the "ii" subcommand.
+    :return: Nothing.
+    """
+    users = read.users() if args.all_users else (args.user_id,)
+    try:
+        ii.recommend_all(
+            users,
+            args.count,
+            args.jobs,
+            args.overwrite,
+            make_reporter(args, 'Recommendation'),
+            args.neighbors,
+        )
+    except exceptions.NoNeighborModelError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+
+
+def _lookup_ii(args):
+    """Read stored item-item recommendations, as per ``--lookup``.
+
+    :param args: The parsed arguments of the "ii" subcommand.
+    :return: A tuple of :class:`movie_recommender.predict.common.Prediction`
+        objects.
+    """
+    try:
+        return read.recommendations(
+            args.user_id,
+            ii.algorithm_name(args.neighbors),
+        )[:args.count]
+    except exceptions.NoStoredRecommendationsError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+
+
+def _compute_ii(args):
+    """Compute item-item recommendations, or fetch them from the cache.
+
+    :param args: The parsed arguments of the "ii" subcommand.
+    :return: A tuple of :class:`movie_recommender.predict.common.Prediction`
+        objects.
+    """
+    if args.engine == 'batch':
+        recommend_func = functools.partial(
+            ii.recommend_batch,
+            args.user_id,
+            args.count,
+            args.neighbors,
+        )
+    else:
+        recommend_func = functools.partial(
+            ii.recommend,
+            args.user_id,
+            args.count,
+            args.jobs,
+            make_reporter(args, 'Recommendation'),
+            args.in_memory,
+            args.neighbors,
+        )
+    if args.cache:
+        recommend_func = functools.partial(
+            cache.recommend,
+            args.user_id,
+            ii.algorithm_name(args.neighbors),
+            '',
+            args.count,
+            recommend_func,
+        )
+    try:
+        return tuple(recommend_func())
+    except exceptions.NoNeighborModelError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+
+
+def _print_ii(recommendations, title):
+    """Print item-item recommendations.
+
+    :param recommendations: An iterable of
+        :class:`movie_recommender.predict.common.Prediction` objects.
+    :param title: A function which accepts a movie ID, and returns its title.
+    :return: Nothing.
+    """
+    for rec in recommendations:
+        movie = title(rec.movie)
+        pred_rating = f'{rec.pred_rating:.1f}'
+        reason = REASONS[rec.reason]
+        print(f'{movie} ({pred_rating}), {reason}')
+
+
+def _format_csv(recommendations, title):  # pylint:disable=unused-argument
     """Yield recommendations, formatted as CSV."""
     output = io.StringIO()
     writer = csv.DictWriter(output, ('movie_id', 'pred_rating'))
@@ -152,10 +389,10 @@ def _format_csv(recommendations):
     yield output.getvalue()
 
 
-def _format_pretty(recommendations):
+def _format_pretty(recommendations, title):
     """Yield recommendations, formatted prettily."""
     for i, recommendation in enumerate(recommendations):
-        movie_name = read.title(recommendation.movie)
+        movie_name = title(recommendation.movie)
         yield f'{i + 1}. {movie_name} ({recommendation.pred_rating:.1f})'
 
 
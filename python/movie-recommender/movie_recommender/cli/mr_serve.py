@@ -0,0 +1,53 @@
+# coding=utf-8
+"""Answer prediction and recommendation requests from a long-running server."""
+import argparse
+import sys
+
+from movie_recommender import exceptions, server
+from movie_recommender.cli.utils import (
+    add_jobs_flag,
+    add_profile_flags,
+    profile,
+)
+from movie_recommender.constants import SERVER_SOCKET_NAME
+
+
+def main():
+    """Parse arguments and call business logic."""
+    args = parse_args()
+    with profile(args):
+        try:
+            server.serve(args.socket, args.jobs, _report_ready)
+        except exceptions.ServerError as err:
+            print(err, file=sys.stderr)
+            exit(1)
+
+
+def parse_args():
+    """Parse CLI arguments."""
+    parser = argparse.ArgumentParser(
+        description="""\
+        Load ratings, average ratings, movie features and packed similarities
+        into memory once, and then answer prediction and recommendation
+        requests over a Unix socket, until interrupted. Pass --socket to
+        'mr-predict' or 'mr-recommend' to send requests to this server. If the
+        dataset changes, the server reloads its data before answering the next
+        request.
+        """,
+    )
+    add_jobs_flag(parser)
+    parser.add_argument(
+        '--socket',
+        help=f"""\
+        Listen on this socket, instead of on a socket named
+        "{SERVER_SOCKET_NAME}" next to the database.
+        """,
+        metavar='PATH',
+    )
+    add_profile_flags(parser)
+    return parser.parse_args()
+
+
+def _report_ready(path):
+    """Tell the user that the server is listening."""
+    print(f'Listening on {path}', flush=True)
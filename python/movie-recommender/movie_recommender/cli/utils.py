@@ -1,9 +1,16 @@
 # coding=utf-8
 """Utilities for the CLI interfaces."""
+import contextlib
+import cProfile
+import datetime
+import functools
+import json
 import multiprocessing
 import sys
+import time
 
-from movie_recommender.db import common
+from movie_recommender import exceptions, profiling, server
+from movie_recommender.db import common, packed, shards
 
 
 def add_jobs_flag(parser):
@@ -18,8 +25,90 @@ def add_jobs_flag(parser):
     )
 
 
+def add_in_memory_flag(parser):
+    """Add the ``--in-memory`` flag to a parser."""
+    parser.add_argument(
+        '--in-memory',
+        action='store_true',
+        help="""\
+        Load ratings, average ratings and movie titles into memory once per
+        process, instead of querying the database for each one. This is much
+        faster, at the cost of memory.
+        """,
+    )
+
+
+def add_neighbors_flag(parser):
+    """Add the ``--neighbors`` flag to a parser."""
+    parser.add_argument(
+        '--neighbors',
+        action='store_true',
+        help="""\
+        Base each prediction on the movie's neighbors only, instead of on every
+        similar movie. The neighbor model is built by running 'mr-analyze ii
+        --neighbors K ...'.
+        """,
+    )
+
+
+def add_packed_flag(parser):
+    """Add the ``--packed`` flag to a parser."""
+    parser.add_argument(
+        '--packed',
+        action='store_true',
+        help="""\
+        Read similarity scores from the packed similarities file, instead of
+        querying the database. The file is memory-mapped, so processes share
+        one copy of it. It's created by 'mr-db pack-similarities', and must be
+        re-created whenever the dataset changes. Has no effect with
+        --neighbors.
+        """,
+    )
+
+
+def load_packed(args):
+    """Load the packed similarities file, if ``--packed`` was passed.
+
+    If the file can't be loaded, print an error message and exit.
+
+    :param args: The parsed arguments from a parser with the ``--packed``
+        flag. See :func:`add_packed_flag`.
+    :return: Nothing.
+    """
+    if not args.packed:
+        return
+    try:
+        packed.load()
+    except exceptions.PackedSimilaritiesError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+
+
+def add_profile_flags(parser):
+    """Add the ``--profile`` and ``--profile-output`` flags to a parser."""
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help="""\
+        When done, print where the time went to stderr: the wall time of each
+        stage, the number and latency of SQL statements, the number of
+        database connections opened, and the number of tasks and bytes sent
+        to and from each process pool.
+        """,
+    )
+    parser.add_argument(
+        '--profile-output',
+        help="""\
+        Profile this process with cProfile, and write the statistics to this
+        file, for use with the pstats module or a viewer such as snakeviz.
+        Implies --profile.
+        """,
+        metavar='PATH',
+    )
+
+
 def add_progress_flags(parser):
-    """Add the ``--{no-,}progress`` flags to a parser."""
+    """Add the ``--{no-,}progress`` and ``--progress-log`` flags."""
     # See: https://stackoverflow.com/a/15008806
     group = parser.add_mutually_exclusive_group(required=False)
     group.add_argument(
@@ -35,33 +124,180 @@ def add_progress_flags(parser):
         help="Don't show progress messages.",
     )
     group.set_defaults(progress=True)
+    parser.add_argument(
+        '--progress-log',
+        help="""\
+        Append progress to this file, as one JSON object per line, even if
+        --no-progress is passed. Each object holds the amount of work done and
+        to do, the rate, the estimated seconds left, and the fraction of time
+        each worker process spent busy.
+        """,
+        metavar='PATH',
+    )
+
+
+@contextlib.contextmanager
+def profile(args):
+    """Profile the enclosed code, if ``--profile`` was passed.
+
+    The enclosed code is recorded as the "total" stage. When it exits, even by
+    calling ``exit()``, a summary is printed to stderr, and if
+    ``--profile-output`` was passed, cProfile statistics are written.
+
+    :param args: The parsed arguments from a parser with the ``--profile``
+        flags. See :func:`add_profile_flags`.
+    :return: A context manager.
+    """
+    if not (args.profile or args.profile_output):
+        yield
+        return
+    profiling.enable()
+    profiler = cProfile.Profile() if args.profile_output else None
+    if profiler:
+        profiler.enable()
+    try:
+        with profiling.stage('total'):
+            yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile_output)
+        print('\n'.join(profiling.summarize()), file=sys.stderr)
+
 
+def log_progress(snapshot, path, name=''):
+    """Append progress to a log file, as a line of JSON.
 
-def report_progress(conn_out, prefix=''):
+    :param snapshot: A :class:`movie_recommender.progress.Snapshot`.
+    :param path: The path to the log file.
+    :param name: The name of the work in progress, e.g. 'User analysis'.
+    :return: Nothing.
+    """
+    record = {'time': time.time(), 'name': name, **snapshot._asdict()}
+    with open(path, 'a') as handle:
+        handle.write(json.dumps(record) + '\n')
+
+
+def make_reporter(args, name):
+    """Make a function which reports progress, as asked for by ``args``.
+
+    :param args: The parsed arguments from a parser with the ``--progress``
+        flags. See :func:`add_progress_flags`.
+    :param name: The name of the work in progress, e.g. 'User analysis'.
+    :return: A function accepting a
+        :class:`movie_recommender.progress.Snapshot`, or ``None`` if progress
+        shouldn't be reported.
+    """
+    reporters = []
+    if args.progress:
+        reporters.append(functools.partial(
+            report_progress,
+            prefix=f'{name} progress: ',
+        ))
+    if args.progress_log:
+        reporters.append(functools.partial(
+            log_progress,
+            path=args.progress_log,
+            name=name,
+        ))
+    if not reporters:
+        return None
+    return functools.partial(_report_all, reporters)
+
+
+def report_progress(snapshot, prefix=''):
     """Tell the user how much work has been done.
 
+    The percentage of work done is printed, along with the rate at which work
+    is being done, the estimated time left, and how busy worker processes
+    were on average. Each call overwrites the line printed by the previous
+    call.
+
+    :param snapshot: A :class:`movie_recommender.progress.Snapshot`. If it's
+        the final snapshot, a newline is printed too.
     :param prefix: A message to print before the progress prompt, e.g.
         'Progress: '.
-    :param conn_out: A multiprocessing ``Connection`` object from which values
-        may be read. Each value emitted by the object should be a float between
-        0 and 1, inclusive, where 0 indicates 0% complete, and 1 represents
-        100% complete. When a value of 1 is received, this function will
-        return.
     :return: Nothing.
     """
-    while True:
-        progress = conn_out.recv()
-        # \r is carriage return. The other is an ANSI escape code. See:
-        # https://en.wikipedia.org/wiki/ANSI_escape_code
-        print(
-            '\r\033[K' + prefix + f'{progress * 100:.0f}%',
-            end='',
-        )
-        sys.stdout.flush()
-        if progress == 1:
-            conn_out.close()
-            print()
-            break
+    if snapshot.finished:
+        fraction = 1
+    else:
+        fraction = snapshot.done / snapshot.total if snapshot.total else 0
+    rate = f'{snapshot.rate:.{2 if snapshot.rate < 10 else 0}f}'
+    message = f'{fraction * 100:.0f}% ({rate}/s'
+    if not snapshot.finished and snapshot.eta is not None:
+        message += f', {datetime.timedelta(seconds=round(snapshot.eta))} left'
+    if snapshot.utilization:
+        busy = sum(snapshot.utilization) / len(snapshot.utilization)
+        message += f', workers {busy * 100:.0f}% busy'
+    message += ')'
+    # \r is carriage return. The other is an ANSI escape code. See:
+    # https://en.wikipedia.org/wiki/ANSI_escape_code
+    print('\r\033[K' + prefix + message, end='\n' if snapshot.finished else '')
+    sys.stdout.flush()
+
+
+def add_socket_flag(parser):
+    """Add the ``--socket`` flag to a parser."""
+    parser.add_argument(
+        '--socket',
+        const='',
+        help="""\
+        Send the request to a server started by 'mr-serve', instead of
+        computing the answer in this process. If PATH is omitted, use the
+        server's default socket. Flags which only control how answers are
+        computed, such as --jobs, are ignored.
+        """,
+        metavar='PATH',
+        nargs='?',
+    )
+
+
+def check_ids(parser, args):
+    """Check that parsed user and movie IDs are in the database.
+
+    Checking IDs needs a database query. If ``--socket`` was passed, the server
+    checks IDs instead. If an ID isn't in the database, print an error message
+    and exit.
+
+    :param parser: The parser which parsed ``args``.
+    :param args: The parsed arguments from a parser with the ``--socket`` flag,
+        and optionally a ``user_id`` or ``movie_id`` argument. See
+        :func:`add_socket_flag`.
+    :return: Nothing.
+    """
+    if args.socket is not None:
+        return
+    try:
+        if getattr(args, 'user_id', None) is not None:
+            to_user_id(args.user_id)
+        if getattr(args, 'movie_id', None) is not None:
+            to_movie_id(args.movie_id)
+    except ValueError as err:
+        parser.error(str(err))
+
+
+def request_server(args, request):
+    """Send a request to the server named by ``--socket``.
+
+    If the server can't be reached, or rejects the request, print an error
+    message and exit.
+
+    :param args: The parsed arguments from a parser with the ``--socket``
+        flag. See :func:`add_socket_flag`.
+    :param request: A :class:`movie_recommender.server.Request`.
+    :return: A ``(predictions, titles)`` tuple. ``predictions`` is a tuple of
+        :class:`movie_recommender.predict.common.Prediction` objects, and
+        ``titles`` is a dict mapping their movie IDs to movie titles.
+    """
+    try:
+        pairs = server.request(request, args.socket or None)
+    except exceptions.ServerError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+    predictions = tuple(prediction for prediction, _ in pairs)
+    titles = {prediction.movie: title for prediction, title in pairs}
+    return predictions, titles
 
 
 def to_movie_id(arg):
@@ -87,6 +323,33 @@ def to_movie_id(arg):
     return movie_id
 
 
+def to_positive_int(arg):
+    """Cast the given string argument to a positive integer, if possible.
+
+    :param arg: A string argument passed on the command line.
+    :return: An integer greater than 0.
+    :raise: ``ValueError`` if ``arg`` isn't a positive integer.
+    """
+    value = int(arg)
+    if value < 1:
+        raise ValueError(f'{arg} is not a positive integer.')
+    return value
+
+
+def to_shard(arg):
+    """Cast the given string argument to a shard, if possible.
+
+    :param arg: A string argument passed on the command line, of the form
+        ``i/N``, where ``0 <= i < N``.
+    :return: A :class:`movie_recommender.db.shards.Shard`.
+    :raise: ``ValueError`` if ``arg`` isn't of the form ``i/N``.
+    """
+    index, count = (int(part) for part in arg.split('/'))
+    if not 0 <= index < count:
+        raise ValueError(f'Shard {arg} is not of the form i/N, 0 <= i < N.')
+    return shards.Shard(index, count)
+
+
 def to_user_id(arg):
     """Cast the given string argument to a user ID, if possible.
 
@@ -108,3 +371,9 @@ def to_user_id(arg):
     if user_id not in user_ids:
         raise ValueError(f'User ID {user_id} not in database.')
     return user_id
+
+
+def _report_all(reporters, snapshot):
+    """Call each of several reporters."""
+    for reporter in reporters:
+        reporter(snapshot)
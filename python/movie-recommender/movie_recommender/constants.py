@@ -24,19 +24,118 @@ REASONS = {
 }
 """Reasons that a movie recommendation might be given, with item-item."""
 
+AVG_RATING_TOLERANCE = 0.05
+"""How far a user's average rating may drift before it's re-computed.
+
+Adjusted cosine similarity (see
+:class:`movie_recommender.matrix.AdjustedCosine`) centres each rating on its
+user's average rating. When new ratings are folded into the similarity model
+by :meth:`movie_recommender.analyze.ii_update.update_ratings`, a user's
+average changes, and strictly speaking, every similarity involving any movie
+that user has rated should then change. That's expensive for users who've rated
+many movies.
+
+Instead, each user's ratings stay centred on the average stored in the
+avgRatings table, even as the user's true average drifts. Once the true average
+differs from the stored average by more than this value, the user is
+re-centred: their contributions to the similarity model are re-computed, and
+their stored average is updated. As a result, every centred rating in the
+similarity model is within this distance of its exact value.
+"""
+
+BENCH_REGRESSION_THRESHOLD = 0.1
+"""How much slower a benchmark scenario may get before it's a regression.
+
+The threshold is a fraction of the scenario's previous time. See
+:func:`movie_recommender.bench.results.compare`.
+"""
+
+DB_CACHED_STATEMENTS = 2**8
+"""The number of prepared statements cached by each database connection.
+
+See :func:`movie_recommender.db.common.get_db_conn`.
+"""
+
 DB_NAME = 'db.db'
 """The basename of Movie Recommender's database file."""
 
+PACKED_SIMILARITIES_NAME = 'similarities.packed'
+"""The basename of the packed similarities file.
+
+It lives next to the database. See :mod:`movie_recommender.db.packed`.
+"""
+
+SERVER_SOCKET_NAME = 'server.sock'
+"""The basename of the socket that ``mr-serve`` listens on, by default.
+
+It lives next to the database. See :mod:`movie_recommender.server`.
+"""
+
+DB_JOURNAL_MODE = 'WAL'
+"""The journal mode of Movie Recommender's database.
+
+WAL lets readers and a writer use the database at the same time. By default,
+SQLite's readers block writers, and vice versa. The journal mode is persistent:
+it's stored in the database file. It's therefore set once, when a database is
+created or migrated, rather than each time a connection is opened. See
+:func:`movie_recommender.db.init.set_journal_mode`.
+"""
+
+DB_PRAGMAS = {
+    'cache_size': -2**16,
+    'mmap_size': 2**28,
+}
+"""PRAGMAs applied to each database connection when it's opened.
+
+* ``cache_size`` is negative, and so is measured in KiB. 64 MiB is used.
+* ``mmap_size`` lets SQLite read up to 256 MiB of the database through a
+  memory map, instead of with read() calls.
+
+These settings only last as long as the connection. For details, see:
+https://www.sqlite.org/pragma.html
+"""
+
+DB_LOAD_CHUNK_SIZE = 2**23
+"""The number of bytes of a CSV file parsed by each job in a fast load.
+
+See :func:`movie_recommender.db.init.cpop_db`. Each chunk is inserted into the
+database with one statement. 8 MiB of ml-20m's ratings.csv is roughly 300,000
+ratings.
+"""
+
+DB_LOAD_PRAGMAS = {
+    'cache_size': -2**18,
+    'journal_mode': 'OFF',
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+}
+"""PRAGMAs applied to a new database's connection while it's fast-loaded.
+
+See :func:`movie_recommender.db.init.cpop_db`. These trade durability for
+speed, which is safe only because a half-written new database may simply be
+deleted and re-created.
+
+* ``cache_size`` is negative, and so is measured in KiB. 256 MiB is used.
+* ``journal_mode=OFF`` disables the rollback journal and write-ahead log.
+* ``synchronous=OFF`` skips calls to fsync().
+* ``temp_store=MEMORY`` sorts rows in memory when indexes are created.
+
+The connection's previous settings are restored afterwards.
+"""
+
 DATASETS = {
     'fixture': None,
     'ml-latest-small': (
         'http://files.grouplens.org/datasets/movielens/ml-latest-small.zip'
     ),
     'ml-20m': 'http://files.grouplens.org/datasets/movielens/ml-20m.zip',
+    'synthetic': None,
 }
 """Datasets this application can manage.
 
-The "fixture" dataset can be created on the fly by this application.
+The "fixture" dataset can be created on the fly by this application. The
+"synthetic" dataset is generated by ``mr-bench generate``. See
+:mod:`movie_recommender.bench.synthetic`.
 """
 
 GENRES = {
@@ -68,6 +167,14 @@ themselves, but hard-coding names is quicker, and it avoids issues that arise
 when not all genres are represented by a dataset.
 """
 
+GENRE_BITS = {genre: 1 << i for i, genre in enumerate(sorted(GENRES))}
+"""A bit for each genre, in a movie's genre bitmask.
+
+See :mod:`movie_recommender.db.features`. Bits are assigned in order of genre
+name, so adding a genre to :data:`GENRES` may change other genres' bits. If it
+does, the "movieFeatures" table must be re-populated.
+"""
+
 JOBS_PER_PROCESS_PER_BATCH = 2**8
 """Jobs processed by each process in each batch of work.
 
@@ -101,6 +208,27 @@ across processes and makes the pickled objects sent to each process smaller.
 Make sure to perform empirical measurements when setting this value!
 """
 
+LSH_BANDS = 2**5
+"""Bands each MinHash signature is split into, for approximate analysis.
+
+Approximate analysis (see :class:`movie_recommender.matrix.MinHashBuckets`)
+only compares pairs of movies whose signatures are identical in at least one
+band. A pair of movies whose sets of raters have a Jaccard similarity of ``s``
+is compared with probability ``1 - (1 - s**LSH_ROWS)**LSH_BANDS``. Roughly,
+pairs with ``s`` above ``(1 / LSH_BANDS)**(1 / LSH_ROWS)`` are likely to be
+compared, and pairs below it are likely to be skipped. Increasing this value
+increases recall, at the cost of comparing more pairs. Use 'mr-analyze
+ii-lsh-report' to measure recall on a sample of movies.
+"""
+
+LSH_ROWS = 2
+"""Rows in each band of a MinHash signature. See :data:`LSH_BANDS`.
+
+Increasing this value makes bands harder to match, so fewer pairs of movies
+are compared, and recall drops. Each signature holds ``LSH_BANDS * LSH_ROWS``
+hash values.
+"""
+
 MAX_RATING = 5.0
 """The max rating that a user can assign to a movie."""
 
@@ -147,6 +275,41 @@ analyses are desired.
 """
 assert MIN_PAIRS_FOR_SIMILARITY >= 1
 
+PREDICTOR_NAMES = ('year',) + tuple(
+    f'genre:{genre}' for genre in sorted(GENRES)
+)
+"""The names of the predictors used by the machine learning algorithm.
+
+See :func:`movie_recommender.predict.ml.make_predictors`. Genre-based
+predictors are sorted by genre, so that this order is the same in every
+process.
+"""
+
+PROGRESS_INTERVAL = 0.5
+"""The number of seconds between progress reports.
+
+See :class:`movie_recommender.progress.Progress`. Reading progress costs a few
+microseconds, so this only controls how often the user sees a new value.
+"""
+
+SCHEMA_VERSION = 4
+"""The latest version of the database schema.
+
+See :mod:`movie_recommender.db.migrate`.
+"""
+
+SIMILARITY_BLOCK_SIZE = 2**7
+"""Movies compared to all other movies at once, by the matrix engine.
+
+The matrix engine (see
+:meth:`movie_recommender.analyze.ii_matrix.analyze_movies_matrix`) compares a
+block of target movies to every movie with a few sparse matrix products. Each
+product yields a dense array with one row per movie and one column per target
+movie, and five such arrays are alive at once. With ml-20m's ~27,000 movies and
+a block size of 128, that's roughly 140 MB. Increasing this value reduces
+per-block overhead, at the cost of memory.
+"""
+
 XDG_RESOURCE = 'movie-recommender'
 """The basename of the directories this application uses for data.
 
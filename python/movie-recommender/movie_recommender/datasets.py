@@ -34,12 +34,12 @@ class Dataset():
     def download(self):
         """Download this dataset into the application cache directory.
 
-        Short circuit if the dataset is "fixture," or if the dataset is already
-        downloaded.
+        Short circuit if the dataset is generated rather than downloaded, as
+        "fixture" and "synthetic" are, or if the dataset is already downloaded.
 
         :return: Nothing.
         """
-        if self.name == 'fixture':
+        if DATASETS[self.name] is None:
             return
         cache_dir = BaseDirectory.save_cache_path(XDG_RESOURCE)
         archive_url = DATASETS[self.name]
@@ -57,9 +57,9 @@ class Dataset():
 
         :return: The path to where this dataset is downloaded.
         :raise movie_recommender.exceptions.DatasetAbsentError: If this
-            dataset's name is "fixture."
+            dataset is generated rather than downloaded.
         """
-        if self.name == 'fixture':
+        if DATASETS[self.name] is None:
             raise exceptions.DatasetAbsentError(
                 f"Dataset {self.name} can't be downloaded."
             )
@@ -90,12 +90,18 @@ class Dataset():
         Short circuit if this dataset is already installed.
 
         :return: Nothing.
+        :raise movie_recommender.exceptions.DatasetAbsentError: If this
+            dataset is "synthetic," and it hasn't been generated.
         """
         if self.name == 'fixture':
             self._install_fixture()
             return
         if self.installed():
             return
+        if self.name == 'synthetic':
+            raise exceptions.DatasetAbsentError(
+                "Dataset synthetic is generated with 'mr-bench generate'."
+            )
         download_path = self.download_path()
         data_dir = BaseDirectory.save_data_path(XDG_RESOURCE)
         with zipfile.ZipFile(download_path, 'r') as handle:
@@ -1,7 +1,18 @@
 # coding=utf-8
 """Functions for calculating values with a database query."""
 from movie_recommender import exceptions
-from movie_recommender.db import common
+from movie_recommender.db import common, store
+
+
+AVG_MOVIE_RATING_QUERY = """
+    SELECT AVG(rating)
+    FROM ratings
+    WHERE movieId=?
+"""
+"""The query :func:`avg_movie_rating` executes, with a movie ID.
+
+See :data:`movie_recommender.db.migrate.HOT_QUERIES`.
+"""
 
 
 def avg_movie_rating(movie):
@@ -12,15 +23,11 @@ def avg_movie_rating(movie):
     :raise movie_recommender.exceptions.NoMovieRatingsError: If an average
         can't be calculated due to a lack of ratings.
     """
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return ratings_store.avg_movie_rating(movie)
     with common.get_db_conn() as conn:
-        avg = conn.execute(
-            """
-            SELECT AVG(rating)
-            FROM ratings
-            WHERE movieId=?
-            """,
-            (movie,)
-        ).fetchone()[0]
+        avg = conn.execute(AVG_MOVIE_RATING_QUERY, (movie,)).fetchone()[0]
     if avg is None:
         raise exceptions.NoMovieRatingsError(
             f"Can't calculate the average rating for movie {movie}, as no "
@@ -35,6 +42,9 @@ def avg_user_rating(user):
     :param user: A user ID. The user whose average ratings are being computed.
     :return: A value such as 3.5.
     """
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return ratings_store.avg_user_rating(user)
     with common.get_db_conn() as conn:
         return conn.execute(
             """
@@ -44,3 +54,30 @@ def avg_user_rating(user):
             """,
             (user,)
         ).fetchone()[0]
+
+
+def avg_user_ratings(overwrite):
+    """Calculate the average of each user's movie ratings, in one pass.
+
+    Unlike :func:`avg_user_rating`, this function executes a single aggregate
+    query, which scans the ratings table in primary key order.
+
+    :param overwrite: If false, skip users already in the avgRatings table.
+    :return: A generator that yields
+        :class:`movie_recommender.db.common.AvgRating` objects, ordered by user
+        ID.
+    """
+    if overwrite:
+        where = ''
+    else:
+        where = 'WHERE userId NOT IN (SELECT userId FROM avgRatings)'
+    with common.get_db_conn() as conn:
+        for row in conn.execute(
+                f"""
+                SELECT userId, AVG(rating)
+                FROM ratings
+                {where}
+                GROUP BY userId
+                ORDER BY userId
+                """):
+            yield common.AvgRating(row[0], row[1])
@@ -2,14 +2,22 @@
 """Objects used by the other database management modules."""
 import contextlib
 import csv
+import os
 import sqlite3
-from collections import namedtuple
+import threading
+import time
+from collections import Counter, namedtuple
 from pathlib import Path
 
 from xdg import BaseDirectory
 
-from movie_recommender import exceptions
-from movie_recommender.constants import DB_NAME, XDG_RESOURCE
+from movie_recommender import exceptions, profiling
+from movie_recommender.constants import (
+    DB_CACHED_STATEMENTS,
+    DB_NAME,
+    DB_PRAGMAS,
+    XDG_RESOURCE,
+)
 
 
 AvgRating = namedtuple('AvgRating', ('user_id', 'avg_rating'))
@@ -24,24 +32,321 @@ Similarity = namedtuple('Similarity', ('movie_a', 'movie_b', 'score'))
 """A pair of movies and their similarity score."""
 
 
+LoadStats = namedtuple('LoadStats', ('table', 'rows', 'seconds'))
+"""The number of rows loaded into a table, and how long loading took."""
+
+
+SimilarityStats = namedtuple('SimilarityStats', (
+    'movie_a',
+    'movie_b',
+    'count',
+    'sum_products',
+    'sum_squares_a',
+    'sum_squares_b',
+))
+"""The sufficient statistics for a pair of movies' similarity score.
+
+See :meth:`movie_recommender.matrix.AdjustedCosine.stats`.
+"""
+
+
+_LOCAL = threading.local()
+"""Connections cached by :func:`get_db_conn`, per thread.
+
+Attributes are set lazily. ``conns`` maps database paths to connections,
+``depths`` maps database paths to how deeply :func:`get_db_conn` has been
+entered, and ``load_path`` caches the return value of :func:`get_load_path`.
+"""
+
+_POOLS = {}
+"""Every thread's ``conns`` dict, keyed by thread. See :func:`_thread_conns`.
+
+:data:`_LOCAL` only lets a thread reach its own connections, but a forked
+process must be able to find every thread's. See :func:`_reset_after_fork`.
+"""
+
+_POOLS_LOCK = threading.Lock()
+"""Guards :data:`_POOLS`."""
+
+_FORKED_CONNS = []
+"""Connections inherited from a parent process. See :func:`_reset_after_fork`."""
+
+_STATS = Counter()
+"""Connection statistics for this process. See :func:`get_conn_stats`."""
+
+
+class _Connection(sqlite3.Connection):
+    """A sqlite3 `Connection`_ which counts the statements it executes.
+
+    If profiling is enabled, each statement's latency is recorded too,
+    including the time spent fetching its results. See
+    :func:`movie_recommender.profiling.record_query` and :class:`_Cursor`.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+
+    def execute(self, *args, **kwargs):  # pylint:disable=arguments-differ
+        """Execute a statement. See ``sqlite3.Connection.execute``."""
+        _STATS['queries'] += 1
+        if not profiling.enabled():
+            return super().execute(*args, **kwargs)
+        return self.cursor(_Cursor).execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):  # pylint:disable=arguments-differ
+        """Execute a statement for each of several sets of parameters."""
+        _STATS['queries'] += 1
+        if not profiling.enabled():
+            return super().executemany(*args, **kwargs)
+        return self.cursor(_Cursor).executemany(*args, **kwargs)
+
+
+class _Cursor(sqlite3.Cursor):
+    """A sqlite3 `Cursor`_ which records how long its statement takes.
+
+    SQLite executes a statement lazily: ``execute()`` only steps to the first
+    row, and each later row is computed as it's fetched. So the time spent
+    fetching rows is recorded against the statement, too. See
+    :func:`movie_recommender.profiling.record_query`.
+
+    .. _Cursor:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Cursor
+    """
+
+    statement = None
+    """The statement most recently executed with this cursor."""
+
+    def execute(self, *args, **kwargs):  # pylint:disable=arguments-differ
+        """Execute a statement. See ``sqlite3.Cursor.execute``."""
+        self.statement = args[0]
+        start = time.perf_counter()
+        cursor = super().execute(*args, **kwargs)
+        profiling.record_query(self.statement, time.perf_counter() - start)
+        return cursor
+
+    def executemany(self, *args, **kwargs):  # pylint:disable=arguments-differ
+        """Execute a statement for each of several sets of parameters."""
+        self.statement = args[0]
+        start = time.perf_counter()
+        cursor = super().executemany(*args, **kwargs)
+        profiling.record_query(self.statement, time.perf_counter() - start)
+        return cursor
+
+    def __next__(self):
+        """Fetch the next row. See ``sqlite3.Cursor.__next__``."""
+        return self._fetch(super().__next__)
+
+    def fetchone(self):
+        """Fetch the next row. See ``sqlite3.Cursor.fetchone``."""
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        """Fetch several rows. See ``sqlite3.Cursor.fetchmany``."""
+        return self._fetch(super().fetchmany, *args, **kwargs)
+
+    def fetchall(self):
+        """Fetch every remaining row. See ``sqlite3.Cursor.fetchall``."""
+        return self._fetch(super().fetchall)
+
+    def _fetch(self, method, *args, **kwargs):
+        """Call a fetching method, and record how long it took."""
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            profiling.record_query(
+                self.statement,
+                time.perf_counter() - start,
+                executions=0,
+            )
+
+
 @contextlib.contextmanager
 def get_db_conn(db_path=None):
     """Return a context manager which yields a database connection.
 
-    :param db_path: The path to a SQLite 3 database.
-    :return: A sqlite3 `Connection`_ object. It will automatically be closed
-        when this context manager exits.
+    Connections are pooled. The first time a thread asks for a connection to a
+    database, a connection is opened, and the PRAGMAs in
+    :data:`movie_recommender.constants.DB_PRAGMAS` are applied. After that,
+    the same connection is handed out again, along with its cache of prepared
+    statements. If a transaction is still open when the outermost context
+    manager for a connection exits, it is rolled back, just as it would be if
+    the connection were closed.
+
+    Processes forked from this one (e.g. by ``multiprocessing.Pool``) don't
+    reuse this process' connections. They open their own.
+
+    :param db_path: The path to a SQLite 3 database. If ``None``, use the
+        path returned by :func:`get_load_path`.
+    :return: A sqlite3 `Connection`_ object. It is owned by the pool, and
+        shouldn't be closed. See :func:`close_db_conns`.
 
     .. _Connection:
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
     """
     if db_path is None:
-        db_path = get_load_path()
-    conn = sqlite3.connect(db_path)
+        db_path = getattr(_LOCAL, 'load_path', None)
+        if db_path is None:
+            db_path = _LOCAL.load_path = get_load_path()
+    db_path = str(db_path)
+
+    conns = _thread_conns()
+    depths = _thread_attr('depths')
+    conn = conns.get(db_path)
+    if conn is None:
+        conn = conns[db_path] = _open_db_conn(db_path)
+        _STATS['opens'] += 1
+        profiling.count('connections opened')
+    else:
+        _STATS['hits'] += 1
+
+    depths[db_path] = depths.get(db_path, 0) + 1
     try:
         yield conn
     finally:
+        depths[db_path] -= 1
+        if not depths[db_path] and conn.in_transaction:
+            conn.rollback()
+
+
+def close_db_conns():
+    """Close the connections pooled by this thread.
+
+    Call this before deleting or replacing a database file which this thread
+    may have opened.
+
+    :return: Nothing.
+    """
+    conns = _thread_conns()
+    for conn in conns.values():
         conn.close()
+    conns.clear()
+    _LOCAL.depths = {}
+    _LOCAL.load_path = None
+
+
+@contextlib.contextmanager
+def pragmas(connection, pragmas_):
+    """Temporarily apply PRAGMAs to a connection.
+
+    The PRAGMAs' previous values are read before the new values are applied,
+    and they're restored when the context manager exits.
+
+    :param connection: A sqlite3 `Connection`_ object. It shouldn't have an
+        open transaction.
+    :param pragmas_: A dict mapping PRAGMA names to values, in the style of
+        :data:`movie_recommender.constants.DB_PRAGMAS`.
+    :return: A context manager.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    previous = {
+        pragma: connection.execute(f'PRAGMA {pragma}').fetchone()[0]
+        for pragma in pragmas_
+    }
+    _apply_pragmas(connection, pragmas_)
+    try:
+        yield
+    finally:
+        _apply_pragmas(connection, previous)
+
+
+def get_dataset_version(connection):
+    """Get the dataset version, with an open connection.
+
+    See :func:`movie_recommender.db.write.bump_dataset_version`.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: An integer. 0 if the dataset version has never been bumped.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    try:
+        row = connection.execute(
+            "SELECT value FROM metadata WHERE key='datasetVersion'"
+        ).fetchone()
+    except sqlite3.OperationalError:  # older databases lack the table
+        return 0
+    return 0 if row is None else row[0]
+
+
+def get_conn_stats():
+    """Get connection statistics for this process.
+
+    :return: A dict with the following keys. ``opens`` is the number of
+        connections opened, ``hits`` is the number of times a pooled connection
+        was reused, and ``queries`` is the number of statements executed.
+    """
+    return {key: _STATS[key] for key in ('opens', 'hits', 'queries')}
+
+
+def _open_db_conn(db_path):
+    """Open a connection, and apply PRAGMAs to it."""
+    conn = sqlite3.connect(
+        db_path,
+        cached_statements=DB_CACHED_STATEMENTS,
+        factory=_Connection,
+    )
+    _apply_pragmas(conn, DB_PRAGMAS)
+    return conn
+
+
+def _apply_pragmas(connection, pragmas_):
+    """Apply PRAGMAs to a connection. See :func:`pragmas`."""
+    for pragma, value in pragmas_.items():
+        connection.execute(f'PRAGMA {pragma}={value}').fetchall()
+
+
+def _thread_attr(name):
+    """Get a dict attribute of :data:`_LOCAL`, creating it if necessary."""
+    try:
+        return getattr(_LOCAL, name)
+    except AttributeError:
+        setattr(_LOCAL, name, {})
+        return getattr(_LOCAL, name)
+
+
+def _thread_conns():
+    """Get this thread's ``conns`` dict, creating and registering it if needed.
+
+    Pools registered by threads which have since exited are dropped, so their
+    connections are closed when garbage collected, as they would be without
+    the registry.
+    """
+    try:
+        return _LOCAL.conns
+    except AttributeError:
+        pass
+    conns = _LOCAL.conns = {}
+    with _POOLS_LOCK:
+        for thread in [thread for thread in _POOLS if not thread.is_alive()]:
+            del _POOLS[thread]
+        _POOLS[threading.current_thread()] = conns
+    return conns
+
+
+def _reset_after_fork():
+    """Forget the connections and statistics inherited from a parent process.
+
+    SQLite connections must not be used across a fork. Neither may they be
+    closed, as closing a connection may interfere with the parent's use of the
+    database, and they are closed when garbage collected. Every thread's
+    connections are stashed away instead, not just the forking thread's, as the
+    child's copies of other threads are discarded.
+    """
+    global _LOCAL, _POOLS_LOCK  # pylint:disable=global-statement
+    for conns in _POOLS.values():
+        _FORKED_CONNS.extend(conns.values())
+    _POOLS.clear()
+    # Another thread may have held the lock when this process was forked.
+    _POOLS_LOCK = threading.Lock()
+    _LOCAL = threading.local()
+    _STATS.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def get_load_path():
@@ -1,6 +1,16 @@
 # coding=utf-8
 """Functions for counting rows in the database."""
-from movie_recommender.db import common
+from movie_recommender.db import common, read, store
+
+
+RATING_PAIRS_COUNT_QUERY = f"""
+    SELECT COUNT (*) FROM ({read.RATING_PAIRS_QUERY})
+"""
+"""The query :func:`rating_pairs` executes, with the two movie IDs in order.
+
+It counts the rows yielded by
+:data:`movie_recommender.db.read.RATING_PAIRS_QUERY`.
+"""
 
 
 def avg_ratings():
@@ -8,6 +18,9 @@ def avg_ratings():
 
     :return: An integer.
     """
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return ratings_store.count_avg_ratings()
     with common.get_db_conn() as conn:
         return conn.execute(
             'SELECT COUNT(DISTINCT userId) FROM avgRatings'
@@ -30,26 +43,13 @@ def rating_pairs(movie_a, movie_b):
             Movie IDs: {movie_a}, {movie_b}
             """
         )
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return len(ratings_store.rating_pairs(movie_a, movie_b))
     movies = [movie_a, movie_b]
     movies.sort()
     with common.get_db_conn() as conn:
-        row = conn.execute(
-            """
-            SELECT COUNT (*)
-            FROM (
-                SELECT userId, rating
-                FROM ratings
-                WHERE movieId = ?
-            ) movieARatings
-            INNER JOIN (
-                SELECT userId, rating
-                FROM ratings
-                WHERE movieId = ?
-            ) movieBRatings
-            WHERE movieARatings.userId = movieBRatings.userId
-            """,
-            movies,
-        ).fetchone()
+        row = conn.execute(RATING_PAIRS_COUNT_QUERY, movies).fetchone()
     return row[0]
 
 
@@ -69,11 +69,25 @@ def unrated_movies(user_id):
         ).fetchone()[0]
 
 
+def user_ratings():
+    """Count the number of ratings each user has made.
+
+    :return: A dict in the form ``{user_id: num_ratings}``.
+    """
+    with common.get_db_conn() as conn:
+        return dict(conn.execute(
+            'SELECT userId, COUNT(*) FROM ratings GROUP BY userId'
+        ))
+
+
 def user_ids():
     """Count the number of users in the current dataset.
 
     :return: An integer.
     """
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return ratings_store.count_user_ids()
     with common.get_db_conn() as conn:
         return conn.execute(
             'SELECT COUNT(DISTINCT userId) FROM ratings'
@@ -0,0 +1,186 @@
+# coding=utf-8
+"""Movie features, parsed once, and cached in each process as arrays.
+
+Predictors made by :mod:`movie_recommender.predict.ml` need each movie's
+release year, which is embedded in its title, e.g. "Toy Story (1995)", and
+each movie's genres, which are stored as a pipe-delimited string, e.g.
+"Animation|Children". Parsing these for every movie in the catalogue, each
+time a user's recommendations are generated, is slow. Instead, the
+"movieFeatures" table holds each movie's year, and a bitmask of its genres, as
+computed by :func:`parse`. It's populated when the database is created or
+migrated. See :func:`movie_recommender.db.init.cpop_movie_features_table`.
+
+:func:`get` loads that table, and each movie's title, into the current process
+the first time it's called, and returns the same :class:`MovieFeatures` from
+then on. Looking up a movie's features then needs no SQL, regular expressions
+or string splitting. Like :mod:`movie_recommender.db.store`, the cache is a
+snapshot, but movies are only added when a database is created, so it's safe
+to hold for the life of a process.
+"""
+import sqlite3
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.constants import GENRE_BITS, YEAR_MATCHER
+from movie_recommender.db import common
+
+
+_FEATURES = None
+"""The movie features loaded into this process, if any. See :func:`get`."""
+
+
+class MovieFeatures():
+    """The year, genres and title of every movie, held in arrays."""
+
+    def __init__(self, rows):
+        """Initialize instance attributes.
+
+        :param rows: An iterable of ``(movie_id, title, year, genre_mask)``
+            tuples, where ``year`` is ``None`` if a movie's title doesn't
+            include a year. See :func:`parse`.
+        """
+        rows = sorted(rows)
+        self._movie_ids = numpy.array(
+            [row[0] for row in rows],
+            dtype=numpy.int64,
+        )
+        self._titles = [row[1] for row in rows]
+        self._years = numpy.array(
+            [numpy.nan if row[2] is None else row[2] for row in rows],
+            dtype=numpy.float64,
+        )
+        self._genre_masks = numpy.array(
+            [row[3] for row in rows],
+            dtype=numpy.int64,
+        )
+        # Looking up one movie in a dict is much faster than searching a numpy
+        # array for it.
+        self._indices = {row[0]: i for i, row in enumerate(rows)}
+        self._years_list = [row[2] for row in rows]
+        self._genre_masks_list = [row[3] for row in rows]
+
+    def lookup(self, movie_ids):
+        """Get the years and genre bitmasks of several movies.
+
+        :param movie_ids: A numpy array of movie IDs.
+        :return: A ``(years, genre_masks)`` tuple of numpy arrays, with one
+            value per movie. A movie's year is NaN if its title doesn't include
+            a year.
+        :raise ValueError: If a movie isn't in the database.
+        """
+        indices = numpy.searchsorted(self._movie_ids, movie_ids)
+        indices = numpy.minimum(indices, len(self._movie_ids) - 1)
+        missing = self._movie_ids[indices] != movie_ids
+        if missing.any():
+            raise ValueError(
+                f'Movie IDs {numpy.asarray(movie_ids)[missing].tolist()} not '
+                'in database.'
+            )
+        return self._years[indices], self._genre_masks[indices]
+
+    def has_genre(self, movie_id, genre):
+        """Tell whether a movie has a genre.
+
+        :param movie_id: A movie ID.
+        :param genre: A genre name, from
+            :data:`movie_recommender.constants.GENRES`.
+        :return: A boolean.
+        """
+        genre_mask = self._genre_masks_list[self._index(movie_id)]
+        return bool(genre_mask & GENRE_BITS[genre])
+
+    def title(self, movie_id):
+        """See :func:`movie_recommender.db.read.title`."""
+        return self._titles[self._index(movie_id)]
+
+    def year(self, movie_id):
+        """Get the release year of a movie.
+
+        :param movie_id: A movie ID.
+        :return: The release year of the given movie.
+        :raise movie_recommender.exceptions.NoMovieYearError: If the given
+            movie doesn't have a release year.
+        """
+        i = self._index(movie_id)
+        year = self._years_list[i]
+        if year is None:
+            raise exceptions.NoMovieYearError(
+                f"Can't find year in movie title: {self._titles[i]}"
+            )
+        return year
+
+    def _index(self, movie_id):
+        """Find a movie's index in this object's arrays."""
+        try:
+            return self._indices[movie_id]
+        except KeyError:
+            raise ValueError(f'Movie ID {movie_id} not in database.') from None
+
+
+def get():
+    """Get the movie features, loading them on first use.
+
+    :return: A :class:`MovieFeatures`.
+    """
+    if _FEATURES is None:
+        load()
+    return _FEATURES
+
+
+def load(reload=False):
+    """Load movie features into this process.
+
+    If the database lacks the "movieFeatures" table, as databases created by
+    older versions of this application do, then features are parsed from the
+    "movies" table instead. Run ``mr-db migrate`` to avoid this.
+
+    :param reload: If features are already loaded, should they be replaced?
+    :return: Nothing.
+    """
+    global _FEATURES  # pylint:disable=global-statement
+    if _FEATURES is not None and not reload:
+        return
+    with common.get_db_conn() as conn:
+        try:
+            rows = conn.execute(
+                """
+                SELECT movieId, title, year, genreMask
+                FROM movies JOIN movieFeatures USING (movieId)
+                """
+            ).fetchall()
+        except sqlite3.OperationalError:  # older databases lack the table
+            rows = [
+                (movie_id, title) + parse(title, genres)
+                for movie_id, title, genres in conn.execute(
+                    'SELECT movieId, title, genres FROM movies'
+                )
+            ]
+    _FEATURES = MovieFeatures(rows)
+
+
+def parse(title, genres):
+    """Parse a movie's features from its title and genres.
+
+    :param title: A movie title, such as "Toy Story (1995)".
+    :param genres: A pipe-delimited string of genres, such as
+        "Animation|Children".
+    :return: A ``(year, genre_mask)`` tuple. ``year`` is ``None`` if the title
+        doesn't include a year. ``genre_mask`` is the bitwise OR of each
+        genre's bit in :data:`movie_recommender.constants.GENRE_BITS`. Genres
+        not in that mapping are ignored.
+    """
+    match = YEAR_MATCHER.search(title)
+    genre_mask = 0
+    for genre in genres.split('|'):
+        genre_mask |= GENRE_BITS.get(genre, 0)
+    return (int(match.group(1)) if match else None), genre_mask
+
+
+def unload():
+    """Discard the movie features loaded into this process, if any.
+
+    :return: Nothing.
+    """
+    global _FEATURES  # pylint:disable=global-statement
+    _FEATURES = None
@@ -1,12 +1,23 @@
 # coding=utf-8
 """Functions for initializing the database."""
+import contextlib
+import csv
+import io
+import multiprocessing
+import time
 from pathlib import Path
 
-from movie_recommender import datasets, exceptions
-from movie_recommender.db import common
+from movie_recommender import datasets, exceptions, profiling
+from movie_recommender.constants import (
+    DB_JOURNAL_MODE,
+    DB_LOAD_CHUNK_SIZE,
+    DB_LOAD_PRAGMAS,
+    SCHEMA_VERSION,
+)
+from movie_recommender.db import common, features
 
 
-def cpop_db(dataset):
+def cpop_db(dataset, fast=False, jobs=None):
     """Create and populate a new database.
 
     More specifically:
@@ -14,11 +25,36 @@ def cpop_db(dataset):
     * Create database tables for the datasets.
     * Create database tables for calculated data. (i.e. Create a table which
       maps userId → predictorName.)
-    * Populate the dataset tables.
+    * Populate the dataset tables, and the "movieFeatures" table derived from
+      them.
+    * Create indexes, set the journal mode, and record the schema version. See
+      :mod:`movie_recommender.db.migrate`.
+
+    By default, each CSV file is parsed in this process, and its rows are
+    inserted with one statement, into a table whose indexes are updated as
+    each row is inserted. If ``fast`` is true, the following is done instead:
+
+    * The PRAGMAs in :data:`movie_recommender.constants.DB_LOAD_PRAGMAS` are
+      applied while the dataset tables are populated.
+    * Each CSV file is split into chunks of
+      :data:`movie_recommender.constants.DB_LOAD_CHUNK_SIZE` bytes, which are
+      parsed by a pool of processes, and inserted in order as they're parsed.
+
+    Either way, the tables have the same schema, and indexes other than
+    primary keys are created after the tables have been populated. The
+    MovieLens CSV files are sorted by their tables' primary keys, so those
+    indexes grow by appending.
+
+    Fast loading assumes that no field in a CSV file contains a newline, as is
+    true of the MovieLens datasets.
 
     :param dataset: The dataset to populate the new database with. Use one of
         the keys from :data:`movie_recommender.constants.DATASETS`.
-    :return: Nothing
+    :param fast: Should the database be populated in fast mode?
+    :param jobs: The number of processes to spawn when populating the database
+        in fast mode. If ``None``, one per CPU.
+    :return: A tuple of :class:`movie_recommender.db.common.LoadStats`, one per
+        dataset table.
     :raises DatabaseAlreadyExistsError: If the target database already exists.
     :raises DatasetAbsentError: If the referenced dataset isn't installed.
     """
@@ -40,155 +76,239 @@ def cpop_db(dataset):
 
     # Create and populate a new database.
     with common.get_db_conn(save_path) as conn:
-        cpop_links_table(
-            conn,
-            Path(installed_datasets[dataset], 'links.csv'),
-        )
-        cpop_movies_table(
-            conn,
-            Path(installed_datasets[dataset], 'movies.csv'),
-        )
-        cpop_ratings_table(
-            conn,
-            Path(installed_datasets[dataset], 'ratings.csv'),
-        )
-        cpop_tags_table(
-            conn,
-            Path(installed_datasets[dataset], 'tags.csv'),
-        )
-        c_predictors_table(conn)
-        c_similarities_table(conn)
-        c_avg_ratings_table(conn)
+        with contextlib.ExitStack() as stack:
+            pool = None
+            if fast:
+                stack.enter_context(common.pragmas(conn, DB_LOAD_PRAGMAS))
+                pool = stack.enter_context(multiprocessing.Pool(jobs))
+            load_stats = (
+                cpop_links_table(
+                    conn,
+                    Path(installed_datasets[dataset], 'links.csv'),
+                    pool,
+                ),
+                cpop_movies_table(
+                    conn,
+                    Path(installed_datasets[dataset], 'movies.csv'),
+                    pool,
+                ),
+                cpop_ratings_table(
+                    conn,
+                    Path(installed_datasets[dataset], 'ratings.csv'),
+                    pool,
+                ),
+                cpop_tags_table(
+                    conn,
+                    Path(installed_datasets[dataset], 'tags.csv'),
+                    pool,
+                ),
+            )
+            cpop_movie_features_table(conn)
+            c_predictors_table(conn)
+            c_similarities_table(conn)
+            c_similarity_stats_table(conn)
+            c_neighbors_table(conn)
+            c_avg_ratings_table(conn)
+            c_metadata_table(conn)
+            c_recommendations_table(conn)
+            c_recommendation_cache_table(conn)
+            c_indexes(conn)
+        set_journal_mode(conn)
+        with conn:
+            conn.execute(
+                "INSERT INTO metadata VALUES ('schemaVersion', ?)",
+                (SCHEMA_VERSION,),
+            )
+    return load_stats
 
 
-def cpop_links_table(connection, csv_path):
+def cpop_links_table(connection, csv_path, pool=None):
     """Create and populate the "links" table.
 
     :param connection: A sqlite3 `Connection`_ object.
     :param csv_path: The path to a ``links.csv`` file.
-    :return: Nothing.
+    :param pool: A ``multiprocessing.Pool``. If not ``None``, populate the
+        table in fast mode. See :func:`cpop_db`.
+    :return: A :class:`movie_recommender.db.common.LoadStats`.
 
     .. _Connection:
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
     """
-    with open(csv_path) as handle:
-        with connection:
-            connection.execute("""\
-                CREATE TABLE links (
-                    movieId integer primary key,
-                    imdbId text,
-                    tmdbId text
-                )
-            """)
-        with connection:
-            connection.executemany(
-                'INSERT INTO links VALUES (?, ?, ?)',
-                common.parse_csv(
-                    handle,
-                    lambda fields: (int(fields[0]), fields[1], fields[2]),
-                )
+    start = time.perf_counter()
+    with connection:
+        connection.execute("""\
+            CREATE TABLE links (
+                movieId integer primary key,
+                imdbId text,
+                tmdbId text
             )
+        """)
+    rows = _populate(connection, 'links', csv_path, _cast_link, pool)
+    return common.LoadStats('links', rows, time.perf_counter() - start)
 
 
-def cpop_movies_table(connection, csv_path):
+def cpop_movies_table(connection, csv_path, pool=None):
     """Create and populate the "movies" table.
 
     :param connection: A sqlite3 `Connection`_ object.
     :param csv_path: The path to a ``movies.csv`` file.
+    :param pool: See :func:`cpop_links_table`.
+    :return: A :class:`movie_recommender.db.common.LoadStats`.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    start = time.perf_counter()
+    with connection:
+        connection.execute("""\
+            CREATE TABLE movies (
+                movieId integer primary key,
+                title text,
+                genres text
+            )
+        """)
+    rows = _populate(connection, 'movies', csv_path, _cast_movie, pool)
+    return common.LoadStats('movies', rows, time.perf_counter() - start)
+
+
+def cpop_movie_features_table(connection):
+    """Create and populate the "movieFeatures" table.
+
+    This table holds each movie's release year, or ``NULL`` if its title
+    doesn't include one, and a bitmask of its genres. Both are parsed from the
+    "movies" table, which must already be populated. See
+    :mod:`movie_recommender.db.features`.
+
+    This table didn't exist in older databases, which is why this function
+    tolerates an existing table, and replaces its rows.
+
+    :param connection: A sqlite3 `Connection`_ object.
     :return: Nothing.
 
     .. _Connection:
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
     """
-    with open(csv_path) as handle:
-        with connection:
-            connection.execute("""\
-                CREATE TABLE movies (
-                    movieId integer primary key,
-                    title text,
-                    genres text
-                )
-            """)
-        with connection:
-            connection.executemany(
-                'INSERT INTO movies VALUES (?, ?, ?)',
-                common.parse_csv(
-                    handle,
-                    lambda fields: (int(fields[0]), fields[1], fields[2]),
-                )
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS movieFeatures (
+                movieId INTEGER PRIMARY KEY,
+                year INTEGER,
+                genreMask INTEGER
             )
+            """
+        )
+        connection.executemany(
+            'INSERT OR REPLACE INTO movieFeatures VALUES (?, ?, ?)',
+            (
+                (movie_id,) + features.parse(title, genres)
+                for movie_id, title, genres in connection.execute(
+                    'SELECT movieId, title, genres FROM movies'
+                ).fetchall()
+            ),
+        )
 
 
-def cpop_ratings_table(connection, csv_path):
+def cpop_ratings_table(connection, csv_path, pool=None):
     """Create and populate the "ratings" table.
 
     :param connection: A sqlite3 `Connection`_ object.
     :param csv_path: The path to a ``ratings.csv`` file.
-    :return: Nothing.
+    :param pool: See :func:`cpop_links_table`.
+    :return: A :class:`movie_recommender.db.common.LoadStats`.
 
     .. _Connection:
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
     """
-    with open(csv_path) as handle:
-        with connection:
-            connection.execute("""\
-                CREATE TABLE ratings (
-                    userId integer,
-                    movieId integer,
-                    rating real,
-                    timestamp integer,
-                    PRIMARY KEY (userId, movieId)
-                )
-            """)
-        with connection:
-            connection.executemany(
-                'INSERT INTO ratings VALUES (?, ?, ?, ?)',
-                common.parse_csv(
-                    handle,
-                    lambda fields: (
-                        int(fields[0]),
-                        int(fields[1]),
-                        float(fields[2]),
-                        int(fields[3]),
-                    )
-                )
+    start = time.perf_counter()
+    with connection:
+        connection.execute("""\
+            CREATE TABLE ratings (
+                userId integer,
+                movieId integer,
+                rating real,
+                timestamp integer,
+                PRIMARY KEY (userId, movieId)
             )
+        """)
+    rows = _populate(connection, 'ratings', csv_path, _cast_rating, pool)
+    return common.LoadStats('ratings', rows, time.perf_counter() - start)
 
 
-def cpop_tags_table(connection, csv_path):
+def cpop_tags_table(connection, csv_path, pool=None):
     """Create and populate the "tags" table.
 
     :param connection: A sqlite3 `Connection`_ object.
     :param csv_path: The path to a ``tags.csv`` file.
-    :return: Nothing.
+    :param pool: See :func:`cpop_links_table`.
+    :return: A :class:`movie_recommender.db.common.LoadStats`.
 
     .. _Connection:
         https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
     """
-    with open(csv_path) as handle:
-        with connection:
-            connection.execute("""\
-                CREATE TABLE tags (
-                    userId integer,
-                    movieId integer,
-                    tag text,
-                    timestamp integer,
-                    PRIMARY KEY (userId, movieId, tag)
-                )
-            """)
-        with connection:
-            connection.executemany(
-                'INSERT INTO tags VALUES (?, ?, ?, ?)',
-                common.parse_csv(
-                    handle,
-                    lambda fields: (
-                        int(fields[0]),
-                        int(fields[1]),
-                        fields[2],
-                        int(fields[3]),
-                    )
-                )
+    start = time.perf_counter()
+    with connection:
+        connection.execute("""\
+            CREATE TABLE tags (
+                userId integer,
+                movieId integer,
+                tag text,
+                timestamp integer,
+                PRIMARY KEY (userId, movieId, tag)
             )
+        """)
+    rows = _populate(connection, 'tags', csv_path, _cast_tag, pool)
+    return common.LoadStats('tags', rows, time.perf_counter() - start)
+
+
+def c_indexes(connection):
+    """Create indexes which aren't implied by tables' primary keys.
+
+    The "ratings" table's primary key is ``(userId, movieId)``, and the
+    "similarities" table's is ``(movieAId, movieBId)``. Queries which look up
+    ratings by movie, or similarity scores by movie B, would scan those tables
+    without these indexes. Each index also holds the column that such queries
+    select, so the tables themselves needn't be read.
+
+    These indexes didn't exist in older databases, which is why this function
+    tolerates existing indexes.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS ratingsMovie
+            ON ratings (movieId, userId, rating)
+            """
+        )
+        connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS similaritiesMovieB
+            ON similarities (movieBId, movieAId, similarity)
+            """
+        )
+
+
+def set_journal_mode(connection):
+    """Switch a database to the journal mode it should use.
+
+    See :data:`movie_recommender.constants.DB_JOURNAL_MODE`. The journal mode
+    is stored in the database file, so this needs to be done once per
+    database, not once per connection.
+
+    :param connection: A sqlite3 `Connection`_ object. It shouldn't have an
+        open transaction.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    connection.execute(f'PRAGMA journal_mode={DB_JOURNAL_MODE}').fetchall()
 
 
 def c_avg_ratings_table(connection):
@@ -278,3 +398,278 @@ def c_similarities_table(connection):
             )
             """
         )
+
+
+def c_neighbors_table(connection):
+    """Create the "neighbors" table, if it doesn't already exist.
+
+    This table is a pruned copy of the "similarities" table. For each movie,
+    it holds up to K of that movie's neighbors, where a neighbor is a movie
+    with a non-zero similarity score. Unlike the "similarities" table, each
+    pair of movies may be stored twice: once as (movieId, neighborId), and once
+    as (neighborId, movieId). See
+    :meth:`movie_recommender.analyze.ii.analyze_neighbors`.
+
+    This table didn't exist in older databases, which is why this function
+    tolerates an existing table.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS neighbors (
+                movieId INTEGER,
+                neighborId INTEGER CHECK(movieId != neighborId),
+                similarity REAL,
+                PRIMARY KEY (movieId, neighborId)
+            )
+            """
+        )
+
+
+def c_similarity_stats_table(connection):
+    """Create the "similarityStats" table, if it doesn't already exist.
+
+    This table holds the sufficient statistics for some of the rows in the
+    "similarities" table, so that similarity scores may be updated as ratings
+    are added or changed. Like the "similarities" table, it's logically one
+    half of an m×m table. Column A refers to the movie with the lower ID. See
+    :meth:`movie_recommender.matrix.AdjustedCosine.stats` and
+    :meth:`movie_recommender.analyze.ii_update.update_ratings`.
+
+    This table didn't exist in older databases, which is why this function
+    tolerates an existing table.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS similarityStats (
+                movieAId INTEGER,
+                movieBId INTEGER CHECK(movieAId < movieBId),
+                count INTEGER,
+                sumProducts REAL,
+                sumSquaresA REAL,
+                sumSquaresB REAL,
+                PRIMARY KEY (movieAId, movieBId)
+            )
+            """
+        )
+
+
+def c_metadata_table(connection):
+    """Create the "metadata" table, if it doesn't already exist.
+
+    This table is a key/value store for facts about the database as a whole.
+    Keys include:
+
+    ``datasetVersion``
+        A counter, incremented whenever data that recommendations depend on is
+        written. See :func:`movie_recommender.db.write.bump_dataset_version`.
+
+    This table didn't exist in older databases, which is why this function
+    tolerates an existing table.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value
+            )
+            """
+        )
+
+
+def c_recommendations_table(connection):
+    """Create the "recommendations" table, if it doesn't already exist.
+
+    This table holds each user's top-N recommendations, as produced by some
+    algorithm, in order of rank. Each row records the dataset version it was
+    computed from, so that stale rows may be found. See
+    :meth:`movie_recommender.recommend.ii.recommend_all`.
+
+    This table didn't exist in older databases, which is why this function
+    tolerates an existing table.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS recommendations (
+                userId INTEGER,
+                algorithm TEXT,
+                rank INTEGER,
+                movieId INTEGER,
+                predRating REAL,
+                reason TEXT,
+                datasetVersion INTEGER,
+                PRIMARY KEY (userId, algorithm, rank)
+            )
+            """
+        )
+
+
+def c_recommendation_cache_table(connection):
+    """Create the "recommendationCache" table, if it doesn't already exist.
+
+    This table caches the recommendations printed by ``mr-recommend``, keyed
+    by user, algorithm, predictor and count. For the item-item algorithm, the
+    predictor is the empty string. Like the "recommendations" table, each row
+    records the dataset version it was computed from, and rows from older
+    dataset versions are ignored, and evicted as new rows are written. See
+    :func:`movie_recommender.recommend.cache.recommend`.
+
+    This table didn't exist in older databases, which is why this function
+    tolerates an existing table.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    with connection:
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS recommendationCache (
+                userId INTEGER,
+                algorithm TEXT,
+                predictor TEXT,
+                count INTEGER,
+                rank INTEGER,
+                movieId INTEGER,
+                predRating REAL,
+                reason TEXT,
+                datasetVersion INTEGER,
+                PRIMARY KEY (userId, algorithm, predictor, count, rank)
+            )
+            """
+        )
+        connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS recommendationCacheVersion
+            ON recommendationCache (datasetVersion)
+            """
+        )
+
+
+def _cast_link(fields):
+    """Cast a row of a ``links.csv`` file."""
+    return (int(fields[0]), fields[1], fields[2])
+
+
+def _cast_movie(fields):
+    """Cast a row of a ``movies.csv`` file."""
+    return (int(fields[0]), fields[1], fields[2])
+
+
+def _cast_rating(fields):
+    """Cast a row of a ``ratings.csv`` file."""
+    return (int(fields[0]), int(fields[1]), float(fields[2]), int(fields[3]))
+
+
+def _cast_tag(fields):
+    """Cast a row of a ``tags.csv`` file."""
+    return (int(fields[0]), int(fields[1]), fields[2], int(fields[3]))
+
+
+def _chunk_bounds(csv_path, size):
+    """Split a CSV file into chunks of whole lines, after its header row.
+
+    :param csv_path: The path to a CSV file with one header row.
+    :param size: The approximate size of each chunk, in bytes.
+    :return: A list of ``(start, stop)`` byte offsets.
+    """
+    bounds = []
+    with open(csv_path, 'rb') as handle:
+        handle.readline()
+        start = handle.tell()
+        end = handle.seek(0, io.SEEK_END)
+        while start < end:
+            handle.seek(min(start + size, end))
+            handle.readline()
+            stop = handle.tell()
+            bounds.append((start, stop))
+            start = stop
+    return bounds
+
+
+def _parse_chunk(args):
+    """Parse a chunk of a CSV file. See :func:`_chunk_bounds`.
+
+    :param args: A ``(csv_path, start, stop, caster)`` tuple.
+    :return: A list of cast rows.
+    """
+    csv_path, start, stop, caster = args
+    with open(csv_path, 'rb') as handle:
+        handle.seek(start)
+        text = handle.read(stop - start).decode()
+    return [caster(tuple(row)) for row in csv.reader(io.StringIO(text))]
+
+
+def _populate(connection, table, csv_path, caster, pool=None):
+    """Insert every row of a CSV file into a table, in one transaction.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :param table: The name of the table to populate.
+    :param csv_path: The path to a CSV file with one header row.
+    :param caster: A function which casts a row of the CSV file. See
+        :func:`movie_recommender.db.common.parse_csv`.
+    :param pool: A ``multiprocessing.Pool``. If not ``None``, the file is
+        split into chunks, which are parsed by the pool, and inserted in order
+        with one statement per chunk.
+    :return: The number of rows inserted.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    columns = len(
+        connection.execute(f'SELECT * FROM {table} LIMIT 0').description
+    )
+    statement = f'INSERT INTO {table} VALUES ({", ".join("?" * columns)})'
+    if pool is None:
+        with open(csv_path) as handle:
+            return _insert_chunks(
+                connection,
+                statement,
+                (common.parse_csv(handle, caster),),
+            )
+    chunks = pool.imap(profiling.task(_parse_chunk, '_parse_chunk'), (
+        (csv_path, start, stop, caster)
+        for start, stop in _chunk_bounds(csv_path, DB_LOAD_CHUNK_SIZE)
+    ))
+    return _insert_chunks(connection, statement, profiling.results(chunks))
+
+
+def _insert_chunks(connection, statement, chunks):
+    """Execute an INSERT statement once per chunk of rows, in one transaction.
+
+    :return: The number of rows inserted.
+    """
+    rows = 0
+    with connection:
+        for chunk in chunks:
+            rows += connection.executemany(statement, chunk).rowcount
+    return rows
@@ -0,0 +1,169 @@
+# coding=utf-8
+"""Upgrade existing databases to the latest schema, in place.
+
+A database's schema version is stored under the ``schemaVersion`` key of the
+"metadata" table. Databases created before schema versions were recorded have
+version 0. :func:`migrate` applies each migration newer than a database's
+schema version, in order. :func:`movie_recommender.db.init.cpop_db` creates
+databases at the latest version,
+:data:`movie_recommender.constants.SCHEMA_VERSION`, so they need no migrations.
+
+Every migration is idempotent, and a database's schema version is only
+recorded once a migration has been applied, so an interrupted migration may
+simply be repeated.
+
+Once a database has been migrated, :func:`check_query_plans` asks SQLite how it
+would execute the hottest queries in this application, and complains if any of
+them would scan an entire table.
+"""
+import re
+import sqlite3
+
+from movie_recommender import exceptions
+from movie_recommender.constants import SCHEMA_VERSION
+from movie_recommender.db import calc, common, count, init, read
+
+
+HOT_QUERIES = {
+    'rating': read.RATING_QUERY,
+    'average rating of a movie': calc.AVG_MOVIE_RATING_QUERY,
+    'pairs of ratings': read.RATING_PAIRS_QUERY,
+    'number of pairs of ratings': count.RATING_PAIRS_COUNT_QUERY,
+    'similar movies, as movie A': read.SIMILAR_AS_MOVIE_A_QUERY,
+    'similar movies, as movie B': read.SIMILAR_AS_MOVIE_B_QUERY,
+    'neighbors': read.NEIGHBORS_QUERY,
+}
+"""Queries which must not scan an entire table, by name.
+
+Each is a query executed by :mod:`movie_recommender.db`, such as
+:data:`movie_recommender.db.read.RATING_PAIRS_QUERY`, which is executed by
+:func:`movie_recommender.db.read.rating_pairs`. See
+:func:`check_query_plans`.
+"""
+
+
+def check_query_plans(connection=None):
+    """Check that no query in :data:`HOT_QUERIES` scans an entire table.
+
+    :param connection: A sqlite3 `Connection`_ object. If ``None``, use a
+        connection to the usual database.
+    :return: Nothing.
+    :raise movie_recommender.exceptions.QueryPlanError: If a query would scan
+        an entire table, or can't be planned.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    if connection is None:
+        with common.get_db_conn() as conn:
+            check_query_plans(conn)
+        return
+    for name, query in HOT_QUERIES.items():
+        try:
+            details = [
+                row[-1] for row in connection.execute(
+                    f'EXPLAIN QUERY PLAN {query}',
+                    (0,) * query.count('?'),
+                )
+            ]
+        except sqlite3.OperationalError as err:  # e.g. a table is missing
+            raise exceptions.QueryPlanError(
+                f'The "{name}" query can\'t be planned: {err}. Try running '
+                '"mr-db migrate".'
+            ) from err
+        scans = [detail for detail in details if _SCAN.match(detail)]
+        if scans:
+            raise exceptions.QueryPlanError(
+                f'The "{name}" query scans an entire table: '
+                f'{"; ".join(scans)}. Try running "mr-db migrate".'
+            )
+
+
+def migrate(connection=None):
+    """Apply pending migrations to a database, and then analyze it.
+
+    :param connection: A sqlite3 `Connection`_ object. It shouldn't have an
+        open transaction. If ``None``, use a connection to the usual database.
+    :return: A tuple of the schema versions migrated to, in order. Empty if the
+        database was already at the latest version.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    if connection is None:
+        with common.get_db_conn() as conn:
+            return migrate(conn)
+    applied = []
+    for version in range(schema_version(connection) + 1, SCHEMA_VERSION + 1):
+        MIGRATIONS[version - 1](connection)
+        with connection:
+            set_schema_version(connection, version)
+        applied.append(version)
+    # Give the query planner statistics about the new indexes. Examining a
+    # sample of each index is much faster than examining all of it, and just
+    # as useful to the query planner.
+    with common.pragmas(connection, {'analysis_limit': 2**10}):
+        connection.execute('ANALYZE')
+    return tuple(applied)
+
+
+def schema_version(connection):
+    """Get a database's schema version.
+
+    :param connection: A sqlite3 `Connection`_ object.
+    :return: An integer. 0 if no schema version has been recorded.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    try:
+        row = connection.execute(
+            "SELECT value FROM metadata WHERE key='schemaVersion'"
+        ).fetchone()
+    except sqlite3.OperationalError:  # older databases lack the table
+        return 0
+    return 0 if row is None else row[0]
+
+
+def set_schema_version(connection, version):
+    """Record a database's schema version.
+
+    :param connection: A sqlite3 `Connection`_ object. The "metadata" table
+        must exist. See :func:`movie_recommender.db.init.c_metadata_table`.
+    :param version: The schema version.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    connection.execute(
+        """
+        INSERT INTO metadata VALUES ('schemaVersion', ?)
+        ON CONFLICT (key) DO UPDATE SET value=excluded.value
+        """,
+        (version,),
+    )
+
+
+def _create_tables(connection):
+    """Create the tables which are missing from older databases."""
+    init.c_metadata_table(connection)
+    init.c_similarity_stats_table(connection)
+    init.c_neighbors_table(connection)
+    init.c_recommendations_table(connection)
+
+
+MIGRATIONS = (
+    _create_tables,
+    init.c_indexes,
+    init.cpop_movie_features_table,
+    init.set_journal_mode,
+)
+"""Functions which upgrade a database's schema, in order.
+
+The n-th function upgrades a database from schema version n - 1 to version n.
+Each accepts a sqlite3 ``Connection`` object.
+"""
+
+_SCAN = re.compile(r'SCAN (?!CONSTANT ROW)')
+"""Matches query plan details which describe a scan of an entire table."""
@@ -0,0 +1,337 @@
+# coding=utf-8
+"""An opt-in, memory-mapped copy of the similarities table.
+
+Predictions and recommendations read similarity scores far more often than
+anything else. :func:`build` packs the non-zero scores in the similarities
+table into a binary file, and :func:`load` maps that file into the current
+process. Once it's loaded, the following functions answer from the file
+instead of querying the database:
+
+* :func:`movie_recommender.db.read.similar_movies_for_user`
+* :func:`movie_recommender.db.read.similar_ratings_for_user`, unless
+  ``neighbors`` is true
+* :func:`movie_recommender.db.read.similarity`
+
+The file holds a symmetric matrix in CSR layout: the similar movies of the
+movie at index ``i`` are ``indices[offsets[i]:offsets[i + 1]]``, where each
+value is an index into ``movie_ids``, and their scores are the same slice of
+``scores``. Scores are stored as 32-bit floats. The file is mapped read-only,
+and every row is a slice of the map, so no scores are copied until they're
+used. Processes which load the same file share a single copy of it in the page
+cache. Processes forked after the file is loaded inherit the map.
+
+Like :mod:`movie_recommender.db.store`, the file is a snapshot. It records the
+dataset version it was built from, and :func:`load` refuses to map a file
+built from an older version of the dataset. See
+:func:`movie_recommender.db.read.dataset_version`.
+"""
+import itertools
+import os
+import struct
+from pathlib import Path
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.constants import PACKED_SIMILARITIES_NAME
+from movie_recommender.db import common
+
+
+_PACKED = None
+"""The packed similarities loaded into this process, if any.
+
+See :func:`get`.
+"""
+
+_MAGIC = b'MRPACK01'
+"""The first bytes of a packed similarities file, and its format version."""
+
+_HEADER = struct.Struct('<8sQQQ')
+"""The header of a packed similarities file.
+
+The header holds :data:`_MAGIC`, the number of movies, the number of stored
+scores, and the dataset version the file was built from. Arrays follow, in the
+order ``movie_ids`` (int64), ``offsets`` (int64), ``indices`` (int32) and
+``scores`` (float32). Each array starts on an 8-byte boundary.
+"""
+
+
+class PackedSimilarities():
+    """A symmetric matrix of similarity scores, held in CSR layout.
+
+    Pairs of movies without a stored score have a similarity score of 0.
+    """
+
+    def __init__(self, movie_ids, offsets, indices, scores):
+        """Initialize instance attributes.
+
+        :param movie_ids: A sorted numpy array of movie IDs.
+        :param offsets: A numpy array of row offsets, one longer than
+            ``movie_ids``.
+        :param indices: A numpy array of indices into ``movie_ids``, sorted
+            within each row.
+        :param scores: A numpy array of similarity scores, one per index.
+        """
+        self._movie_ids = movie_ids
+        self._offsets = offsets
+        self._indices = indices
+        self._scores = scores
+
+    @classmethod
+    def from_buffer(cls, buffer):
+        """Create an instance whose arrays are views of a buffer.
+
+        :param buffer: A numpy array of bytes, in the format described by
+            :data:`_HEADER`.
+        :return: A ``(packed_similarities, dataset_version)`` tuple.
+        :raise movie_recommender.exceptions.PackedSimilaritiesError: If the
+            buffer isn't in the expected format.
+        """
+        if len(buffer) < _HEADER.size:
+            raise exceptions.PackedSimilaritiesError('File is truncated.')
+        magic, num_movies, num_scores, dataset_version = _HEADER.unpack(
+            buffer[:_HEADER.size].tobytes()
+        )
+        if magic != _MAGIC:
+            raise exceptions.PackedSimilaritiesError(
+                'File is not a packed similarities file, or is from an '
+                'incompatible version of this application.'
+            )
+        movie_ids, start = _view(buffer, _HEADER.size, numpy.int64, num_movies)
+        offsets, start = _view(buffer, start, numpy.int64, num_movies + 1)
+        indices, start = _view(buffer, start, numpy.int32, num_scores)
+        scores, _ = _view(buffer, start, numpy.float32, num_scores)
+        return cls(movie_ids, offsets, indices, scores), dataset_version
+
+    @classmethod
+    def from_pairs(cls, movie_ids, movies_a, movies_b, scores):
+        """Create an instance from pairs of movies and their scores.
+
+        :param movie_ids: A numpy array of every movie ID.
+        :param movies_a: A numpy array of movie IDs.
+        :param movies_b: A numpy array of movie IDs. The n-th movie in
+            ``movies_a`` is paired with the n-th movie in ``movies_b``. Each
+            unordered pair should be given once.
+        :param scores: A numpy array of similarity scores, one per pair.
+        :return: A :class:`PackedSimilarities`.
+        """
+        movie_ids = numpy.unique(movie_ids)
+        rows = numpy.searchsorted(movie_ids, numpy.concatenate((
+            movies_a,
+            movies_b,
+        )))
+        cols = numpy.searchsorted(movie_ids, numpy.concatenate((
+            movies_b,
+            movies_a,
+        )))
+        order = numpy.lexsort((cols, rows))
+        return cls(
+            movie_ids,
+            numpy.searchsorted(
+                rows[order],
+                numpy.arange(len(movie_ids) + 1),
+            ).astype(numpy.int64),
+            cols[order].astype(numpy.int32),
+            numpy.concatenate((scores, scores))[order].astype(numpy.float32),
+        )
+
+    def row(self, movie_id):
+        """Get the movies with a non-zero similarity score to a movie.
+
+        :param movie_id: A movie ID.
+        :return: A ``(movie_ids, scores)`` tuple of numpy arrays.
+        """
+        i = _find(self._movie_ids, movie_id)
+        if i is None:
+            return self._movie_ids[:0], self._scores[:0]
+        start, stop = self._offsets[i], self._offsets[i + 1]
+        return (
+            self._movie_ids[self._indices[start:stop]],
+            self._scores[start:stop],
+        )
+
+    def similarity(self, movie_a, movie_b):
+        """See :func:`movie_recommender.db.read.similarity`.
+
+        Unlike that function, this method can't tell a score of 0 from a
+        missing score. If both movies were in the database when the file was
+        built, their score is assumed to be 0.
+        """
+        i = _find(self._movie_ids, movie_a)
+        j = _find(self._movie_ids, movie_b)
+        if i is None or j is None:
+            raise exceptions.MissingSimilarityError(
+                f'Movies {movie_a} and {movie_b} are not both in the packed '
+                'similarities file.'
+            )
+        start, stop = self._offsets[i], self._offsets[i + 1]
+        k = _find(self._indices[start:stop], j)
+        return 0.0 if k is None else float(self._scores[start + k])
+
+    def write(self, handle, dataset_version):
+        """Write this matrix to a file.
+
+        The file is in the format read by :meth:`from_buffer`.
+
+        :param handle: A file opened for writing in binary mode.
+        :param dataset_version: The dataset version this matrix was built
+            from.
+        :return: Nothing.
+        """
+        handle.write(_HEADER.pack(
+            _MAGIC,
+            len(self._movie_ids),
+            len(self._indices),
+            dataset_version,
+        ))
+        for array in (
+                self._movie_ids,
+                self._offsets,
+                self._indices,
+                self._scores):
+            handle.write(array.tobytes())
+            handle.write(bytes(_align(handle.tell()) - handle.tell()))
+
+
+def build(path=None):
+    """Pack the similarities table into a file.
+
+    The file is written next to its final path, and then moved into place.
+    Processes which have mapped an older copy of the file keep using it.
+
+    :param path: The path to write to. If ``None``, use :func:`get_path`.
+    :return: The number of similarity scores packed. Each is stored twice,
+        once for each movie in the pair.
+    """
+    path = get_path() if path is None else str(path)
+    with common.get_db_conn() as conn:
+        movie_ids = numpy.fromiter(
+            (row[0] for row in conn.execute('SELECT movieId FROM movies')),
+            dtype=numpy.int64,
+        )
+        dataset_version = common.get_dataset_version(conn)
+        cursor = conn.execute(
+            """
+            SELECT movieAId, movieBId, similarity
+            FROM similarities
+            WHERE similarity != 0
+            """
+        )
+        chunks = []
+        while True:
+            chunk = numpy.fromiter(
+                itertools.chain.from_iterable(cursor.fetchmany(2**16)),
+                dtype=numpy.float64,
+            ).reshape(-1, 3)
+            if not chunk.size:
+                break
+            chunks.append(chunk)
+    rows = numpy.concatenate(chunks) if chunks else numpy.empty((0, 3))
+    packed = PackedSimilarities.from_pairs(
+        movie_ids,
+        rows[:, 0].astype(numpy.int64),
+        rows[:, 1].astype(numpy.int64),
+        rows[:, 2],
+    )
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as handle:
+        packed.write(handle, dataset_version)
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+def get():
+    """Get the packed similarities loaded into this process.
+
+    :return: A :class:`PackedSimilarities`, or ``None`` if none are loaded.
+    """
+    return _PACKED
+
+
+def get_path():
+    """Return the default path to the packed similarities file.
+
+    The file lives next to the database. See
+    :func:`movie_recommender.db.common.get_load_path`.
+    """
+    return str(Path(common.get_load_path()).with_name(
+        PACKED_SIMILARITIES_NAME
+    ))
+
+
+def load(path=None, reload=False):
+    """Map a packed similarities file into this process.
+
+    :param path: The path to the file. If ``None``, use :func:`get_path`.
+    :param reload: If a file is already loaded, should it be replaced?
+    :return: Nothing.
+    :raise movie_recommender.exceptions.PackedSimilaritiesError: If the file
+        doesn't exist, is corrupt, or was built from an older version of the
+        dataset.
+    """
+    global _PACKED  # pylint:disable=global-statement
+    if _PACKED is not None and not reload:
+        return
+    path = get_path() if path is None else str(path)
+    if not Path(path).exists():
+        raise exceptions.PackedSimilaritiesError(
+            f"{path} doesn't exist. Create it with 'mr-db pack-similarities'."
+        )
+    # An empty file can't be mapped.
+    if not Path(path).stat().st_size:
+        raise exceptions.PackedSimilaritiesError('File is truncated.')
+    packed, dataset_version = PackedSimilarities.from_buffer(
+        numpy.memmap(path, dtype=numpy.uint8, mode='r')
+    )
+    with common.get_db_conn() as conn:
+        current_version = common.get_dataset_version(conn)
+    if dataset_version != current_version:
+        raise exceptions.PackedSimilaritiesError(
+            f'{path} was built from version {dataset_version} of the dataset, '
+            f'but the database holds version {current_version}. Re-create it '
+            "with 'mr-db pack-similarities'."
+        )
+    _PACKED = packed
+
+
+def unload():
+    """Discard the packed similarities loaded into this process, if any.
+
+    :return: Nothing.
+    """
+    global _PACKED  # pylint:disable=global-statement
+    _PACKED = None
+
+
+def _align(offset):
+    """Round an offset up to the next multiple of 8."""
+    return (offset + 7) // 8 * 8
+
+
+def _view(buffer, start, dtype, length):
+    """View part of a buffer as an array.
+
+    :param buffer: A numpy array of bytes.
+    :param start: The offset of the array in ``buffer``.
+    :param dtype: The numpy dtype of the array.
+    :param length: The number of elements in the array.
+    :return: A ``(array, next_start)`` tuple, where ``next_start`` is the
+        offset of the next array in ``buffer``.
+    :raise movie_recommender.exceptions.PackedSimilaritiesError: If
+        ``buffer`` is too short.
+    """
+    stop = start + length * numpy.dtype(dtype).itemsize
+    if stop > len(buffer):
+        raise exceptions.PackedSimilaritiesError('File is truncated.')
+    return buffer[start:stop].view(dtype), _align(stop)
+
+
+def _find(haystack, needle):
+    """Find ``needle`` in the sorted numpy array ``haystack``.
+
+    :return: The index of ``needle``, or ``None`` if it's absent.
+    """
+    i = int(numpy.searchsorted(haystack, needle))
+    if i < len(haystack) and haystack[i] == needle:
+        return i
+    return None
@@ -1,8 +1,69 @@
 # coding=utf-8
 """Functions for reading rows from the database."""
+import itertools
+import sqlite3
+
+import numpy
+
 from movie_recommender import exceptions
 from movie_recommender.constants import YEAR_MATCHER
-from movie_recommender.db import common
+from movie_recommender.db import common, packed, store
+from movie_recommender.predict.common import Prediction
+
+
+RATING_PAIRS_QUERY = """
+    SELECT
+        movieARatings.userId,
+        movieARatings.rating,
+        movieBRatings.rating
+    FROM (
+        SELECT userId, rating
+        FROM ratings
+        WHERE movieId = ?
+    ) movieARatings
+    INNER JOIN (
+        SELECT userId, rating
+        FROM ratings
+        WHERE movieId = ?
+    ) movieBRatings
+    WHERE movieARatings.userId = movieBRatings.userId
+"""
+"""The query :func:`rating_pairs` executes, with the two movie IDs in order.
+
+See :data:`movie_recommender.db.migrate.HOT_QUERIES`.
+"""
+
+RATING_QUERY = """
+    SELECT rating FROM ratings WHERE userId=? and movieId=?
+"""
+"""The query :func:`rating` executes, with a user ID and a movie ID."""
+
+NEIGHBORS_QUERY = """
+    SELECT neighbors.neighborId, neighbors.similarity, ratings.rating
+    FROM neighbors
+    JOIN ratings
+        ON ratings.movieId = neighbors.neighborId
+        AND ratings.userId = ?
+    WHERE neighbors.movieId = ?
+"""
+"""The query :func:`neighbors_for_user` executes, with a user and a movie."""
+
+SIMILAR_AS_MOVIE_A_QUERY = """
+    SELECT movieBId, similarity
+    FROM similarities
+    WHERE movieAId = ? AND similarity != 0
+"""
+"""A query :func:`similar_movies_for_user` executes, with a movie ID.
+
+It finds the movies paired with the given movie, where that movie is movie A.
+"""
+
+SIMILAR_AS_MOVIE_B_QUERY = """
+    SELECT movieAId, similarity
+    FROM similarities
+    WHERE movieBId = ? AND similarity != 0
+"""
+"""Like :data:`SIMILAR_AS_MOVIE_A_QUERY`, where the given movie is movie B."""
 
 
 def all_movies():
@@ -15,12 +76,35 @@ def all_movies():
             yield row[0]
 
 
+def all_avg_ratings():
+    """Yield every average rating in the avgRatings table.
+
+    :return: A generator that yields
+        :class:`movie_recommender.db.common.AvgRating` objects.
+    """
+    with common.get_db_conn() as conn:
+        for row in conn.execute('SELECT userId, avgRating FROM avgRatings'):
+            yield common.AvgRating(row[0], row[1])
+
+
+def all_ratings():
+    """Yield every rating.
+
+    :return: A generator that yields ``(user_id, movie_id, rating)`` tuples.
+    """
+    with common.get_db_conn() as conn:
+        yield from conn.execute('SELECT userId, movieId, rating FROM ratings')
+
+
 def avg_rating(user_id):
     """Get the average of a user's ratings, from the avgRatings table.
 
     :param user_id: A user ID. The user whose average rating is being fetched.
     :return: An average rating, such as 3.5.
     """
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return ratings_store.avg_rating(user_id)
     with common.get_db_conn() as conn:
         row = conn.execute(
             """
@@ -35,12 +119,67 @@ def avg_rating(user_id):
     return row[0]
 
 
+def cached_recommendations(  # pylint:disable=too-many-arguments
+        user_id,
+        algorithm,
+        predictor,
+        count,
+        dataset_version_):
+    """Get recommendations from the recommendation cache.
+
+    See :func:`movie_recommender.db.init.c_recommendation_cache_table`.
+
+    :param user_id: A user ID.
+    :param algorithm: The name of the algorithm which made the
+        recommendations, e.g. "ii" or "ml".
+    :param predictor: The name of the predictor used by the algorithm, or the
+        empty string.
+    :param count: The number of recommendations requested.
+    :param dataset_version_: The current dataset version. See
+        :func:`dataset_version`.
+    :return: A tuple of :class:`movie_recommender.predict.common.Prediction`
+        objects, in order of rank, or ``None`` if no recommendations computed
+        from this dataset version are cached.
+    """
+    with common.get_db_conn() as conn:
+        try:
+            rows = conn.execute(
+                """
+                SELECT predRating, movieId, reason
+                FROM recommendationCache
+                WHERE userId=? AND algorithm=? AND predictor=? AND count=?
+                    AND datasetVersion=?
+                ORDER BY rank
+                """,
+                (user_id, algorithm, predictor, count, dataset_version_),
+            ).fetchall()
+        except sqlite3.OperationalError:  # older databases lack the table
+            rows = ()
+    if not rows:
+        return None
+    return tuple(Prediction(*row) for row in rows)
+
+
+def dataset_version():
+    """Get the dataset version.
+
+    See :func:`movie_recommender.db.write.bump_dataset_version`.
+
+    :return: An integer. 0 if the dataset version has never been bumped.
+    """
+    with common.get_db_conn() as conn:
+        return common.get_dataset_version(conn)
+
+
 def genres(movie_id):
     """Get the genres of the given movie.
 
     :param movie_id: A movie ID.
     :return: An iterable of genres, as strings.
     """
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return ratings_store.genres(movie_id)
     with common.get_db_conn() as conn:
         genres_strings = tuple(
             row[0] for row in conn.execute(
@@ -52,6 +191,24 @@ def genres(movie_id):
     return genres_strings[0].split('|')
 
 
+def neighbors_for_user(movie, user):
+    """Yield the neighbors of ``movie`` that ``user`` has rated.
+
+    This function is like :func:`similar_movies_for_user`, but it reads from
+    the pruned "neighbors" table, and it fetches the user's ratings in the same
+    query.
+
+    :param movie: A movie ID.
+    :param user: A user ID.
+    :return: A generator yielding tuples of the form ``(movie_id, similarity,
+        rating)``.
+    :raise movie_recommender.exceptions.NoNeighborModelError: If no neighbor
+        model has been built.
+    """
+    with common.get_db_conn() as conn:
+        yield from _execute_neighbors(conn, NEIGHBORS_QUERY, (user, movie))
+
+
 def predictor_name(user_id):
     """Get the personalized predictor name for the given user.
 
@@ -74,12 +231,37 @@ def predictor_name(user_id):
     return row[0]
 
 
+def rated_movie_ratings(user_id):
+    """Get the ID of each movie a user has rated, and the rating.
+
+    Ratings of movies missing from the "movies" table are omitted.
+
+    :param user_id: A user ID.
+    :return: A tuple of ``(movie_id, rating)`` tuples.
+    """
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return ratings_store.rated_movie_ratings(user_id)
+    with common.get_db_conn() as conn:
+        return tuple(conn.execute(
+            """
+            SELECT ratings.movieId, ratings.rating
+            FROM ratings JOIN movies USING (movieId)
+            WHERE ratings.userId = ?
+            """,
+            (user_id,),
+        ))
+
+
 def rated_movies(user_ids):
     """Get the IDs of the movies the given users have rated.
 
     :param user_ids: An iterable of user IDs.
     :return: A set of movie IDs.
     """
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return ratings_store.rated_movies(user_ids)
     with common.get_db_conn() as conn:
         return {
             row[0] for row in conn.execute(
@@ -100,12 +282,13 @@ def rating(user_id, movie_id):
     :param movie_id: A movie ID.
     :return: A movie rating. (A float.)
     """
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return ratings_store.rating(user_id, movie_id)
     with common.get_db_conn() as conn:
         ratings = tuple(
-            row[0] for row in conn.execute(
-                'SELECT rating FROM ratings WHERE userId=? and movieId=?',
-                (user_id, movie_id)
-            )
+            row[0]
+            for row in conn.execute(RATING_QUERY, (user_id, movie_id))
         )
     assert len(ratings) == 1
     return ratings[0]
@@ -139,29 +322,68 @@ def rating_pairs(movie_a, movie_b):
             Movie IDs: {movie_a}, {movie_b}
             """
         )
+    ratings_store = store.get()
+    if ratings_store is not None:
+        yield from ratings_store.rating_pairs(movie_a, movie_b)
+        return
     movies = [movie_a, movie_b]
     movies.sort()
     with common.get_db_conn() as conn:
-        for row in conn.execute(
+        for row in conn.execute(RATING_PAIRS_QUERY, movies):
+            yield common.RatingPair(row[0], row[1], row[2])
+
+
+def recommendations(user_id, algorithm):
+    """Get a user's stored recommendations.
+
+    :param user_id: A user ID.
+    :param algorithm: The name of the algorithm which made the
+        recommendations, e.g. "ii".
+    :return: A tuple of :class:`movie_recommender.predict.common.Prediction`
+        objects, in order of rank.
+    :raise movie_recommender.exceptions.NoStoredRecommendationsError: If no
+        recommendations have been stored for the user.
+    """
+    with common.get_db_conn() as conn:
+        try:
+            rows = conn.execute(
                 """
-                SELECT
-                    movieARatings.userId,
-                    movieARatings.rating,
-                    movieBRatings.rating
-                FROM (
-                    SELECT userId, rating
-                    FROM ratings
-                    WHERE movieId = ?
-                ) movieARatings
-                INNER JOIN (
-                    SELECT userId, rating
-                    FROM ratings
-                    WHERE movieId = ?
-                ) movieBRatings
-                WHERE movieARatings.userId = movieBRatings.userId
+                SELECT predRating, movieId, reason
+                FROM recommendations
+                WHERE userId=? AND algorithm=?
+                ORDER BY rank
                 """,
-                movies):
-            yield common.RatingPair(row[0], row[1], row[2])
+                (user_id, algorithm),
+            ).fetchall()
+        except sqlite3.OperationalError:  # older databases lack the table
+            rows = ()
+    if not rows:
+        raise exceptions.NoStoredRecommendationsError(
+            f'No {algorithm} recommendations have been stored for user '
+            f'{user_id}. Try storing some with "mr-recommend".'
+        )
+    return tuple(Prediction(*row) for row in rows)
+
+
+def recommended_users(algorithm, dataset_version_):
+    """Get the users with up-to-date stored recommendations.
+
+    :param algorithm: The name of the algorithm which made the
+        recommendations, e.g. "ii".
+    :param dataset_version_: A dataset version. See :func:`dataset_version`.
+    :return: A set of user IDs.
+    """
+    with common.get_db_conn() as conn:
+        return {
+            row[0] for row in conn.execute(
+                """
+                SELECT DISTINCT userId
+                FROM recommendations
+                WHERE algorithm=? AND datasetVersion=?
+                """,
+                (algorithm, dataset_version_),
+            )
+        }
 
 
 def similar_movies_for_user(movie, user):
@@ -176,38 +398,104 @@ def similar_movies_for_user(movie, user):
         similarity)``.
     """
     rated_movies_ = rated_movies((user,))
+    packed_similarities = packed.get()
+    if packed_similarities is not None:
+        movies, similarities = packed_similarities.row(movie)
+        rated = numpy.isin(movies, tuple(rated_movies_))
+        yield from zip(
+            movies[rated].tolist(),
+            similarities[rated].tolist(),
+        )
+        return
     with common.get_db_conn() as conn:
         # There's probably some clever technique for expressing the following
         # queries as a single SQL query.
-        for row in conn.execute(
-                """
-                SELECT movieAId, similarity
-                FROM similarities
-                WHERE movieBId = ? AND similarity != 0
-                """,
-                (movie,)):
+        for row in conn.execute(SIMILAR_AS_MOVIE_B_QUERY, (movie,)):
             if row[0] in rated_movies_:
                 yield row
-        for row in conn.execute(
-                """
-                SELECT movieBId, similarity
-                FROM similarities
-                WHERE movieAId = ? AND similarity != 0
-                """,
-                (movie,)):
+        for row in conn.execute(SIMILAR_AS_MOVIE_A_QUERY, (movie,)):
             if row[0] in rated_movies_:
                 yield row
 
 
+def similar_ratings_for_user(user, neighbors=False):
+    """Yield each movie paired with a similar movie ``user`` has rated.
+
+    This function is a batched form of :func:`similar_movies_for_user`. Rather
+    than finding the rated movies similar to one movie, it finds the rated
+    movies similar to every movie, and it fetches the user's ratings in the
+    same query.
+
+    :param user: A user ID.
+    :param neighbors: If true, read from the pruned "neighbors" table instead
+        of the "similarities" table. See :func:`neighbors_for_user`.
+    :return: A generator yielding tuples of the form ``(movie_id, similarity,
+        rating)``, where ``rating`` is the user's rating of a movie similar to
+        ``movie_id``. A movie is yielded once per similar rated movie. Movies
+        the user has rated may be yielded, too.
+    :raise movie_recommender.exceptions.NoNeighborModelError: If
+        ``neighbors`` is true, and no neighbor model has been built.
+    """
+    packed_similarities = packed.get()
+    if packed_similarities is not None and not neighbors:
+        for _, rated_movie, rating_ in user_ratings((user,)):
+            movies, similarities = packed_similarities.row(rated_movie)
+            yield from zip(
+                movies.tolist(),
+                similarities.tolist(),
+                itertools.repeat(rating_),
+            )
+        return
+    with common.get_db_conn() as conn:
+        if neighbors:
+            yield from _execute_neighbors(
+                conn,
+                """
+                SELECT neighbors.movieId, neighbors.similarity, ratings.rating
+                FROM neighbors
+                JOIN ratings
+                    ON ratings.movieId = neighbors.neighborId
+                    AND ratings.userId = ?
+                """,
+                (user,),
+            )
+            return
+        yield from conn.execute(
+            """
+            SELECT similarities.movieBId, similarities.similarity,
+                ratings.rating
+            FROM similarities
+            JOIN ratings
+                ON ratings.movieId = similarities.movieAId
+                AND ratings.userId = ?
+            WHERE similarities.similarity != 0
+            UNION ALL
+            SELECT similarities.movieAId, similarities.similarity,
+                ratings.rating
+            FROM similarities
+            JOIN ratings
+                ON ratings.movieId = similarities.movieBId
+                AND ratings.userId = ?
+            WHERE similarities.similarity != 0
+            """,
+            (user, user),
+        )
+
+
 def similarity(movie_a, movie_b):
     """Return the similarity score for the two given movies.
 
     :param movie_a: A movie ID.
     :param movie_b: A movie ID.
-    :return: The similarity score for the pair of movies.
+    :return: The similarity score for the pair of movies. If packed
+        similarities are loaded, pairs without a packed score have a score of
+        0. See :mod:`movie_recommender.db.packed`.
     :raise movie_recommender.exceptions.MissingSimilarityError: If no
         similarity score has been computed for this pair of movies.
     """
+    packed_similarities = packed.get()
+    if packed_similarities is not None:
+        return packed_similarities.similarity(movie_a, movie_b)
     movies = [movie_a, movie_b]
     movies.sort()
     with common.get_db_conn() as conn:
@@ -229,12 +517,28 @@ def similarity(movie_a, movie_b):
     return row[0]
 
 
+def similarity_keys(db_path=None):
+    """Yield the pair of movies for each row in the similarities table.
+
+    :param db_path: The path to the database to read from. If ``None``, read
+        from the usual database. See
+        :func:`movie_recommender.db.common.get_db_conn`.
+    :return: A generator that yields ``(movie_a, movie_b)`` tuples, where
+        ``movie_a < movie_b``.
+    """
+    with common.get_db_conn(db_path) as conn:
+        yield from conn.execute('SELECT movieAId, movieBId FROM similarities')
+
+
 def title(movie_id):
     """Get the title of the given movie.
 
     :param movie_id: A movie ID.
     :return: The title of the given movie.
     """
+    ratings_store = store.get()
+    if ratings_store is not None:
+        return ratings_store.title(movie_id)
     with common.get_db_conn() as conn:
         row = conn.execute(
             'SELECT title FROM movies WHERE movieId=?',
@@ -245,6 +549,23 @@ def title(movie_id):
     return row[0]
 
 
+def user_ratings(user_ids):
+    """Yield the ratings given by the given users.
+
+    :param user_ids: A sequence of user IDs.
+    :return: A generator that yields ``(user_id, movie_id, rating)`` tuples.
+    """
+    with common.get_db_conn() as conn:
+        yield from conn.execute(
+            f"""
+            SELECT userId, movieId, rating FROM ratings WHERE userId IN ({
+            ', '.join('?' for _ in range(len(user_ids)))
+            })
+            """,
+            tuple(user_ids),
+        )
+
+
 def users():
     """Get the ID of every user.
 
@@ -269,6 +590,18 @@ def users_in_avg_ratings():
         }
 
 
+def users_in_predictors():
+    """Get the ID of every user in the predictors table.
+
+    :return: A set of user IDs.
+    """
+    with common.get_db_conn() as conn:
+        return {
+            row[0]
+            for row in conn.execute('SELECT userId FROM predictors')
+        }
+
+
 def unrated_movies(user_id):
     """Yield the ID of each movie the given user hasn't rated.
 
@@ -285,6 +618,22 @@ def unrated_movies(user_id):
             yield row[0]
 
 
+def _execute_neighbors(connection, query, parameters):
+    """Execute a query which reads from the "neighbors" table.
+
+    :return: A cursor.
+    :raise movie_recommender.exceptions.NoNeighborModelError: If the table
+        doesn't exist.
+    """
+    try:
+        return connection.execute(query, parameters)
+    except sqlite3.OperationalError as err:  # older databases lack the table
+        raise exceptions.NoNeighborModelError(
+            'No neighbor model has been built. Try building one with '
+            '"mr-analyze ii --neighbors K".'
+        ) from err
+
+
 def year(movie_title):
     """Extract the year from the given movie title.
 
@@ -0,0 +1,290 @@
+# coding=utf-8
+"""Tools for splitting the similarities table into shards.
+
+Computing a similarity score for every pair of movies is expensive, and a
+single database file can only be written to by one process at a time. Instead,
+the space of pairs of movies may be split into N shards, and each shard may be
+analyzed separately and written to its own file. For example, with eight
+machines, each of which has a copy of the same dataset:
+
+.. code-block:: sh
+
+    # On machine i, for i in 0…7:
+    mr-analyze ii --shard i/8 --output shard-i.db
+
+    # On one machine, once every shard file has been copied to it:
+    mr-db merge-similarities shard-*.db
+
+Each pair of movies belongs to exactly one shard. See :func:`pair_shards`.
+
+A shard file is only merged once its analysis has finished. See :func:`finish`.
+"""
+import hashlib
+import itertools
+import sqlite3
+from collections import namedtuple
+from pathlib import Path
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.db import common, init, write
+
+
+Shard = namedtuple('Shard', ('index', 'count'))
+"""One of ``count`` shards, where ``0 <= index < count``."""
+
+ShardRun = namedtuple('ShardRun', ('targets', 'overwrite'))
+"""How a shard file was analyzed. See :func:`finish`."""
+
+
+def pair_shards(movies_a, movies_b, count):
+    """Tell which shard each pair of movies belongs to.
+
+    The shard is a function of the pair of movie IDs alone. Pairs are
+    unordered, so ``(1, 2)`` and ``(2, 1)`` belong to the same shard. The IDs
+    are mixed with a hash function before being split, so that each shard
+    gets a similar number of pairs.
+
+    :param movies_a: A numpy array of movie IDs.
+    :param movies_b: A numpy array of movie IDs, or a single movie ID. The
+        n-th movie in ``movies_a`` is paired with the n-th movie in
+        ``movies_b``.
+    :param count: The number of shards.
+    :return: A numpy array of shard indices.
+    """
+    movies_a = numpy.asarray(movies_a, dtype=numpy.int64)
+    movies_b = numpy.asarray(movies_b, dtype=numpy.int64)
+    low = numpy.minimum(movies_a, movies_b).astype(numpy.uint64)
+    high = numpy.maximum(movies_a, movies_b).astype(numpy.uint64)
+    # A SplitMix64-style finalizer. Arithmetic is modulo 2**64.
+    with numpy.errstate(over='ignore'):
+        key = low * numpy.uint64(0x9E3779B97F4A7C15) + high
+        key ^= key >> numpy.uint64(31)
+        key *= numpy.uint64(0xBF58476D1CE4E5B9)
+        key ^= key >> numpy.uint64(27)
+    return (key % numpy.uint64(count)).astype(numpy.int64)
+
+
+def create(path, shard):
+    """Create a shard file, if it doesn't already exist.
+
+    A shard file holds a "similarities" table, and records which shard it
+    holds in a "metadata" table. If the file already exists, its completion
+    marker is removed, as it's about to be analyzed again. See :func:`finish`.
+
+    :param path: The path to the shard file.
+    :param shard: A :class:`Shard`.
+    :return: Nothing.
+    :raise movie_recommender.exceptions.ShardError: If the file exists, but
+        holds a different shard.
+    """
+    if Path(path).exists():
+        existing = read_shard(path)
+        if existing != shard:
+            raise exceptions.ShardError(
+                f'{path} holds shard {existing.index}/{existing.count}, not '
+                f'shard {shard.index}/{shard.count}.'
+            )
+        with common.get_db_conn(path) as conn:
+            with conn:
+                conn.execute(
+                    """
+                    DELETE FROM metadata
+                    WHERE key IN ('shardTargets', 'shardOverwrite')
+                    """
+                )
+        return
+    with common.get_db_conn(path) as conn:
+        init.c_similarities_table(conn)
+        init.c_metadata_table(conn)
+        with conn:
+            conn.executemany(
+                'INSERT INTO metadata VALUES (?, ?)',
+                (('shardIndex', shard.index), ('shardCount', shard.count)),
+            )
+
+
+def read_shard(path):
+    """Read which shard a shard file holds.
+
+    :param path: The path to a shard file.
+    :return: A :class:`Shard`.
+    :raise movie_recommender.exceptions.ShardError: If the file isn't a shard
+        file.
+    """
+    if not Path(path).exists():
+        raise exceptions.ShardError(f'{path} does not exist.')
+    with common.get_db_conn(path) as conn:
+        try:
+            values = dict(conn.execute(
+                """
+                SELECT key, value FROM metadata
+                WHERE key IN ('shardIndex', 'shardCount')
+                """
+            ))
+        except sqlite3.OperationalError:
+            values = {}
+    if len(values) != 2:
+        raise exceptions.ShardError(f'{path} is not a shard file.')
+    return Shard(values['shardIndex'], values['shardCount'])
+
+
+def finish(path, target_movies, overwrite):
+    """Mark a shard file as completely analyzed.
+
+    The target movies and the overwrite mode are recorded in the "metadata"
+    table. Their presence is the completion marker. Every shard of one
+    analysis must have been analyzed with the same target movies and overwrite
+    mode, which :func:`merge` checks.
+
+    :param path: The path to a shard file. See :func:`create`.
+    :param target_movies: An iterable of movie IDs. The movies which were
+        compared to every other movie. Only a digest of this set is recorded.
+    :param overwrite: Were already-computed values re-computed?
+    :return: Nothing.
+    """
+    with common.get_db_conn(path) as conn:
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO metadata VALUES (?, ?)
+                ON CONFLICT (key) DO UPDATE SET value=excluded.value
+                """,
+                (
+                    ('shardTargets', _digest(target_movies)),
+                    ('shardOverwrite', int(overwrite)),
+                ),
+            )
+
+
+def read_run(path):
+    """Read how a shard file was analyzed.
+
+    :param path: The path to a shard file.
+    :return: A :class:`ShardRun`, where ``targets`` is a digest of the set of
+        target movies.
+    :raise movie_recommender.exceptions.ShardError: If the file's analysis
+        hasn't finished. See :func:`finish`.
+    """
+    with common.get_db_conn(path) as conn:
+        values = dict(conn.execute(
+            """
+            SELECT key, value FROM metadata
+            WHERE key IN ('shardTargets', 'shardOverwrite')
+            """
+        ))
+    if len(values) != 2:
+        raise exceptions.ShardError(
+            f'{path} is incomplete. Its analysis was interrupted, or is still '
+            'running.'
+        )
+    return ShardRun(values['shardTargets'], bool(values['shardOverwrite']))
+
+
+def merge(paths):
+    """Merge shard files into the similarities table.
+
+    The shard files are checked before anything is merged:
+
+    * Each file must hold a different shard.
+    * Each file's analysis must have finished. See :func:`finish`.
+    * Every file must have been analyzed with the same target movies and
+      overwrite mode.
+    * Every shard must be present.
+    * Every pair of movies in a file must belong to that file's shard. Shards
+      don't overlap, so this means that no pair of movies is present in two
+      files.
+
+    Existing similarity scores are overwritten. Each shard file is merged in
+    its own transaction, and the dataset version is bumped once at the end.
+    Merging is idempotent, so an interrupted merge may simply be repeated.
+
+    :param paths: An iterable of paths to shard files.
+    :return: The number of similarity scores merged.
+    :raise movie_recommender.exceptions.ShardError: If a check fails.
+    """
+    paths = tuple(str(path) for path in paths)
+    shards = {}
+    runs = {}
+    for path in paths:
+        shard = read_shard(path)
+        if shard in shards:
+            raise exceptions.ShardError(
+                f'{shards[shard]} and {path} both hold shard '
+                f'{shard.index}/{shard.count}.'
+            )
+        shards[shard] = path
+        runs.setdefault(read_run(path), path)
+    if len(runs) > 1:
+        run_paths = tuple(runs.values())
+        raise exceptions.ShardError(
+            f'{run_paths[0]} and {run_paths[1]} were analyzed with different '
+            'target movies or overwrite modes.'
+        )
+    counts = {shard.count for shard in shards}
+    if len(counts) > 1:
+        raise exceptions.ShardError(
+            f'Shard files were split in different ways: {sorted(counts)} '
+            'shards.'
+        )
+    for count in counts:
+        missing = set(range(count)) - {shard.index for shard in shards}
+        if missing:
+            raise exceptions.ShardError(
+                f'Shards {sorted(missing)} of {count} are missing.'
+            )
+    for shard, path in shards.items():
+        _check_pairs(path, shard)
+
+    merged = 0
+    with write.changing_dataset(), common.get_db_conn() as conn:
+        for path in paths:
+            # ATTACH can't be executed within a transaction.
+            conn.execute('ATTACH DATABASE ? AS shard', (path,))
+            try:
+                with conn:
+                    merged += conn.execute(
+                        """
+                        INSERT INTO similarities
+                        SELECT movieAId, movieBId, similarity
+                        FROM shard.similarities
+                        WHERE true
+                        ON CONFLICT (movieAId, movieBId) DO UPDATE
+                        SET similarity=excluded.similarity
+                        """
+                    ).rowcount
+            finally:
+                conn.execute('DETACH DATABASE shard')
+    return merged
+
+
+def _digest(movies):
+    """Return a hex digest of a set of movie IDs."""
+    movies = numpy.unique(numpy.fromiter(movies, dtype=numpy.int64))
+    return hashlib.sha256(movies.astype('<i8').tobytes()).hexdigest()
+
+
+def _check_pairs(path, shard):
+    """Check that every pair of movies in a shard file belongs to its shard.
+
+    :raise movie_recommender.exceptions.ShardError: If a check fails.
+    """
+    with common.get_db_conn(path) as conn:
+        cursor = conn.execute('SELECT movieAId, movieBId FROM similarities')
+        while True:
+            pairs = numpy.fromiter(
+                itertools.chain.from_iterable(cursor.fetchmany(2**16)),
+                dtype=numpy.int64,
+            ).reshape(-1, 2)
+            if not pairs.size:
+                break
+            shards = pair_shards(pairs[:, 0], pairs[:, 1], shard.count)
+            wrong = numpy.flatnonzero(shards != shard.index)
+            if wrong.size:
+                movie_a, movie_b = pairs[wrong[0]].tolist()
+                raise exceptions.ShardError(
+                    f'{path} holds shard {shard.index}/{shard.count}, but '
+                    f'movies {movie_a} and {movie_b} belong to shard '
+                    f'{shards[wrong[0]]}/{shard.count}.'
+                )
@@ -0,0 +1,284 @@
+# coding=utf-8
+"""An opt-in, in-memory copy of the data read most often from the database.
+
+Functions like :func:`movie_recommender.db.read.rating` are called millions of
+times when analyzing movies or generating recommendations, and each call opens a
+connection and executes a query. If this module's store has been loaded into
+the current process with :func:`load`, then those functions answer from memory
+instead. Functions which answer from the store include:
+
+* :func:`movie_recommender.db.calc.avg_movie_rating`
+* :func:`movie_recommender.db.calc.avg_user_rating`
+* :func:`movie_recommender.db.count.avg_ratings`
+* :func:`movie_recommender.db.count.rating_pairs`
+* :func:`movie_recommender.db.count.user_ids`
+* :func:`movie_recommender.db.read.avg_rating`
+* :func:`movie_recommender.db.read.genres`
+* :func:`movie_recommender.db.read.rated_movie_ratings`
+* :func:`movie_recommender.db.read.rated_movies`
+* :func:`movie_recommender.db.read.rating`
+* :func:`movie_recommender.db.read.rating_pairs`
+* :func:`movie_recommender.db.read.title`
+
+The store is a snapshot. Rows written to the database after the store is loaded
+aren't visible through it. As a result, the store is best loaded by a process
+pool's initializer, after any prerequisite writes have been made:
+
+.. code-block:: python
+
+    with multiprocessing.Pool(jobs, initializer=store.load) as pool:
+        ...
+
+If the store is loaded by a process before it forks, then child processes
+inherit it, and the bulk of it (a handful of numpy arrays) is shared
+copy-on-write between them.
+"""
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.db import common
+
+
+_STORE = None
+"""The store loaded into this process, if any. See :func:`get`."""
+
+
+class RatingsStore():  # pylint:disable=too-many-instance-attributes
+    """Ratings, average ratings and movie metadata, held in compact arrays.
+
+    Ratings are held twice: once sorted by user, and once sorted by movie. Each
+    copy consists of an array of IDs, an array of offsets, and a pair of value
+    arrays. For example, the movies rated by the user at index ``i`` in
+    ``user_ids`` are ``user_movies[user_offsets[i]:user_offsets[i + 1]]``.
+    """
+
+    def __init__(self, ratings, avg_ratings, movies):
+        """Initialize instance attributes.
+
+        :param ratings: An iterable of ``(user_id, movie_id, rating)`` tuples.
+        :param avg_ratings: An iterable of ``(user_id, avg_rating)`` tuples.
+        :param movies: An iterable of ``(movie_id, title, genres)`` tuples.
+        """
+        ratings = tuple(ratings)
+        users = numpy.fromiter((row[0] for row in ratings), numpy.int64)
+        movies_ = numpy.fromiter((row[1] for row in ratings), numpy.int64)
+        values = numpy.fromiter((row[2] for row in ratings), numpy.float64)
+
+        order = numpy.lexsort((movies_, users))
+        (self._user_ids, self._user_offsets, self._user_movies,
+         self._user_ratings) = _group(users[order], movies_[order], values[order])
+
+        order = numpy.lexsort((users, movies_))
+        (self._movie_ids, self._movie_offsets, self._movie_users,
+         self._movie_ratings) = _group(movies_[order], users[order], values[order])
+
+        avg_ratings = sorted(avg_ratings)
+        self._avg_user_ids = numpy.array(
+            [row[0] for row in avg_ratings],
+            dtype=numpy.int64,
+        )
+        self._avg_ratings = numpy.array(
+            [row[1] for row in avg_ratings],
+            dtype=numpy.float64,
+        )
+
+        movies = sorted(movies)
+        self._titled_movie_ids = numpy.array(
+            [row[0] for row in movies],
+            dtype=numpy.int64,
+        )
+        self._titles = [row[1] for row in movies]
+        self._genres = [row[2] for row in movies]
+
+    def avg_rating(self, user_id):
+        """See :func:`movie_recommender.db.read.avg_rating`."""
+        i = _find(self._avg_user_ids, user_id)
+        if i is None:
+            raise exceptions.MissingAverageRatingError(
+                f'No average rating for user {user_id} has been calculated.'
+            )
+        return float(self._avg_ratings[i])
+
+    def avg_user_rating(self, user_id):
+        """See :func:`movie_recommender.db.calc.avg_user_rating`."""
+        ratings = self._user_slice(user_id)[1]
+        return float(ratings.mean()) if ratings.size else None
+
+    def avg_movie_rating(self, movie_id):
+        """See :func:`movie_recommender.db.calc.avg_movie_rating`."""
+        ratings = self._movie_slice(movie_id)[1]
+        if ratings.size == 0:
+            raise exceptions.NoMovieRatingsError(
+                f"Can't calculate the average rating for movie {movie_id}, as "
+                'no ratings have been assigned to it.'
+            )
+        return float(ratings.mean())
+
+    def count_avg_ratings(self):
+        """See :func:`movie_recommender.db.count.avg_ratings`."""
+        return len(self._avg_user_ids)
+
+    def count_user_ids(self):
+        """See :func:`movie_recommender.db.count.user_ids`."""
+        return len(self._user_ids)
+
+    def genres(self, movie_id):
+        """See :func:`movie_recommender.db.read.genres`."""
+        i = _find(self._titled_movie_ids, movie_id)
+        assert i is not None
+        return self._genres[i].split('|')
+
+    def has_user(self, user_id):
+        """Tell whether a user has rated any movies.
+
+        :param user_id: A user ID.
+        :return: A boolean.
+        """
+        return _find(self._user_ids, user_id) is not None
+
+    def rated_movie_ratings(self, user_id):
+        """See :func:`movie_recommender.db.read.rated_movie_ratings`."""
+        movies, ratings = self._user_slice(user_id)
+        titled = numpy.isin(movies, self._titled_movie_ids)
+        return tuple(zip(movies[titled].tolist(), ratings[titled].tolist()))
+
+    def rated_movies(self, user_ids):
+        """See :func:`movie_recommender.db.read.rated_movies`."""
+        movies = set()
+        for user_id in user_ids:
+            movies.update(self._user_slice(user_id)[0].tolist())
+        return movies
+
+    def rating(self, user_id, movie_id):
+        """See :func:`movie_recommender.db.read.rating`."""
+        movies, ratings = self._user_slice(user_id)
+        i = _find(movies, movie_id)
+        assert i is not None
+        return float(ratings[i])
+
+    def rating_pairs(self, movie_a, movie_b):
+        """See :func:`movie_recommender.db.read.rating_pairs`.
+
+        Unlike that function, this method returns a tuple, and doesn't check
+        whether ``movie_a`` and ``movie_b`` are equal.
+        """
+        movie_a, movie_b = sorted((movie_a, movie_b))
+        users_a, ratings_a = self._movie_slice(movie_a)
+        users_b, ratings_b = self._movie_slice(movie_b)
+        users, i_a, i_b = numpy.intersect1d(
+            users_a,
+            users_b,
+            assume_unique=True,
+            return_indices=True,
+        )
+        return tuple(
+            common.RatingPair(*row) for row in zip(
+                users.tolist(),
+                ratings_a[i_a].tolist(),
+                ratings_b[i_b].tolist(),
+            )
+        )
+
+    def title(self, movie_id):
+        """See :func:`movie_recommender.db.read.title`."""
+        i = _find(self._titled_movie_ids, movie_id)
+        if i is None:
+            raise ValueError(f'Movie ID {movie_id} not in database.')
+        return self._titles[i]
+
+    def _user_slice(self, user_id):
+        """Return the movies rated by a user, and the ratings given."""
+        return self._slice(
+            self._user_ids,
+            self._user_offsets,
+            self._user_movies,
+            self._user_ratings,
+            user_id,
+        )
+
+    def _movie_slice(self, movie_id):
+        """Return the users who rated a movie, and the ratings given."""
+        return self._slice(
+            self._movie_ids,
+            self._movie_offsets,
+            self._movie_users,
+            self._movie_ratings,
+            movie_id,
+        )
+
+    @staticmethod
+    def _slice(keys, offsets, ids, ratings, key):  # pylint:disable=too-many-arguments
+        """Return the slices of ``ids`` and ``ratings`` belonging to ``key``."""
+        i = _find(keys, key)
+        if i is None:
+            return ids[:0], ratings[:0]
+        start, stop = offsets[i], offsets[i + 1]
+        return ids[start:stop], ratings[start:stop]
+
+
+def get():
+    """Get the store loaded into this process.
+
+    :return: A :class:`RatingsStore`, or ``None`` if no store is loaded.
+    """
+    return _STORE
+
+
+def load(reload=False, db_path=None):
+    """Load a store into this process, from the database.
+
+    This function is suitable for use as a ``multiprocessing.Pool``
+    initializer.
+
+    :param reload: If a store is already loaded, should it be replaced?
+    :param db_path: The path to the database to load from. If ``None``, load
+        from the usual database.
+    :return: Nothing.
+    """
+    global _STORE  # pylint:disable=global-statement
+    if _STORE is not None and not reload:
+        return
+    with common.get_db_conn(db_path) as conn:
+        ratings = tuple(conn.execute(
+            'SELECT userId, movieId, rating FROM ratings'
+        ))
+        avg_ratings = tuple(conn.execute(
+            'SELECT userId, avgRating FROM avgRatings'
+        ))
+        movies = tuple(conn.execute(
+            'SELECT movieId, title, genres FROM movies'
+        ))
+    _STORE = RatingsStore(ratings, avg_ratings, movies)
+
+
+def unload():
+    """Discard the store loaded into this process, if any.
+
+    :return: Nothing.
+    """
+    global _STORE  # pylint:disable=global-statement
+    _STORE = None
+
+
+def _find(haystack, needle):
+    """Find ``needle`` in the sorted numpy array ``haystack``.
+
+    :return: The index of ``needle``, or ``None`` if it's absent.
+    """
+    i = int(numpy.searchsorted(haystack, needle))
+    if i < len(haystack) and haystack[i] == needle:
+        return i
+    return None
+
+
+def _group(keys, ids, ratings):
+    """Group ids and ratings by key.
+
+    :param keys: A sorted numpy array of keys, e.g. user IDs.
+    :param ids: A numpy array of IDs, e.g. movie IDs.
+    :param ratings: A numpy array of ratings.
+    :return: A tuple of ``(unique_keys, offsets, ids, ratings)``.
+    """
+    unique_keys, starts = numpy.unique(keys, return_index=True)
+    offsets = numpy.append(starts, len(keys))
+    return unique_keys, offsets, ids, ratings
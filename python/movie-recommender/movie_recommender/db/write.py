@@ -6,7 +6,9 @@ support for `UPSERT`_ in version 3.24.0, which was released on 2018-06-24.
 
 .. _UPSERT: https://www.sqlite.org/lang_UPSERT.html
 """
-from movie_recommender.db import common
+import contextlib
+
+from movie_recommender.db import common, init
 
 
 def avg_ratings(avg_ratings_):
@@ -16,6 +18,7 @@ def avg_ratings(avg_ratings_):
         :class:`movie_recommender.db.common.AvgRating` objects.
     """
     with common.get_db_conn() as conn:
+        init.c_metadata_table(conn)
         with conn:
             values = (
                 avg_rating + (avg_rating.avg_rating,)
@@ -28,17 +31,201 @@ def avg_ratings(avg_ratings_):
                 """,
                 values,
             )
+            bump_dataset_version(conn)
+
+
+def bump_dataset_version(connection):
+    """Increment the dataset version.
+
+    Call this function whenever data that recommendations depend on is
+    written, within the same transaction. Stored recommendations with an older
+    dataset version are then known to be stale. See
+    :func:`movie_recommender.db.read.dataset_version`. Operations which write
+    in many transactions should bump the version once instead. See
+    :func:`changing_dataset`.
+
+    :param connection: A sqlite3 `Connection`_ object. The "metadata" table
+        must exist. See :func:`movie_recommender.db.init.c_metadata_table`.
+    :return: Nothing.
+
+    .. _Connection:
+        https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection
+    """
+    connection.execute(
+        """
+        INSERT INTO metadata VALUES ('datasetVersion', 1)
+        ON CONFLICT (key) DO UPDATE SET value=value + 1
+        """
+    )
+
+
+@contextlib.contextmanager
+def changing_dataset(db_path=None):
+    """Bump the dataset version once a ``with`` block exits.
+
+    Use this around an operation which writes data that recommendations
+    depend on in many transactions, such as an analysis or a merge. The
+    version is bumped even if the block raises an exception, as some of its
+    writes may have been committed.
+
+    :param db_path: The path to the database being written to. If it isn't
+        ``None``, i.e. if it's a shard file, nothing is bumped.
+    :return: A context manager, which yields nothing.
+    """
+    try:
+        yield
+    finally:
+        if db_path is None:
+            with common.get_db_conn() as conn:
+                init.c_metadata_table(conn)
+                with conn:
+                    bump_dataset_version(conn)
+
+
+def cached_recommendations(  # pylint:disable=too-many-arguments
+        user_id,
+        algorithm,
+        predictor_name,
+        count,
+        predictions,
+        dataset_version):
+    """Write recommendations to the recommendation cache.
+
+    Cached recommendations for the same user, algorithm, predictor and count
+    are replaced, and cached recommendations computed from other dataset
+    versions are evicted. See
+    :func:`movie_recommender.db.read.cached_recommendations`.
+
+    :param user_id: A user ID.
+    :param algorithm: The name of the algorithm which made the predictions,
+        e.g. "ii" or "ml".
+    :param predictor_name: The name of the predictor used by the algorithm,
+        or the empty string.
+    :param count: The number of recommendations requested.
+    :param predictions: A sequence of
+        :class:`movie_recommender.predict.common.Prediction` objects, in order
+        of rank.
+    :param dataset_version: The dataset version the predictions were computed
+        from.
+    :return: Nothing.
+    """
+    with common.get_db_conn() as conn:
+        init.c_recommendation_cache_table(conn)
+        with conn:
+            conn.execute(
+                'DELETE FROM recommendationCache WHERE datasetVersion != ?',
+                (dataset_version,),
+            )
+            conn.execute(
+                """
+                DELETE FROM recommendationCache
+                WHERE userId=? AND algorithm=? AND predictor=? AND count=?
+                """,
+                (user_id, algorithm, predictor_name, count),
+            )
+            conn.executemany(
+                """
+                INSERT INTO recommendationCache
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    (
+                        user_id,
+                        algorithm,
+                        predictor_name,
+                        count,
+                        rank,
+                        prediction.movie,
+                        prediction.pred_rating,
+                        prediction.reason,
+                        dataset_version,
+                    )
+                    for rank, prediction in enumerate(predictions, 1)
+                ),
+            )
+
+
+def predictor(user_id, predictor_name):
+    """Write a user's personalized predictor to the database.
+
+    See :func:`movie_recommender.analyze.ml.analyze_user`.
+
+    :param user_id: A user ID.
+    :param predictor_name: The name of a predictor, like "year" or
+        "genre:Comedy".
+    :return: Nothing.
+    """
+    with common.get_db_conn() as conn:
+        init.c_metadata_table(conn)
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO predictors VALUES (?, ?)
+                ON CONFLICT (userId) DO UPDATE SET predictor=excluded.predictor
+                """,
+                (user_id, predictor_name),
+            )
+            bump_dataset_version(conn)
+
+
+def recommendations(user_recommendations, algorithm, dataset_version):
+    """Write users' recommendations to the database.
+
+    Each user's existing recommendations for the given algorithm are replaced.
+
+    :param user_recommendations: An iterable of ``(user_id, predictions)``
+        tuples, where ``predictions`` is a sequence of
+        :class:`movie_recommender.predict.common.Prediction` objects, in order
+        of rank.
+    :param algorithm: The name of the algorithm which made the predictions,
+        e.g. "ii".
+    :param dataset_version: The dataset version the predictions were computed
+        from.
+    """
+    with common.get_db_conn() as conn:
+        init.c_recommendations_table(conn)
+        with conn:
+            for user_id, predictions in user_recommendations:
+                conn.execute(
+                    """
+                    DELETE FROM recommendations
+                    WHERE userId=? AND algorithm=?
+                    """,
+                    (user_id, algorithm),
+                )
+                conn.executemany(
+                    """
+                    INSERT INTO recommendations VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        (
+                            user_id,
+                            algorithm,
+                            rank,
+                            prediction.movie,
+                            prediction.pred_rating,
+                            prediction.reason,
+                            dataset_version,
+                        )
+                        for rank, prediction in enumerate(predictions, 1)
+                    ),
+                )
 
 
-def similarities(similarities_):
+def similarities(similarities_, db_path=None):
     """Write movies similarity scores to the database.
 
+    The dataset version isn't bumped. See :func:`changing_dataset`.
+
     :param similarities_: An iterable of
         :class:`movie_recommender.db.common.Similarity` objects.
+    :param db_path: The path to the database to write to. If ``None``, write
+        to the usual database. See
+        :func:`movie_recommender.db.common.get_db_conn`.
     """
     # SQLite added support for UPSERT in version 3.24.0, which was released on
     # 2018-06-24. See: https://www.sqlite.org/lang_UPSERT.html
-    with common.get_db_conn() as conn:
+    with common.get_db_conn(db_path) as conn:
         with conn:
             conn.executemany(
                 """
@@ -49,6 +236,28 @@ def similarities(similarities_):
             )
 
 
+def similarity_stats(stats):
+    """Write the sufficient statistics for similarity scores to the database.
+
+    :param stats: An iterable of
+        :class:`movie_recommender.db.common.SimilarityStats` objects. Movie A
+        must have a lower ID than movie B.
+    """
+    with common.get_db_conn() as conn:
+        with conn:
+            conn.executemany(
+                """
+                INSERT INTO similarityStats VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (movieAId, movieBId) DO UPDATE SET
+                    count=excluded.count,
+                    sumProducts=excluded.sumProducts,
+                    sumSquaresA=excluded.sumSquaresA,
+                    sumSquaresB=excluded.sumSquaresB
+                """,
+                stats,
+            )
+
+
 def _similarities_values(similarities_):
     """Yield values for ``similarities`` insert statement."""
     for similarity in similarities_:
@@ -36,6 +36,13 @@ class MissingSimilarityError(Exception):
     """Indicates that similarity hasn't been computed for a pair of movies."""
 
 
+class MissingSimilarityStatsError(Exception):
+    """Indicates that sufficient statistics haven't been computed for movies.
+
+    See :meth:`movie_recommender.analyze.ii_update.update_ratings`.
+    """
+
+
 class NoMovieRatingsError(Exception):
     """Indicates that no ratings have been given to a movie."""
 
@@ -52,10 +59,18 @@ class NoMovieYearError(Exception):
     """
 
 
+class NoNeighborModelError(Exception):
+    """Indicates that no neighbor model has been built."""
+
+
 class NoSimilarMoviesError(Exception):
     """Indicates that there are no movies similar to a given movie."""
 
 
+class NoStoredRecommendationsError(Exception):
+    """Indicates that no recommendations have been stored for a user."""
+
+
 class NoSuchPredictorError(Exception):
     """Indicates that the requested type of predictor isn't (yet) implemented.
 
@@ -68,5 +83,21 @@ class NoPersonalizedPredictorError(Exception):
     """Indicates that the named user doesn't have a personalized predictor."""
 
 
+class PackedSimilaritiesError(Exception):
+    """Indicates that a packed similarities file can't be loaded."""
+
+
+class QueryPlanError(Exception):
+    """Indicates that a hot query would scan an entire table."""
+
+
+class ServerError(Exception):
+    """Indicates that a server can't be reached, or rejected a request."""
+
+
+class ShardError(Exception):
+    """Indicates that a shard file is invalid, or conflicts with another."""
+
+
 class VerticalLineOfBestFitGraphError(Exception):
     """Indicates that a graph's line of best fit is vertical."""
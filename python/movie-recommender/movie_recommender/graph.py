@@ -1,6 +1,20 @@
 # coding=utf-8
-"""Tools for working with a cartesian graph."""
-from collections import namedtuple
+"""Tools for working with a cartesian graph.
+
+Three implementations of a graph are available. They have the same properties,
+and make the same predictions:
+
+* :class:`Graph` holds a tuple of points, and computes each statistic with its
+  own pass over them, in pure Python.
+* :class:`ArrayGraph` holds its points in numpy arrays, and computes every
+  statistic in one vectorized pass.
+* :class:`OnlineGraph` holds running sums, which are updated as points are
+  added and removed. Every statistic is current after each update, in O(1).
+"""
+import itertools
+from collections import Counter, namedtuple
+
+import numpy
 
 from movie_recommender import exceptions
 
@@ -137,3 +151,233 @@ class Graph():
             error = point.y - self.predict_y(point.x)
             sse += error ** 2
         return sse
+
+
+class ArrayGraph(Graph):
+    """A cartesian graph, whose points are held in numpy arrays.
+
+    The first time a statistic of this graph is needed, every statistic is
+    computed at once, with a vectorized pass over the points.
+    """
+
+    def __init__(self, points):
+        """Initialize instance attributes.
+
+        :param points: An iterable of :class:`Point` objects. The points on
+            this cartesian graph.
+        """
+        super().__init__(None)
+        points = numpy.fromiter(
+            itertools.chain.from_iterable(points),
+            dtype=numpy.float64,
+        ).reshape(-1, 2)
+        self._x_values = points[:, 0]
+        self._y_values = points[:, 1]
+
+    @classmethod
+    def from_arrays(cls, x_values, y_values):
+        """Create a graph from arrays of x and y values.
+
+        :param x_values: A numpy array of x values.
+        :param y_values: A numpy array of y values, one per x value.
+        :return: An :class:`ArrayGraph`.
+        """
+        graph = cls(())
+        graph._x_values = numpy.asarray(x_values, dtype=numpy.float64)
+        graph._y_values = numpy.asarray(y_values, dtype=numpy.float64)
+        return graph
+
+    @property
+    def points(self):
+        """Get the points on this graph."""
+        if self._points is None:
+            self._points = tuple(
+                Point(x, y) for x, y in zip(
+                    self._x_values.tolist(),
+                    self._y_values.tolist(),
+                )
+            )
+        return self._points
+
+    @property
+    def avg_point(self):
+        """See :meth:`Graph.avg_point`."""
+        self._fit()
+        return self._avg_point
+
+    @property
+    def slope(self):
+        """See :meth:`Graph.slope`."""
+        self._fit()
+        if self._slope is None:
+            raise exceptions.VerticalLineOfBestFitGraphError(
+                "This graph's line of best fit is vertical. As a result, its "
+                "slope can't be calculated."
+            )
+        return self._slope
+
+    @property
+    def sse(self):
+        """See :meth:`Graph.sse`."""
+        self.slope  # pylint:disable=pointless-statement
+        return self._sse
+
+    def _fit(self):
+        """Compute every statistic of this graph, if not yet done.
+
+        The average point is always computed, so it tells whether this has
+        been done.
+        """
+        if self._avg_point is not None:
+            return
+        if not self._x_values.size:
+            raise exceptions.EmptyGraphError(
+                "Can't calculate the average point of an empty graph."
+            )
+        avg_x = self._x_values.mean()
+        avg_y = self._y_values.mean()
+        self._avg_point = Point(float(avg_x), float(avg_y))
+        x_minus_xavg = self._x_values - avg_x
+        y_minus_yavg = self._y_values - avg_y
+        denominator = float(x_minus_xavg @ x_minus_xavg)
+        if denominator != 0:
+            self._slope = float(x_minus_xavg @ y_minus_yavg) / denominator
+            self._y_intercept = float(avg_y - avg_x * self._slope)
+            errors = y_minus_yavg - self._slope * x_minus_xavg
+            self._sse = float(errors @ errors)
+
+
+class OnlineGraph(Graph):
+    """A cartesian graph, to which points may be added and removed.
+
+    Rather than holding its points in a sequence, this graph holds running
+    means and sums of squared deviations from them. These are updated with
+    Welford's method, which loses little precision to cancellation. Each update
+    and each statistic takes O(1) time.
+    """
+
+    def __init__(self, points=()):
+        """Initialize instance attributes.
+
+        :param points: An iterable of :class:`Point` objects. The initial
+            points on this cartesian graph.
+        """
+        super().__init__(None)
+        self._counts = Counter()
+        self._x_counts = Counter()
+        self._moments = _Moments()
+        for point in points:
+            self.add_point(point)
+
+    @property
+    def points(self):
+        """Get the points on this graph, in no particular order."""
+        return tuple(self._counts.elements())
+
+    def add_point(self, point):
+        """Add a point to this graph.
+
+        :param point: A :class:`Point`.
+        :return: Nothing.
+        """
+        self._counts[point] += 1
+        self._x_counts[point.x] += 1
+        self._moments.add(point)
+
+    def remove_point(self, point):
+        """Remove a point from this graph.
+
+        :param point: A :class:`Point`.
+        :return: Nothing.
+        :raise ValueError: If the point isn't on this graph.
+        """
+        if not self._counts[point]:
+            raise ValueError(f'{point} is not on this graph.')
+        self._counts[point] -= 1
+        self._x_counts[point.x] -= 1
+        if not self._counts[point]:
+            del self._counts[point]
+        if not self._x_counts[point.x]:
+            del self._x_counts[point.x]
+        self._moments.remove(point)
+
+    @property
+    def avg_point(self):
+        """See :meth:`Graph.avg_point`."""
+        if not self._moments.num_points:
+            raise exceptions.EmptyGraphError(
+                "Can't calculate the average point of an empty graph."
+            )
+        return Point(self._moments.avg_x, self._moments.avg_y)
+
+    @property
+    def slope(self):
+        """See :meth:`Graph.slope`.
+
+        The line of best fit is vertical if every point has the same x value.
+        This is decided by counting distinct x values, rather than by
+        comparing running sums to zero, as those sums may not return to
+        exactly zero as points are removed.
+        """
+        if not self._moments.num_points:
+            raise exceptions.EmptyGraphError(
+                "Can't calculate the slope of an empty graph."
+            )
+        if len(self._x_counts) == 1:
+            raise exceptions.VerticalLineOfBestFitGraphError(
+                "This graph's line of best fit is vertical. As a result, its "
+                "slope can't be calculated."
+            )
+        return self._moments.sxy / self._moments.sxx
+
+    @property
+    def y_intercept(self):
+        """See :meth:`Graph.y_intercept`."""
+        return self._moments.avg_y - self._moments.avg_x * self.slope
+
+    @property
+    def sse(self):
+        """See :meth:`Graph.sse`."""
+        return max(self._moments.syy - self._moments.sxy * self.slope, 0.0)
+
+
+class _Moments():
+    """Running means of a set of points, and sums of deviations from them.
+
+    See :class:`OnlineGraph`.
+    """
+
+    def __init__(self):
+        """Initialize instance attributes, for an empty set of points."""
+        self.num_points = 0
+        self.avg_x = 0.0
+        self.avg_y = 0.0
+        self.sxx = 0.0  # sum of (x - avg_x) ** 2
+        self.sxy = 0.0  # sum of (x - avg_x) * (y - avg_y)
+        self.syy = 0.0  # sum of (y - avg_y) ** 2
+
+    def add(self, point):
+        """Add a :class:`Point` to the set."""
+        self.num_points += 1
+        x_delta = point.x - self.avg_x
+        y_delta = point.y - self.avg_y
+        self.avg_x += x_delta / self.num_points
+        self.avg_y += y_delta / self.num_points
+        self.sxx += x_delta * (point.x - self.avg_x)
+        self.sxy += x_delta * (point.y - self.avg_y)
+        self.syy += y_delta * (point.y - self.avg_y)
+
+    def remove(self, point):
+        """Remove a :class:`Point` from the set."""
+        self.num_points -= 1
+        if not self.num_points:
+            self.avg_x = self.avg_y = 0.0
+            self.sxx = self.sxy = self.syy = 0.0
+            return
+        x_delta = point.x - self.avg_x
+        y_delta = point.y - self.avg_y
+        self.avg_x -= x_delta / self.num_points
+        self.avg_y -= y_delta / self.num_points
+        self.sxx -= x_delta * (point.x - self.avg_x)
+        self.sxy -= x_delta * (point.y - self.avg_y)
+        self.syy -= y_delta * (point.y - self.avg_y)
@@ -0,0 +1,580 @@
+# coding=utf-8
+"""Tools for working with movie ratings as a sparse matrix.
+
+The functions in :mod:`movie_recommender.db` work with one row, or one pair of
+movies, at a time. That's convenient, but it's slow when every movie must be
+compared to every other movie. The tools in this module instead load every
+rating into a sparse user × movie matrix, so that whole blocks of movies may be
+processed with a handful of sparse matrix products.
+"""
+import numpy
+from scipy import sparse
+
+from movie_recommender import exceptions
+from movie_recommender.db import read
+
+
+class RatingsMatrix():
+    """A sparse user × movie matrix of ratings.
+
+    Rows are users, and columns are movies. Both are sorted by ID. Use
+    :meth:`user_index` and :meth:`movie_index` to translate IDs to row and
+    column indices.
+    """
+
+    def __init__(self, user_ids, movie_ids, ratings, all_movie_ids=None):
+        """Initialize instance attributes.
+
+        :param user_ids: An iterable of user IDs. One per rating.
+        :param movie_ids: An iterable of movie IDs. One per rating.
+        :param ratings: An iterable of ratings. The n-th rating was given by
+            the n-th user to the n-th movie.
+        :param all_movie_ids: An iterable of movie IDs. Movies which should
+            have a column in this matrix, even if nobody has rated them. If
+            ``None``, only rated movies have a column.
+        """
+        user_ids = numpy.asarray(user_ids, dtype=numpy.int64)
+        movie_ids = numpy.asarray(movie_ids, dtype=numpy.int64)
+        ratings = numpy.asarray(ratings, dtype=numpy.float64)
+        if all_movie_ids is None:
+            all_movie_ids = movie_ids
+        else:
+            all_movie_ids = numpy.concatenate((
+                numpy.asarray(tuple(all_movie_ids), dtype=numpy.int64),
+                movie_ids,
+            ))
+        self._users = numpy.unique(user_ids)
+        self._movies = numpy.unique(all_movie_ids)
+        self._ratings = sparse.csc_matrix(
+            (
+                ratings,
+                (
+                    numpy.searchsorted(self._users, user_ids),
+                    numpy.searchsorted(self._movies, movie_ids),
+                ),
+            ),
+            shape=(len(self._users), len(self._movies)),
+        )
+
+    @property
+    def users(self):
+        """Get the user IDs, in row order."""
+        return self._users
+
+    @property
+    def movies(self):
+        """Get the movie IDs, in column order."""
+        return self._movies
+
+    @property
+    def ratings(self):
+        """Get the ratings, as a ``scipy.sparse.csc_matrix``."""
+        return self._ratings
+
+    def user_index(self, user_ids):
+        """Translate user IDs to row indices.
+
+        :param user_ids: An iterable of user IDs.
+        :return: A numpy array of row indices.
+        :raise: ``KeyError`` if a user ID isn't in this matrix.
+        """
+        return self._index(self._users, user_ids)
+
+    def movie_index(self, movie_ids):
+        """Translate movie IDs to column indices.
+
+        :param movie_ids: An iterable of movie IDs.
+        :return: A numpy array of column indices.
+        :raise: ``KeyError`` if a movie ID isn't in this matrix.
+        """
+        return self._index(self._movies, movie_ids)
+
+    @staticmethod
+    def _index(haystack, needles):
+        """Find the index of each needle in a sorted haystack."""
+        needles = numpy.asarray(tuple(needles), dtype=numpy.int64)
+        indices = numpy.searchsorted(haystack, needles)
+        found = indices < len(haystack)
+        found[found] = haystack[indices[found]] == needles[found]
+        if not found.all():
+            raise KeyError(
+                f'IDs not in this matrix: {needles[~found].tolist()}'
+            )
+        return indices
+
+    def rated(self):
+        """Return a matrix with a 1 wherever a rating exists.
+
+        :return: A ``scipy.sparse.csc_matrix`` with the same shape as
+            :attr:`ratings`.
+        """
+        rated = self._ratings.copy()
+        rated.data = numpy.ones_like(rated.data)
+        return rated
+
+    def centered(self, avg_ratings):
+        """Subtract each user's average rating from each of their ratings.
+
+        :param avg_ratings: A numpy array of average ratings, in row order.
+        :return: A ``scipy.sparse.csc_matrix`` with the same sparsity pattern
+            as :attr:`ratings`. Ratings which equal the user's average are
+            stored as explicit zeros.
+        """
+        centered = self._ratings.copy()
+        centered.data = centered.data - avg_ratings[centered.indices]
+        return centered
+
+
+class AdjustedCosine():  # pylint:disable=too-few-public-methods
+    """Compute adjusted cosine similarity scores for blocks of movies.
+
+    Given the ratings for movies A and B, sum the following over every user
+    that has rated both movies, where ``avg`` is that user's average rating::
+
+        numerator = sum((rating_a - avg) * (rating_b - avg))
+        denominator_a = sum((rating_a - avg) ** 2)
+        denominator_b = sum((rating_b - avg) ** 2)
+
+    The similarity is then ``numerator / (sqrt(denominator_a) *
+    sqrt(denominator_b))``. This is the same formula used by
+    :meth:`movie_recommender.analyze.ii.compute_similarity_unsafe`. Note that
+    the denominators sum over co-raters only, so they depend on the pair of
+    movies and not just on one movie. Each sum is therefore computed with a
+    sparse matrix product.
+    """
+
+    def __init__(self, centered, rated, min_pairs):
+        """Initialize instance attributes.
+
+        :param centered: A sparse user × movie matrix of ratings, centered on
+            each user's average rating. See :meth:`RatingsMatrix.centered`.
+        :param rated: A sparse user × movie matrix, with a 1 wherever a rating
+            exists. See :meth:`RatingsMatrix.rated`.
+        :param min_pairs: If fewer than this many users have rated a pair of
+            movies, their similarity is 0. See
+            :data:`movie_recommender.constants.MIN_PAIRS_FOR_SIMILARITY`.
+        """
+        self._centered = sparse.csc_matrix(centered)
+        self._rated = sparse.csc_matrix(rated)
+        self._squared = self._centered.multiply(self._centered).tocsc()
+        # Products are of the form `transpose @ block`. Converting each
+        # transpose to CSR once is cheaper than letting scipy do it per block.
+        self._centered_t = self._centered.T.tocsr()
+        self._rated_t = self._rated.T.tocsr()
+        self._squared_t = self._squared.T.tocsr()
+        self._min_pairs = min_pairs
+
+    def scores(self, columns, rows=None):
+        """Compute the similarity of some movies to all movies.
+
+        :param columns: A sequence of column indices. The movies to compare to
+            all other movies.
+        :param rows: See :meth:`stats`.
+        :return: A dense movies × ``len(columns)`` numpy array of similarity
+            scores, ranging from -1 to 1. Pairs with too few ratings, or with a
+            denominator of zero, have a score of 0. If ``rows`` is given, there
+            is a row per index in ``rows``, not per movie.
+        """
+        return adjusted_cosine(
+            *(stat.toarray() for stat in self.stats(columns, rows)),
+            self._min_pairs,
+        )
+
+    def stats(self, columns, rows=None):
+        """Compute the sufficient statistics for some movies and all movies.
+
+        The sufficient statistics for a pair of movies are the sums described
+        in this class' docstring, along with the number of users who rated both
+        movies. They're sums over users, so the statistics for a set of users
+        may be updated by adding the statistics for additional users, or by
+        subtracting the statistics for departing users.
+
+        :param columns: A sequence of column indices. The movies to compare to
+            all other movies.
+        :param rows: A sequence of column indices, or ``None``. If given, the
+            movies in ``columns`` are compared to these movies only, rather
+            than to all movies, and the cost of each product shrinks to match.
+        :return: A ``(counts, products, squares_a, squares_b)`` tuple of sparse
+            movies × ``len(columns)`` matrices. ``products`` is the numerator.
+            ``squares_a`` is the first denominator, where movie A is the movie
+            of the row, and ``squares_b`` is the second denominator, where
+            movie B is the movie of the column. If ``rows`` is given, the n-th
+            row of each matrix is for the n-th movie in ``rows``.
+        """
+        rated_t, centered_t, squared_t = (
+            self._rated_t,
+            self._centered_t,
+            self._squared_t,
+        )
+        if rows is not None:
+            rows = numpy.asarray(rows, dtype=numpy.int64)
+            rated_t, centered_t, squared_t = (
+                rated_t[rows],
+                centered_t[rows],
+                squared_t[rows],
+            )
+        return (
+            rated_t @ self._rated[:, columns],
+            centered_t @ self._centered[:, columns],
+            squared_t @ self._rated[:, columns],
+            rated_t @ self._squared[:, columns],
+        )
+
+
+class CoRaters():  # pylint:disable=too-few-public-methods
+    """Count the users who have rated each pair of movies.
+
+    Each row of a rated matrix is one user's list of rated movies, so the
+    number of users who have rated both movie A and movie B is an entry of the
+    movie × movie product ``rated.T @ rated``. That product is built one block
+    of columns at a time, so memory use is bounded by the block size, not by
+    the number of pairs of movies. Counting co-raters this way lets pairs with
+    too few of them be skipped without a query per pair. See
+    :data:`movie_recommender.constants.MIN_PAIRS_FOR_SIMILARITY`.
+    """
+
+    def __init__(self, ratings):
+        """Initialize instance attributes.
+
+        :param ratings: A :class:`RatingsMatrix`. Only which ratings exist
+            matters, not their values.
+        """
+        self._ratings = ratings
+        self._rated = sparse.csc_matrix(ratings.rated(), dtype=numpy.int32)
+        self._rated_t = self._rated.T.tocsr()
+
+    @property
+    def movies(self):
+        """Get the movie IDs, in row order. See :meth:`counts`."""
+        return self._ratings.movies
+
+    def counts(self, movie_ids):
+        """Count the co-raters of some movies and all movies.
+
+        :param movie_ids: An iterable of movie IDs.
+        :return: A dense numpy array of integers, with a row per movie in
+            :attr:`movies`, and a column per movie in ``movie_ids``. Each entry
+            is the number of users who rated both movies.
+        :raise: ``KeyError`` if a movie ID isn't in the ratings matrix.
+        """
+        columns = self._ratings.movie_index(movie_ids)
+        return (self._rated_t @ self._rated[:, columns]).toarray()
+
+
+class MinHashBuckets():
+    """Find pairs of movies with similar sets of raters, approximately.
+
+    Each movie's set of raters is summarized by a MinHash signature: for each
+    of ``bands * rows`` random hash functions over user IDs, the smallest hash
+    of any of the movie's raters. Two movies agree on any one value with
+    probability equal to the Jaccard similarity of their sets of raters.
+    Signatures are split into ``bands`` bands of ``rows`` values, and movies
+    whose signatures are identical in a band share a bucket. Movies which share
+    at least one bucket *collide*. See
+    :data:`movie_recommender.constants.LSH_BANDS` for how ``bands`` and
+    ``rows`` trade recall against the number of collisions.
+
+    Building the buckets costs one pass over the ratings per hash function.
+    Each band then gets an index from buckets to their members, so finding a
+    movie's collisions costs one lookup per band, plus the number of
+    collisions, and enumerating collisions doesn't cost O(M²) for M movies.
+    Movies nobody has rated never collide.
+    """
+
+    _PRIME = 2**31 - 1
+    """A Mersenne prime, larger than the number of users in any dataset."""
+
+    def __init__(self, ratings, bands, rows, seed=0):
+        """Initialize instance attributes.
+
+        :param ratings: A :class:`RatingsMatrix`. Only which ratings exist
+            matters, not their values.
+        :param bands: The number of bands to split each signature into.
+        :param rows: The number of hash values in each band.
+        :param seed: A seed for the random hash functions. The same seed
+            always produces the same buckets.
+        """
+        self._ratings = ratings
+        signatures = self.signatures(ratings, bands * rows, seed)
+        rated = numpy.flatnonzero(numpy.diff(ratings.ratings.indptr) > 0)
+        # For each band, each movie's bucket, and each bucket's members. The
+        # members of bucket b are members[bounds[b]:bounds[b + 1]], in column
+        # order. Movies nobody has rated have bucket -1, and are no member.
+        self._labels = []
+        self._members = []
+        self._bounds = []
+        for band in range(bands):
+            _, labels = numpy.unique(
+                signatures[band * rows:(band + 1) * rows, rated].T,
+                axis=0,
+                return_inverse=True,
+            )
+            labels = labels.reshape(-1)
+            order = numpy.argsort(labels, kind='stable')
+            self._labels.append(numpy.full(len(ratings.movies), -1))
+            self._labels[-1][rated] = labels
+            self._members.append(rated[order])
+            self._bounds.append(numpy.searchsorted(
+                labels[order],
+                numpy.arange(labels.max(initial=-1) + 2),
+            ))
+
+    @property
+    def movies(self):
+        """Get the movie IDs, in the order used by :meth:`collisions`."""
+        return self._ratings.movies
+
+    @classmethod
+    def signatures(cls, ratings, num_hashes, seed=0):
+        """Compute the MinHash signature of each movie's set of raters.
+
+        :param ratings: A :class:`RatingsMatrix`.
+        :param num_hashes: The number of hash functions, and thus the length
+            of each signature.
+        :param seed: A seed for the random hash functions.
+        :return: A numpy array of integers, with a row per hash function, and
+            a column per movie in ``ratings``. Columns for movies nobody has
+            rated hold meaningless values.
+        """
+        # Hash functions of the form (a * x + b) mod p, with x a row index.
+        rng = numpy.random.default_rng(seed)
+        coefficients = rng.integers(1, cls._PRIME, size=num_hashes)
+        offsets = rng.integers(0, cls._PRIME, size=num_hashes)
+        rated = ratings.ratings
+        users = numpy.arange(rated.shape[0], dtype=numpy.int64)
+        starts = rated.indptr[:-1]
+        nonempty = starts < rated.indptr[1:]
+        signatures = numpy.zeros(
+            (num_hashes, rated.shape[1]),
+            dtype=numpy.int64,
+        )
+        for i in range(num_hashes):
+            hashes = (coefficients[i] * users + offsets[i]) % cls._PRIME
+            # Each column's smallest hash. Empty columns are excluded, so that
+            # each remaining segment ends where the next non-empty one starts.
+            signatures[i, nonempty] = numpy.minimum.reduceat(
+                hashes[rated.indices],
+                starts[nonempty],
+            )
+        return signatures
+
+    def collisions(self, movie_id):
+        """Find the movies which share at least one bucket with a movie.
+
+        :param movie_id: A movie ID.
+        :return: A sorted numpy array of the indices in :attr:`movies` of the
+            movies which collide with the given movie. A movie collides with
+            itself, unless nobody has rated it.
+        :raise: ``KeyError`` if the movie ID isn't in the ratings matrix.
+        """
+        column = self._ratings.movie_index((movie_id,))[0]
+        if self._labels[0][column] < 0:
+            return numpy.empty(0, dtype=numpy.int64)
+        return numpy.unique(numpy.concatenate(tuple(
+            members[bounds[labels[column]]:bounds[labels[column] + 1]]
+            for labels, members, bounds in zip(
+                self._labels,
+                self._members,
+                self._bounds,
+            )
+        )))
+
+
+class PairBitmap():
+    """A set of pairs of movies, stored as a bitmap.
+
+    Pairs are unordered: adding ``(1, 2)`` also adds ``(2, 1)``. Each movie
+    has a row of bits, one per movie, so testing whether a pair is in the set
+    costs O(1), and fetching every pair involving a movie costs one row. With
+    ml-20m's ~27,000 movies, the bitmap occupies roughly 91 MB.
+    """
+
+    def __init__(self, movie_ids):
+        """Initialize instance attributes.
+
+        :param movie_ids: An iterable of movie IDs. Pairs of other movies are
+            silently discarded by :meth:`add`.
+        """
+        self._movies = numpy.unique(
+            numpy.asarray(tuple(movie_ids), dtype=numpy.int64)
+        )
+        num_movies = len(self._movies)
+        self._bits = numpy.zeros(
+            (num_movies, (num_movies + 7) // 8),
+            dtype=numpy.uint8,
+        )
+
+    def __contains__(self, pair):
+        """Tell whether a pair of movies is in this set.
+
+        :param pair: A pair of movie IDs.
+        :return: True if the pair is in this set, false otherwise.
+        """
+        i = self._find(pair[0])
+        j = self._find(pair[1])
+        if i is None or j is None:
+            return False
+        return bool(self._bits[i, j >> 3] & (1 << (j & 7)))
+
+    def add(self, movies_a, movies_b):
+        """Add pairs of movies to this set.
+
+        :param movies_a: A sequence of movie IDs.
+        :param movies_b: A sequence of movie IDs. The n-th movie in
+            ``movies_a`` is paired with the n-th movie in ``movies_b``.
+        :return: Nothing.
+        """
+        movies_a = numpy.asarray(movies_a, dtype=numpy.int64)
+        movies_b = numpy.asarray(movies_b, dtype=numpy.int64)
+        if not self._movies.size:
+            return
+        rows = numpy.searchsorted(self._movies, movies_a)
+        cols = numpy.searchsorted(self._movies, movies_b)
+        rows = numpy.minimum(rows, len(self._movies) - 1)
+        cols = numpy.minimum(cols, len(self._movies) - 1)
+        found = self._movies[rows] == movies_a
+        found &= self._movies[cols] == movies_b
+        rows = rows[found]
+        cols = cols[found]
+        for row, col in ((rows, cols), (cols, rows)):
+            numpy.bitwise_or.at(
+                self._bits,
+                (row, col >> 3),
+                numpy.left_shift(1, col & 7).astype(numpy.uint8),
+            )
+
+    def paired(self, movie_id, movie_ids):
+        """Tell whether a movie is paired with each of some movies.
+
+        Unlike :meth:`row`, this costs O(n) for n movie IDs, not O(M) for M
+        movies.
+
+        :param movie_id: A movie ID.
+        :param movie_ids: A numpy array of movie IDs.
+        :return: A numpy array of booleans. The n-th value tells whether
+            ``movie_id`` is paired with the n-th movie in ``movie_ids``.
+        """
+        paired = numpy.zeros(len(movie_ids), dtype=bool)
+        i = self._find(movie_id)
+        if i is None or len(movie_ids) == 0:
+            return paired
+        cols = numpy.minimum(
+            numpy.searchsorted(self._movies, movie_ids),
+            len(self._movies) - 1,
+        )
+        found = self._movies[cols] == movie_ids
+        cols = cols[found]
+        paired[found] = (self._bits[i, cols >> 3] >> (cols & 7)) & 1 == 1
+        return paired
+
+    def row(self, movie_id):
+        """Get the pairs involving a movie.
+
+        :param movie_id: A movie ID.
+        :return: A numpy array of booleans, one per movie ID passed to the
+            constructor, in sorted order. The n-th value tells whether
+            ``movie_id`` is paired with the n-th movie.
+        """
+        i = self._find(movie_id)
+        if i is None:
+            return numpy.zeros(len(self._movies), dtype=bool)
+        return numpy.unpackbits(
+            self._bits[i],
+            count=len(self._movies),
+            bitorder='little',
+        ).astype(bool)
+
+    def _find(self, movie_id):
+        """Return the index of a movie, or ``None`` if it's absent."""
+        i = int(numpy.searchsorted(self._movies, movie_id))
+        if i < len(self._movies) and self._movies[i] == movie_id:
+            return i
+        return None
+
+
+def adjusted_cosine(  # pylint:disable=too-many-arguments
+        counts,
+        products,
+        squares_a,
+        squares_b,
+        min_pairs):
+    """Compute adjusted cosine similarity scores from sufficient statistics.
+
+    See :meth:`AdjustedCosine.stats`.
+
+    :param counts: A numpy array of co-rater counts.
+    :param products: A numpy array of sums of products.
+    :param squares_a: A numpy array of sums of squares for movie A.
+    :param squares_b: A numpy array of sums of squares for movie B.
+    :param min_pairs: See :class:`AdjustedCosine`.
+    :return: A numpy array of similarity scores, ranging from -1 to 1. Pairs
+        with too few ratings, or with a denominator of zero, have a score of 0.
+    """
+    # Sums of squares which have been updated incrementally may be slightly
+    # negative, due to rounding.
+    denominator = numpy.sqrt(numpy.maximum(squares_a, 0))
+    denominator *= numpy.sqrt(numpy.maximum(squares_b, 0))
+    valid = (counts >= min_pairs) & (denominator != 0)
+    scores = numpy.zeros_like(products, dtype=numpy.float64)
+    scores[valid] = products[valid] / denominator[valid]
+    return scores
+
+
+def load_ratings_matrix():
+    """Load every rating in the database into a :class:`RatingsMatrix`.
+
+    Every movie in the database gets a column, even if nobody has rated it.
+
+    :return: A :class:`RatingsMatrix`.
+    """
+    user_ids = []
+    movie_ids = []
+    ratings = []
+    for user_id, movie_id, rating in read.all_ratings():
+        user_ids.append(user_id)
+        movie_ids.append(movie_id)
+        ratings.append(rating)
+    return RatingsMatrix(user_ids, movie_ids, ratings, read.all_movies())
+
+
+def load_avg_ratings(ratings):
+    """Load the average of each user's ratings, in row order.
+
+    :param ratings: A :class:`movie_recommender.matrix.RatingsMatrix`.
+    :return: A numpy array of average ratings, where the n-th value is the
+        average rating of the n-th user in ``ratings``.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
+    avg_ratings = numpy.full(len(ratings.users), numpy.nan)
+    for avg_rating in read.all_avg_ratings():
+        i = numpy.searchsorted(ratings.users, avg_rating.user_id)
+        if i < len(ratings.users) and ratings.users[i] == avg_rating.user_id:
+            avg_ratings[i] = avg_rating.avg_rating
+    missing = numpy.isnan(avg_ratings)
+    if missing.any():
+        raise exceptions.MissingAverageRatingError(
+            f"""
+            The adjusted cosine similarity algorithm requires that the average
+            ratings given by each user be precomputed. However, there are
+            {len(avg_ratings) - missing.sum()} precomputed average ratings,
+            and {len(avg_ratings)} users.
+            """
+        )
+    return avg_ratings
+
+
+def load_adjusted_cosine(ratings, min_pairs):
+    """Prepare to compute similarity scores for the movies in a ratings matrix.
+
+    :param ratings: A :class:`movie_recommender.matrix.RatingsMatrix`.
+    :param min_pairs: See :class:`AdjustedCosine`.
+    :return: A :class:`AdjustedCosine`.
+    :raise movie_recommender.exceptions.MissingAverageRatingError: If the
+        average of a user's ratings hasn't been pre-computed.
+    """
+    return AdjustedCosine(
+        ratings.centered(load_avg_ratings(ratings)),
+        ratings.rated(),
+        min_pairs,
+    )
@@ -13,7 +13,7 @@ from movie_recommender.db import calc, read
 from movie_recommender.predict.common import Prediction
 
 
-def predict_rating_for_predict(user, movie):
+def predict_rating_for_predict(user, movie, neighbors=False):
     """Predict the given user's rating for the given movie.
 
     Try the following, in order:
@@ -31,11 +31,12 @@ def predict_rating_for_predict(user, movie):
     :param user: A user ID. The user for whom a predicted rating is generated.
     :param movie: An movie ID. The movie for which a predicted rating is
         generated.
+    :param neighbors: See :func:`movie_recommender.predict.ii.predict_rating`.
     :return: A predicted rating.
     :rtype movie_recommender.predict.common.Prediction:
     """
     try:
-        pred_rating = predict_rating(user, movie)
+        pred_rating = predict_rating(user, movie, neighbors)
         reason = SIMILAR
     except exceptions.NoSimilarMoviesError:
         try:
@@ -47,7 +48,7 @@ def predict_rating_for_predict(user, movie):
     return Prediction(pred_rating, movie, reason)
 
 
-def predict_rating_for_recommend(user, movie):
+def predict_rating_for_recommend(user, movie, neighbors=False):
     """Predict the given user's rating for the given movie.
 
     Try the following, in order:
@@ -62,11 +63,12 @@ def predict_rating_for_recommend(user, movie):
     :param user: A user ID. The user for whom a predicted rating is generated.
     :param movie: An movie ID. The movie for which a predicted rating is
         generated.
+    :param neighbors: See :func:`movie_recommender.predict.ii.predict_rating`.
     :return: A predicted rating.
     :rtype movie_recommender.predict.common.Prediction:
     """
     try:
-        pred_rating = predict_rating(user, movie)
+        pred_rating = predict_rating(user, movie, neighbors)
         reason = SIMILAR
     except exceptions.NoSimilarMoviesError:
         pred_rating = MIN_RATING
@@ -74,7 +76,7 @@ def predict_rating_for_recommend(user, movie):
     return Prediction(pred_rating, movie, reason)
 
 
-def predict_rating(user, movie):
+def predict_rating(user, movie, neighbors=False):
     """Predict the given user's rating for the given movie.
 
     Use the weighted sum algorithm to predict what rating the given user will
@@ -85,6 +87,11 @@ def predict_rating(user, movie):
     :param user: A user ID. The user for whom a predicted rating is generated.
     :param movie: An movie ID. The movie for which a predicted rating is
         generated.
+    :param neighbors: If false, consider every movie similar to the given
+        movie. If true, consider only the movie's neighbors, as stored by
+        :meth:`movie_recommender.analyze.ii.analyze_neighbors`. This is
+        faster, as the cost of a prediction is bounded by the number of
+        neighbors per movie.
     :return: A predicted movie rating, ranging from
         :data:`movie_recommender.constants.MIN_RATING` to
         :data:`movie_recommender.constants.MAX_RATING`.
@@ -92,12 +99,21 @@ def predict_rating(user, movie):
         any movies similar to the given movie that the user has seen. (In other
         words, if the algorithm fails to run.)
     """
+    if neighbors:
+        similar_ratings = (
+            (similarity, rating)
+            for _, similarity, rating in read.neighbors_for_user(movie, user)
+        )
+    else:
+        similar_ratings = (
+            (similarity, read.rating(user, similar_movie))
+            for similar_movie, similarity
+            in read.similar_movies_for_user(movie, user)
+        )
     numerator = 0
     denominator = 0
-    for (similar_movie, similarity) in read.similar_movies_for_user(movie, user):
-        numerator += similarity * normalize_rating(
-            read.rating(user, similar_movie)
-        )
+    for similarity, rating in similar_ratings:
+        numerator += similarity * normalize_rating(rating)
         denominator += math.fabs(similarity)
     try:
         normalized_rating = numerator / denominator
@@ -2,10 +2,12 @@
 """Tools for predicting movie ratings with the machine learning algorithm."""
 import functools
 
+import numpy
+
 from movie_recommender import exceptions
-from movie_recommender.constants import GENRES
-from movie_recommender.graph import Graph, Point
-from movie_recommender.db import common, read
+from movie_recommender.constants import GENRE_BITS, GENRES, PREDICTOR_NAMES
+from movie_recommender.graph import ArrayGraph, Point
+from movie_recommender.db import common, features, read
 
 
 def clamp_rating(rating):
@@ -26,9 +28,122 @@ def make_predictor(user_id, predictor_name):
         predictions.
     :return: A predictor. A function which accepts a movie ID and returns a
         rating.
+    :raise movie_recommender.exceptions.NoSuchPredictorError: If the requested
+        type of predictor is not yet implemented.
+    """
+    return make_predictors(user_id, (predictor_name,))[predictor_name]
+
+
+def make_predictors(user_id, predictor_names=PREDICTOR_NAMES):
+    """Make several univariate predictors for the given user, at once.
+
+    The user's rated movies are read once, and every predictor is fitted with
+    one vectorized operation over a matrix of movie features. See
+    :func:`rated_movie_features`. Each predictor behaves like the one made by
+    the matching factory from :func:`get_predictor_factory`.
+
+    :param user_id: A user ID. The user for which predictors are being created.
+    :param predictor_names: An iterable of predictor names. See
+        :data:`movie_recommender.constants.PREDICTOR_NAMES`.
+    :return: A dict in the form ``{predictor_name: predictor}``.
+    :raise movie_recommender.exceptions.NoSuchPredictorError: If a requested
+        type of predictor is not yet implemented.
+    """
+    columns = {}
+    for predictor_name in predictor_names:
+        try:
+            columns[predictor_name] = PREDICTOR_NAMES.index(predictor_name)
+        except ValueError:
+            raise exceptions.NoSuchPredictorError(
+                f'A predictor for {predictor_name} is not (yet) implemented.'
+            ) from None
+    lines = fit_lines(*rated_movie_features(user_id))
+    return {
+        predictor_name: _make_fitted_predictor(predictor_name, lines[column])
+        for predictor_name, column in columns.items()
+    }
+
+
+def fit_lines(x_values, present, ratings):
+    """Fit a line of best fit for each column of a matrix of features.
+
+    Each column's line is fitted to the rows in which that feature is present,
+    like a graph would. See :class:`movie_recommender.graph.Graph`.
+
+    :param x_values: See :func:`rated_movie_features`.
+    :param present: See :func:`rated_movie_features`.
+    :param ratings: See :func:`rated_movie_features`.
+    :return: A list with one item per column. Each item is ``None`` if no row
+        has that feature, or a ``(slope, y_intercept)`` tuple otherwise. If a
+        line is vertical, its slope is 0, and its y intercept is the average
+        rating.
     """
-    predictor_factory = get_predictor_factory(predictor_name)
-    return predictor_factory(user_id)
+    counts = present.sum(axis=0)
+    y_values = numpy.broadcast_to(ratings.reshape(-1, 1), x_values.shape)
+    # A line is vertical if every x value is the same. Such a line predicts
+    # the average y value. A user may have no rated movies at all, so the
+    # reductions need initial values.
+    min_x = numpy.min(
+        numpy.where(present, x_values, numpy.inf),
+        axis=0,
+        initial=numpy.inf,
+    )
+    max_x = numpy.max(
+        numpy.where(present, x_values, -numpy.inf),
+        axis=0,
+        initial=-numpy.inf,
+    )
+    vertical = min_x == max_x
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        avg_x = numpy.where(present, x_values, 0).sum(axis=0) / counts
+        avg_y = numpy.where(present, y_values, 0).sum(axis=0) / counts
+        x_minus_xavg = numpy.where(present, x_values - avg_x, 0)
+        numerators = (x_minus_xavg * (y_values - avg_y)).sum(axis=0)
+        slopes = numpy.where(
+            vertical,
+            0.0,
+            numerators / (x_minus_xavg ** 2).sum(axis=0),
+        )
+        y_intercepts = avg_y - avg_x * slopes
+    return [
+        (slope, y_intercept) if count else None
+        for count, slope, y_intercept in zip(
+            counts.tolist(),
+            slopes.tolist(),
+            y_intercepts.tolist(),
+        )
+    ]
+
+
+def rated_movie_features(user_id):
+    """Get features of each movie a user has rated, and the user's ratings.
+
+    Features are looked up with :func:`movie_recommender.db.features.get`.
+
+    :param user_id: A user ID.
+    :return: A ``(x_values, present, ratings)`` tuple of numpy arrays.
+        ``x_values`` has one row per rated movie, and one column per predictor
+        in :data:`movie_recommender.constants.PREDICTOR_NAMES`. The "year"
+        column holds each movie's year, and each genre's column holds 1 if a
+        movie has that genre, or 0 otherwise. ``present`` is a boolean array
+        shaped like ``x_values``, and is false where a movie lacks a feature,
+        i.e. where a movie's title doesn't include a year. ``ratings`` holds
+        the user's rating of each movie.
+    """
+    rows = read.rated_movie_ratings(user_id)
+    movie_ids = numpy.array([row[0] for row in rows], dtype=numpy.int64)
+    ratings = numpy.array([row[1] for row in rows], dtype=numpy.float64)
+    years, genre_masks = features.get().lookup(movie_ids)
+    genre_bits = numpy.array(
+        [GENRE_BITS[name[len('genre:'):]] for name in PREDICTOR_NAMES[1:]],
+        dtype=numpy.int64,
+    )
+    x_values = numpy.empty((len(rows), len(PREDICTOR_NAMES)))
+    x_values[:, 0] = years
+    x_values[:, 1:] = (genre_masks.reshape(-1, 1) & genre_bits) != 0
+    present = numpy.ones(x_values.shape, dtype=bool)
+    present[:, 0] = ~numpy.isnan(years)
+    return x_values, present, ratings
 
 
 def get_predictor_factory(predictor_name):
@@ -53,7 +168,7 @@ def get_predictor_factory(predictor_name):
     except KeyError:
         raise exceptions.NoSuchPredictorError(
             f'A predictor for {predictor_name} is not (yet) implemented.'
-        )
+        ) from None
 
 
 def make_year_predictor(user_id, forbidden_movie=None):
@@ -92,7 +207,7 @@ def make_year_predictor(user_id, forbidden_movie=None):
                 continue
             rating = row[1]
             points.append(Point(year, rating))
-    graph = Graph(points)
+    graph = ArrayGraph(points)
 
     def predictor(movie_id):
         """Predict a user's rating for the given movie.
@@ -108,8 +223,7 @@ def make_year_predictor(user_id, forbidden_movie=None):
             include a year, but all of the movies this user has rated lack a
             year.
         """
-        title = read.title(movie_id)
-        year = read.year(title)
+        year = features.get().year(movie_id)
         try:
             rating = graph.predict_y(year)
         except exceptions.VerticalLineOfBestFitGraphError:
@@ -149,7 +263,7 @@ def make_genre_predictor(genre, user_id, forbidden_movie=None):
             genre_present = 1 if genre in genres else 0
             rating = row[1]
             points.append(Point(genre_present, rating))
-    graph = Graph(points)
+    graph = ArrayGraph(points)
 
     def predictor(movie_id):
         """Predict a user's rating for the given movie.
@@ -157,8 +271,7 @@ def make_genre_predictor(genre, user_id, forbidden_movie=None):
         :param movie_id: A movie ID.
         :return: A predicted rating for the given movie.
         """
-        genres = read.genres(movie_id)
-        genre_present = 1 if genre in genres else 0
+        genre_present = 1 if features.get().has_genre(movie_id, genre) else 0
         try:
             rating = graph.predict_y(genre_present)
         except exceptions.VerticalLineOfBestFitGraphError:
@@ -166,3 +279,30 @@ def make_genre_predictor(genre, user_id, forbidden_movie=None):
         return clamp_rating(rating)
 
     return predictor
+
+
+def _make_fitted_predictor(predictor_name, line):
+    """Make a predictor from a fitted line.
+
+    :param predictor_name: A predictor name, like "year" or "genre:Comedy".
+    :param line: A ``(slope, y_intercept)`` tuple, or ``None`` if no line
+        could be fitted, due to a lack of relevant data.
+    :return: A function which accepts a movie ID and returns a predicted
+        rating. See :func:`make_year_predictor` and
+        :func:`make_genre_predictor` for the exceptions it may raise.
+    """
+    def predictor(movie_id):
+        """Predict a user's rating for the given movie."""
+        if predictor_name == 'year':
+            x_value = features.get().year(movie_id)
+        else:
+            genre = predictor_name[len('genre:'):]
+            x_value = 1 if features.get().has_genre(movie_id, genre) else 0
+        if line is None:
+            raise exceptions.EmptyGraphError(
+                "Can't calculate the average point of an empty graph."
+            )
+        slope, y_intercept = line
+        return clamp_rating(slope * x_value + y_intercept)
+
+    return predictor
@@ -0,0 +1,266 @@
+# coding=utf-8
+"""Record where the time goes while a command runs.
+
+When an analysis is slow, the time may go to SQL, to pickling tasks and
+results between processes, to the pool itself, or to Python arithmetic. Once
+:func:`enable` has been called, this module records:
+
+* The wall time of each stage, as marked by :func:`stage`.
+* The number and total latency of each distinct SQL statement. See
+  :func:`movie_recommender.db.common.get_db_conn`. Latency is the time spent
+  in ``execute()`` or ``executemany()``, which includes producing the first
+  row, but not fetching the rest.
+* The number of database connections opened.
+* The number of tasks run by each process pool, the time they took, and the
+  number of bytes of tasks and results pickled. See :func:`task` and
+  :func:`results`.
+
+Records are per process. Pool loops wrap their task functions with
+:func:`task`, so that each worker ships what it recorded back with each
+result, and the parent merges it in :func:`results`. While profiling is
+disabled, both functions hand back their argument, so pools run exactly as
+they otherwise would, and every other hook costs one function call.
+"""
+import contextlib
+import os
+import pickle
+import re
+import time
+from collections import Counter
+
+_ENABLED = False
+"""Whether profiling is enabled in this process. See :func:`enable`."""
+
+_RECORDS = None
+"""What this process has recorded. See :func:`take`."""
+
+_WHITESPACE = re.compile(r'\s+')
+"""Matches runs of whitespace in SQL statements."""
+
+
+class _Result():  # pylint:disable=too-few-public-methods
+    """A pool task's result, and what its worker recorded."""
+
+    def __init__(self, result, records):
+        """Initialize instance attributes."""
+        self.result = result
+        self.records = records
+
+
+class _Task():  # pylint:disable=too-few-public-methods
+    """A pool task function, which ships records back with its result."""
+
+    def __init__(self, func, pool_name):
+        """Initialize instance attributes."""
+        self.func = func
+        self.pool_name = pool_name
+
+    def __call__(self, arg):
+        """Call the task function, and record its cost.
+
+        :return: A :class:`_Result`. Records include whatever else this
+            worker recorded since its last task, such as a pool initializer's
+            queries.
+        """
+        start = time.perf_counter()
+        result = self.func(arg)
+        seconds = time.perf_counter() - start
+        pool = _RECORDS['pools'].setdefault(self.pool_name, Counter())
+        pool['tasks'] += 1
+        pool['seconds'] += seconds
+        pool['sent'] += len(pickle.dumps(arg))
+        pool['received'] += len(pickle.dumps(result))
+        return _Result(result, take())
+
+
+def count(name, value=1):
+    """Add to a counter, if profiling is enabled.
+
+    :param name: The counter's name, such as "connections opened".
+    :param value: The amount to add.
+    :return: Nothing.
+    """
+    if _ENABLED:
+        _RECORDS['counters'][name] += value
+
+
+def disable():
+    """Disable profiling in this process.
+
+    Records are kept, so they may still be summarized.
+
+    :return: Nothing.
+    """
+    global _ENABLED  # pylint:disable=global-statement
+    _ENABLED = False
+
+
+def enable():
+    """Enable profiling in this process, and in processes forked from it.
+
+    Anything recorded before is discarded.
+
+    :return: Nothing.
+    """
+    global _ENABLED  # pylint:disable=global-statement
+    _ENABLED = True
+    take()
+
+
+def enabled():
+    """Tell whether profiling is enabled.
+
+    :return: A boolean.
+    """
+    return _ENABLED
+
+
+def merge(records):
+    """Add records from another process to this process' records.
+
+    :param records: A dict, as returned by :func:`take`.
+    :return: Nothing.
+    """
+    for key in ('counters', 'stages'):
+        _RECORDS[key].update(records[key])
+    for key in ('pools', 'queries'):
+        for name, counter in records[key].items():
+            _RECORDS[key].setdefault(name, Counter()).update(counter)
+
+
+def record_query(statement, seconds, executions=1):
+    """Record that a SQL statement was executed, or its results fetched.
+
+    :param statement: The statement. Runs of whitespace are collapsed, so that
+        the same statement is always recorded under the same name.
+    :param seconds: How long the statement took to execute, or its results
+        took to fetch.
+    :param executions: How many times the statement was executed. 0 if only
+        results were fetched.
+    :return: Nothing.
+    """
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    query = _RECORDS['queries'].setdefault(statement, Counter())
+    query['count'] += executions
+    query['seconds'] += seconds
+
+
+def results(iterable):
+    """Unwrap the results of tasks wrapped by :func:`task`.
+
+    :param iterable: An iterable of results, as returned by
+        ``multiprocessing.Pool.imap_unordered``.
+    :return: A generator which yields each task's original result, after
+        merging its worker's records into this process' records. If profiling
+        is disabled, ``iterable`` is returned as-is.
+    """
+    if not _ENABLED:
+        return iterable
+    return _unwrap_results(iterable)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Record the wall time of a stage of work, if profiling is enabled.
+
+    A stage may be entered several times, and its times are summed. Stages
+    are summarized in the order they were first entered.
+
+    :param name: The stage's name, such as "write similarities".
+    :return: A context manager.
+    """
+    if not _ENABLED:
+        yield
+        return
+    _RECORDS['stages'][name] += 0
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _RECORDS['stages'][name] += time.perf_counter() - start
+
+
+def summarize(records=None, top=10):
+    """Summarize records, as text for humans.
+
+    :param records: A dict, as returned by :func:`take`. If ``None``, this
+        process' records are used.
+    :param top: The number of slowest SQL statements to list.
+    :return: A list of lines of text.
+    """
+    records = _RECORDS if records is None else records
+    lines = ['Stages:']
+    for name, seconds in records['stages'].items():
+        lines.append(f'  {seconds:10.3f}s  {name}')
+    queries = records['queries']
+    total = sum(query['seconds'] for query in queries.values())
+    lines.append(
+        f'SQL: {sum(query["count"] for query in queries.values())} '
+        f'statements in {total:.3f}s, '
+        f'{records["counters"]["connections opened"]} connections opened'
+    )
+    slowest = sorted(
+        queries.items(),
+        key=lambda item: item[1]['seconds'],
+        reverse=True,
+    )[:top]
+    for statement, query in slowest:
+        mean_ms = query['seconds'] / query['count'] * 1000
+        lines.append(
+            f'  {query["seconds"]:10.3f}s  {query["count"]:9d}×  '
+            f'{mean_ms:8.3f}ms  {statement[:100]}'
+        )
+    lines.append('Pools:')
+    for name, pool in records['pools'].items():
+        tasks = pool['tasks']
+        lines.append(
+            f'  {name}: {tasks} tasks in {pool["seconds"]:.3f}s of worker '
+            f'time, {pool["sent"] / tasks:.0f} bytes sent and '
+            f'{pool["received"] / tasks:.0f} bytes received per task'
+        )
+    return lines
+
+
+def take():
+    """Return and discard what this process has recorded.
+
+    :return: A dict with the following keys. ``stages`` maps stage names to
+        seconds. ``queries`` maps SQL statements to counters of ``count`` and
+        ``seconds``. ``counters`` maps counter names to values. ``pools`` maps
+        pool names to counters of ``tasks``, ``seconds``, ``sent`` and
+        ``received``.
+    """
+    global _RECORDS  # pylint:disable=global-statement
+    records = _RECORDS
+    _RECORDS = {
+        'counters': Counter(),
+        'pools': {},
+        'queries': {},
+        'stages': Counter(),
+    }
+    return records
+
+
+def task(func, pool_name):
+    """Wrap a pool task function, so that its worker's records are kept.
+
+    :param func: A function accepting one argument. It must be picklable.
+    :param pool_name: A name under which to record the pool's tasks, such as
+        "similarities".
+    :return: A picklable callable, whose results must be unwrapped with
+        :func:`results`. If profiling is disabled, ``func`` is returned as-is.
+    """
+    if not _ENABLED:
+        return func
+    return _Task(func, pool_name)
+
+
+def _unwrap_results(iterable):
+    """Unwrap results. See :func:`results`."""
+    for result in iterable:
+        merge(result.records)
+        yield result.result
+
+
+take()
+os.register_at_fork(after_in_child=take)
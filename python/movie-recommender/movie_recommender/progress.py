@@ -0,0 +1,274 @@
+# coding=utf-8
+"""Track the progress of work spread across a pool of processes.
+
+A :class:`Progress` object counts work in a small block of shared memory, and
+reports it from a timer thread in the process which created it. No reporter
+process or pipe is needed, and workers never wait on the reporter:
+
+* Any process may call :meth:`Progress.advance` to count completed work, and
+  :meth:`Progress.add_busy` to count time spent working. Each process claims
+  its own slot in shared memory the first time it does so, and only that
+  process writes to that slot, so no lock is taken.
+* Every :data:`movie_recommender.constants.PROGRESS_INTERVAL` seconds, the
+  timer thread sums the slots into a :class:`Snapshot`, and hands it to a
+  reporter function. Once the work is done, a final snapshot is reported.
+
+Processes forked while a :class:`Progress` is active inherit it, so that a pool
+created inside its ``with`` block may count work with :func:`advance`, and
+report busy time with :func:`add_busy` or :func:`timed`.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple
+
+from movie_recommender.constants import PROGRESS_INTERVAL
+
+
+Snapshot = namedtuple('Snapshot', (
+    'done',
+    'total',
+    'seconds',
+    'rate',
+    'eta',
+    'utilization',
+    'finished',
+))
+"""The progress of some work, at some point in time.
+
+``done`` and ``total`` are amounts of work, such as a number of users, or the
+number of ratings those users have made. ``seconds`` is the time since the
+work started, and ``rate`` is ``done / seconds``. ``eta`` is the estimated
+number of seconds until the work is done, or ``None`` if nothing is done yet.
+``utilization`` is a tuple with one value per process which reported busy
+time, in the order those processes started reporting. Each value is the
+fraction of the last interval that process spent busy, or for the final
+snapshot, the fraction of the whole run. Busy time is counted as each task
+completes, so a long task counts towards the interval it ends in, and values
+are capped at 1. ``finished`` tells whether this is the final snapshot.
+"""
+
+_ACTIVE = []
+"""Every active :class:`Progress`, innermost last. See :func:`add_busy`."""
+
+
+class Progress():
+    """Count work done by several processes, and report it periodically.
+
+    Use this as a context manager. Work may be counted only inside the
+    ``with`` block.
+
+    :param total: The total amount of work to do.
+    :param reporter: A function accepting a :class:`Snapshot`. It's called from
+        a thread in this process, and shouldn't block. If ``None``, work is
+        counted, but not reported.
+    :param workers: The number of worker processes which will count work. They
+        and this process count work without taking a lock. Any other processes
+        share a slot, and take a lock. If ``None``, one per CPU.
+    :param interval: The number of seconds between reports.
+    """
+
+    def __init__(
+            self,
+            total,
+            reporter=None,
+            workers=None,
+            interval=PROGRESS_INTERVAL):
+        """Initialize instance attributes."""
+        self.total = total
+        self.reporter = reporter
+        self.interval = interval
+        self._slots = _Slots(os.cpu_count() if workers is None else workers)
+        self._start = None
+        self._previous = None
+        self._ticker = None
+
+    def __enter__(self):
+        """Start the reporter thread, if there's a reporter."""
+        _ACTIVE.append(self)
+        self._start = time.perf_counter()
+        self._previous = (self._start, tuple(self._slots.busy))
+        if self.reporter is not None:
+            self._ticker = _Ticker(
+                self.interval,
+                lambda: self.reporter(self.snapshot()),
+            )
+            self._ticker.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Stop the reporter thread, and report a final snapshot."""
+        _ACTIVE.pop()
+        if self._ticker is not None:
+            self._ticker.stop()
+            self._ticker = None
+            self.reporter(self.snapshot(finished=True))
+
+    def add_busy(self, seconds):
+        """Count time spent working.
+
+        :param seconds: The number of seconds this process spent working.
+        :return: Nothing.
+        """
+        self._slots.add(self._slots.busy, seconds)
+
+    def advance(self, amount=1):
+        """Count completed work.
+
+        :param amount: The amount of work completed.
+        :return: Nothing.
+        """
+        self._slots.add(self._slots.done, amount)
+
+    def snapshot(self, finished=False):
+        """Sum the work done so far.
+
+        Utilization is measured since the previous snapshot, unless this is
+        the final snapshot.
+
+        :param finished: Whether this is the final snapshot.
+        :return: A :class:`Snapshot`.
+        """
+        now = time.perf_counter()
+        done = sum(self._slots.done)
+        busy = tuple(self._slots.busy)
+        seconds = now - self._start
+        rate = done / seconds if seconds else 0.0
+        eta = max(self.total - done, 0) / rate if rate else None
+        if finished:
+            then, busy_then = self._start, (0.0,) * len(busy)
+        else:
+            then, busy_then = self._previous
+        elapsed = now - then
+        utilization = tuple(
+            min((busy[slot] - busy_then[slot]) / elapsed, 1.0)
+            if elapsed else 0.0
+            for slot in range(1, len(busy))
+            if busy[slot]
+        )
+        self._previous = (now, busy)
+        return Snapshot(
+            done,
+            self.total,
+            seconds,
+            rate,
+            eta,
+            utilization,
+            finished,
+        )
+
+
+class _Slots():  # pylint:disable=too-few-public-methods
+    """Counters in shared memory, with one slot per process.
+
+    Slot 0 is shared by any processes beyond the first ``workers + 1``, and
+    guarded by a lock.
+    """
+
+    def __init__(self, workers):
+        """Initialize instance attributes."""
+        slots = workers + 2
+        self.done = multiprocessing.RawArray('q', slots)
+        self.busy = multiprocessing.RawArray('d', slots)
+        self._next_slot = multiprocessing.RawValue('i', 1)
+        self._lock = multiprocessing.Lock()
+        self._pid = None
+        self._slot = 0
+
+    def add(self, counter, amount):
+        """Add to this process' slot of a counter.
+
+        :param counter: Either ``done`` or ``busy``.
+        :param amount: The amount to add.
+        :return: Nothing.
+        """
+        slot = self._claim_slot()
+        if slot:
+            counter[slot] += amount
+        else:
+            with self._lock:
+                counter[0] += amount
+
+    def _claim_slot(self):
+        """Get this process' slot, claiming one if necessary."""
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                slot = self._next_slot.value
+                if slot < len(self.done):
+                    self._next_slot.value += 1
+                else:
+                    slot = 0
+            self._pid = pid
+            self._slot = slot
+        return self._slot
+
+
+class _Ticker(threading.Thread):
+    """A daemon thread which calls a function every interval, until stopped."""
+
+    def __init__(self, interval, func):
+        """Initialize instance attributes."""
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.func = func
+        self._stopped = threading.Event()
+
+    def run(self):
+        """Call the function every interval, until stopped."""
+        while not self._stopped.wait(self.interval):
+            self.func()
+
+    def stop(self):
+        """Stop calling the function, and wait for this thread to exit."""
+        self._stopped.set()
+        self.join()
+
+
+class _Timed():  # pylint:disable=too-few-public-methods
+    """A pool task function, which counts the time it spends busy."""
+
+    def __init__(self, func):
+        """Initialize instance attributes."""
+        self.func = func
+
+    def __call__(self, arg):
+        """Call the function, and count the time it took."""
+        start = time.perf_counter()
+        result = self.func(arg)
+        add_busy(time.perf_counter() - start)
+        return result
+
+
+def add_busy(seconds):
+    """Count time spent working, against the innermost active progress.
+
+    :param seconds: See :meth:`Progress.add_busy`.
+    :return: Nothing. If no progress is active, nothing is counted.
+    """
+    if _ACTIVE:
+        _ACTIVE[-1].add_busy(seconds)
+
+
+def advance(amount=1):
+    """Count completed work, against the innermost active progress.
+
+    :param amount: See :meth:`Progress.advance`.
+    :return: Nothing. If no progress is active, nothing is counted.
+    """
+    if _ACTIVE:
+        _ACTIVE[-1].advance(amount)
+
+
+def timed(func):
+    """Wrap a pool task function, so that its workers report busy time.
+
+    :param func: A function accepting one argument. It must be picklable.
+    :return: A picklable callable, which calls ``func`` and then
+        :func:`add_busy`. If no progress is active, ``func`` is returned
+        as-is.
+    """
+    if not _ACTIVE or _ACTIVE[-1].reporter is None:
+        return func
+    return _Timed(func)
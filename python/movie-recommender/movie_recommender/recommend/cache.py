@@ -0,0 +1,55 @@
+# coding=utf-8
+"""Cache the recommendations made for a user, until the dataset changes.
+
+Recommending movies for a user means predicting a rating for every movie they
+haven't rated, which takes far longer than looking up a stored answer.
+:func:`recommend` stores each answer in the "recommendationCache" table, keyed
+by user, algorithm, predictor and count, and answers repeat requests from it.
+
+Each cached answer records the dataset version it was computed from. Writes to
+the ratings, similarities, avgRatings and predictors tables bump the dataset
+version, so answers computed before such a write are never returned, and are
+evicted by the next write to the cache. See
+:func:`movie_recommender.db.write.bump_dataset_version`.
+"""
+from movie_recommender.db import read, write
+
+
+def recommend(user_id, algorithm, predictor, count, recommend_func):
+    """Get a user's recommendations from the cache, or compute them.
+
+    :param user_id: A user ID.
+    :param algorithm: The name of the algorithm making recommendations, such
+        as the value returned by
+        :func:`movie_recommender.recommend.ii.algorithm_name`, or "ml".
+    :param predictor: The name of the predictor used by the algorithm, or the
+        empty string if it has none.
+    :param count: The number of recommendations requested.
+    :param recommend_func: A function which accepts no arguments, and returns
+        an iterable of the user's recommendations, as
+        :class:`movie_recommender.predict.common.Prediction` objects. It's only
+        called if no up-to-date recommendations are cached.
+    :return: A tuple of :class:`movie_recommender.predict.common.Prediction`
+        objects, in order of rank.
+    """
+    # The dataset version is read first, so that if the dataset changes while
+    # recommendations are being computed, they're stored as stale.
+    dataset_version = read.dataset_version()
+    recommendations = read.cached_recommendations(
+        user_id,
+        algorithm,
+        predictor,
+        count,
+        dataset_version,
+    )
+    if recommendations is None:
+        recommendations = tuple(recommend_func())
+        write.cached_recommendations(
+            user_id,
+            algorithm,
+            predictor,
+            count,
+            recommendations,
+            dataset_version,
+        )
+    return recommendations
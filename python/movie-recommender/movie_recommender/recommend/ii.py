@@ -1,15 +1,34 @@
 # coding=utf-8
 """Tools for generating top-n recommendations with item-item."""
 import heapq
+import itertools
 import multiprocessing
 
-from movie_recommender.constants import JOBS_PER_PROCESS_PER_BATCH
+import numpy
+
+from movie_recommender import profiling, progress
+from movie_recommender.constants import (
+    JOBS_PER_PROCESS_PER_BATCH,
+    MIN_RATING,
+    SIMILAR,
+)
 from movie_recommender.db import count as db_count
-from movie_recommender.db import read
-from movie_recommender.predict.ii import predict_rating_for_recommend
+from movie_recommender.db import common, init, read, store, write
+from movie_recommender.predict.common import Prediction
+from movie_recommender.predict.ii import (
+    denormalize_rating,
+    normalize_rating,
+    predict_rating_for_recommend,
+)
 
 
-def recommend(user, count, jobs, reporter=None):
+def recommend(  # pylint:disable=too-many-arguments
+        user,
+        count,
+        jobs,
+        reporter=None,
+        in_memory=False,
+        neighbors=False):
     """Recommend several movies for the given user.
 
     :param user: A user ID. The user for whom recommendations are being
@@ -18,49 +37,186 @@ def recommend(user, count, jobs, reporter=None):
     :param jobs: The number of processes to spawn. If ``None``, spawn one per
         CPU.
     :param reporter: A function that reports progress to the user. Must accept
-        one argument, where that argument is a multiprocessing ``Connection``
-        object. Values from 0 to 1, inclusive, will be sent.  If ``None``,
-        progress isn't reported.
+        one argument, a :class:`movie_recommender.progress.Snapshot`. If
+        ``None``, progress isn't reported.
+    :param in_memory: Should each process answer reads from an in-memory
+        store? See :mod:`movie_recommender.db.store`.
+    :param neighbors: Should predictions consider only each movie's neighbors?
+        See :func:`movie_recommender.predict.ii.predict_rating`.
     :return: A generator that yields up to ``count``
         :class:`movie_recommender.predict.common.Prediction` objects, in order
         of confidence.
     """
     best_predictions = []
-    with multiprocessing.Pool(jobs) as pool:
-        prfr_args = _gen_prfr_args(user, reporter)
-        predictions = pool.imap_unordered(func=_call_prfr, iterable=prfr_args)
-        for prediction in predictions:
-            if len(best_predictions) >= count:
-                heapq.heappushpop(best_predictions, prediction)
-            else:
-                heapq.heappush(best_predictions, prediction)
+    initializer = store.load if in_memory else None
+    num_unrated_movies = db_count.unrated_movies(user) if reporter else 0
+    with progress.Progress(num_unrated_movies, reporter, jobs) as tracker:
+        with multiprocessing.Pool(jobs, initializer=initializer) as pool:
+            prfr_args = (
+                (user, movie, neighbors) for movie in read.unrated_movies(user)
+            )
+            predictions = profiling.results(pool.imap_unordered(
+                func=profiling.task(progress.timed(_call_prfr), '_call_prfr'),
+                iterable=prfr_args,
+            ))
+            for prediction in predictions:
+                if len(best_predictions) >= count:
+                    heapq.heappushpop(best_predictions, prediction)
+                else:
+                    heapq.heappush(best_predictions, prediction)
+                tracker.advance()
 
     for prediction in heapq.nlargest(count, best_predictions):
         yield prediction
 
 
-def _call_prfr(args):
-    return predict_rating_for_recommend(*args)
+def recommend_batch(  # pylint:disable=too-many-locals
+        user,
+        count,
+        neighbors=False):
+    """Recommend several movies for the given user, in one vectorized pass.
+
+    This function is an alternative to :meth:`recommend`, and it produces the
+    same recommendations. But instead of predicting a rating for each unrated
+    movie in a worker process, with several queries per movie, it fetches every
+    relevant similarity score and rating with one query, and computes every
+    weighted sum at once. For each unrated movie, the weighted sum is:
+
+    .. code-block:: python
+
+        sum(similarity * normalize_rating(rating)) / sum(abs(similarity))
+
+    ...where the sums are over the movies similar to the unrated movie that the
+    user has rated. Movies without any such similar movies are given a rating
+    of :data:`movie_recommender.constants.MIN_RATING`. See
+    :func:`movie_recommender.predict.ii.predict_rating_for_recommend`.
+
+    :param user: A user ID. The user for whom recommendations are being
+        generated.
+    :param count: The number of recommendations to generate for the given user.
+    :param neighbors: Should predictions consider only each movie's neighbors?
+        See :func:`movie_recommender.predict.ii.predict_rating`.
+    :return: A generator that yields up to ``count``
+        :class:`movie_recommender.predict.common.Prediction` objects, in order
+        of confidence.
+    """
+    unrated = numpy.array(
+        sorted(read.unrated_movies(user)),
+        dtype=numpy.int64,
+    )
+    rows = numpy.array(
+        tuple(read.similar_ratings_for_user(user, neighbors)),
+        dtype=numpy.float64,
+    ).reshape(-1, 3)
+
+    # Discard rows for movies the user has rated.
+    indices = numpy.searchsorted(unrated, rows[:, 0])
+    found = indices < len(unrated)
+    found[found] = unrated[indices[found]] == rows[found, 0]
+    indices = indices[found]
+    similarities = rows[found, 1]
+    ratings = rows[found, 2]
 
+    numerators = numpy.bincount(
+        indices,
+        weights=similarities * normalize_rating(ratings),
+        minlength=len(unrated),
+    )
+    denominators = numpy.bincount(
+        indices,
+        weights=numpy.fabs(similarities),
+        minlength=len(unrated),
+    )
+    similar = denominators != 0
+    pred_ratings = numpy.full(len(unrated), MIN_RATING)
+    pred_ratings[similar] = denormalize_rating(
+        numerators[similar] / denominators[similar]
+    )
 
-def _gen_prfr_args(user, reporter=None):
-    if reporter:
-        num_unrated_movies = db_count.unrated_movies(user)
-        conn_out, conn_in = multiprocessing.Pipe(duplex=False)
-        proc = multiprocessing.Process(target=reporter, args=(conn_out,))
-        proc.start()
+    predictions = (
+        Prediction(pred_rating, movie, SIMILAR if is_similar else None)
+        for pred_rating, movie, is_similar in zip(
+            pred_ratings.tolist(),
+            unrated.tolist(),
+            similar.tolist(),
+        )
+    )
+    yield from heapq.nlargest(count, predictions)
 
-    for i, movie in enumerate(read.unrated_movies(user)):
-        yield (user, movie)
 
-        if reporter:
-            yielded = i + 1
-            # We're not doing batch processing here, but in practice, this
-            # constant also works well in places like this.
-            if yielded % JOBS_PER_PROCESS_PER_BATCH == 0:
-                conn_in.send(yielded / num_unrated_movies)
+def recommend_all(  # pylint:disable=too-many-arguments
+        users,
+        count,
+        jobs,
+        overwrite,
+        reporter=None,
+        neighbors=False):
+    """Recommend several movies for each of the given users, and store them.
 
-    if reporter:
-        conn_in.send(1)
-        conn_in.close()
-        proc.join()
+    Users are spread across a process pool, and each process recommends movies
+    for one user at a time with :meth:`recommend_batch`. Recommendations are
+    written to the recommendations table in batches. A user whose
+    recommendations are up to date with the current dataset version is
+    skipped, unless ``overwrite`` is true. As a result, if this function is
+    interrupted, calling it again resumes where it left off. Stored
+    recommendations may be read with
+    :func:`movie_recommender.db.read.recommendations`.
+
+    :param users: An iterable of user IDs.
+    :param count: The number of recommendations to store for each user.
+    :param jobs: The number of processes to spawn. If ``None``, spawn one per
+        CPU.
+    :param overwrite: Should up-to-date recommendations be re-computed?
+    :param reporter: A function that reports progress to the user. Must accept
+        one argument, a :class:`movie_recommender.progress.Snapshot`. If
+        ``None``, progress isn't reported.
+    :param neighbors: Should predictions consider only each movie's neighbors?
+        See :func:`movie_recommender.predict.ii.predict_rating`.
+    :return: Nothing.
+    """
+    algorithm = algorithm_name(neighbors)
+    dataset_version = read.dataset_version()
+    users = set(users)
+    if not overwrite:
+        with common.get_db_conn() as conn:
+            init.c_recommendations_table(conn)
+        users.difference_update(
+            read.recommended_users(algorithm, dataset_version)
+        )
+    users = sorted(users)
+
+    rb_args = ((user, count, neighbors) for user in users)
+    with progress.Progress(len(users), reporter, jobs) as tracker:
+        with multiprocessing.Pool(jobs) as pool:
+            results = profiling.results(pool.imap_unordered(
+                profiling.task(progress.timed(_call_rb), '_call_rb'),
+                rb_args,
+                chunksize=4,
+            ))
+            while True:
+                batch = tuple(
+                    itertools.islice(results, JOBS_PER_PROCESS_PER_BATCH)
+                )
+                if not batch:
+                    break
+                with profiling.stage('write recommendations'):
+                    write.recommendations(batch, algorithm, dataset_version)
+                tracker.advance(len(batch))
+
+
+def algorithm_name(neighbors=False):
+    """Get the name under which recommendations are stored.
+
+    :param neighbors: Were predictions made with the neighbor model?
+    :return: A string, such as "ii".
+    """
+    return 'ii-neighbors' if neighbors else 'ii'
+
+
+def _call_rb(args):
+    user = args[0]
+    return user, tuple(recommend_batch(*args))
+
+
+def _call_prfr(args):
+    return predict_rating_for_recommend(*args)
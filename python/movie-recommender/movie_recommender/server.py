@@ -0,0 +1,414 @@
+# coding=utf-8
+"""A long-running server, which answers prediction and recommendation requests.
+
+Each call to ``mr-predict`` or ``mr-recommend`` starts an interpreter, finds
+and opens the database, and reads what it needs from disk. For one prediction,
+start-up takes far longer than the prediction itself. :func:`serve` instead
+loads the data read most often into memory once, and then answers requests
+over a Unix socket until it's stopped. See :mod:`movie_recommender.db.store`,
+:mod:`movie_recommender.db.features` and :mod:`movie_recommender.db.packed`.
+
+Connections are handled by an asyncio event loop. Scoring is CPU-bound, so
+it's done in a pool of worker processes. Workers are forked after data is
+loaded, so they share it copy-on-write. Before each request is handled, the
+dataset version is checked. If the dataset has changed, data is reloaded, and
+the pool is replaced. See :func:`movie_recommender.db.read.dataset_version`.
+
+The protocol is line-oriented. A client sends a request, which is a
+:class:`Request` encoded as a JSON object on one line. The server replies with
+a JSON object on one line. A client may send several requests over one
+connection. For example:
+
+.. code-block:: text
+
+    → {"command": "recommend", "algorithm": "ii", "user_id": 1, "count": 2}
+    ← {"predictions": [{"pred_rating": 4.9, "movie": 7, "reason": "similar",
+       "title": "Foo (1995)"}, ...]}
+    → {"command": "predict", "algorithm": "ml", "user_id": 0, "movie_id": 7}
+    ← {"error": "User ID 0 not in database."}
+
+The reply to a predict request holds one prediction. :func:`request` sends a
+request, and decodes the reply.
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import json
+import os
+import signal
+import socket
+import traceback
+from collections import namedtuple
+from pathlib import Path
+
+from movie_recommender import exceptions
+from movie_recommender.constants import SERVER_SOCKET_NAME
+from movie_recommender.db import common, features, packed, read, store
+from movie_recommender.predict import ii as predict_ii
+from movie_recommender.predict import ml as predict_ml
+from movie_recommender.predict.common import Prediction
+from movie_recommender.recommend import cache
+from movie_recommender.recommend import ii as recommend_ii
+from movie_recommender.recommend import ml as recommend_ml
+
+
+Request = namedtuple('Request', (
+    'command',
+    'algorithm',
+    'user_id',
+    'movie_id',
+    'count',
+    'predictor',
+    'neighbors',
+    'cache',
+), defaults=(None, 5, None, False, True))
+"""A request for a prediction or for recommendations.
+
+:param command: Either "predict" or "recommend".
+:param algorithm: Either "ii" or "ml".
+:param user_id: A user ID.
+:param movie_id: A movie ID. Required by predict requests, and ignored by
+    recommend requests.
+:param count: The number of recommendations to make.
+:param predictor: The name of the predictor to use with the ml algorithm. If
+    ``None``, use the user's stored predictor.
+:param neighbors: Should the ii algorithm consider only each movie's
+    neighbors? See :func:`movie_recommender.predict.ii.predict_rating`.
+:param cache: Should recommendations be answered from the recommendation
+    cache? See :mod:`movie_recommender.recommend.cache`.
+"""
+
+_ALGORITHMS = ('ii', 'ml')
+"""The algorithms a :class:`Request` may name."""
+
+_CLIENT_ERRORS = (
+    exceptions.NoMovieYearError,
+    exceptions.NoNeighborModelError,
+    exceptions.NoPersonalizedPredictorError,
+    exceptions.NoSuchPredictorError,
+    ValueError,
+)
+"""Exceptions caused by a bad request, and reported to the client."""
+
+
+class Server():
+    """Answer requests for predictions and recommendations.
+
+    Call :meth:`load` before handling requests, and :meth:`close` after.
+    """
+
+    def __init__(self, jobs=None):
+        """Initialize instance attributes.
+
+        :param jobs: The number of worker processes to spawn. If ``None``,
+            spawn one per CPU.
+        """
+        self._jobs = jobs
+        self._executor = None
+        self._dataset_version = None
+
+    def load(self):
+        """Load data into this process, and start a new pool of workers.
+
+        The packed similarities file is loaded if it's up to date, and skipped
+        otherwise. The old pool, if any, finishes its pending work, and then
+        exits.
+
+        :return: Nothing.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self._dataset_version = read.dataset_version()
+        store.load(reload=True)
+        features.load(reload=True)
+        try:
+            packed.load(reload=True)
+        except exceptions.PackedSimilaritiesError:
+            packed.unload()
+        # Workers are forked as they're needed, after the data above is loaded.
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            self._jobs,
+            initializer=_init_worker,
+        )
+
+    def close(self):
+        """Stop the pool of workers, after it finishes its pending work.
+
+        :return: Nothing.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def handle_connection(self, reader, writer):
+        """Answer each request sent over a connection, in order.
+
+        :param reader: An ``asyncio.StreamReader``.
+        :param writer: An ``asyncio.StreamWriter``.
+        :return: Nothing.
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = await self.handle_request(line)
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, line):
+        """Answer one request.
+
+        :param line: A :class:`Request`, encoded as a line of JSON.
+        :return: A reply, as a dict. See :mod:`movie_recommender.server`.
+        """
+        try:
+            request_ = _decode_request(line)
+            # Reloading blocks the event loop, but every request must wait for
+            # it anyway.
+            if read.dataset_version() != self._dataset_version:
+                self.load()
+            _check_ids(request_)
+            func = _predict if request_.command == 'predict' else _recommend
+            predictions = await asyncio.get_running_loop().run_in_executor(
+                self._executor,
+                functools.partial(func, request_),
+            )
+        except _CLIENT_ERRORS as err:
+            return {'error': str(err)}
+        except concurrent.futures.process.BrokenProcessPool:
+            self._executor = None
+            self.load()
+            return {'error': 'A worker process died. Try again.'}
+        except Exception as err:  # pylint:disable=broad-except
+            traceback.print_exc()
+            return {'error': f'Internal server error: {err!r}'}
+        titles = features.get()
+        return {'predictions': [
+            dict(prediction._asdict(), title=titles.title(prediction.movie))
+            for prediction in predictions
+        ]}
+
+
+def get_socket_path():
+    """Return the default path to the server's socket.
+
+    The socket lives next to the database. See
+    :func:`movie_recommender.db.common.get_load_path`.
+    """
+    return str(Path(common.get_load_path()).with_name(SERVER_SOCKET_NAME))
+
+
+def request(request_, path=None):
+    """Send a request to a server, and wait for its reply.
+
+    :param request_: A :class:`Request`.
+    :param path: The path to the server's socket. If ``None``, use
+        :func:`get_socket_path`.
+    :return: A tuple of ``(prediction, title)`` pairs, where ``prediction`` is
+        a :class:`movie_recommender.predict.common.Prediction`, and ``title``
+        is the title of the movie it's for.
+    :raise movie_recommender.exceptions.ServerError: If the server can't be
+        reached, or rejects the request.
+    """
+    path = get_socket_path() if path is None else str(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+            sock.sendall(json.dumps(request_._asdict()).encode() + b'\n')
+            with sock.makefile('rb') as handle:
+                line = handle.readline()
+        except OSError as err:
+            raise exceptions.ServerError(
+                f"Can't talk to a server at {path}: {err}. Start one with "
+                "'mr-serve'."
+            ) from err
+    if not line:
+        raise exceptions.ServerError(f'The server at {path} hung up.')
+    reply = json.loads(line)
+    if 'error' in reply:
+        raise exceptions.ServerError(reply['error'])
+    return tuple(
+        (
+            Prediction(row['pred_rating'], row['movie'], row['reason']),
+            row['title'],
+        )
+        for row in reply['predictions']
+    )
+
+
+def serve(path=None, jobs=None, on_ready=None):
+    """Answer requests over a Unix socket, until SIGINT or SIGTERM arrives.
+
+    :param path: The path to the socket to create. If ``None``, use
+        :func:`get_socket_path`.
+    :param jobs: The number of worker processes to spawn. If ``None``, spawn
+        one per CPU.
+    :param on_ready: A function to call once the server is listening, or
+        ``None``. It's passed the path to the socket.
+    :return: Nothing.
+    :raise movie_recommender.exceptions.ServerError: If a server is already
+        listening on the socket.
+    """
+    path = get_socket_path() if path is None else str(path)
+    asyncio.run(_serve(path, jobs, on_ready))
+
+
+async def _serve(path, jobs, on_ready):
+    """Answer requests over a Unix socket. See :func:`serve`."""
+    _remove_stale_socket(path)
+    server = Server(jobs)
+    server.load()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        unix_server = await asyncio.start_unix_server(
+            server.handle_connection,
+            path,
+        )
+        async with unix_server:
+            if on_ready is not None:
+                on_ready(path)
+            await stop.wait()
+    finally:
+        server.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+
+
+def _check_ids(request_):
+    """Check that a request's user and movie are in the database.
+
+    Unlike :func:`movie_recommender.cli.utils.to_user_id`, this answers from
+    memory.
+
+    :raise ValueError: If not.
+    """
+    if not store.get().has_user(request_.user_id):
+        raise ValueError(f'User ID {request_.user_id} not in database.')
+    if request_.command == 'predict':
+        features.get().title(request_.movie_id)
+
+
+def _decode_request(line):
+    """Decode and validate a request.
+
+    :param line: A :class:`Request`, encoded as a line of JSON.
+    :return: A :class:`Request`.
+    :raise ValueError: If the request is malformed.
+    """
+    try:
+        request_ = Request(**json.loads(line))
+    except (TypeError, ValueError) as err:
+        raise ValueError(f'Malformed request: {err}') from err
+    if request_.command not in ('predict', 'recommend'):
+        raise ValueError(f'Unknown command: {request_.command}')
+    if request_.algorithm not in _ALGORITHMS:
+        raise ValueError(f'Unknown algorithm: {request_.algorithm}')
+    ids = (request_.user_id, request_.count)
+    if request_.command == 'predict':
+        ids += (request_.movie_id,)
+    if not all(isinstance(id_, int) for id_ in ids):
+        raise ValueError('IDs and counts must be integers.')
+    return request_
+
+
+def _init_worker():
+    """Undo the signal handling a worker process inherits from the server.
+
+    The server's event loop catches SIGINT and SIGTERM. Workers are stopped by
+    the server, so they ignore SIGINT, e.g. from a terminal, and let SIGTERM
+    kill them.
+    """
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _make_ml_predictor(request_):
+    """Make the ml predictor named by a request.
+
+    :return: A ``(predictor_name, predictor)`` tuple.
+    """
+    predictor_name = request_.predictor
+    if predictor_name is None:
+        predictor_name = read.predictor_name(request_.user_id)
+    return predictor_name, predict_ml.make_predictor(
+        request_.user_id,
+        predictor_name,
+    )
+
+
+def _predict(request_):
+    """Answer a predict request, in a worker process.
+
+    :return: A one-tuple of
+        :class:`movie_recommender.predict.common.Prediction` objects.
+    """
+    if request_.algorithm == 'ii':
+        return (predict_ii.predict_rating_for_predict(
+            request_.user_id,
+            request_.movie_id,
+            request_.neighbors,
+        ),)
+    predictor = _make_ml_predictor(request_)[1]
+    return (Prediction(predictor(request_.movie_id), request_.movie_id, None),)
+
+
+def _recommend(request_):
+    """Answer a recommend request, in a worker process.
+
+    :return: A tuple of :class:`movie_recommender.predict.common.Prediction`
+        objects.
+    """
+    if request_.algorithm == 'ii':
+        algorithm = recommend_ii.algorithm_name(request_.neighbors)
+        predictor_name = ''
+        recommend_func = functools.partial(
+            recommend_ii.recommend_batch,
+            request_.user_id,
+            request_.count,
+            request_.neighbors,
+        )
+    else:
+        algorithm = 'ml'
+        predictor_name, predictor = _make_ml_predictor(request_)
+        recommend_func = functools.partial(
+            recommend_ml.recommend,
+            request_.user_id,
+            request_.count,
+            predictor,
+        )
+    if request_.cache:
+        return cache.recommend(
+            request_.user_id,
+            algorithm,
+            predictor_name,
+            request_.count,
+            recommend_func,
+        )
+    return tuple(recommend_func())
+
+
+def _remove_stale_socket(path):
+    """Remove a socket left behind by a server which has since exited.
+
+    :raise movie_recommender.exceptions.ServerError: If a server is listening
+        on the socket.
+    """
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            os.unlink(path)
+            return
+    raise exceptions.ServerError(f'A server is already listening on {path}.')
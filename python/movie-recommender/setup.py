@@ -40,7 +40,7 @@ setup(
         'Programming Language :: Python :: 3.7',
     ],
     packages=find_packages(),
-    install_requires=['pyxdg', 'requests'],
+    install_requires=['numpy', 'pyxdg', 'requests', 'scipy'],
     extras_require={
         'dev': [
             # For `make docs-{clean,html}`
@@ -56,11 +56,13 @@ setup(
     entry_points={
         'console_scripts': [
             'mr-analyze=movie_recommender.cli.mr_analyze:main',
+            'mr-bench=movie_recommender.cli.mr_bench:main',
             'mr-dataset=movie_recommender.cli.mr_dataset:main',
             'mr-db=movie_recommender.cli.mr_db:main',
             'mr-graph=movie_recommender.cli.mr_graph:main',
             'mr-predict=movie_recommender.cli.mr_predict:main',
             'mr-recommend=movie_recommender.cli.mr_recommend:main',
+            'mr-serve=movie_recommender.cli.mr_serve:main',
         ]
     },
     test_suite='tests',
@@ -0,0 +1,71 @@
+# coding=utf-8
+"""Tests for the benchmark suite."""
+import os
+import subprocess
+import tempfile
+import unittest
+
+from .utils import run
+
+
+class RunTestCase(unittest.TestCase):
+    """Call ``mr-bench run`` and ``mr-bench compare``."""
+
+    def test_run_compare(self):
+        """Benchmark a tiny dataset, and compare the results with themselves.
+
+        Then compare them with results from a different dataset.
+        """
+        args = ('mr-bench', 'run', '--repeat', '1', '--jobs', '2')
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, f'{i}.json') for i in range(2)]
+            run(args + (
+                '--users', '10',
+                '--movies', '20',
+                '--ratings', '100',
+                '--output', paths[0],
+            ))
+            lines = run(('mr-bench', 'compare', paths[0], paths[0]))
+            self.assertEqual(len(lines), 7, lines)
+            run(args + (
+                '--users', '10',
+                '--movies', '20',
+                '--ratings', '101',
+                '--scenarios', 'db-create',
+                '--output', paths[1],
+            ))
+            with self.assertRaises(subprocess.CalledProcessError):
+                run(('mr-bench', 'compare', paths[0], paths[1]))
+
+    def test_repeat_invalid(self):
+        """Pass a ``--repeat`` which isn't positive.
+
+        It must be rejected as a usage error, before any scenario runs.
+        """
+        with self.assertRaises(subprocess.CalledProcessError) as ctx:
+            run(('mr-bench', 'run', '--repeat', '0'))
+        self.assertEqual(ctx.exception.returncode, 2)
+
+    def test_scenario_fails(self):
+        """Run a scenario which fails, and assert no traceback is printed.
+
+        Recommending movies fails if no database has been created.
+        """
+        with self.assertRaises(subprocess.CalledProcessError) as ctx:
+            subprocess.run(
+                (
+                    'mr-bench', 'run',
+                    '--repeat', '1',
+                    '--users', '10',
+                    '--movies', '20',
+                    '--ratings', '100',
+                    '--scenarios', 'recommend-ii',
+                ),
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+            )
+        # The failing command's own traceback comes first.
+        last_line = ctx.exception.stderr.splitlines()[-1]
+        self.assertTrue(last_line.startswith('Command '), last_line)
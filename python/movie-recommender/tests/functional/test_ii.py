@@ -1,8 +1,15 @@
 # coding=utf-8
 """Tests for the item-item recommendation algorithm."""
+import contextlib
+import json
+import sqlite3
+import subprocess
+import tempfile
 import unittest
 
-from .utils import backup_db, restore_db, run
+from movie_recommender.constants import AVG_RATING_TOLERANCE
+
+from .utils import backup_db, delete_db, restore_db, run, serve
 
 
 def setUpModule():  # pylint:disable=invalid-name
@@ -14,8 +21,7 @@ def setUpModule():  # pylint:disable=invalid-name
 
 def tearDownModule():  # pylint:disable=invalid-name
     """Delete the current database, and restore the old one."""
-    load_path = run(('mr-db', 'load-path'))[0]
-    run(('rm', load_path))
+    delete_db()
     restore_db()
 
 
@@ -43,6 +49,24 @@ class AnalyzeTestCase(unittest.TestCase):
         """Pass ``--progress``."""
         run(('mr-analyze', 'ii', '--overwrite', '--progress'))
 
+    def test_progress_log(self):
+        """Pass ``--progress-log``, and assert each analysis is logged."""
+        with tempfile.NamedTemporaryFile('r') as handle:
+            run((
+                'mr-analyze', 'ii',
+                '--overwrite',
+                '--no-progress',
+                '--progress-log', handle.name,
+            ))
+            records = [json.loads(line) for line in handle]
+        finished = [record for record in records if record['finished']]
+        self.assertEqual(
+            [record['name'] for record in finished],
+            ['User analysis', 'Movie analysis'],
+        )
+        for record in finished:
+            self.assertEqual(record['done'], record['total'])
+
     def test_no_progress(self):
         """Pass ``--no-progress``."""
         run(('mr-analyze', 'ii', '--overwrite', '--no-progress'))
@@ -72,6 +96,220 @@ class AnalyzeTestCase(unittest.TestCase):
         """Pass ``--jobs 2``."""
         run(('mr-analyze', 'ii', '--overwrite', '--jobs', '2'))
 
+    def test_in_memory(self):
+        """Pass ``--in-memory``."""
+        run(('mr-analyze', 'ii', '--overwrite', '--in-memory'))
+
+    def test_engine_matrix(self):
+        """Pass ``--engine matrix``."""
+        run(('mr-analyze', 'ii', '--overwrite', '--engine', 'matrix'))
+
+    def test_engine_matrix_movie_ids(self):
+        """Pass ``--engine matrix`` and ``--movie-ids``."""
+        run((
+            'mr-analyze', 'ii',
+            '--engine', 'matrix',
+            '--movie-ids', '1', '2',
+            '--overwrite',
+        ))
+
+    def test_avg_engine_scan(self):
+        """Pass ``--avg-engine scan`` and ``--progress``."""
+        run((
+            'mr-analyze', 'ii',
+            '--avg-engine', 'scan',
+            '--overwrite',
+            '--progress',
+        ))
+
+    def test_migrate(self):
+        """Migrate the database, which is already at the latest version."""
+        run(('mr-db', 'migrate'))
+
+    def test_neighbors(self):
+        """Pass ``--neighbors``."""
+        run(('mr-analyze', 'ii', '--neighbors', '3'))
+
+    def test_neighbors_invalid(self):
+        """Assert bad uses of ``--neighbors`` are rejected.
+
+        Similarities must survive the attempt to drop them.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for args in (
+                    ('--neighbors', '0', '--drop-similarities'),
+                    ('--neighbors', '3', '--output', f'{tmpdir}/shard.db'),
+                    ('--neighbors', '3', '--shard', '0/2')):
+                with self.subTest(args=args):
+                    with self.assertRaises(subprocess.CalledProcessError):
+                        run(('mr-analyze', 'ii') + args)
+        run(('mr-predict', 'ii', '1', '2'))
+
+    def test_stats(self):
+        """Pass ``--engine matrix --stats``, and then call ``ii-update``.
+
+        Change two of the fixture's ratings, and assert the updated similarity
+        scores are close to re-computed ones. Then restore the ratings, so
+        that later tests are unaffected.
+        """
+        run((
+            'mr-analyze', 'ii',
+            '--engine', 'matrix',
+            '--stats',
+            '--overwrite',
+        ))
+        before = _similarities()
+        try:
+            _update_ratings(('1,1,3.0,123456789', '2,3,4.5,123456789'))
+            updated = _similarities()
+            run(('mr-analyze', 'ii', '--engine', 'matrix', '--overwrite'))
+            recomputed = _similarities()
+        finally:
+            _update_ratings(('1,1,4.0,123456789', '2,3,2.5,123456789'))
+            run(('mr-analyze', 'ii', '--overwrite'))
+        self.assertNotEqual(updated, before)
+        self.assertEqual(updated.keys(), recomputed.keys())
+        for pair, similarity in recomputed.items():
+            with self.subTest(pair=pair):
+                self.assertAlmostEqual(
+                    updated[pair],
+                    similarity,
+                    delta=AVG_RATING_TOLERANCE,
+                )
+
+    def test_stats_missing(self):
+        """Call ``ii-update`` without sufficient statistics.
+
+        The update must be rejected, and nothing must be written.
+        """
+        load_path = run(('mr-db', 'load-path'))[0]
+        with contextlib.closing(sqlite3.connect(load_path)) as conn:
+            with conn:
+                conn.execute('DROP TABLE IF EXISTS similarityStats')
+        version = _dataset_version()
+        before = _similarities()
+        with self.assertRaises(subprocess.CalledProcessError):
+            _update_ratings(('1,1,3.0,123456789',))
+        self.assertEqual(_dataset_version(), version)
+        self.assertEqual(_similarities(), before)
+        with contextlib.closing(sqlite3.connect(load_path)) as conn:
+            self.assertEqual(
+                conn.execute(
+                    'SELECT rating FROM ratings WHERE userId=1 AND movieId=1'
+                ).fetchone(),
+                (4.0,),
+            )
+
+
+class LshTestCase(unittest.TestCase):
+    """Call ``mr-analyze`` with ``--lsh``, and ``mr-analyze ii-lsh-report``."""
+
+    def test_lsh(self):
+        """Pass ``--lsh``, with both engines."""
+        for engine in ('pairwise', 'matrix'):
+            with self.subTest(engine=engine):
+                run((
+                    'mr-analyze', 'ii',
+                    '--engine', engine,
+                    '--lsh',
+                    '--lsh-bands', '4',
+                    '--overwrite',
+                ))
+
+    def test_lsh_flags(self):
+        """Pass bands or rows which aren't positive."""
+        for flag in ('--lsh-bands', '--lsh-rows'):
+            with self.subTest(flag=flag):
+                with self.assertRaises(subprocess.CalledProcessError):
+                    run(('mr-analyze', 'ii', '--lsh', flag, '0'))
+
+    def test_lsh_report(self):
+        """Call ``ii-lsh-report``."""
+        lines = run(('mr-analyze', 'ii-lsh-report', '--sample', '3'))
+        self.assertEqual(len(lines), 5, lines)
+        self.assertTrue(lines[0].startswith('Sampled 3 movies'), lines)
+        self.assertTrue(lines[4].startswith('Scoring took'), lines)
+
+    def test_lsh_report_flags(self):
+        """Pass a sample size or number of neighbors which isn't positive."""
+        for flag in ('--sample', '--neighbors'):
+            with self.subTest(flag=flag):
+                with self.assertRaises(subprocess.CalledProcessError):
+                    run(('mr-analyze', 'ii-lsh-report', flag, '-1'))
+
+
+class ShardTestCase(unittest.TestCase):
+    """Analyze shards of the similarities table, and merge them."""
+
+    def test_shard_merge(self):
+        """Analyze two shards to separate files, and merge them.
+
+        Shards are rejected if one is missing, duplicated, or incomplete. The
+        dataset version is bumped once by the merge, and not by analysis.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = tuple(f'{tmpdir}/shard-{i}.db' for i in range(2))
+            for i, path in enumerate(paths):
+                run((
+                    'mr-analyze', 'ii',
+                    '--shard', f'{i}/2',
+                    '--output', path,
+                ))
+            version = _dataset_version()
+            with self.assertRaises(subprocess.CalledProcessError):
+                run(('mr-db', 'merge-similarities', paths[0]))
+            with self.assertRaises(subprocess.CalledProcessError):
+                run(('mr-db', 'merge-similarities', paths[0], paths[0]))
+            with contextlib.closing(sqlite3.connect(paths[1])) as conn:
+                with conn:
+                    conn.execute(
+                        "DELETE FROM metadata WHERE key='shardTargets'"
+                    )
+            with self.assertRaises(subprocess.CalledProcessError):
+                run(('mr-db', 'merge-similarities', *paths))
+            run(('mr-analyze', 'ii', '--shard', '1/2', '--output', paths[1]))
+            self.assertEqual(_dataset_version(), version)
+            run(('mr-db', 'merge-similarities', *paths))
+            self.assertEqual(_dataset_version(), version + 1)
+
+
+def _dataset_version():
+    """Read the dataset version from the database."""
+    load_path = run(('mr-db', 'load-path'))[0]
+    with contextlib.closing(sqlite3.connect(load_path)) as conn:
+        return conn.execute(
+            "SELECT value FROM metadata WHERE key='datasetVersion'"
+        ).fetchone()[0]
+
+
+def _similarities():
+    """Read every similarity score from the database.
+
+    :return: A dict in the form ``{(movie_a, movie_b): similarity}``.
+    """
+    load_path = run(('mr-db', 'load-path'))[0]
+    with contextlib.closing(sqlite3.connect(load_path)) as conn:
+        return {
+            (movie_a, movie_b): similarity
+            for movie_a, movie_b, similarity in conn.execute(
+                'SELECT movieAId, movieBId, similarity FROM similarities'
+            )
+        }
+
+
+def _update_ratings(lines):
+    """Call ``mr-analyze ii-update`` with some ratings.
+
+    :param lines: Lines of CSV, in the form ``userId,movieId,rating,timestamp``.
+    :return: Nothing.
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.csv') as handle:
+        handle.write('userId,movieId,rating,timestamp\n')
+        for line in lines:
+            handle.write(f'{line}\n')
+        handle.flush()
+        run(('mr-analyze', 'ii-update', handle.name))
+
 
 class RecommendTestCase(unittest.TestCase):
     """Generate recommendations for each user."""
@@ -89,3 +327,137 @@ class RecommendTestCase(unittest.TestCase):
             'mr-recommend', 'ii', '1', '--count', '2', '--no-progress'
         ))
         self.assertEqual(len(lines), 2, lines)
+
+    def test_in_memory(self):
+        """Assert ``--in-memory`` doesn't change recommendations."""
+        args = (
+            'mr-recommend', 'ii', '1',
+            '--count', '3',
+            '--no-progress',
+            '--no-cache',
+        )
+        self.assertEqual(run(args), run(args + ('--in-memory',)))
+
+    def test_engine_batch(self):
+        """Assert ``--engine batch`` doesn't change recommendations."""
+        for user in ('1', '2', '3', '4'):
+            with self.subTest(user=user):
+                args = (
+                    'mr-recommend', 'ii', user,
+                    '--count', '5',
+                    '--no-cache',
+                )
+                self.assertEqual(
+                    run(args + ('--no-progress',)),
+                    run(args + ('--engine', 'batch')),
+                )
+
+    def test_packed(self):
+        """Assert ``--packed`` doesn't change recommendations."""
+        run(('mr-db', 'pack-similarities'))
+        for engine in ('batch', 'pool'):
+            with self.subTest(engine=engine):
+                args = (
+                    'mr-recommend', 'ii', '1',
+                    '--count', '3',
+                    '--engine', engine,
+                    '--no-progress',
+                    '--no-cache',
+                )
+                self.assertEqual(run(args), run(args + ('--packed',)))
+        args = ('mr-predict', 'ii', '1', '2')
+        self.assertEqual(run(args), run(args + ('--packed',)))
+
+    def test_cache(self):
+        """Assert cached recommendations match, until the dataset changes.
+
+        Change one of user 4's ratings, which changes their recommendations,
+        and assert the cache is invalidated. Then restore the rating, so that
+        later tests are unaffected.
+        """
+        run((
+            'mr-analyze', 'ii',
+            '--engine', 'matrix',
+            '--stats',
+            '--overwrite',
+        ))
+        args = ('mr-recommend', 'ii', '4', '--count', '3', '--no-progress')
+        before = run(args + ('--no-cache',))
+        self.assertEqual(run(args + ('--cache',)), before)
+        self.assertEqual(run(args + ('--cache',)), before)
+        try:
+            _update_ratings(('4,4,1.0,123456789',))
+            after = run(args + ('--no-cache',))
+            self.assertNotEqual(after, before)
+            self.assertEqual(run(args + ('--cache',)), after)
+        finally:
+            _update_ratings(('4,4,4.0,123456789',))
+            run(('mr-analyze', 'ii', '--overwrite'))
+        self.assertEqual(run(args + ('--cache',)), before)
+
+    def test_neighbors(self):
+        """Assert a neighbor model of every movie doesn't change anything."""
+        run(('mr-analyze', 'ii', '--neighbors', '1000'))
+        args = ('mr-recommend', 'ii', '1', '--count', '3', '--no-progress')
+        self.assertEqual(run(args), run(args + ('--neighbors',)))
+
+    def test_neighbors_missing(self):
+        """Assert predictions fail cleanly without a neighbors table."""
+        load_path = run(('mr-db', 'load-path'))[0]
+        with sqlite3.connect(load_path) as conn:
+            conn.execute('DROP TABLE IF EXISTS neighbors')
+        try:
+            for args in (
+                    ('mr-predict', 'ii', '1', '2'),
+                    ('mr-recommend', 'ii', '1', '--no-progress')):
+                with self.subTest(args=args):
+                    with self.assertRaises(subprocess.CalledProcessError):
+                        run(args + ('--neighbors',))
+        finally:
+            run(('mr-analyze', 'ii', '--neighbors', '1000'))
+
+    def test_store_lookup(self):
+        """Store recommendations for all users, and look them up."""
+        run((
+            'mr-recommend', 'ii',
+            '--all-users',
+            '--store',
+            '--count', '3',
+            '--no-progress',
+        ))
+        for user in ('1', '2', '3', '4'):
+            with self.subTest(user=user):
+                args = ('mr-recommend', 'ii', user, '--count', '3')
+                self.assertEqual(
+                    run(args + ('--no-progress',)),
+                    run(args + ('--lookup',)),
+                )
+
+
+class ServeTestCase(unittest.TestCase):
+    """Send requests to ``mr-serve``."""
+
+    def test_socket(self):
+        """Assert ``--socket`` doesn't change predictions or recommendations.
+
+        Change the dataset part-way through, so that the server reloads it.
+        """
+        commands = (
+            ('mr-predict', 'ii', '1', '2'),
+            ('mr-recommend', 'ii', '1', '--count', '3', '--no-progress'),
+        )
+        with serve() as path:
+            for _ in range(2):
+                for args in commands:
+                    with self.subTest(args=args):
+                        self.assertEqual(
+                            run(args),
+                            run(args + ('--socket', path)),
+                        )
+                run(('mr-analyze', 'ii', '--overwrite'))
+
+    def test_bad_user(self):
+        """Assert the server rejects an unknown user."""
+        with serve() as path:
+            with self.assertRaises(subprocess.CalledProcessError):
+                run(('mr-predict', 'ii', '99999', '1', '--socket', path))
@@ -1,8 +1,11 @@
 # coding=utf-8
 """Tests for the machine learning recommendation algorithm."""
+import os
+import subprocess
+import tempfile
 import unittest
 
-from .utils import backup_db, restore_db, run
+from .utils import backup_db, delete_db, restore_db, run, serve
 
 
 def setUpModule():  # pylint:disable=invalid-name
@@ -15,11 +18,21 @@ def setUpModule():  # pylint:disable=invalid-name
 
 def tearDownModule():  # pylint:disable=invalid-name
     """Delete the current database, and restore the old one."""
-    load_path = run(('mr-db', 'load-path'))[0]
-    run(('rm', load_path))
+    delete_db()
     restore_db()
 
 
+class AnalyzeTestCase(unittest.TestCase):
+    """Call ``mr-analyze`` with various arguments."""
+
+    def test_in_memory(self):
+        """Assert ``--in-memory`` doesn't change the chosen predictors."""
+        args = ('mr-recommend', 'ml', '1', '--count', '3', '--format', 'csv')
+        before = run(args)
+        run(('mr-analyze', 'ml', '--overwrite', '--in-memory'))
+        self.assertEqual(before, run(args))
+
+
 class PredictTestCase(unittest.TestCase):
     """Generate predictions for each user."""
 
@@ -83,6 +96,30 @@ class PredictTestCase(unittest.TestCase):
                 self.assertEqual(target_rating, actual_rating)
 
 
+class ProfileTestCase(unittest.TestCase):
+    """Call ``mr-recommend --profile``."""
+
+    def test_profile(self):
+        """Assert a summary is printed to stderr, and stdout is unchanged."""
+        args = ('ml', '1', '--count', '1', '--format', 'csv', '--no-cache')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            stats_path = os.path.join(temp_dir, 'stats')
+            proc = subprocess.run(
+                ('mr-recommend', '--profile-output', stats_path) + args,
+                check=True,
+                stderr=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                universal_newlines=True,
+            )
+            self.assertTrue(os.path.exists(stats_path))
+        self.assertEqual(
+            proc.stdout.splitlines(),
+            run(('mr-recommend',) + args),
+        )
+        self.assertIn('SQL: ', proc.stderr)
+        self.assertIn('total', proc.stderr)
+
+
 class RecommendTestCase(unittest.TestCase):
     """Generate recommendations for each user."""
 
@@ -116,3 +153,18 @@ class RecommendTestCase(unittest.TestCase):
         ))
         self.assertEqual(len(lines), 3, lines)
         self.assertEqual(lines[1], '10,4.0')
+
+
+class ServeTestCase(unittest.TestCase):
+    """Send requests to ``mr-serve``."""
+
+    def test_socket(self):
+        """Assert ``--socket`` doesn't change any output."""
+        with serve() as path:
+            for args in (
+                    ('mr-predict', 'ml', '1', '2'),
+                    ('mr-recommend', 'ml', '1', '--count', '3'),
+                    ('mr-recommend', 'ml', '2', '--format', 'csv'),
+            ):
+                with self.subTest(args=args):
+                    self.assertEqual(run(args), run(args + ('--socket', path)))
@@ -1,10 +1,20 @@
 # coding=utf-8
 """Utilities for functional tests."""
+import contextlib
+import os
 import subprocess
+import tempfile
 
 _BACKUP_PATH = None
 """The path to the backed-up database, if any."""
 
+_DB_SUFFIXES = ('', '-wal', '-shm')
+"""Suffixes of the files that make up a database in WAL mode.
+
+A new database must not inherit an old one's write-ahead log, so these files
+are moved and deleted together.
+"""
+
 
 def backup_db():
     """Back up the current database if one exists.
@@ -19,7 +29,7 @@ def backup_db():
     # runs both this and restore_db().
     global _BACKUP_PATH  # pylint:disable=global-statement
     _BACKUP_PATH = run(('mktemp',))[0]
-    run(('mv', load_path, _BACKUP_PATH))
+    _move_db(load_path, _BACKUP_PATH)
 
 
 def restore_db():
@@ -33,10 +43,24 @@ def restore_db():
     if not _BACKUP_PATH:
         return
     save_path = run(('mr-db', 'save-path'))[0]
-    run(('mv', _BACKUP_PATH, save_path))
+    _move_db(_BACKUP_PATH, save_path)
     _BACKUP_PATH = None
 
 
+def delete_db():
+    """Delete the current database."""
+    load_path = run(('mr-db', 'load-path'))[0]
+    for suffix in _DB_SUFFIXES:
+        run(('rm', '-f', load_path + suffix))
+
+
+def _move_db(src, dst):
+    """Move a database, along with its write-ahead log, if any."""
+    for suffix in _DB_SUFFIXES:
+        if os.path.exists(src + suffix):
+            run(('mv', src + suffix, dst + suffix))
+
+
 def run(args):
     """Call ``subprocess.run`` with several common arguments set.
 
@@ -52,3 +76,24 @@ def run(args):
         stdout=subprocess.PIPE,
         universal_newlines=True,  # convert this OSs newline sequence to \n
     ).stdout.splitlines()
+
+
+@contextlib.contextmanager
+def serve():
+    """Run ``mr-serve`` for the duration of a ``with`` block.
+
+    :return: A context manager which yields the path to the server's socket.
+    """
+    with tempfile.TemporaryDirectory() as socket_dir:
+        path = os.path.join(socket_dir, 'server.sock')
+        with subprocess.Popen(
+                ('mr-serve', '--jobs', '2', '--socket', path),
+                stdout=subprocess.PIPE,
+                universal_newlines=True) as proc:
+            try:
+                # The server prints a line once it's listening.
+                proc.stdout.readline()
+                yield path
+            finally:
+                proc.terminate()
+                proc.wait()
@@ -0,0 +1,110 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.analyze.ii`."""
+import itertools
+import unittest
+
+import numpy
+
+from movie_recommender.analyze import ii
+from movie_recommender.constants import MIN_PAIRS_FOR_SIMILARITY
+from movie_recommender.db import common, count, init, store
+from movie_recommender.matrix import CoRaters, RatingsMatrix
+
+from .utils import make_db_path
+
+
+RATINGS = (
+    (5, 40, 1.0),
+    (6, 30, 4.5),
+    (6, 40, 2.0),
+    (7, 10, 3.0),
+    (7, 30, 1.5),
+    (8, 10, 5.0),
+    (8, 20, 3.5),
+    (9, 20, 2.5),
+)
+"""Ratings, as ``(user, movie, rating)`` tuples. Nobody rates movie 50."""
+
+MOVIES = (10, 20, 30, 40, 50)
+"""Every movie ID."""
+
+
+class CoRatersTestCase(unittest.TestCase):
+    """Compare co-rater counts to :func:`movie_recommender.db.count`.
+
+    :func:`movie_recommender.db.count.rating_pairs` answers from a store,
+    loaded from a throwaway database.
+    """
+
+    def setUp(self):
+        """Create a database, load a store from it, and count co-raters."""
+        db_path = make_db_path(self)
+        with common.get_db_conn(db_path) as conn:
+            init.c_avg_ratings_table(conn)
+            with conn:
+                conn.execute(
+                    'CREATE TABLE movies (movieId, title, genres)'
+                )
+                conn.executemany(
+                    "INSERT INTO movies VALUES (?, '', '')",
+                    ((movie,) for movie in MOVIES),
+                )
+                conn.execute(
+                    'CREATE TABLE ratings (userId, movieId, rating)'
+                )
+                conn.executemany(
+                    'INSERT INTO ratings VALUES (?, ?, ?)',
+                    RATINGS,
+                )
+        store.load(reload=True, db_path=db_path)
+        self.addCleanup(store.unload)
+        self.all_movies = numpy.array(MOVIES, dtype=numpy.int64)
+        self.co_raters = CoRaters(
+            RatingsMatrix(*zip(*RATINGS), all_movie_ids=MOVIES)
+        )
+
+    def test_counts(self):
+        """Assert each pair's count matches its number of rating pairs."""
+        self.assertEqual(self.co_raters.movies.tolist(), list(MOVIES))
+        counts = self.co_raters.counts(MOVIES)
+        for (i, movie_a), (j, movie_b) in itertools.permutations(
+                enumerate(MOVIES), 2):
+            with self.subTest(movie_a=movie_a, movie_b=movie_b):
+                self.assertEqual(
+                    counts[i, j],
+                    count.rating_pairs(movie_a, movie_b),
+                )
+
+    def test_gen_pairs(self):
+        """Assert pairs are split by their number of co-raters.
+
+        Pairs with enough co-raters are yielded, and every other pair is
+        skipped with a score of 0. Together, they're the pairs yielded when
+        co-raters aren't counted.
+        """
+        target_movies = numpy.array((10, 30, 50), dtype=numpy.int64)
+        unfiltered = tuple(ii.gen_pairs(self.all_movies, target_movies))
+        zeros = []
+        pairs = tuple(ii.gen_pairs(
+            self.all_movies,
+            target_movies,
+            co_raters=self.co_raters,
+            skip=zeros.extend,
+        ))
+        for movie, target_movie in pairs:
+            self.assertGreaterEqual(
+                count.rating_pairs(movie, target_movie),
+                MIN_PAIRS_FOR_SIMILARITY,
+            )
+        for zero in zeros:
+            self.assertEqual(zero.score, 0)
+            self.assertLess(
+                count.rating_pairs(zero.movie_a, zero.movie_b),
+                MIN_PAIRS_FOR_SIMILARITY,
+            )
+        self.assertTrue(pairs)
+        self.assertTrue(zeros)
+        self.assertEqual(
+            sorted(pairs + tuple(zero[:2] for zero in zeros)),
+            sorted(unfiltered),
+        )
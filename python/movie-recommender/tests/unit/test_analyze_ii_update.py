@@ -0,0 +1,100 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.analyze.ii_update`."""
+import unittest
+
+import numpy
+
+from movie_recommender.analyze import ii_update
+from movie_recommender.matrix import AdjustedCosine, RatingsMatrix
+
+
+OLD_RATINGS = {
+    1: {10: 4.0, 20: 5.0, 30: 0.5},
+    2: {10: 3.5, 20: 3.0},
+}
+"""Ratings before an update, in the form ``{user: {movie: rating}}``."""
+
+NEW_RATINGS = {
+    1: {10: 4.0, 20: 2.0, 30: 0.5},
+    2: {10: 3.5, 20: 3.0, 40: 1.0},
+    3: {20: 4.5, 30: 4.0},
+}
+"""Ratings after an update."""
+
+
+def _matrix(ratings):
+    """Make a ratings matrix with a column for each of movies 10–40."""
+    triples = tuple(
+        (user, movie, rating)
+        for user, user_ratings in ratings.items()
+        for movie, rating in user_ratings.items()
+    )
+    return RatingsMatrix(*zip(*triples), all_movie_ids=(10, 20, 30, 40))
+
+
+def _stats(ratings, means):
+    """Compute statistics for every pair of movies, in a dict."""
+    matrix = _matrix(ratings)
+    stats = AdjustedCosine(
+        matrix.centered(numpy.array(
+            [means[user] for user in matrix.users.tolist()]
+        )),
+        matrix.rated(),
+        1,
+    ).stats(range(4))
+    stats = tuple(stat.toarray() for stat in stats)
+    movies = matrix.movies.tolist()
+    return {
+        (movies[i], movies[j]): tuple(stat[i][j] for stat in stats)
+        for i in range(4)
+        for j in range(i + 1, 4)
+    }
+
+
+class GenStatsDeltasTestCase(unittest.TestCase):
+    """Test :meth:`movie_recommender.analyze.ii_update.gen_stats_deltas`."""
+
+    def test_deltas(self):
+        """Assert old statistics plus deltas equal new statistics.
+
+        User 1 is re-centred, user 2 keeps a stale mean, and user 3 is new.
+        """
+        old_means = {1: 3.0, 2: 3.25}
+        new_means = {1: 6.5 / 3, 2: 3.25, 3: 4.25}
+        deltas = tuple(ii_update.gen_stats_deltas(
+            _matrix(OLD_RATINGS),
+            old_means,
+            _matrix(NEW_RATINGS),
+            new_means,
+            {10, 20, 30, 40},
+        ))
+        pairs = [(delta.movie_a, delta.movie_b) for delta in deltas]
+        self.assertEqual(len(pairs), len(set(pairs)))
+
+        stats = _stats(OLD_RATINGS, old_means)
+        for delta in deltas:
+            pair = (delta.movie_a, delta.movie_b)
+            stats[pair] = tuple(
+                old + change for old, change in zip(stats[pair], delta[2:])
+            )
+        target = _stats(NEW_RATINGS, new_means)
+        for pair, values in target.items():
+            with self.subTest(pair=pair):
+                numpy.testing.assert_allclose(stats[pair], values, atol=1e-12)
+
+    def test_unchanged(self):
+        """Assert pairs of unchanged movies are skipped."""
+        new_ratings = dict(NEW_RATINGS)
+        del new_ratings[3]
+        means = {1: 3.0, 2: 3.25}
+        deltas = tuple(ii_update.gen_stats_deltas(
+            _matrix(OLD_RATINGS),
+            means,
+            _matrix(new_ratings),
+            means,
+            {20, 40},
+        ))
+        self.assertEqual(
+            {(delta.movie_a, delta.movie_b) for delta in deltas},
+            {(10, 20), (20, 30), (10, 40), (20, 40)},
+        )
@@ -0,0 +1,56 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.analyze.ml`."""
+import unittest
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.analyze.ml import loo_predictions
+from movie_recommender.graph import Graph, Point
+
+
+def _loo_prediction(x_values, y_values, i):
+    """Make a leave-one-out prediction with a graph."""
+    x_values, y_values = x_values.tolist(), y_values.tolist()
+    graph = Graph([
+        Point(x, y)
+        for j, (x, y) in enumerate(zip(x_values, y_values))
+        if j != i
+    ])
+    try:
+        return graph.predict_y(x_values[i])
+    except exceptions.VerticalLineOfBestFitGraphError:
+        return graph.avg_point.y
+
+
+class LooPredictionsTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.analyze.ml.loo_predictions`."""
+
+    def test_graph(self):
+        """Assert predictions match those made one graph at a time."""
+        y_values = numpy.array((4.0, 3.5, 1.0, 5.0, 2.5, 3.0))
+        x_values = numpy.array((
+            # Years, genres, a lone genre and an absent genre.
+            (1994, 1, 0, 0),
+            (1999, 0, 0, 0),
+            (1972, 1, 1, 0),
+            (1994, 1, 0, 0),
+            (2010, 0, 0, 0),
+            (1960, 1, 0, 0),
+        ), dtype=numpy.float64)
+        predictions = loo_predictions(x_values, y_values)
+        for j in range(x_values.shape[1]):
+            for i in range(len(y_values)):
+                with self.subTest(i=i, j=j):
+                    self.assertAlmostEqual(
+                        predictions[i, j],
+                        _loo_prediction(x_values[:, j], y_values, i),
+                    )
+
+    def test_two_points(self):
+        """Assert each of two points is predicted to equal the other."""
+        predictions = loo_predictions(
+            numpy.array(((1.0,), (0.0,))),
+            numpy.array((2.0, 4.5)),
+        )
+        self.assertEqual(predictions[:, 0].tolist(), [4.5, 2.0])
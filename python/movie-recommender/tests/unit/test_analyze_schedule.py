@@ -0,0 +1,53 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.analyze.schedule`."""
+import math
+import unittest
+
+from movie_recommender.analyze import schedule
+
+
+class LongestFirstTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.analyze.schedule.longest_first`."""
+
+    def test_order(self):
+        """Assert costly tasks come first, and ties keep their order."""
+        self.assertEqual(
+            schedule.longest_first((1, 2, 3, 4, 5), {1: 5, 2: 9, 4: 5, 5: 1}),
+            [2, 1, 4, 5, 3],
+        )
+
+
+class RunTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.analyze.schedule.run`."""
+
+    def test_results(self):
+        """Assert every result is consumed, in batches."""
+        batches = []
+        tasks = range(10)
+        report = schedule.run(
+            math.sqrt,
+            tasks,
+            {task: task for task in tasks},
+            batches.append,
+            jobs=2,
+            batch_size=4,
+        )
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 2])
+        self.assertEqual(
+            dict(pair for batch in batches for pair in batch),
+            {task: math.sqrt(task) for task in tasks},
+        )
+        self.assertEqual(
+            sorted(timing.task for timing in report.timings),
+            list(tasks),
+        )
+        self.assertLessEqual(0, report.tail_seconds)
+        self.assertLessEqual(report.tail_seconds, report.seconds)
+
+    def test_no_tasks(self):
+        """Assert nothing is consumed if there are no tasks."""
+        batches = []
+        report = schedule.run(math.sqrt, (), {}, batches.append, jobs=2)
+        self.assertEqual(batches, [])
+        self.assertEqual(report.timings, ())
+        self.assertEqual(report.tail_seconds, 0)
@@ -0,0 +1,40 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.bench.results`."""
+import os
+import tempfile
+import unittest
+
+from movie_recommender.bench import results
+
+
+class CompareTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.bench.results.compare`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Make base results."""
+        cls.dataset = {'users': 1, 'movies': 2, 'ratings': 2, 'seed': 0}
+        cls.base = results.make(cls.dataset, {'a': [2.0, 1.0], 'b': [1.0]})
+
+    def test_regressed(self):
+        """Assert only scenarios slower than the threshold regress."""
+        new = results.make(self.dataset, {'a': [1.05], 'b': [1.2], 'c': [1]})
+        comparisons = results.compare(self.base, new, 0.1)
+        self.assertEqual(
+            [(row.scenario, row.regressed) for row in comparisons],
+            [('a', False), ('b', True)],
+        )
+        self.assertAlmostEqual(comparisons[1].ratio, 1.2)
+
+    def test_datasets_differ(self):
+        """Assert results for different datasets can't be compared."""
+        new = results.make(dict(self.dataset, seed=1), {'a': [1.0]})
+        with self.assertRaises(ValueError):
+            results.compare(self.base, new)
+
+    def test_save_load(self):
+        """Assert results survive a round trip through a file."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'results.json')
+            results.save(self.base, path)
+            self.assertEqual(results.load(path), self.base)
@@ -0,0 +1,81 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.bench.synthetic`."""
+import csv
+import filecmp
+import os
+import shutil
+import tempfile
+import unittest
+
+from movie_recommender.bench.synthetic import generate
+from movie_recommender.constants import YEAR_MATCHER
+
+
+def _read_csv(path):
+    """Read the rows of a CSV file, after its header row."""
+    with open(path) as handle:
+        return list(csv.reader(handle))[1:]
+
+
+class GenerateTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.bench.synthetic.generate`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Generate a dataset."""
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.tmp_dir, 'synthetic')
+        generate(cls.path, 20, 30, 300, seed=1)
+        cls.ratings = _read_csv(os.path.join(cls.path, 'ratings.csv'))
+        cls.movies = _read_csv(os.path.join(cls.path, 'movies.csv'))
+
+    @classmethod
+    def tearDownClass(cls):
+        """Delete the dataset."""
+        shutil.rmtree(cls.tmp_dir)
+
+    def test_ratings(self):
+        """Assert every user rates, and no user rates a movie twice."""
+        pairs = [(int(row[0]), int(row[1])) for row in self.ratings]
+        self.assertEqual(len(pairs), 300)
+        self.assertEqual(len(set(pairs)), 300)
+        self.assertEqual(pairs, sorted(pairs))
+        self.assertEqual({user for user, _ in pairs}, set(range(1, 21)))
+        self.assertTrue(all(1 <= movie <= 30 for _, movie in pairs))
+        values = {float(row[2]) for row in self.ratings}
+        self.assertTrue(values <= {i / 2 for i in range(1, 11)}, values)
+
+    def test_movies(self):
+        """Assert every movie is listed, and most have a year."""
+        self.assertEqual(
+            [int(row[0]) for row in self.movies],
+            list(range(1, 31)),
+        )
+        with_year = [row for row in self.movies if YEAR_MATCHER.search(row[1])]
+        self.assertGreater(len(with_year), 15)
+
+    def test_seed(self):
+        """Assert a seed always generates the same dataset."""
+        path = os.path.join(self.tmp_dir, 'again')
+        generate(path, 20, 30, 300, seed=1)
+        names = ('links.csv', 'movies.csv', 'ratings.csv', 'tags.csv')
+        self.assertEqual(
+            filecmp.cmpfiles(self.path, path, names, shallow=False)[0],
+            list(names),
+        )
+
+    def test_dense(self):
+        """Generate a dataset in which every user rates every movie."""
+        path = os.path.join(self.tmp_dir, 'dense')
+        generate(path, 3, 4, 12)
+        self.assertEqual(
+            len(_read_csv(os.path.join(path, 'ratings.csv'))),
+            12,
+        )
+
+    def test_impossible(self):
+        """Ask for fewer ratings than users, or more than can be given."""
+        for ratings in (2, 13):
+            with self.subTest(ratings=ratings):
+                with self.assertRaises(ValueError):
+                    generate(self.tmp_dir, 3, 4, ratings)
@@ -1,7 +1,12 @@
 # coding=utf-8
 """Unit tests for :mod:`movie_recommender.db.common`."""
+import multiprocessing
+import os
+import tempfile
+import threading
 import unittest
 
+from movie_recommender.constants import DB_PRAGMAS
 from movie_recommender.db import common
 
 from .utils import get_fixture
@@ -47,3 +52,114 @@ class ParseCSVTestCase(unittest.TestCase):
                     (0.269, 4.47),
                 ),
             )
+
+
+class GetDBConnTestCase(unittest.TestCase):
+    """Tests for :func:`movie_recommender.db.common.get_db_conn`."""
+
+    def setUp(self):
+        """Create a database file."""
+        handle, self.db_path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        """Close pooled connections, and delete the database file."""
+        common.close_db_conns()
+        for suffix in ('', '-shm', '-wal'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def test_reuse(self):
+        """Assert the same connection is handed out repeatedly."""
+        before = common.get_conn_stats()
+        with common.get_db_conn(self.db_path) as conn_a:
+            conn_a.execute('CREATE TABLE foo (bar integer)')
+        with common.get_db_conn(self.db_path) as conn_b:
+            conn_b.execute('SELECT * FROM foo').fetchall()
+        after = common.get_conn_stats()
+        self.assertIs(conn_a, conn_b)
+        self.assertEqual(after['opens'] - before['opens'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(
+            after['queries'] - before['queries'],
+            len(DB_PRAGMAS) + 2,
+        )
+
+    def test_pragmas(self):
+        """Assert PRAGMAs are applied to new connections."""
+        with common.get_db_conn(self.db_path) as conn:
+            cache_size = conn.execute('PRAGMA cache_size').fetchone()[0]
+        self.assertEqual(cache_size, DB_PRAGMAS['cache_size'])
+
+    def test_journal_mode(self):
+        """Assert opening a connection doesn't change the journal mode."""
+        with common.get_db_conn(self.db_path) as conn:
+            journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(journal_mode, 'delete')
+
+    def test_temporary_pragmas(self):
+        """Assert temporary PRAGMAs are reverted."""
+        with common.get_db_conn(self.db_path) as conn:
+            with common.pragmas(conn, {'journal_mode': 'OFF'}):
+                self.assertEqual(
+                    conn.execute('PRAGMA journal_mode').fetchone()[0],
+                    'off',
+                )
+            journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(journal_mode, 'delete')
+
+    def test_rollback(self):
+        """Assert an open transaction is rolled back when the pool exits."""
+        with common.get_db_conn(self.db_path) as conn:
+            with conn:
+                conn.execute('CREATE TABLE foo (bar integer)')
+            conn.execute('INSERT INTO foo VALUES (1)')
+        with common.get_db_conn(self.db_path) as conn:
+            self.assertEqual(conn.execute('SELECT * FROM foo').fetchall(), [])
+
+    def test_fork(self):
+        """Assert a forked process doesn't reuse its parent's connection."""
+        with common.get_db_conn(self.db_path):
+            pass
+        context = multiprocessing.get_context('fork')
+        with context.Pool(1) as pool:
+            stats = pool.apply(_get_conn_stats, (self.db_path,))
+        self.assertEqual(stats['opens'], 1)
+        self.assertEqual(stats['hits'], 0)
+
+    def test_fork_threads(self):
+        """Assert a forked process stashes every thread's connections."""
+        opened = threading.Event()
+        done = threading.Event()
+
+        def hold_conn():
+            """Open a connection, and keep this thread alive until told."""
+            with common.get_db_conn(self.db_path):
+                opened.set()
+                done.wait()
+
+        thread = threading.Thread(target=hold_conn)
+        thread.start()
+        try:
+            opened.wait()
+            with common.get_db_conn(self.db_path):
+                pass
+            context = multiprocessing.get_context('fork')
+            with context.Pool(1) as pool:
+                forked = pool.apply(_count_forked_conns)
+        finally:
+            done.set()
+            thread.join()
+        self.assertEqual(forked, 2)
+
+
+def _count_forked_conns():
+    """Return the number of connections inherited from the parent process."""
+    return len(common._FORKED_CONNS)  # pylint:disable=protected-access
+
+
+def _get_conn_stats(db_path):
+    """Get a connection, and return connection statistics."""
+    with common.get_db_conn(db_path):
+        pass
+    return common.get_conn_stats()
@@ -0,0 +1,69 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.db.features`."""
+import unittest
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.constants import GENRE_BITS
+from movie_recommender.db.features import MovieFeatures, parse
+
+
+class ParseTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.db.features.parse`."""
+
+    def test_year_and_genres(self):
+        """Parse a title with a year, and several genres."""
+        self.assertEqual(
+            parse('Foo (1995)', 'Animation|Comedy'),
+            (1995, GENRE_BITS['Animation'] | GENRE_BITS['Comedy']),
+        )
+
+    def test_no_year(self):
+        """Parse a title without a year, and an unknown genre."""
+        self.assertEqual(parse('Foo', 'Unknown'), (None, 0))
+
+
+class MovieFeaturesTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.db.features.MovieFeatures`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Hold the features of some movies."""
+        cls.features = MovieFeatures((
+            (20, 'Bar') + parse('Bar', 'Horror'),
+            (10, 'Foo (1995)') + parse('Foo (1995)', 'Animation|Comedy'),
+        ))
+
+    def test_year(self):
+        """Get the year of a movie, and of a movie without a year."""
+        self.assertEqual(self.features.year(10), 1995)
+        with self.assertRaises(exceptions.NoMovieYearError):
+            self.features.year(20)
+
+    def test_has_genre(self):
+        """Tell whether movies have genres."""
+        self.assertTrue(self.features.has_genre(10, 'Comedy'))
+        self.assertFalse(self.features.has_genre(10, 'Horror'))
+        self.assertTrue(self.features.has_genre(20, 'Horror'))
+
+    def test_title(self):
+        """Get the title of a movie."""
+        self.assertEqual(self.features.title(20), 'Bar')
+
+    def test_lookup(self):
+        """Get the features of several movies at once."""
+        years, genre_masks = self.features.lookup(numpy.array((20, 10)))
+        self.assertTrue(numpy.isnan(years[0]))
+        self.assertEqual(years[1], 1995)
+        self.assertEqual(genre_masks.tolist(), [
+            GENRE_BITS['Horror'],
+            GENRE_BITS['Animation'] | GENRE_BITS['Comedy'],
+        ])
+
+    def test_missing(self):
+        """Assert looking up a movie not in the database fails."""
+        with self.assertRaises(ValueError):
+            self.features.year(30)
+        with self.assertRaises(ValueError):
+            self.features.lookup(numpy.array((10, 30)))
@@ -0,0 +1,109 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.db.migrate`."""
+import os
+import tempfile
+import unittest
+
+from movie_recommender import exceptions
+from movie_recommender.constants import (
+    DB_JOURNAL_MODE,
+    GENRE_BITS,
+    SCHEMA_VERSION,
+)
+from movie_recommender.db import common, migrate
+
+
+class MigrateTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.db.migrate.migrate`."""
+
+    def setUp(self):
+        """Create a database with the original schema."""
+        handle, self.db_path = tempfile.mkstemp()
+        os.close(handle)
+        with common.get_db_conn(self.db_path) as conn:
+            with conn:
+                conn.execute(
+                    """
+                    CREATE TABLE movies (
+                        movieId integer primary key,
+                        title text,
+                        genres text
+                    )
+                    """
+                )
+                conn.execute(
+                    "INSERT INTO movies VALUES (1, 'Foo (1999)', 'Comedy')"
+                )
+                conn.execute(
+                    """
+                    CREATE TABLE ratings (
+                        userId integer,
+                        movieId integer,
+                        rating real,
+                        timestamp integer,
+                        PRIMARY KEY (userId, movieId)
+                    )
+                    """
+                )
+                conn.execute(
+                    """
+                    CREATE TABLE similarities (
+                        movieAId INTEGER,
+                        movieBId INTEGER CHECK(movieAId < movieBId),
+                        similarity REAL,
+                        PRIMARY KEY (movieAId, movieBId)
+                    )
+                    """
+                )
+
+    def tearDown(self):
+        """Close pooled connections, and delete the database file."""
+        common.close_db_conns()
+        for suffix in ('', '-shm', '-wal'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def test_migrations(self):
+        """Assert there's one migration per schema version."""
+        self.assertEqual(len(migrate.MIGRATIONS), SCHEMA_VERSION)
+
+    def test_migrate(self):
+        """Migrate a database twice, checking query plans before and after."""
+        with common.get_db_conn(self.db_path) as conn:
+            self.assertEqual(migrate.schema_version(conn), 0)
+            with self.assertRaises(exceptions.QueryPlanError):
+                migrate.check_query_plans(conn)
+            self.assertEqual(
+                migrate.migrate(conn),
+                tuple(range(1, SCHEMA_VERSION + 1)),
+            )
+            self.assertEqual(migrate.schema_version(conn), SCHEMA_VERSION)
+            migrate.check_query_plans(conn)
+            self.assertEqual(migrate.migrate(conn), ())
+
+    def test_movie_features(self):
+        """Assert migrating a database populates the movieFeatures table."""
+        with common.get_db_conn(self.db_path) as conn:
+            migrate.migrate(conn)
+            self.assertEqual(
+                conn.execute('SELECT * FROM movieFeatures').fetchall(),
+                [(1, 1999, GENRE_BITS['Comedy'])],
+            )
+
+    def test_journal_mode(self):
+        """Assert migrating a database switches it to the WAL journal mode."""
+        with common.get_db_conn(self.db_path) as conn:
+            migrate.migrate(conn)
+            journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(journal_mode, DB_JOURNAL_MODE.lower())
+
+    def test_full_scan(self):
+        """Assert a query which scans an entire table is reported."""
+        with common.get_db_conn(self.db_path) as conn:
+            migrate.migrate(conn)
+            with conn:
+                conn.execute('DROP INDEX ratingsMovie')
+            with self.assertRaisesRegex(
+                    exceptions.QueryPlanError,
+                    'SCAN ratings'):
+                migrate.check_query_plans(conn)
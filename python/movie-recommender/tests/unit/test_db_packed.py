@@ -0,0 +1,80 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.db.packed`."""
+import io
+import tempfile
+import unittest
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.db import packed
+from movie_recommender.db.packed import PackedSimilarities
+
+
+class PackedSimilaritiesTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.db.packed.PackedSimilarities`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Pack some similarity scores, and read them back from a buffer."""
+        similarities = PackedSimilarities.from_pairs(
+            numpy.array((40, 10, 30, 20)),
+            numpy.array((10, 20, 10)),
+            numpy.array((20, 30, 30)),
+            numpy.array((0.5, -0.25, 1.0)),
+        )
+        handle = io.BytesIO()
+        similarities.write(handle, 3)
+        cls.buffer = numpy.frombuffer(handle.getvalue(), dtype=numpy.uint8)
+        cls.packed, cls.dataset_version = PackedSimilarities.from_buffer(
+            cls.buffer
+        )
+
+    def test_dataset_version(self):
+        """Assert the dataset version survives a round trip."""
+        self.assertEqual(self.dataset_version, 3)
+
+    def test_row(self):
+        """Get the movies similar to a movie, in either direction."""
+        for movie, target in (
+                (10, ([20, 30], [0.5, 1.0])),
+                (30, ([10, 20], [1.0, -0.25])),
+                (40, ([], [])),
+                (50, ([], []))):
+            with self.subTest(movie=movie):
+                movies, scores = self.packed.row(movie)
+                self.assertEqual((movies.tolist(), scores.tolist()), target)
+
+    def test_similarity(self):
+        """Get the similarity of a pair of movies, in either order."""
+        self.assertEqual(self.packed.similarity(20, 10), 0.5)
+        self.assertEqual(self.packed.similarity(20, 30), -0.25)
+        self.assertEqual(self.packed.similarity(10, 40), 0)
+
+    def test_similarity_missing(self):
+        """Assert an error is raised for a movie not in the file."""
+        with self.assertRaises(exceptions.MissingSimilarityError):
+            self.packed.similarity(10, 50)
+
+    def test_bad_magic(self):
+        """Assert a buffer in an unknown format is rejected."""
+        buffer = self.buffer.copy()
+        buffer[0] = 0
+        with self.assertRaises(exceptions.PackedSimilaritiesError):
+            PackedSimilarities.from_buffer(buffer)
+
+    def test_truncated(self):
+        """Assert a truncated buffer is rejected."""
+        with self.assertRaises(exceptions.PackedSimilaritiesError):
+            PackedSimilarities.from_buffer(self.buffer[:-8])
+
+
+class LoadTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.db.packed.load`."""
+
+    def test_empty(self):
+        """Assert an empty file is rejected."""
+        with tempfile.NamedTemporaryFile() as handle:
+            with self.assertRaises(exceptions.PackedSimilaritiesError):
+                packed.load(handle.name, reload=True)
+        self.assertIsNone(packed.get())
@@ -0,0 +1,105 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.db.shards`."""
+import itertools
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.db import common
+from movie_recommender.db.shards import (
+    Shard,
+    ShardRun,
+    create,
+    finish,
+    merge,
+    pair_shards,
+    read_run,
+)
+
+
+class PairShardsTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.db.shards.pair_shards`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Create every pair of some movies."""
+        pairs = numpy.array(
+            tuple(itertools.combinations(range(1, 201), 2)),
+            dtype=numpy.int64,
+        )
+        cls.movies_a = pairs[:, 0]
+        cls.movies_b = pairs[:, 1]
+
+    def test_unordered(self):
+        """Assert ``(a, b)`` and ``(b, a)`` belong to the same shard."""
+        self.assertEqual(
+            pair_shards(self.movies_a, self.movies_b, 8).tolist(),
+            pair_shards(self.movies_b, self.movies_a, 8).tolist(),
+        )
+
+    def test_scalar(self):
+        """Pair many movies with one movie."""
+        self.assertEqual(
+            pair_shards(self.movies_b[:199], 1, 8).tolist(),
+            pair_shards(self.movies_a[:199], self.movies_b[:199], 8).tolist(),
+        )
+
+    def test_balanced(self):
+        """Assert every shard gets a similar number of pairs."""
+        for count in (1, 2, 7, 8):
+            with self.subTest(count=count):
+                shards = pair_shards(self.movies_a, self.movies_b, count)
+                sizes = numpy.bincount(shards, minlength=count)
+                self.assertEqual(len(sizes), count)
+                self.assertEqual(sizes.sum(), len(self.movies_a))
+                self.assertLess(sizes.max() / sizes.min(), 1.1)
+
+
+class ShardRunTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.db.shards.finish`.
+
+    Also test how :func:`movie_recommender.db.shards.merge` treats its marker.
+    """
+
+    def setUp(self):
+        """Create two empty shard files."""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.addCleanup(common.close_db_conns)
+        self.paths = tuple(f'{tmpdir}/shard-{i}.db' for i in range(2))
+        for i, path in enumerate(self.paths):
+            create(path, Shard(i, 2))
+
+    def test_finish(self):
+        """Assert the target movies and overwrite mode are recorded."""
+        finish(self.paths[0], (3, 1, 2, 1), True)
+        finish(self.paths[1], {1, 2, 3}, True)
+        runs = tuple(read_run(path) for path in self.paths)
+        self.assertEqual(runs[0], runs[1])
+        self.assertIsInstance(runs[0], ShardRun)
+        self.assertTrue(runs[0].overwrite)
+
+    def test_incomplete(self):
+        """Assert a shard file without a completion marker isn't merged."""
+        finish(self.paths[0], (1, 2, 3), False)
+        with self.assertRaises(exceptions.ShardError):
+            merge(self.paths)
+
+    def test_resumed(self):
+        """Assert re-creating a shard file removes its completion marker."""
+        finish(self.paths[0], (1, 2, 3), False)
+        create(self.paths[0], Shard(0, 2))
+        with self.assertRaises(exceptions.ShardError):
+            read_run(self.paths[0])
+
+    def test_different_runs(self):
+        """Assert shard files analyzed in different ways aren't merged."""
+        for targets, overwrite in (((1, 2), False), ((1, 2, 3), True)):
+            with self.subTest(targets=targets, overwrite=overwrite):
+                finish(self.paths[0], (1, 2, 3), False)
+                finish(self.paths[1], targets, overwrite)
+                with self.assertRaises(exceptions.ShardError):
+                    merge(self.paths)
@@ -0,0 +1,88 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.db.store`."""
+import unittest
+
+from movie_recommender import exceptions
+from movie_recommender.db import common
+from movie_recommender.db.store import RatingsStore
+
+
+class RatingsStoreTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.db.store.RatingsStore`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Create a store."""
+        cls.store = RatingsStore(
+            (
+                (2, 30, 2.5),
+                (1, 10, 4.0),
+                (1, 20, 5.0),
+                (2, 10, 3.5),
+                (3, 20, 2.0),
+            ),
+            ((1, 4.5), (2, 3.0)),
+            (
+                (10, 'Foo (1960)', 'Animation|Children'),
+                (20, 'Bar', '(no genres listed)'),
+                (30, 'Biz (1980)', 'Horror'),
+                (40, 'Baz (1990)', 'Horror'),
+            ),
+        )
+
+    def test_rating(self):
+        """Get a rating."""
+        self.assertEqual(self.store.rating(2, 10), 3.5)
+
+    def test_rating_missing(self):
+        """Get a rating that doesn't exist."""
+        with self.assertRaises(AssertionError):
+            self.store.rating(3, 10)
+
+    def test_rating_pairs(self):
+        """Get pairs of ratings, and assert the lower movie ID comes first."""
+        pairs = (
+            common.RatingPair(1, 4.0, 5.0),
+            common.RatingPair(2, 3.5, 2.5),
+        )
+        for movies, target in (
+                ((20, 10), pairs[:1]),
+                ((10, 20), pairs[:1]),
+                ((30, 10), pairs[1:]),
+                ((30, 40), ())):
+            with self.subTest(movies=movies):
+                self.assertEqual(self.store.rating_pairs(*movies), target)
+
+    def test_rated_movies(self):
+        """Get the movies some users have rated."""
+        self.assertEqual(self.store.rated_movies((1, 3)), {10, 20})
+        self.assertEqual(self.store.rated_movies((4,)), set())
+
+    def test_avg_rating(self):
+        """Get a precomputed average rating."""
+        self.assertEqual(self.store.avg_rating(1), 4.5)
+        with self.assertRaises(exceptions.MissingAverageRatingError):
+            self.store.avg_rating(3)
+
+    def test_avg_user_rating(self):
+        """Calculate the average of a user's ratings."""
+        self.assertEqual(self.store.avg_user_rating(2), 3.0)
+        self.assertIsNone(self.store.avg_user_rating(4))
+
+    def test_avg_movie_rating(self):
+        """Calculate the average of a movie's ratings."""
+        self.assertEqual(self.store.avg_movie_rating(20), 3.5)
+        with self.assertRaises(exceptions.NoMovieRatingsError):
+            self.store.avg_movie_rating(40)
+
+    def test_counts(self):
+        """Count users and average ratings."""
+        self.assertEqual(self.store.count_user_ids(), 3)
+        self.assertEqual(self.store.count_avg_ratings(), 2)
+
+    def test_title_genres(self):
+        """Get a movie's title and genres."""
+        self.assertEqual(self.store.title(30), 'Biz (1980)')
+        self.assertEqual(self.store.genres(10), ['Animation', 'Children'])
+        with self.assertRaises(ValueError):
+            self.store.title(50)
@@ -0,0 +1,39 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.db.write`."""
+import unittest
+
+from movie_recommender.db import common, init, read, write
+
+from .utils import make_db_path
+
+
+class DatasetVersionTestCase(unittest.TestCase):
+    """Assert writing data that recommendations depend on bumps its version.
+
+    See :func:`movie_recommender.db.write.bump_dataset_version`.
+    """
+
+    def setUp(self):
+        """Create a database, and make it this thread's default."""
+        db_path = make_db_path(self)
+        with common.get_db_conn(db_path) as conn:
+            init.c_avg_ratings_table(conn)
+            init.c_predictors_table(conn)
+        common._LOCAL.load_path = db_path  # pylint:disable=protected-access
+
+    def test_avg_ratings(self):
+        """Write average ratings, and then change one."""
+        self.assertEqual(read.dataset_version(), 0)
+        write.avg_ratings((common.AvgRating(1, 3.5), common.AvgRating(2, 4)))
+        self.assertEqual(read.dataset_version(), 1)
+        write.avg_ratings((common.AvgRating(1, 2.5),))
+        self.assertEqual(read.dataset_version(), 2)
+        self.assertEqual(read.avg_rating(1), 2.5)
+
+    def test_predictor(self):
+        """Write a predictor, and then change it."""
+        self.assertEqual(read.dataset_version(), 0)
+        write.predictor(1, 'year')
+        self.assertEqual(read.dataset_version(), 1)
+        write.predictor(1, 'genre:Comedy')
+        self.assertEqual(read.dataset_version(), 2)
@@ -3,7 +3,7 @@
 import unittest
 
 from movie_recommender import exceptions
-from movie_recommender.graph import Graph, Point
+from movie_recommender.graph import ArrayGraph, Graph, OnlineGraph, Point
 
 
 class GraphPointsTestCase(unittest.TestCase):
@@ -168,3 +168,81 @@ class NonTrivialGraphTestCase(unittest.TestCase):
         # 4 + 4 + 4 + 4
         # 16
         self.assertEqual(self.graph.sse, 16)
+
+
+class OtherGraphsTestCase(unittest.TestCase):
+    """Compare :class:`movie_recommender.graph.Graph` to its alternatives.
+
+    Assert :class:`movie_recommender.graph.ArrayGraph` and
+    :class:`movie_recommender.graph.OnlineGraph` compute the same statistics.
+    """
+
+    def test_non_trivial(self):
+        """Compare statistics of a non-trivial graph."""
+        points = (Point(-2, 14), Point(2, 10), Point(-2, 10), Point(2, 6))
+        for cls in (ArrayGraph, OnlineGraph):
+            with self.subTest(cls=cls):
+                graph = cls(points)
+                self.assertEqual(graph.avg_point, Point(0, 10))
+                self.assertAlmostEqual(graph.slope, -1)
+                self.assertAlmostEqual(graph.y_intercept, 10)
+                self.assertAlmostEqual(graph.predict_y(0), 10)
+                self.assertAlmostEqual(graph.sse, 16)
+
+    def test_empty(self):
+        """Assert an empty graph has no average point or slope."""
+        for cls in (ArrayGraph, OnlineGraph):
+            with self.subTest(cls=cls):
+                graph = cls(())
+                with self.assertRaises(exceptions.EmptyGraphError):
+                    graph.avg_point  # pylint:disable=pointless-statement
+                with self.assertRaises(exceptions.EmptyGraphError):
+                    graph.slope  # pylint:disable=pointless-statement
+
+    def test_vertical_slope(self):
+        """Assert a vertical slope can't be calculated."""
+        for cls in (ArrayGraph, OnlineGraph):
+            with self.subTest(cls=cls):
+                graph = cls((Point(1, 1), Point(1, 2)))
+                with self.assertRaises(
+                        exceptions.VerticalLineOfBestFitGraphError):
+                    graph.slope  # pylint:disable=pointless-statement
+
+    def test_from_arrays(self):
+        """Create an array graph from arrays of x and y values."""
+        graph = ArrayGraph.from_arrays((0, 2), (1, 2))
+        self.assertEqual(graph.points, (Point(0, 1), Point(2, 2)))
+        self.assertEqual(graph.slope, 0.5)
+
+
+class OnlineGraphTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.graph.OnlineGraph`."""
+
+    def test_add_remove(self):
+        """Assert adding and removing points keeps the fit current."""
+        graph = OnlineGraph((Point(0, 1), Point(2, 2)))
+        graph.add_point(Point(4, 9))
+        graph.add_point(Point(1, 1.5))
+        graph.remove_point(Point(4, 9))
+        self.assertCountEqual(
+            graph.points,
+            (Point(0, 1), Point(2, 2), Point(1, 1.5)),
+        )
+        self.assertAlmostEqual(graph.slope, 0.5)
+        self.assertAlmostEqual(graph.y_intercept, 1)
+        self.assertAlmostEqual(graph.sse, 0)
+
+    def test_vertical_after_remove(self):
+        """Assert a graph becomes vertical once all other x values go."""
+        graph = OnlineGraph((Point(0.1, 1), Point(0.3, 2), Point(0.1, 3)))
+        graph.remove_point(Point(0.3, 2))
+        with self.assertRaises(exceptions.VerticalLineOfBestFitGraphError):
+            graph.slope  # pylint:disable=pointless-statement
+        self.assertAlmostEqual(graph.avg_point.y, 2)
+
+    def test_remove_missing(self):
+        """Assert a point not on the graph can't be removed."""
+        graph = OnlineGraph((Point(0, 1),))
+        with self.assertRaises(ValueError):
+            graph.remove_point(Point(1, 0))
+        self.assertEqual(graph.points, (Point(0, 1),))
@@ -0,0 +1,317 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.matrix`."""
+import math
+import unittest
+
+import numpy
+
+from movie_recommender.matrix import (
+    AdjustedCosine,
+    CoRaters,
+    MinHashBuckets,
+    PairBitmap,
+    RatingsMatrix,
+    adjusted_cosine,
+)
+
+
+RATINGS = (
+    # user, movie, rating
+    (1, 10, 4.0),
+    (1, 20, 5.0),
+    (1, 30, 0.5),
+    (2, 10, 3.5),
+    (2, 20, 3.0),
+    (2, 30, 2.5),
+    (3, 20, 2.0),
+    (3, 30, 5.0),
+    (4, 30, 4.0),
+)
+"""Ratings for a small matrix. Movie 40 is unrated."""
+
+
+def _adjusted_cosine(movie_a, movie_b, avg_ratings):
+    """Compute adjusted cosine similarity one pair at a time."""
+    by_user = {}
+    for user, movie, rating in RATINGS:
+        by_user.setdefault(user, {})[movie] = rating
+    numerator = 0
+    denominator_a = 0
+    denominator_b = 0
+    pairs = 0
+    for user, ratings in by_user.items():
+        if movie_a in ratings and movie_b in ratings:
+            pairs += 1
+            rating_a = ratings[movie_a] - avg_ratings[user]
+            rating_b = ratings[movie_b] - avg_ratings[user]
+            numerator += rating_a * rating_b
+            denominator_a += rating_a ** 2
+            denominator_b += rating_b ** 2
+    try:
+        return numerator / (math.sqrt(denominator_a) * math.sqrt(denominator_b))
+    except ZeroDivisionError:
+        return 0
+
+
+class RatingsMatrixTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.matrix.RatingsMatrix`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Create a matrix."""
+        cls.matrix = RatingsMatrix(*zip(*RATINGS), all_movie_ids=(40,))
+
+    def test_shape(self):
+        """Assert every user has a row, and every movie has a column."""
+        self.assertEqual(self.matrix.users.tolist(), [1, 2, 3, 4])
+        self.assertEqual(self.matrix.movies.tolist(), [10, 20, 30, 40])
+        self.assertEqual(self.matrix.ratings.shape, (4, 4))
+
+    def test_movie_index(self):
+        """Translate movie IDs to column indices."""
+        self.assertEqual(self.matrix.movie_index((40, 10)).tolist(), [3, 0])
+
+    def test_movie_index_missing(self):
+        """Assert a ``KeyError`` is raised for an unknown movie."""
+        with self.assertRaises(KeyError):
+            self.matrix.movie_index((50,))
+
+    def test_centered(self):
+        """Assert each user's average is subtracted from their ratings."""
+        avg_ratings = self.matrix.ratings.sum(axis=1).A1 / (
+            self.matrix.rated().sum(axis=1).A1
+        )
+        centered = self.matrix.centered(avg_ratings).toarray()
+        self.assertEqual(centered[3].tolist(), [0, 0, 0, 0])
+        self.assertAlmostEqual(centered[2][1], -1.5)
+
+
+class AdjustedCosineTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.matrix.AdjustedCosine`."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Compare every movie to every movie."""
+        matrix = RatingsMatrix(*zip(*RATINGS), all_movie_ids=(40,))
+        avg_ratings = matrix.ratings.sum(axis=1).A1 / (
+            matrix.rated().sum(axis=1).A1
+        )
+        cls.avg_ratings = dict(zip(matrix.users.tolist(), avg_ratings))
+        cls.movies = matrix.movies.tolist()
+        cls.cosine = AdjustedCosine(
+            matrix.centered(avg_ratings),
+            matrix.rated(),
+            1,
+        )
+
+    def test_pairwise(self):
+        """Assert scores match those computed one pair at a time."""
+        scores = self.cosine.scores(range(len(self.movies)))
+        for i, movie_a in enumerate(self.movies):
+            for j, movie_b in enumerate(self.movies):
+                if movie_a == movie_b:
+                    continue
+                with self.subTest(movie_a=movie_a, movie_b=movie_b):
+                    self.assertAlmostEqual(
+                        scores[i][j],
+                        _adjusted_cosine(movie_a, movie_b, self.avg_ratings),
+                    )
+
+    def test_block(self):
+        """Assert a block of columns has the same scores as all columns."""
+        scores = self.cosine.scores(range(len(self.movies)))
+        block = self.cosine.scores((2, 0))
+        self.assertEqual(block[:, 0].tolist(), scores[:, 2].tolist())
+        self.assertEqual(block[:, 1].tolist(), scores[:, 0].tolist())
+
+    def test_stats(self):
+        """Assert scores may be computed from sufficient statistics."""
+        columns = range(len(self.movies))
+        stats = tuple(stat.toarray() for stat in self.cosine.stats(columns))
+        self.assertEqual(
+            adjusted_cosine(*stats, 1).tolist(),
+            self.cosine.scores(columns).tolist(),
+        )
+        # Movies 20 and 30 have been rated by users 1, 2 and 3.
+        self.assertEqual(stats[0][1][2], 3)
+
+    def test_stats_rows(self):
+        """Assert statistics may be computed for some rows only."""
+        columns = (2, 0)
+        full = self.cosine.stats(columns)
+        some = self.cosine.stats(columns, (3, 1))
+        for full_stat, some_stat in zip(full, some):
+            self.assertEqual(
+                some_stat.toarray().tolist(),
+                full_stat.toarray()[[3, 1]].tolist(),
+            )
+        self.assertEqual(
+            self.cosine.scores(columns, (3, 1)).tolist(),
+            self.cosine.scores(columns)[[3, 1]].tolist(),
+        )
+
+    def test_stats_additive(self):
+        """Assert the statistics for two sets of users may be summed."""
+        avg_ratings = self.avg_ratings
+        halves = []
+        # Users 1 and 2, and users 3 and 4.
+        for ratings in (RATINGS[:6], RATINGS[6:]):
+            matrix = RatingsMatrix(
+                *zip(*ratings),
+                all_movie_ids=(10, 20, 30, 40),
+            )
+            halves.append(AdjustedCosine(
+                matrix.centered(numpy.array(
+                    [avg_ratings[user] for user in matrix.users.tolist()]
+                )),
+                matrix.rated(),
+                1,
+            ).stats(range(4)))
+        for full, half_a, half_b in zip(self.cosine.stats(range(4)), *halves):
+            numpy.testing.assert_allclose(
+                full.toarray(),
+                (half_a + half_b).toarray(),
+            )
+
+    def test_min_pairs(self):
+        """Assert pairs with too few co-raters have a score of 0."""
+        matrix = RatingsMatrix(*zip(*RATINGS))
+        avg_ratings = matrix.ratings.sum(axis=1).A1 / (
+            matrix.rated().sum(axis=1).A1
+        )
+        cosine = AdjustedCosine(
+            matrix.centered(avg_ratings),
+            matrix.rated(),
+            3,
+        )
+        # Only movies 20 and 30 have been rated by three users.
+        scores = cosine.scores(range(3))
+        self.assertEqual(scores[0].tolist(), [0, 0, 0])
+        self.assertNotEqual(scores[1][2], 0)
+
+
+class CoRatersTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.matrix.CoRaters`."""
+
+    def test_counts(self):
+        """Assert co-raters are counted for a block of movies."""
+        matrix = RatingsMatrix(*zip(*RATINGS), all_movie_ids=(40,))
+        counts = CoRaters(matrix).counts((20, 40))
+        self.assertEqual(counts.tolist(), [
+            [2, 0],
+            [3, 0],
+            [3, 0],
+            [0, 0],
+        ])
+
+
+class MinHashBucketsTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.matrix.MinHashBuckets`."""
+
+    def setUp(self):
+        """Bucket the small matrix, plus two movies.
+
+        Movie 50 has the same raters as movie 20. Movie 60's raters have
+        rated nothing else.
+        """
+        ratings = RATINGS + (
+            (1, 50, 1.0),
+            (2, 50, 1.0),
+            (3, 50, 1.0),
+            (5, 60, 1.0),
+            (6, 60, 1.0),
+        )
+        self.matrix = RatingsMatrix(*zip(*ratings), all_movie_ids=(40,))
+        self.buckets = MinHashBuckets(self.matrix, 8, 2)
+
+    def test_signatures(self):
+        """Assert movies with the same raters have the same signature."""
+        signatures = MinHashBuckets.signatures(self.matrix, 16)
+        columns = self.matrix.movie_index((20, 50, 60))
+        self.assertEqual(signatures.shape, (16, len(self.matrix.movies)))
+        self.assertEqual(
+            signatures[:, columns[0]].tolist(),
+            signatures[:, columns[1]].tolist(),
+        )
+        self.assertNotEqual(
+            signatures[:, columns[0]].tolist(),
+            signatures[:, columns[2]].tolist(),
+        )
+
+    def test_collisions(self):
+        """Assert movies with the same raters collide."""
+        movies = self.buckets.movies
+        self.assertEqual(movies.tolist(), [10, 20, 30, 40, 50, 60])
+        self.assertIn(50, movies[self.buckets.collisions(20)].tolist())
+        self.assertEqual(movies[self.buckets.collisions(60)].tolist(), [60])
+
+    def test_unrated(self):
+        """Assert an unrated movie collides with nothing."""
+        self.assertEqual(self.buckets.collisions(40).tolist(), [])
+        for movie in (10, 20, 30, 50, 60):
+            with self.subTest(movie=movie):
+                self.assertNotIn(3, self.buckets.collisions(movie).tolist())
+
+    def test_symmetric(self):
+        """Assert collisions are sorted, and symmetric."""
+        movies = self.buckets.movies.tolist()
+        for i, movie in enumerate(movies):
+            with self.subTest(movie=movie):
+                collisions = self.buckets.collisions(movie).tolist()
+                self.assertEqual(collisions, sorted(set(collisions)))
+                for j in collisions:
+                    self.assertIn(
+                        i,
+                        self.buckets.collisions(movies[j]).tolist(),
+                    )
+
+
+class PairBitmapTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.matrix.PairBitmap`."""
+
+    def setUp(self):
+        """Create a bitmap, and add some pairs to it."""
+        self.pairs = PairBitmap(range(10, 100, 10))
+        self.pairs.add((10, 90, 50), (20, 30, 60))
+
+    def test_contains(self):
+        """Assert pairs are unordered."""
+        for pair in ((10, 20), (20, 10), (30, 90), (90, 30)):
+            with self.subTest(pair=pair):
+                self.assertIn(pair, self.pairs)
+        for pair in ((10, 30), (10, 10), (10, 100)):
+            with self.subTest(pair=pair):
+                self.assertNotIn(pair, self.pairs)
+
+    def test_row(self):
+        """Get the pairs involving a movie."""
+        self.assertEqual(
+            self.pairs.row(30).tolist(),
+            [False] * 8 + [True],
+        )
+        self.assertFalse(self.pairs.row(100).any())
+
+    def test_paired(self):
+        """Assert pairs may be looked up for some movies only."""
+        movies = numpy.array((90, 100, 20, 30), dtype=numpy.int64)
+        self.assertEqual(
+            self.pairs.paired(30, movies).tolist(),
+            [True, False, False, False],
+        )
+        self.assertEqual(
+            self.pairs.paired(100, movies).tolist(),
+            [False] * 4,
+        )
+        movies = numpy.arange(10, 100, 10)
+        for movie in movies.tolist():
+            with self.subTest(movie=movie):
+                self.assertEqual(
+                    self.pairs.paired(movie, movies).tolist(),
+                    self.pairs.row(movie).tolist(),
+                )
+
+    def test_add_unknown(self):
+        """Assert pairs of unknown movies are discarded."""
+        self.pairs.add((10, 100), (100, 20))
+        self.assertNotIn((10, 100), self.pairs)
+        self.assertEqual(self.pairs.row(10).sum(), 1)
@@ -0,0 +1,138 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.predict.ml`."""
+import unittest
+
+import numpy
+
+from movie_recommender import exceptions
+from movie_recommender.constants import PREDICTOR_NAMES
+from movie_recommender.db import common, features, init
+from movie_recommender.predict import ml
+
+from .utils import make_db_path
+
+
+MOVIES = (
+    (10, 'Foo (1995)', 'Animation|Comedy'),
+    (20, 'Bar (1995)', 'Comedy'),
+    (30, 'Biz (2001)', 'Horror'),
+    (40, 'Baz', 'Drama|Horror'),
+    (50, 'Qux (1980)', '(no genres listed)'),
+)
+"""Movies, as ``(movie, title, genres)`` tuples. Movie 40 has no year."""
+
+RATINGS = (
+    (1, 10, 4.0),
+    (1, 20, 3.5),
+    (1, 30, 1.0),
+    (1, 40, 2.5),
+    (2, 40, 5.0),
+    (3, 10, 2.0),
+    (3, 20, 4.5),
+)
+"""Ratings, as ``(user, movie, rating)`` tuples.
+
+User 1 rates a variety of movies. User 2 only rates a movie without a year, so
+their year predictor has no data. User 3 only rates movies from one year, so
+their year predictor's line of best fit is vertical. User 4 rates nothing.
+"""
+
+USERS = (1, 2, 3, 4)
+"""Every user ID."""
+
+
+class MakePredictorsTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.predict.ml.make_predictors`.
+
+    Predictions are read from a throwaway database.
+    """
+
+    def setUp(self):
+        """Create a database, and make it this thread's default."""
+        db_path = make_db_path(self)
+        with common.get_db_conn(db_path) as conn:
+            with conn:
+                conn.execute('CREATE TABLE movies (movieId, title, genres)')
+                conn.executemany(
+                    'INSERT INTO movies VALUES (?, ?, ?)',
+                    MOVIES,
+                )
+                conn.execute('CREATE TABLE ratings (userId, movieId, rating)')
+                conn.executemany(
+                    'INSERT INTO ratings VALUES (?, ?, ?)',
+                    RATINGS,
+                )
+            init.cpop_movie_features_table(conn)
+        common._LOCAL.load_path = db_path  # pylint:disable=protected-access
+        features.load(reload=True)
+        self.addCleanup(features.unload)
+
+    def test_factories(self):
+        """Assert each predictor matches the one made by its factory.
+
+        Both must predict the same rating, or raise the same exception.
+        """
+        for user in USERS:
+            predictors = ml.make_predictors(user)
+            self.assertEqual(tuple(predictors), PREDICTOR_NAMES)
+            for name in PREDICTOR_NAMES:
+                factory_predictor = ml.get_predictor_factory(name)(user)
+                for movie, _, _ in MOVIES:
+                    with self.subTest(user=user, name=name, movie=movie):
+                        try:
+                            target = factory_predictor(movie)
+                        except (
+                                exceptions.EmptyGraphError,
+                                exceptions.NoMovieYearError) as err:
+                            with self.assertRaises(type(err)):
+                                predictors[name](movie)
+                        else:
+                            self.assertAlmostEqual(
+                                predictors[name](movie),
+                                target,
+                                delta=1e-12,
+                            )
+
+    def test_exceptions(self):
+        """Assert missing years, empty graphs and vertical lines are handled.
+
+        These are the cases described by :data:`RATINGS`.
+        """
+        predictors = ml.make_predictors(1)
+        with self.assertRaises(exceptions.NoMovieYearError):
+            predictors['year'](40)
+        with self.assertRaises(exceptions.EmptyGraphError):
+            ml.make_predictors(2)['year'](10)
+        with self.assertRaises(exceptions.EmptyGraphError):
+            ml.make_predictors(4)['genre:Comedy'](10)
+        # A vertical line predicts the average rating.
+        self.assertEqual(ml.make_predictors(3)['year'](30), 3.25)
+
+    def test_no_such_predictor(self):
+        """Ask for a predictor which isn't implemented."""
+        with self.assertRaises(exceptions.NoSuchPredictorError):
+            ml.make_predictors(1, ('genre:Foo',))
+
+
+class FitLinesTestCase(unittest.TestCase):
+    """Test :func:`movie_recommender.predict.ml.fit_lines`."""
+
+    def test_lines(self):
+        """Fit a sloped, a vertical, and an empty line."""
+        lines = ml.fit_lines(
+            numpy.array(((1.0, 2.0, 0.0), (3.0, 2.0, 0.0))),
+            numpy.array(((True, True, False), (True, True, False))),
+            numpy.array((1.0, 2.0)),
+        )
+        self.assertEqual(lines[0], (0.5, 0.5))
+        self.assertEqual(lines[1], (0.0, 1.5))
+        self.assertIsNone(lines[2])
+
+    def test_no_rows(self):
+        """Fit lines to a user who hasn't rated any movies."""
+        lines = ml.fit_lines(
+            numpy.empty((0, 2)),
+            numpy.empty((0, 2), dtype=bool),
+            numpy.empty(0),
+        )
+        self.assertEqual(lines, [None, None])
@@ -0,0 +1,131 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.profiling`."""
+import math
+import os
+import tempfile
+import unittest
+
+from movie_recommender import profiling
+from movie_recommender.analyze import schedule
+from movie_recommender.db import common
+
+
+class DisabledTestCase(unittest.TestCase):
+    """Test :mod:`movie_recommender.profiling` while it's disabled."""
+
+    def setUp(self):
+        """Discard records."""
+        profiling.take()
+
+    def test_passthrough(self):
+        """Assert task functions and results are handed back as-is."""
+        results = iter((1, 2))
+        self.assertIs(profiling.task(math.sqrt, 'sqrt'), math.sqrt)
+        self.assertIs(profiling.results(results), results)
+
+    def test_nothing_recorded(self):
+        """Assert stages and counters aren't recorded."""
+        with profiling.stage('stage'):
+            profiling.count('counter')
+        records = profiling.take()
+        self.assertEqual(records['stages'], {})
+        self.assertEqual(records['counters'], {})
+
+
+class EnabledTestCase(unittest.TestCase):
+    """Test :mod:`movie_recommender.profiling` while it's enabled."""
+
+    def setUp(self):
+        """Enable profiling."""
+        profiling.enable()
+
+    def tearDown(self):
+        """Disable profiling."""
+        profiling.disable()
+        profiling.take()
+
+    def test_stage(self):
+        """Assert a stage's times are summed, in the order first entered."""
+        with profiling.stage('outer'):
+            for _ in range(2):
+                with profiling.stage('inner'):
+                    pass
+        stages = profiling.take()['stages']
+        self.assertEqual(tuple(stages), ('outer', 'inner'))
+        self.assertLessEqual(stages['inner'], stages['outer'])
+
+    def test_queries(self):
+        """Assert statements and connections are recorded."""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'db.sqlite3')
+            with common.get_db_conn(db_path) as conn:
+                for _ in range(3):
+                    conn.execute('SELECT\n    1').fetchall()
+            common.close_db_conns()
+        records = profiling.take()
+        self.assertEqual(records['counters']['connections opened'], 1)
+        self.assertEqual(records['queries']['SELECT 1']['count'], 3)
+
+    def test_fetches(self):
+        """Assert fetching rows is timed, but not counted as an execution."""
+        statement = (
+            'WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) '
+            'SELECT x FROM n LIMIT 100'
+        )
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = os.path.join(temp_dir, 'db.sqlite3')
+            with common.get_db_conn(db_path) as conn:
+                cursor = conn.execute(statement)
+                self.assertEqual(
+                    profiling.take()['queries'][statement]['count'],
+                    1,
+                )
+                self.assertEqual(cursor.fetchone(), (1,))
+                self.assertEqual(cursor.fetchmany(2), [(2,), (3,)])
+                self.assertEqual(next(cursor), (4,))
+                self.assertEqual(len(cursor.fetchall()), 96)
+            common.close_db_conns()
+        query = profiling.take()['queries'][statement]
+        self.assertEqual(query['count'], 0)
+        self.assertGreater(query['seconds'], 0)
+
+    def test_pool(self):
+        """Assert tasks run in a pool are recorded, and results unwrapped."""
+        results = []
+        tasks = range(-5, 5)
+        schedule.run(
+            abs,
+            tasks,
+            dict.fromkeys(tasks, 1),
+            results.extend,
+            jobs=2,
+        )
+        self.assertEqual(
+            sorted(results),
+            [(task, abs(task)) for task in tasks],
+        )
+        records = profiling.take()
+        self.assertEqual(records['pools']['abs']['tasks'], 10)
+        self.assertLess(0, records['pools']['abs']['received'])
+        self.assertIn('consume abs results', records['stages'])
+
+    def test_summarize(self):
+        """Assert each stage, statement and pool is summarized."""
+        with profiling.stage('stage'):
+            profiling.record_query('SELECT 1', 0.5)
+        profiling.merge({
+            'counters': {'connections opened': 2},
+            'pools': {'pool': {
+                'tasks': 2,
+                'seconds': 1.0,
+                'sent': 10,
+                'received': 20,
+            }},
+            'queries': {'SELECT 1': {'count': 1, 'seconds': 0.5}},
+            'stages': {},
+        })
+        lines = profiling.summarize()
+        self.assertIn('SQL: 2 statements in 1.000s', lines[2])
+        self.assertIn('2 connections opened', lines[2])
+        self.assertTrue(lines[3].endswith('SELECT 1'), lines)
+        self.assertIn('5 bytes sent and 10 bytes received', lines[-1])
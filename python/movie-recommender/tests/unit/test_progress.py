@@ -0,0 +1,63 @@
+# coding=utf-8
+"""Unit tests for :mod:`movie_recommender.progress`."""
+import multiprocessing
+import time
+import unittest
+
+from movie_recommender import progress
+
+
+def _advance(_):
+    """Count one item of work, in a worker process."""
+    progress.advance()
+
+
+def _sleep(seconds):
+    """Sleep, and return the number of seconds slept."""
+    time.sleep(seconds)
+    return seconds
+
+
+class ProgressTestCase(unittest.TestCase):
+    """Test :class:`movie_recommender.progress.Progress`."""
+
+    def test_workers(self):
+        """Assert work counted by this process and its workers is summed."""
+        with progress.Progress(12, workers=2) as tracker:
+            tracker.advance(2)
+            with multiprocessing.Pool(2) as pool:
+                pool.map(_advance, (None,) * 10)
+            snapshot = tracker.snapshot()
+        self.assertEqual(snapshot.done, 12)
+        self.assertEqual(snapshot.total, 12)
+        self.assertEqual(snapshot.eta, 0)
+        self.assertFalse(snapshot.finished)
+
+    def test_shared_slot(self):
+        """Assert work is counted when there are more workers than slots."""
+        with progress.Progress(20, workers=0) as tracker:
+            with multiprocessing.Pool(4) as pool:
+                pool.map(_advance, (None,) * 20, chunksize=1)
+            self.assertEqual(tracker.snapshot().done, 20)
+
+    def test_reporter(self):
+        """Assert a final snapshot is reported, with busy workers."""
+        snapshots = []
+        with progress.Progress(3, snapshots.append, 2, interval=60):
+            with multiprocessing.Pool(2) as pool:
+                self.assertEqual(
+                    pool.map(progress.timed(_sleep), (0.05,) * 4),
+                    [0.05] * 4,
+                )
+        self.assertEqual(len(snapshots), 1)
+        self.assertTrue(snapshots[0].finished)
+        self.assertTrue(snapshots[0].utilization)
+        for utilization in snapshots[0].utilization:
+            self.assertLess(0, utilization)
+            self.assertLessEqual(utilization, 1)
+
+    def test_timed_inactive(self):
+        """Assert task functions are handed back as-is if nothing's tracked."""
+        self.assertIs(progress.timed(_sleep), _sleep)
+        with progress.Progress(1):
+            self.assertIs(progress.timed(_sleep), _sleep)
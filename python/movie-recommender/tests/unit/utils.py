@@ -1,8 +1,27 @@
 # coding=utf-8
 """Utilities for unit tests."""
 import os
+import shutil
+import tempfile
+
+from movie_recommender.db import common
 
 
 def get_fixture(filename):
     """Generate the path to a file in the "fixtures" directory."""
     return os.path.join(os.path.dirname(__file__), 'fixtures', filename)
+
+
+def make_db_path(test_case):
+    """Generate the path to a throwaway database.
+
+    The database's directory, and this thread's connections, are cleaned up
+    along with ``test_case``.
+
+    :param test_case: A ``unittest.TestCase``.
+    :return: The path to a database, which doesn't exist yet.
+    """
+    tmpdir = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, tmpdir)
+    test_case.addCleanup(common.close_db_conns)
+    return os.path.join(tmpdir, 'db.sqlite3')